@@ -0,0 +1,471 @@
+"""
+Бенчмарк цепочки `sslocal` -> SOCKS -> `tun2socks`.
+
+Тесты: пропускная способность TCP (upload/download), частота установления соединений,
+RTT запрос/ответ (p50/p95/p99), потери и задержка UDP через SOCKS5 UDP ASSOCIATE (`sslocal -U`).
+
+Встроенный сервер (`serve`) на одном порту обслуживает TCP-команды и UDP-эхо.
+Для офлайн-прогона поднимается ещё и локальная незашифрованная замена апстрима —
+минимальный SOCKS5-сервер с CONNECT и UDP ASSOCIATE.
+
+Отдельно — время импорта точки входа CLI (`python -X importtime`) с бюджетом.
+"""
+
+import asyncio
+import json
+import math
+import os
+import platform
+import socket
+import struct
+import subprocess
+import sys
+import time
+from dataclasses import dataclass, field
+
+from vpn_cli.socks5 import pack_addr, parse_udp_header, read_addr, socks5_connect, socks5_udp_associate
+
+DEFAULT_PORT = 9870
+CHUNK = 256 * 1024
+
+# Команды TCP-сервера (первый байт соединения)
+CMD_ECHO = b"E"
+CMD_UPLOAD = b"U"
+CMD_DOWNLOAD = b"D"
+
+# Метрики, где «больше — лучше»; для остальных (задержки, потери) лучше меньше
+HIGHER_IS_BETTER = {"upload_mbps", "download_mbps", "connections_per_s"}
+
+# --- встроенный сервер ---
+
+async def _handle_tcp(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        cmd = await reader.readexactly(1)
+        if cmd == CMD_ECHO:
+            while data := await reader.read(CHUNK):
+                writer.write(data)
+                await writer.drain()
+        elif cmd == CMD_UPLOAD:
+            total = 0
+            while data := await reader.read(CHUNK):
+                total += len(data)
+            writer.write(struct.pack("!Q", total))
+            await writer.drain()
+        elif cmd == CMD_DOWNLOAD:
+            (size,) = struct.unpack("!Q", await reader.readexactly(8))
+            block = b"\0" * CHUNK
+            while size > 0:
+                n = min(size, CHUNK)
+                writer.write(block[:n])
+                await writer.drain()
+                size -= n
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+class _UdpEcho(asyncio.DatagramProtocol):
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.transport.sendto(data, addr)
+
+async def start_bench_server(host: str = "127.0.0.1", port: int = 0) -> tuple[asyncio.AbstractServer, asyncio.BaseTransport, int]:
+    """Поднять TCP- и UDP-сервер бенчмарка на одном порту; вернуть `(tcp, udp, port)`."""
+    server = await asyncio.start_server(_handle_tcp, host, port)
+    port = server.sockets[0].getsockname()[1]
+    loop = asyncio.get_running_loop()
+    udp, _ = await loop.create_datagram_endpoint(_UdpEcho, local_addr=(host, port))
+    return server, udp, port
+
+# --- заглушка апстрима (SOCKS5-сервер) ---
+
+class _UdpRelay(asyncio.DatagramProtocol):
+    """UDP-релей заглушки апстрима: клиент <-> цели, с SOCKS5-заголовками на стороне клиента."""
+
+    def __init__(self) -> None:
+        self.client: tuple | None = None
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if self.client is None or addr == self.client:
+            self.client = addr
+            try:
+                host, port, payload = parse_udp_header(data)
+            except (IndexError, ValueError, struct.error):
+                return
+            self.transport.sendto(payload, (host, port))
+        else:
+            self.transport.sendto(b"\0\0\0" + pack_addr(addr[0], addr[1]) + data, self.client)
+
+async def _pipe(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        while data := await reader.read(CHUNK):
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        try:
+            writer.write_eof()
+        except (OSError, RuntimeError):
+            writer.close()
+
+async def _handle_socks(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        ver, n = await reader.readexactly(2)
+        await reader.readexactly(n)
+        writer.write(b"\x05\x00")
+        _, cmd, _ = await reader.readexactly(3)
+        host, port = await read_addr(reader)
+        if cmd == 1:
+            up_reader, up_writer = await asyncio.open_connection(host, port)
+            writer.write(b"\x05\x00\x00" + pack_addr("0.0.0.0", 0))
+            await writer.drain()
+            await asyncio.gather(_pipe(reader, up_writer), _pipe(up_reader, writer))
+            up_writer.close()
+        elif cmd == 3:
+            loop = asyncio.get_running_loop()
+            local = writer.get_extra_info("sockname")[0]
+            transport, _ = await loop.create_datagram_endpoint(_UdpRelay, local_addr=(local, 0))
+            writer.write(b"\x05\x00\x00" + pack_addr(*transport.get_extra_info("sockname")[:2]))
+            await writer.drain()
+            # Ассоциация живёт, пока открыто управляющее соединение
+            await reader.read()
+            transport.close()
+        else:
+            writer.write(b"\x05\x07\x00" + pack_addr("0.0.0.0", 0))
+    except (asyncio.IncompleteReadError, ConnectionError, OSError):
+        pass
+    finally:
+        writer.close()
+
+async def start_socks_standin(host: str = "127.0.0.1", port: int = 0) -> tuple[asyncio.AbstractServer, int]:
+    """Незашифрованная замена `sslocal`+сервера: SOCKS5 c CONNECT и UDP ASSOCIATE."""
+    server = await asyncio.start_server(_handle_socks, host, port)
+    return server, server.sockets[0].getsockname()[1]
+
+# --- клиентская часть ---
+
+@dataclass
+class BenchConfig:
+    target: str = "127.0.0.1"
+    port: int = DEFAULT_PORT
+    socks: tuple[str, int] | None = None
+    device: str | None = None
+    size: int = 32 * 1024 * 1024
+    streams: int = 1  # параллельных соединений в upload/download (многоядерный data path)
+    connections: int = 200
+    concurrency: int = 16
+    pings: int = 1000
+    udp_count: int = 1000
+    udp_interval: float = 0.001
+    timeout: float = 10.0
+    tests: tuple[str, ...] = ("upload", "download", "connect", "rtt", "udp")
+
+@dataclass
+class BenchReport:
+    meta: dict = field(default_factory=dict)
+    results: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Перцентиль по методу ближайшего ранга."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+async def _open(cfg: BenchConfig) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    if cfg.socks:
+        return await socks5_connect(cfg.socks, cfg.target, cfg.port)
+    if cfg.device:
+        family = socket.AF_INET6 if ":" in cfg.target else socket.AF_INET
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, cfg.device.encode())
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (cfg.target, cfg.port))
+        return await asyncio.open_connection(sock=sock)
+    return await asyncio.open_connection(cfg.target, cfg.port)
+
+def _mbps(nbytes: int, seconds: float) -> float:
+    return nbytes * 8 / seconds / 1e6 if seconds > 0 else 0.0
+
+async def _upload_one(cfg: BenchConfig, size: int) -> int:
+    reader, writer = await _open(cfg)
+    block = b"\0" * CHUNK
+    writer.write(CMD_UPLOAD)
+    left = size
+    while left > 0:
+        n = min(left, CHUNK)
+        writer.write(block[:n])
+        await writer.drain()
+        left -= n
+    writer.write_eof()
+    (received,) = struct.unpack("!Q", await reader.readexactly(8))
+    writer.close()
+    return received
+
+async def _download_one(cfg: BenchConfig, size: int) -> int:
+    reader, writer = await _open(cfg)
+    writer.write(CMD_DOWNLOAD + struct.pack("!Q", size))
+    await writer.drain()
+    received = 0
+    while received < size:
+        data = await reader.read(CHUNK)
+        if not data:
+            break
+        received += len(data)
+    writer.close()
+    return received
+
+def _stream_sizes(cfg: BenchConfig) -> list[int]:
+    """`size` поровну на `streams` параллельных соединений (остаток — первому)."""
+    share, rest = divmod(cfg.size, cfg.streams)
+    return [share + rest] + [share] * (cfg.streams - 1)
+
+async def bench_upload(cfg: BenchConfig) -> dict:
+    t0 = time.perf_counter()
+    received = sum(await asyncio.gather(*(_upload_one(cfg, size) for size in _stream_sizes(cfg))))
+    elapsed = time.perf_counter() - t0
+    return {"upload_mbps": _mbps(received, elapsed), "upload_bytes": received, "upload_s": elapsed}
+
+async def bench_download(cfg: BenchConfig) -> dict:
+    t0 = time.perf_counter()
+    received = sum(await asyncio.gather(*(_download_one(cfg, size) for size in _stream_sizes(cfg))))
+    elapsed = time.perf_counter() - t0
+    return {"download_mbps": _mbps(received, elapsed), "download_bytes": received, "download_s": elapsed}
+
+async def bench_connect(cfg: BenchConfig) -> dict:
+    """Частота соединений: connect + одно эхо + close, `concurrency` параллельно."""
+    sem = asyncio.Semaphore(cfg.concurrency)
+    setup_ms: list[float] = []
+    failures = 0
+
+    async def _one() -> None:
+        nonlocal failures
+        async with sem:
+            t0 = time.perf_counter()
+            try:
+                reader, writer = await _open(cfg)
+                writer.write(CMD_ECHO + b"x")
+                await reader.readexactly(1)
+                setup_ms.append((time.perf_counter() - t0) * 1000)
+                writer.close()
+            except (OSError, asyncio.IncompleteReadError):
+                failures += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_one() for _ in range(cfg.connections)))
+    elapsed = time.perf_counter() - t0
+    return {
+        "connections_per_s": len(setup_ms) / elapsed if elapsed > 0 else 0.0,
+        "connect_failures": failures,
+        "connect_p50_ms": percentile(setup_ms, 50),
+        "connect_p99_ms": percentile(setup_ms, 99),
+    }
+
+async def bench_rtt(cfg: BenchConfig) -> dict:
+    """RTT запрос/ответ по одному соединению (64 байта туда и обратно)."""
+    reader, writer = await _open(cfg)
+    writer.write(CMD_ECHO)
+    payload = b"p" * 64
+    samples: list[float] = []
+    for _ in range(cfg.pings):
+        t0 = time.perf_counter()
+        writer.write(payload)
+        await writer.drain()
+        await reader.readexactly(len(payload))
+        samples.append((time.perf_counter() - t0) * 1000)
+    writer.close()
+    return {
+        "rtt_p50_ms": percentile(samples, 50),
+        "rtt_p95_ms": percentile(samples, 95),
+        "rtt_p99_ms": percentile(samples, 99),
+    }
+
+class _UdpClient(asyncio.DatagramProtocol):
+    def __init__(self, strip_header: bool) -> None:
+        self.strip_header = strip_header
+        self.rtts: dict[int, float] = {}
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        if self.strip_header:
+            try:
+                _, _, data = parse_udp_header(data)
+            except (IndexError, ValueError, struct.error):
+                return
+        if len(data) < 12:
+            return
+        seq, sent = struct.unpack("!Id", data[:12])
+        self.rtts.setdefault(seq, (time.perf_counter() - sent) * 1000)
+
+async def bench_udp(cfg: BenchConfig) -> dict:
+    """Потери и задержка UDP: `udp_count` датаграмм с номером и временем отправки."""
+    loop = asyncio.get_running_loop()
+    control = None
+    if cfg.socks:
+        _, control, relay = await socks5_udp_associate(cfg.socks)
+        header = b"\0\0\0" + pack_addr(cfg.target, cfg.port)
+        dest = relay
+    else:
+        header = b""
+        dest = (cfg.target, cfg.port)
+    sock = socket.socket(socket.AF_INET6 if ":" in dest[0] else socket.AF_INET, socket.SOCK_DGRAM)
+    if cfg.device and not cfg.socks:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BINDTODEVICE, cfg.device.encode())
+    sock.setblocking(False)
+    transport, proto = await loop.create_datagram_endpoint(lambda: _UdpClient(bool(cfg.socks)), sock=sock)
+    try:
+        for seq in range(cfg.udp_count):
+            transport.sendto(header + struct.pack("!Id", seq, time.perf_counter()) + b"u" * 52, dest)
+            await asyncio.sleep(cfg.udp_interval)
+        await asyncio.sleep(min(1.0, cfg.timeout))
+    finally:
+        transport.close()
+        if control is not None:
+            control.close()
+    rtts = list(proto.rtts.values())
+    return {
+        "udp_sent": cfg.udp_count,
+        "udp_received": len(rtts),
+        "udp_loss": 1 - len(rtts) / cfg.udp_count if cfg.udp_count else 0.0,
+        "udp_p50_ms": percentile(rtts, 50),
+        "udp_p99_ms": percentile(rtts, 99),
+    }
+
+TESTS = {
+    "upload": bench_upload,
+    "download": bench_download,
+    "connect": bench_connect,
+    "rtt": bench_rtt,
+    "udp": bench_udp,
+}
+
+async def run_bench(cfg: BenchConfig, offline: bool = False) -> BenchReport:
+    """
+    Прогнать выбранные тесты. При `offline=True` поднимаются встроенный сервер и
+    SOCKS5-заглушка апстрима на 127.0.0.1, сеть не нужна.
+    """
+    servers: list = []
+    if offline:
+        tcp, udp, port = await start_bench_server("127.0.0.1", 0)
+        socks_server, socks_port = await start_socks_standin("127.0.0.1", 0)
+        servers += [tcp, udp, socks_server]
+        cfg.target, cfg.port = "127.0.0.1", port
+        cfg.socks, cfg.device = ("127.0.0.1", socks_port), None
+
+    report = BenchReport(
+        meta={
+            "ts": time.time(),
+            "host": platform.node(),
+            "cpus": os.cpu_count(),
+            "offline": offline,
+            "target": f"{cfg.target}:{cfg.port}",
+            "via": f"socks5://{cfg.socks[0]}:{cfg.socks[1]}" if cfg.socks else (f"dev {cfg.device}" if cfg.device else "direct"),
+            "size": cfg.size,
+            "streams": cfg.streams,
+        }
+    )
+    try:
+        for name in cfg.tests:
+            try:
+                report.results.update(await asyncio.wait_for(TESTS[name](cfg), cfg.timeout * 6))
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                report.errors[name] = str(e) or type(e).__name__
+    finally:
+        for server in servers:
+            server.close()
+    return report
+
+async def serve_forever(host: str, port: int) -> None:
+    """Запустить сервер бенчмарка (для удалённой стороны туннеля) и ждать."""
+    tcp, _, _ = await start_bench_server(host, port)
+    async with tcp:
+        await tcp.serve_forever()
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Список регрессий: метрика хуже базовой более чем на `tolerance` (относительно; для потерь — абсолютно)."""
+    regressions = []
+    for key, base in baseline.items():
+        cur = current.get(key)
+        if not isinstance(base, (int, float)) or not isinstance(cur, (int, float)):
+            continue
+        if key.endswith(("_bytes", "_s", "_sent", "_received", "_failures")):
+            continue
+        if key.endswith("_loss"):
+            # Потери — уже доля, сравниваем абсолютную разницу (базовые 0% тоже считаются)
+            worse = cur - base
+        elif base == 0:
+            continue
+        elif key in HIGHER_IS_BETTER:
+            worse = (base - cur) / base
+        else:
+            worse = (cur - base) / base
+        if worse > tolerance:
+            regressions.append(f"{key}: {base:.3f} -> {cur:.3f} ({worse:+.0%})")
+    return regressions
+
+def save_report(report: BenchReport, path: str) -> None:
+    with open(path, "w") as f:
+        json.dump({"meta": report.meta, "results": report.results, "errors": report.errors}, f, indent=2)
+        f.write("\n")
+
+# --- время запуска CLI ---
+
+# Бюджет на импорт точки входа: `status`/`stop` дёргают из скриптов и статус-баров
+STARTUP_MODULE = "vpn_cli.cli"
+STARTUP_BUDGET_MS = 50.0
+
+def parse_importtime(stderr: str) -> list[tuple[str, int, int]]:
+    """Строки `-X importtime`: `(модуль с отступом вложенности, self мкс, cumulative мкс)`."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:") :].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # заголовок таблицы
+        rows.append((parts[2][1:].rstrip(), int(parts[0]), int(parts[1])))
+    return rows
+
+def measure_imports(module: str = STARTUP_MODULE, runs: int = 5, top: int = 10) -> dict:
+    """
+    Время импорта `module` в свежем интерпретаторе (лучший из `runs` прогонов, мс),
+    самые дорогие по собственному времени модули этого прогона и все модули, которые он подгрузил.
+    """
+    best_ms: float | None = None
+    best_rows: list[tuple[str, int, int]] = []
+    for _ in range(runs):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        rows = parse_importtime(proc.stderr)
+        end = next((i for i, (name, _, _) in enumerate(rows) if name == module), None)
+        if end is None:
+            raise RuntimeError(f"{module} не найден в выводе -X importtime")
+        # Вложенные импорты печатаются до самого модуля и с отступом; `site` и прочее — не наши
+        start = end
+        while start > 0 and rows[start - 1][0].startswith(" "):
+            start -= 1
+        total = rows[end][2] / 1000
+        if best_ms is None or total < best_ms:
+            best_ms, best_rows = total, rows[start : end + 1]
+    heaviest = sorted(best_rows, key=lambda r: r[1], reverse=True)[:top]
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms": round(best_ms or 0.0, 1),
+        "heaviest": [{"module": name.strip(), "self_ms": round(own / 1000, 2)} for name, own, _ in heaviest],
+        "modules": [name.strip() for name, _, _ in best_rows],
+    }
@@ -0,0 +1,276 @@
+"""
+Точка входа `my-vpn`.
+
+`status` и `stop` у запущенного VPN отвечают через управляющий сокет и не импортируют typer,
+asyncio и загрузчик зависимостей (`requests`), так что их удобно вызывать из скриптов и
+статус-баров. Всё остальное (и эти же команды без запущенного демона) обрабатывает
+полноценный CLI из `vpn_cli.main`.
+"""
+
+import json
+import os
+import sys
+import time
+
+from vpn_cli.daemon import request as daemon_request
+from vpn_cli.utils import get_env_file
+
+# Команды, которые обслуживаются без typer, и флаги, которые быстрый путь понимает (в любом порядке)
+FAST_COMMANDS = {
+    "status": {"--json", "--quality"},
+    "stop": set(),
+}
+
+def load_env(env_file: str | None, override: bool = False) -> None:
+    """Загрузить конфигурацию из `.env` по приоритетам CLI/окружения."""
+    from dotenv import find_dotenv, load_dotenv
+
+    if env_file:
+        load_dotenv(env_file, override=override)
+        return
+    default_env = get_env_file()
+    if default_env:
+        load_dotenv(default_env, override=override)
+        return
+    auto = find_dotenv(usecwd=True)
+    if auto:
+        load_dotenv(auto, override=override)
+
+def format_components(components: dict) -> str:
+    lines = []
+    for name, comp in components.items():
+        line = (
+            f"{name}: {comp.get('state')} (pid {comp.get('pid') or '-'}), "
+            f"restarts {comp.get('restarts', 0)}, downtime {comp.get('downtime_s', 0):.3f}s"
+        )
+        if comp.get("last_exit") is not None:
+            line += f", last exit {comp['last_exit']}"
+        lines.append(line)
+    return "\n".join(lines)
+
+def format_routes(routes: dict | None) -> str:
+    if not routes:
+        return "routes: -"
+    line = f"routes: {routes.get('installed', 0)} installed"
+    if routes.get("include") or routes.get("exclude"):
+        line += f" (include {routes.get('include', 0)}, exclude {routes.get('exclude', 0)})"
+    if "apply_ms" in routes:
+        line += f", last apply {routes['apply_ms']:.1f} ms (+{routes.get('added', 0)}/-{routes.get('removed', 0)})"
+    return line
+
+def format_events(events: dict | None) -> str:
+    """Счётчики событий из логов одной строкой на компонент."""
+    if not events:
+        return "log events: -"
+    parts = []
+    for name, counters in (events.get("counters") or {}).items():
+        if counters:
+            parts.append(f"{name} " + ", ".join(f"{ev} {n}" for ev, n in sorted(counters.items())))
+    return "log events: " + ("; ".join(parts) if parts else "нет")
+
+def format_gateway(watch: dict | None) -> str:
+    """Шлюз и его смены (слежение за маршрутом по умолчанию)."""
+    if not watch:
+        return ""
+    line = f"gateway: {watch.get('gateway') or 'нет'}, changes {watch.get('changes', 0)}"
+    recent = watch.get("recent") or []
+    if recent:
+        last = recent[-1]
+        line += f" (last {last.get('old') or 'нет'} -> {last.get('new') or 'нет'}, repin {last.get('repin_ms', 0):.1f} ms)"
+    return line + "\n"
+
+def _ms(value) -> str:
+    return f"{value:.1f}" if value is not None else "-"
+
+def _pct(value) -> str:
+    return f"{value * 100:.0f}%" if value is not None else "-"
+
+def format_dns(dns: dict | None) -> str:
+    """Счётчики DNS-стаба: доля попаданий в кэш и задержка ответа."""
+    if not dns:
+        return ""
+    queries = dns.get("queries", 0)
+    rate = _pct(dns.get("hit_rate"))
+    latency = dns.get("latency_ms") or {}
+    miss = dns.get("miss_latency_ms") or {}
+    return (
+        f"dns: {dns.get('listen')}, {queries} queries, hit rate {rate}, cache {dns.get('cache_entries', 0)}, "
+        f"p50 {_ms(latency.get('p50'))} / p99 {_ms(latency.get('p99'))} ms (miss p50 {_ms(miss.get('p50'))} ms), "
+        f"coalesced {dns.get('coalesced', 0)}, prefetched {dns.get('prefetches', 0)}, "
+        f"upstream errors {dns.get('upstream_errors', 0)}\n"
+    )
+
+def format_pool(pool: dict | None) -> str:
+    """Пул прогретых соединений по серверам: доля попаданий, сэкономленное время, размер."""
+    if not pool:
+        return ""
+    lines = []
+    for u in pool.get("upstreams") or []:
+        connect = u.get("connect_ms") or {}
+        error = f", ошибок соединения {u['dial_errors']}" if u.get("dial_errors") else ""
+        saved = u.get("saved_ms", 0)
+        lines.append(
+            f"pool {u.get('server')}: idle {u.get('idle', 0)}/{u.get('target', 0)}, "
+            f"{u.get('sessions', 0)} sessions, hit rate {_pct(u.get('hit_rate'))}, "
+            f"saved {f'{saved / 1000:.1f}s' if saved >= 1000 else f'{saved:.0f} ms'}, connect p50 {_ms(connect.get('p50'))} ms, "
+            f"recycled {u.get('recycled', 0)}, TFO {'on' if u.get('fastopen') else 'off'}{error}\n"
+        )
+    return "".join(lines)
+
+def format_quality(quality: dict | None) -> str:
+    """Пробы качества по целям: успешность и джиттер по окнам, гистограммы задержек."""
+    if not quality:
+        return "пробы качества выключены (QUALITY_TARGETS пуст)"
+    lines = [
+        f"через SOCKS {quality.get('socks')}, раз в {quality.get('interval_s', 0):g} с, "
+        f"раундов {quality.get('rounds', 0)}"
+    ]
+    for t in quality.get("targets") or []:
+        state = "нет данных" if t.get("last_ok") is None else ("ok" if t["last_ok"] else "FAIL")
+        failed = f", {t['failures']} неудачных" if t.get("failures") else ""
+        error = f" (последняя ошибка: {t['last_error']})" if t.get("last_error") else ""
+        lines.append(f"{t.get('target')}: {state}, проб {t.get('probes', 0)}{failed}{error}")
+        windows = t.get("windows") or {}
+        success = " / ".join(f"{w} {_pct(s.get('success_rate'))}" for w, s in windows.items())
+        jitter = " / ".join(f"{w} {_ms(s.get('jitter_ms'))}" for w, s in windows.items())
+        lines.append(f"  успешно: {success}; джиттер, ms: {jitter}")
+        for key, label in (("connect_ms", "connect"), ("first_byte_ms", "first byte")):
+            h = t.get(key) or {}
+            if h.get("count"):
+                lines.append(
+                    f"  {label}: p50 {_ms(h.get('p50'))} / p90 {_ms(h.get('p90'))} / p99 {_ms(h.get('p99'))} ms"
+                    f" (min {_ms(h.get('min'))}, max {_ms(h.get('max'))}, n={h['count']})"
+                )
+    return "\n".join(lines)
+
+def format_quality_line(quality: dict | None) -> str:
+    """Сводка проб для `status`: успешность за самое короткое окно и медиана connect."""
+    if not quality:
+        return ""
+    parts = []
+    for t in quality.get("targets") or []:
+        windows = t.get("windows") or {}
+        label, first = next(iter(windows.items()), ("", {}))
+        parts.append(
+            f"{t.get('target')} {_pct(first.get('success_rate'))} ({label}), "
+            f"connect p50 {_ms((t.get('connect_ms') or {}).get('p50'))} ms"
+        )
+    return "quality: " + ("; ".join(parts) or "нет целей") + "\n"
+
+def format_daemon_status(resp: dict) -> str:
+    """Текст панели `status` для ответа запущенного демона."""
+    metrics_line = f"metrics: {resp['metrics']}\n" if resp.get("metrics") else ""
+    tunnels = resp.get("tunnels") or []
+    tunnels_lines = "".join(
+        f"tunnel {t['index']}: {t.get('server')} ({t.get('server_ip')}), "
+        f"{t.get('tun_dev')}, SOCKS {t.get('socks_port')}, table {t.get('table')}\n"
+        for t in tunnels
+    )
+    draining_line = f"draining after switch: {', '.join(resp['draining'])}\n" if resp.get("draining") else ""
+    tunables = resp.get("tunables") or {}
+    tuning_line = ""
+    if resp.get("profile") or tunables:
+        settings = ", ".join(f"{k}={v}" for k, v in tunables.items()) or "по умолчанию"
+        tuning_line = f"profile: {resp.get('profile') or '-'} ({settings})\n"
+    return (
+        f"Server: {resp.get('server')} ({resp.get('server_ip')})\n"
+        f"TUN_DEV: {resp.get('tun_dev')}, SOCKS: 127.0.0.1:{resp.get('socks_port')}\n"
+        f"uptime: {resp.get('uptime_s', 0):.0f}s, pid {resp.get('pid')}, net backend: {resp.get('backend')}\n"
+        f"{tunnels_lines}"
+        f"{draining_line}"
+        f"{format_gateway(resp.get('gateway_watch'))}"
+        f"{format_dns(resp.get('dns'))}"
+        f"{format_pool(resp.get('pool'))}"
+        f"{format_quality_line(resp.get('quality'))}"
+        f"{tuning_line}"
+        f"{format_routes(resp.get('routes'))}\n"
+        f"{metrics_line}"
+        f"{format_events(resp.get('log_events'))}\n"
+        f"{format_components(resp.get('components', {}))}"
+    )
+
+def pid_running(pid: int) -> bool:
+    """Жив ли процесс `pid` (зомби, которого ещё не подобрал init, считается завершённым)."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return False
+
+def wait_pid_exit(pid: int, timeout: float) -> bool:
+    """Дождаться завершения процесса `pid` (в том числе чужого, например root-а)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not pid_running(pid):
+            return True
+        time.sleep(0.01)
+    return False
+
+def _split_env_file(argv: list[str]) -> tuple[str | None, list[str]]:
+    """Отделить ведущий `--env-file PATH` (или `--env-file=PATH`) от команды."""
+    if argv and argv[0].startswith("--env-file="):
+        return argv[0].split("=", 1)[1], argv[1:]
+    if len(argv) >= 2 and argv[0] == "--env-file":
+        return argv[1], argv[2:]
+    return None, argv
+
+def _fast_status(json_out: bool, quality: bool = False) -> bool:
+    resp = daemon_request("status", timeout=1.0)
+    if resp is None or not resp.get("ok"):
+        return False
+    if quality:
+        resp = resp.get("quality")
+    if json_out:
+        sys.stdout.write(json.dumps(resp, ensure_ascii=False, indent=2) + "\n")
+        return True
+    from rich.console import Console
+    from rich.panel import Panel
+
+    if quality:
+        Console().print(Panel(format_quality(resp), title="Quality"))
+    else:
+        Console().print(Panel(format_daemon_status(resp), title="Status"))
+    return True
+
+def _fast_stop() -> bool:
+    resp = daemon_request("stop")
+    if resp is None or not resp.get("ok"):
+        return False
+    from rich.console import Console
+
+    console = Console()
+    console.print("Останавливаем запущенный my-vpn...")
+    if not wait_pid_exit(int(resp["pid"]), timeout=15.0):
+        console.print("[yellow]my-vpn не завершился за 15 сек.[/yellow]")
+        sys.exit(1)
+    console.print("Готово! VPN выключен, работаем напрямую.")
+    return True
+
+def fast_command(argv: list[str]) -> tuple[str, set[str]] | None:
+    """`(команда, флаги)`, если argv (после `--env-file`) целиком понятен быстрому пути, иначе `None`."""
+    if not argv or argv[0] not in FAST_COMMANDS:
+        return None
+    flags = set(argv[1:])
+    return (argv[0], flags) if flags <= FAST_COMMANDS[argv[0]] else None
+
+def main() -> None:
+    env_file, rest = _split_env_file(sys.argv[1:])
+    fast = fast_command(rest)
+    # С трассировкой — через полный CLI: там её включает колбэк typer
+    if fast is not None and not os.getenv("MY_VPN_TRACE"):
+        command, flags = fast
+        # `.env` может переопределить путь к управляющему сокету — грузим его до запроса
+        load_env(env_file)
+        if command == "stop":
+            handled = _fast_stop()
+        else:
+            handled = _fast_status(json_out="--json" in flags, quality="--quality" in flags)
+        if handled:
+            return
+
+    from vpn_cli.main import app
+
+    app()
+
+if __name__ == "__main__":
+    main()
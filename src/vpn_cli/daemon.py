@@ -0,0 +1,254 @@
+"""
+Управляющий Unix-сокет запущенного VPN.
+
+Протокол: одно соединение — один запрос. Клиент шлёт строку JSON `{"cmd": "...", ...}\\n`,
+сервер отвечает строкой JSON `{"ok": true, ...}\\n` и закрывает соединение.
+Ответы собираются из состояния в памяти процесса-супервизора — без обхода таблицы процессов.
+Долгие команды (`switch`) отвечают позже: соединение остаётся открытым, пока обработчик не вызовет `reply`.
+Запрос читается без блокировки: соединение ждёт своей строки в том же цикле, что и сокет, и не задерживает
+перезапуски компонентов, даже если клиент подключился и молчит.
+"""
+
+import json
+import os
+import socket
+import struct
+import threading
+from functools import partial
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from vpn_cli.utils import get_state_dir
+
+if TYPE_CHECKING:
+    from vpn_cli.supervisor import Supervisor
+
+ENV_CONTROL_SOCKET = "MY_VPN_CONTROL_SOCKET"
+CONTROL_FILENAME = "control.sock"
+MAX_REQUEST = 64 * 1024
+# Сколько ждать запрос от подключившегося клиента и сколько дописывать ответ, не влезший в буфер сокета
+REQUEST_TIMEOUT = 1.0
+
+Handler = Callable[[dict], dict]
+# Ответ отложенного обработчика: результат или исключение (его текст уйдёт клиенту как ошибка)
+Reply = Callable[[dict | Exception], None]
+DeferredHandler = Callable[[dict, Reply], None]
+
+def control_socket_path() -> Path:
+    """Путь к управляющему сокету (env `MY_VPN_CONTROL_SOCKET` или `<state_dir>/control.sock`)."""
+    override = os.environ.get(ENV_CONTROL_SOCKET, "").strip()
+    if override:
+        return Path(override).expanduser()
+    return get_state_dir() / CONTROL_FILENAME
+
+def _allowed_uids() -> set[int]:
+    uids = {0, os.geteuid()}
+    sudo_uid = os.environ.get("SUDO_UID")
+    if sudo_uid and sudo_uid.isdigit():
+        uids.add(int(sudo_uid))
+    return uids
+
+def _read_line(conn: socket.socket) -> bytes:
+    buf = b""
+    while b"\n" not in buf and len(buf) < MAX_REQUEST:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        buf += chunk
+    return buf.split(b"\n", 1)[0]
+
+def read_request(
+    loop: "Supervisor",
+    conn: socket.socket,
+    until: bytes,
+    done: Callable[[bytes | None], None],
+    *,
+    limit: int = MAX_REQUEST,
+    timeout: float = REQUEST_TIMEOUT,
+) -> None:
+    """
+    Копить данные `conn` из цикла `loop` до `until` (или `limit` байт, или EOF) и вызвать `done(data)`.
+    Не дождались за `timeout` — `done(None)`. Цикл между порциями данных не ждёт.
+    """
+    conn.setblocking(False)
+    buf = bytearray()
+    finished = False
+
+    def finish(data: bytes | None) -> None:
+        nonlocal finished
+        if finished:
+            return
+        finished = True
+        loop.remove_reader(conn)
+        done(data)
+
+    def on_readable(_conn) -> None:
+        try:
+            chunk = conn.recv(4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            finish(None)
+            return
+        buf.extend(chunk)
+        if not chunk or until in buf or len(buf) >= limit:
+            finish(bytes(buf))
+
+    loop.add_reader(conn, on_readable)
+    loop.call_later(timeout, lambda: finish(None))
+
+def send_and_close(conn: socket.socket, data: bytes) -> None:
+    """Отправить ответ и закрыть соединение; что не влезло в буфер сокета, дописывает рабочий поток."""
+    conn.setblocking(False)
+    try:
+        sent = conn.send(data)
+    except BlockingIOError:
+        sent = 0
+    except OSError:
+        conn.close()
+        return
+    if sent == len(data):
+        conn.close()
+        return
+
+    def rest() -> None:
+        with conn:
+            conn.settimeout(REQUEST_TIMEOUT)
+            try:
+                conn.sendall(data[sent:])
+            except OSError:
+                pass
+
+    threading.Thread(target=rest, name="reply", daemon=True).start()
+
+def _send(conn: socket.socket, response: dict) -> None:
+    send_and_close(conn, json.dumps(response, ensure_ascii=False).encode() + b"\n")
+
+def _reply(conn: socket.socket, result: dict | Exception) -> None:
+    _send(conn, {"ok": False, "error": str(result)} if isinstance(result, Exception) else {"ok": True, **result})
+
+class ControlError(RuntimeError):
+    """Управляющий сокет уже занят живым процессом."""
+
+class ControlServer:
+    """Сервер управляющего сокета; обслуживается из цикла `Supervisor` (`serve`)."""
+
+    def __init__(
+        self,
+        handlers: dict[str, Handler],
+        path: Path | None = None,
+        *,
+        deferred: dict[str, DeferredHandler] | None = None,
+    ) -> None:
+        self.handlers = handlers
+        # Обработчики, которые отвечают позже через `reply` (долгая работа — вне цикла супервизора)
+        self.deferred = deferred or {}
+        self.path = path if path is not None else control_socket_path()
+        self.allowed_uids = _allowed_uids()
+        self.sock: socket.socket | None = None
+        self.loop: "Supervisor | None" = None
+
+    def open(self) -> socket.socket:
+        if self.path.exists():
+            if request("ping", path=self.path, timeout=0.2) is not None:
+                raise ControlError(f"my-vpn уже запущен (сокет {self.path})")
+            self.path.unlink()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(str(self.path))
+        os.chmod(self.path, 0o660)
+        sudo_uid, sudo_gid = os.environ.get("SUDO_UID"), os.environ.get("SUDO_GID")
+        if os.geteuid() == 0 and sudo_uid and sudo_gid:
+            try:
+                os.chown(self.path, int(sudo_uid), int(sudo_gid))
+            except (OSError, ValueError):
+                pass
+        sock.listen(16)
+        sock.setblocking(False)
+        self.sock = sock
+        return sock
+
+    def close(self) -> None:
+        if self.sock is None:
+            return
+        self.sock.close()
+        self.sock = None
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+    def serve(self, loop: "Supervisor") -> None:
+        """Принимать соединения и читать запросы в цикле `loop`."""
+        self.loop = loop
+        loop.add_reader(self.sock, self.on_readable)
+
+    def on_readable(self, sock: socket.socket) -> None:
+        try:
+            conn, _ = sock.accept()
+        except BlockingIOError:
+            return
+        try:
+            creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i"))
+        except OSError:
+            conn.close()
+            return
+        _, uid, _ = struct.unpack("3i", creds)
+        if uid not in self.allowed_uids:
+            _send(conn, {"ok": False, "error": "permission denied"})
+            return
+        read_request(self.loop, conn, b"\n", partial(self._on_request, conn))
+
+    def _on_request(self, conn: socket.socket, data: bytes | None) -> None:
+        if data is None:
+            conn.close()
+            return
+        response = self._dispatch(data.split(b"\n", 1)[0], conn)
+        if response is not None:
+            _send(conn, response)
+
+    def _dispatch(self, line: bytes, conn: socket.socket) -> dict | None:
+        """Ответ на запрос или `None`, если соединение забрал отложенный обработчик."""
+        try:
+            req = json.loads(line or b"{}")
+        except ValueError:
+            return {"ok": False, "error": "bad request"}
+        cmd = req.get("cmd")
+        if cmd == "ping":
+            return {"ok": True, "pid": os.getpid()}
+        deferred = self.deferred.get(cmd)
+        if deferred is not None:
+            try:
+                deferred(req, partial(_reply, conn))
+            except Exception as e:
+                return {"ok": False, "error": str(e)}
+            return None
+        handler = self.handlers.get(cmd)
+        if handler is None:
+            return {"ok": False, "error": f"unknown command: {cmd!r}"}
+        try:
+            return {"ok": True, **handler(req)}
+        except Exception as e:
+            return {"ok": False, "error": str(e)}
+
+def request(cmd: str, *, path: Path | None = None, timeout: float = 2.0, **params) -> dict | None:
+    """
+    Отправить команду запущенному `my-vpn`.
+
+    Возвращает ответ или `None`, если демон не запущен (нет сокета / никто не слушает).
+    """
+    path = path if path is not None else control_socket_path()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(path))
+            sock.sendall(json.dumps({"cmd": cmd, **params}).encode() + b"\n")
+            line = _read_line(sock)
+    except (FileNotFoundError, ConnectionRefusedError):
+        return None
+    except OSError as e:
+        return {"ok": False, "error": str(e)}
+    try:
+        return json.loads(line)
+    except ValueError:
+        return {"ok": False, "error": "bad response"}
@@ -0,0 +1,600 @@
+"""
+Локальный кэширующий DNS-стаб (`DNS_STUB=1` или `start --dns`).
+
+Когда весь трафик идёт в TUN, каждый DNS-запрос — полный круг `tun2socks` -> `sslocal` -> сервер.
+Стаб отвечает из кэша, а промахи отправляет апстриму (`DNS_UPSTREAM`) через SOCKS5 UDP ASSOCIATE
+`sslocal -U`, минуя TUN и `tun2socks`:
+
+- LRU-кэш ответов с TTL из самих записей; в ответе из кэша TTL уменьшен на прошедшее время
+- одинаковые запросы в полёте склеиваются: к апстриму уходит один
+- отрицательные ответы (NXDOMAIN, NODATA) кэшируются на TTL из SOA (RFC 2308)
+- популярные имена обновляются заранее, до истечения TTL
+- запросы по TCP (повтор после усечённого ответа) уходят апстриму по TCP через SOCKS5 CONNECT
+
+Цикл asyncio живёт в отдельном потоке. Счётчики (доля попаданий, задержка ответа) — в `status`
+и Prometheus.
+"""
+
+import asyncio
+import os
+import random
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from pathlib import Path
+
+from vpn_cli.bench import percentile
+from vpn_cli.socks5 import parse_udp_header, socks5_connect, socks5_udp_associate, udp_header
+
+ENV_DNS_LISTEN = "DNS_LISTEN"
+ENV_DNS_UPSTREAM = "DNS_UPSTREAM"
+DEFAULT_LISTEN = "127.0.0.1:53"
+DEFAULT_UPSTREAM = "1.1.1.1,8.8.8.8"
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_NEGATIVE_TTL = 60  # если в отрицательном ответе нет SOA
+MAX_TTL = 86400
+# Имя, к которому обращались хотя бы PREFETCH_MIN_HITS раз, обновляется, когда осталось < 10% TTL
+PREFETCH_FRACTION = 0.1
+PREFETCH_MIN_HITS = 2
+LATENCY_SAMPLES = 1024
+TCP_IDLE_TIMEOUT = 10.0
+RESOLV_CONF = Path("/etc/resolv.conf")
+
+_HEADER = struct.Struct("!HHHHHH")
+FLAG_QR = 0x8000
+FLAG_TC = 0x0200
+RCODE_NOERROR = 0
+RCODE_FORMERR = 1
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+TYPE_SOA = 6
+TYPE_OPT = 41
+
+class DnsFormatError(ValueError):
+    """Сообщение не разбирается как DNS-запрос/ответ."""
+
+def parse_host_port(value: str, default_port: int = 53) -> tuple[str, int]:
+    """`1.1.1.1`, `1.1.1.1:5353`, `[::1]:53` -> `(host, port)`."""
+    value = value.strip()
+    if value.startswith("["):
+        host, _, port = value[1:].partition("]")
+        return host, int(port.lstrip(":") or default_port)
+    if value.count(":") == 1:
+        host, port = value.split(":")
+        return host, int(port)
+    return value, default_port
+
+def upstream_servers() -> list[tuple[str, int]]:
+    raw = os.getenv(ENV_DNS_UPSTREAM, DEFAULT_UPSTREAM)
+    return [parse_host_port(item) for item in raw.replace(" ", ",").split(",") if item.strip()]
+
+# --- разбор сообщений ---
+
+def _skip_name(msg: bytes, off: int) -> int:
+    while True:
+        n = msg[off]
+        if n & 0xC0 == 0xC0:
+            return off + 2
+        if n == 0:
+            return off + 1
+        off += 1 + n
+
+def parse_query(msg: bytes) -> tuple[tuple[str, int, int], int]:
+    """Ключ вопроса `(имя в нижнем регистре, тип, класс)` и конец секции вопроса."""
+    try:
+        _, flags, qdcount, *_ = _HEADER.unpack_from(msg)
+        if flags & FLAG_QR or qdcount != 1:
+            raise DnsFormatError("ожидается запрос с одним вопросом")
+        labels = []
+        off = _HEADER.size
+        while n := msg[off]:
+            if n & 0xC0:
+                raise DnsFormatError("сжатие имени в вопросе")
+            labels.append(msg[off + 1 : off + 1 + n])
+            off += 1 + n
+        qtype, qclass = struct.unpack_from("!HH", msg, off + 1)
+    except (IndexError, struct.error) as e:
+        raise DnsFormatError(str(e)) from None
+    return (b".".join(labels).lower().decode("ascii", "replace"), qtype, qclass), off + 5
+
+def scan_response(msg: bytes) -> tuple[list[tuple[int, int]], int | None, int | None]:
+    """
+    `(TTL-поля всех записей как (смещение, TTL), минимальный TTL ответа, TTL отрицательного ответа из SOA)`.
+    Псевдозапись OPT пропускается: в её поле TTL — флаги EDNS.
+    """
+    try:
+        _, _, qdcount, ancount, nscount, arcount = _HEADER.unpack_from(msg)
+        off = _HEADER.size
+        for _ in range(qdcount):
+            off = _skip_name(msg, off) + 4
+        ttls: list[tuple[int, int]] = []
+        answer_ttl = negative_ttl = None
+        for i in range(ancount + nscount + arcount):
+            off = _skip_name(msg, off)
+            rtype, _, ttl, rdlength = struct.unpack_from("!HHIH", msg, off)
+            if rtype != TYPE_OPT:
+                ttls.append((off + 4, ttl))
+            if i < ancount:
+                answer_ttl = ttl if answer_ttl is None else min(answer_ttl, ttl)
+            elif rtype == TYPE_SOA and i < ancount + nscount:
+                # RDATA SOA: MNAME, RNAME, затем SERIAL REFRESH RETRY EXPIRE MINIMUM
+                fixed = _skip_name(msg, _skip_name(msg, off + 10))
+                (minimum,) = struct.unpack_from("!I", msg, fixed + 16)
+                negative_ttl = min(ttl, minimum)
+            off += 10 + rdlength
+    except (IndexError, struct.error) as e:
+        raise DnsFormatError(str(e)) from None
+    return ttls, answer_ttl, negative_ttl
+
+def error_response(query: bytes, qend: int, rcode: int) -> bytes:
+    """Ответ без записей с кодом `rcode` на вопрос из `query`."""
+    qid, flags = struct.unpack_from("!HH", query)
+    flags = FLAG_QR | (flags & 0x7900) | 0x0080 | rcode  # opcode и RD из запроса, RA
+    return _HEADER.pack(qid, flags, 1, 0, 0, 0) + query[_HEADER.size : qend]
+
+# --- кэш ---
+
+@dataclass
+class CacheEntry:
+    query: bytes  # запрос, которым получен ответ (для обновления заранее)
+    response: bytes
+    ttls: list[tuple[int, int]]
+    stored: float
+    ttl: float
+    negative: bool
+    hits: int = 0
+
+    def remaining(self, now: float) -> float:
+        return self.stored + self.ttl - now
+
+    def answer(self, query: bytes, qend: int, now: float) -> bytes:
+        """Ответ клиенту: его ID и регистр имени в вопросе (0x20), TTL за вычетом прошедшего времени."""
+        buf = bytearray(self.response)
+        buf[0:2] = query[0:2]
+        if len(buf) >= qend:
+            buf[_HEADER.size : qend] = query[_HEADER.size : qend]
+        elapsed = int(now - self.stored)
+        for off, ttl in self.ttls:
+            struct.pack_into("!I", buf, off, max(0, ttl - elapsed))
+        return bytes(buf)
+
+class AnswerCache:
+    """LRU по ключу вопроса; протухшие записи выбрасываются при обращении."""
+
+    def __init__(self, size: int = DEFAULT_CACHE_SIZE) -> None:
+        self.size = size
+        self.entries: OrderedDict[tuple, CacheEntry] = OrderedDict()
+
+    def get(self, key: tuple, now: float) -> CacheEntry | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.remaining(now) <= 0:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple, entry: CacheEntry) -> None:
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+# --- апстрим через SOCKS5 ---
+
+class _RelayProtocol(asyncio.DatagramProtocol):
+    def __init__(self, upstream: "SocksUpstream") -> None:
+        self.upstream = upstream
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.upstream._on_datagram(data)
+
+class SocksUpstream:
+    """DNS-запросы к `servers` через SOCKS5: одна UDP-ассоциация на все запросы, ответы — по ID."""
+
+    def __init__(self, socks_port: int, servers: list[tuple[str, int]], timeout: float = 2.0) -> None:
+        self.socks = ("127.0.0.1", socks_port)
+        self.servers = servers
+        self.timeout = timeout
+        self.errors = 0
+        self._preferred = 0
+        self._transport: asyncio.DatagramTransport | None = None
+        self._control: asyncio.StreamWriter | None = None
+        self._pending: dict[int, asyncio.Future] = {}
+        self._lock: asyncio.Lock | None = None
+
+    def set_socks_port(self, port: int) -> None:
+        """Новый `sslocal` (после `switch`): следующая ассоциация — уже через него."""
+        self.socks = ("127.0.0.1", port)
+        self._reset()
+
+    def _order(self) -> list[tuple[str, int]]:
+        # Начинаем с последнего ответившего сервера
+        return self.servers[self._preferred :] + self.servers[: self._preferred]
+
+    async def _ensure(self) -> asyncio.DatagramTransport:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._transport is None:
+                reader, control, relay = await asyncio.wait_for(socks5_udp_associate(self.socks), self.timeout)
+                loop = asyncio.get_running_loop()
+                transport, _ = await loop.create_datagram_endpoint(lambda: _RelayProtocol(self), remote_addr=relay)
+                self._transport, self._control = transport, control
+                loop.create_task(self._watch_control(reader, control))
+            return self._transport
+
+    async def _watch_control(self, reader: asyncio.StreamReader, control: asyncio.StreamWriter) -> None:
+        try:
+            await reader.read()
+        except (ConnectionError, OSError):
+            pass
+        if self._control is control:
+            self._reset()
+
+    def _reset(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+        if self._control is not None:
+            self._control.close()
+        self._transport = self._control = None
+        for fut in self._pending.values():
+            if not fut.done():
+                fut.set_exception(ConnectionError("UDP-ассоциация SOCKS5 закрыта"))
+        self._pending.clear()
+
+    def _on_datagram(self, data: bytes) -> None:
+        try:
+            _, _, payload = parse_udp_header(data)
+            (qid,) = struct.unpack_from("!H", payload)
+        except (IndexError, ValueError, struct.error):
+            return
+        fut = self._pending.pop(qid, None)
+        if fut is not None and not fut.done():
+            fut.set_result(payload)
+
+    async def query(self, packet: bytes) -> bytes:
+        """Отправить запрос (ID подменяется своим) и вернуть ответ апстрима; по таймауту — следующий сервер."""
+        loop = asyncio.get_running_loop()
+        last: Exception | None = None
+        for server in self._order():
+            try:
+                transport = await self._ensure()
+            except (OSError, ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                self.errors += 1
+                raise ConnectionError(f"SOCKS5 UDP ASSOCIATE к {self.socks[0]}:{self.socks[1]}: {e}") from None
+            qid = random.getrandbits(16)
+            while qid in self._pending:
+                qid = random.getrandbits(16)
+            fut = loop.create_future()
+            self._pending[qid] = fut
+            transport.sendto(udp_header(*server) + struct.pack("!H", qid) + packet[2:])
+            try:
+                response = await asyncio.wait_for(fut, self.timeout)
+            except (asyncio.TimeoutError, ConnectionError) as e:
+                self.errors += 1
+                last = e
+                continue
+            finally:
+                self._pending.pop(qid, None)
+            self._preferred = self.servers.index(server)
+            return response
+        raise ConnectionError(f"апстримы DNS не ответили: {last or 'таймаут'}")
+
+    async def query_tcp(self, packet: bytes) -> bytes:
+        """Запрос по TCP через SOCKS5 CONNECT (для ответов, не влезающих в UDP)."""
+        host, port = self.servers[self._preferred]
+        try:
+            reader, writer = await asyncio.wait_for(socks5_connect(self.socks, host, port), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            self.errors += 1
+            raise ConnectionError(f"SOCKS5 CONNECT к {host}:{port}: {e}") from None
+        try:
+            writer.write(struct.pack("!H", len(packet)) + packet)
+            (length,) = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), self.timeout))
+            return await asyncio.wait_for(reader.readexactly(length), self.timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+            self.errors += 1
+            raise ConnectionError(f"DNS по TCP к {host}:{port}: {e}") from None
+        finally:
+            writer.close()
+
+    def close(self) -> None:
+        self._reset()
+
+# --- стаб ---
+
+class _StubUdp(asyncio.DatagramProtocol):
+    def __init__(self, stub: "DnsStub") -> None:
+        self.stub = stub
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        # Попадание в кэш отвечается сразу, без создания задачи
+        response = self.stub.answer_cached(data)
+        if response is not None:
+            self.transport.sendto(response, addr)
+            return
+        self.stub.spawn(self._resolve(data, addr))
+
+    async def _resolve(self, data: bytes, addr) -> None:
+        response = await self.stub.resolve_miss(data)
+        if response is not None:
+            self.transport.sendto(response, addr)
+
+class DnsStub:
+    """UDP+TCP DNS-сервер на `listen` с кэшем перед `SocksUpstream`."""
+
+    def __init__(
+        self,
+        upstream: SocksUpstream,
+        listen: tuple[str, int],
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        negative_ttl: int = DEFAULT_NEGATIVE_TTL,
+    ) -> None:
+        self.upstream = upstream
+        self.listen = listen
+        self.cache = AnswerCache(cache_size)
+        self.negative_ttl = negative_ttl
+        self.queries = self.hits = self.negative_hits = self.misses = 0
+        self.coalesced = self.prefetches = self.servfails = 0
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.miss_latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._inflight: dict[tuple, asyncio.Future] = {}
+        self._tasks: set[asyncio.Task] = set()  # ссылки на фоновые задачи, чтобы их не собрал GC
+        self._clients: set[asyncio.StreamWriter] = set()
+        self._client_tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._udp: asyncio.DatagramTransport | None = None
+        self._tcp: asyncio.AbstractServer | None = None
+
+    # --- жизненный цикл ---
+
+    def start(self) -> None:
+        """Открыть сокеты (ошибка bind — `OSError` сразу здесь) и запустить цикл в фоновом потоке."""
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(self._open())
+        except BaseException:
+            self._loop.close()
+            self._loop = None
+            raise
+        self._thread = threading.Thread(target=self._loop.run_forever, name="dns-stub", daemon=True)
+        self._thread.start()
+
+    async def _open(self) -> None:
+        loop = asyncio.get_running_loop()
+        self._udp, _ = await loop.create_datagram_endpoint(lambda: _StubUdp(self), local_addr=self.listen)
+        try:
+            self._tcp = await asyncio.start_server(self._handle_tcp, *self.listen)
+        except OSError:
+            self._udp.close()
+            raise
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        loop, self._loop = self._loop, None
+        asyncio.run_coroutine_threadsafe(self._close(), loop).result(timeout=2.0)
+        loop.call_soon_threadsafe(loop.stop)
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        loop.close()
+
+    async def _close(self) -> None:
+        self._udp.close()
+        self._tcp.close()
+        self.upstream.close()
+        for task in self._tasks:
+            task.cancel()
+        # TCP-клиентов не отменяем (задачи создал `start_server`), а закрываем: обработчик выйдет по EOF
+        for writer in self._clients:
+            writer.close()
+        pending = self._tasks | self._client_tasks
+        if pending:
+            await asyncio.wait(pending, timeout=1.0)
+
+    def set_socks_port(self, port: int) -> None:
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.upstream.set_socks_port, port)
+
+    def spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # --- разрешение имён ---
+
+    def answer_cached(self, query: bytes) -> bytes | None:
+        """Ответ из кэша или `None` (промах, битый запрос — их обрабатывает `resolve`)."""
+        t0 = time.perf_counter()
+        try:
+            key, qend = parse_query(query)
+        except DnsFormatError:
+            return None
+        now = time.monotonic()
+        entry = self.cache.get(key, now)
+        if entry is None:
+            return None
+        self.queries += 1
+        self.hits += 1
+        if entry.negative:
+            self.negative_hits += 1
+        entry.hits += 1
+        self._maybe_prefetch(key, entry, now)
+        response = entry.answer(query, qend, now)
+        self.latencies.append((time.perf_counter() - t0) * 1000)
+        return response
+
+    async def resolve(self, query: bytes, tcp: bool = False) -> bytes | None:
+        response = self.answer_cached(query)
+        if response is not None:
+            return response
+        return await self.resolve_miss(query, tcp)
+
+    async def resolve_miss(self, query: bytes, tcp: bool = False) -> bytes | None:
+        """Промах кэша (уже проверенный `answer_cached`): апстрим, FORMERR или SERVFAIL."""
+        t0 = time.perf_counter()
+        try:
+            key, qend = parse_query(query)
+        except DnsFormatError:
+            if len(query) < _HEADER.size:
+                return None
+            return _HEADER.pack(struct.unpack_from("!H", query)[0], FLAG_QR | RCODE_FORMERR, 0, 0, 0, 0)
+        self.queries += 1
+        self.misses += 1
+        try:
+            entry = await self._fetch(key, query, tcp)
+            response = entry.answer(query, qend, time.monotonic())
+        except (ConnectionError, OSError, asyncio.TimeoutError, DnsFormatError):
+            self.servfails += 1
+            response = error_response(query, qend, RCODE_SERVFAIL)
+        elapsed = (time.perf_counter() - t0) * 1000
+        self.latencies.append(elapsed)
+        self.miss_latencies.append(elapsed)
+        return response
+
+    async def _fetch(self, key: tuple, query: bytes, tcp: bool = False) -> CacheEntry:
+        """Запрос к апстриму; одинаковые запросы в полёте ждут один и тот же ответ."""
+        flight = (key, tcp)
+        fut = self._inflight.get(flight)
+        if fut is not None:
+            self.coalesced += 1
+            return await asyncio.shield(fut)
+        fut = asyncio.get_running_loop().create_future()
+        # Исключение без ожидающих — не ошибка
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._inflight[flight] = fut
+        try:
+            response = await (self.upstream.query_tcp(query) if tcp else self.upstream.query(query))
+            entry = self._store(key, query, response)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(entry)
+            return entry
+        finally:
+            del self._inflight[flight]
+
+    def _store(self, key: tuple, query: bytes, response: bytes) -> CacheEntry:
+        ttls, answer_ttl, soa_ttl = scan_response(response)
+        (flags,) = struct.unpack_from("!H", response, 2)
+        rcode = flags & 0xF
+        ttl, negative = 0, False
+        if flags & FLAG_TC:
+            pass  # усечённый ответ не кэшируем: клиент повторит по TCP
+        elif rcode == RCODE_NOERROR and answer_ttl is not None:
+            ttl = min(answer_ttl, MAX_TTL)
+        elif rcode in (RCODE_NOERROR, RCODE_NXDOMAIN):
+            ttl, negative = (soa_ttl if soa_ttl is not None else self.negative_ttl), True
+        entry = CacheEntry(query, response, ttls, time.monotonic(), ttl, negative)
+        if ttl > 0:
+            self.cache.put(key, entry)
+        return entry
+
+    def _maybe_prefetch(self, key: tuple, entry: CacheEntry, now: float) -> None:
+        if entry.negative or entry.hits < PREFETCH_MIN_HITS or (key, False) in self._inflight:
+            return
+        if entry.remaining(now) >= entry.ttl * PREFETCH_FRACTION:
+            return
+        self.prefetches += 1
+        self.spawn(self._prefetch(key, entry))
+
+    async def _prefetch(self, key: tuple, entry: CacheEntry) -> None:
+        try:
+            fresh = await self._fetch(key, entry.query)
+        except (ConnectionError, OSError, asyncio.TimeoutError, DnsFormatError):
+            return
+        # Популярность переносится: иначе имя обновлялось бы заранее только через раз
+        fresh.hits = entry.hits
+
+    async def _handle_tcp(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._clients.add(writer)
+        self._client_tasks.add(task)
+        try:
+            while True:
+                (length,) = struct.unpack("!H", await asyncio.wait_for(reader.readexactly(2), TCP_IDLE_TIMEOUT))
+                response = await self.resolve(await reader.readexactly(length), tcp=True)
+                if response is None:
+                    break
+                writer.write(struct.pack("!H", len(response)) + response)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError, OSError):
+            pass
+        finally:
+            self._clients.discard(writer)
+            self._client_tasks.discard(task)
+            writer.close()
+
+    # --- статистика ---
+
+    def stats(self) -> dict:
+        """Снимок статистики. Счётчики и окна задержек меняет цикл стаба, поэтому снимок собирается в нём."""
+        if self._loop is None:
+            return self._stats()
+        return asyncio.run_coroutine_threadsafe(self._stats_async(), self._loop).result(timeout=2.0)
+
+    async def _stats_async(self) -> dict:
+        return self._stats()
+
+    def _stats(self) -> dict:
+        latencies = list(self.latencies)
+        misses = list(self.miss_latencies)
+        return {
+            "listen": f"{self.listen[0]}:{self.listen[1]}",
+            "queries": self.queries,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / self.queries, 4) if self.queries else None,
+            "coalesced": self.coalesced,
+            "prefetches": self.prefetches,
+            "servfails": self.servfails,
+            "upstream_errors": self.upstream.errors,
+            "cache_entries": len(self.cache),
+            "latency_ms": {f"p{p}": _round(percentile(latencies, p)) for p in (50, 90, 99)},
+            "miss_latency_ms": {f"p{p}": _round(percentile(misses, p)) for p in (50, 99)},
+        }
+
+def _round(value: float | None) -> float | None:
+    return None if value is None else round(value, 3)
+
+# --- направить систему на стаб ---
+
+def read_resolv_conf(path: Path = RESOLV_CONF) -> dict:
+    """Что было до нас: содержимое или цель симлинка (systemd-resolved) — для журнала и отката."""
+    if path.is_symlink():
+        return {"symlink": os.readlink(path), "content": None}
+    try:
+        return {"symlink": None, "content": path.read_text()}
+    except FileNotFoundError:
+        return {"symlink": None, "content": None}
+
+def write_resolv_conf(address: str, path: Path = RESOLV_CONF) -> None:
+    """`nameserver <address>` вместо прежних серверов; `search`/`domain`/`options` сохраняются."""
+    try:
+        old = path.read_text().splitlines()
+    except OSError:
+        old = []
+    keep = [line for line in old if line.split()[:1] in (["search"], ["domain"], ["options"])]
+    text = "\n".join(["# my-vpn: DNS через локальный стаб (вернётся при остановке)", f"nameserver {address}", *keep]) + "\n"
+    tmp = path.with_name(f".{path.name}.my-vpn.tmp")
+    try:
+        tmp.write_text(text)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, path)  # заменяет и симлинк, а не файл, на который он указывает
+    except OSError:
+        # Например, bind-mount в контейнере: заменить нельзя, только переписать на месте
+        tmp.unlink(missing_ok=True)
+        path.write_text(text)
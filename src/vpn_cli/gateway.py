@@ -0,0 +1,69 @@
+"""
+Слежение за шлюзом по умолчанию (смена Wi-Fi, док-станция, VPN поверх VPN).
+
+Маршрут до сервера прибит к шлюзу, который был при `start`. После смены сети он ведёт в никуда,
+и зашифрованный трафик к серверу уходит в сам туннель. `GatewayWatcher` подписан на уведомления
+ядра о маршрутах и интерфейсах (без опроса) и при смене шлюза сразу вызывает перепривязку.
+"""
+
+import time
+from collections import deque
+from dataclasses import asdict, dataclass
+from typing import Callable
+
+from vpn_cli.network import NetBackend, RouteMonitor
+
+@dataclass
+class GatewayChange:
+    """Один переход: когда, откуда, куда и сколько заняла перепривязка."""
+
+    at: float
+    old: str | None
+    new: str | None
+    repin_ms: float
+
+class GatewayWatcher:
+    """
+    `on_change(old, new)` вызывается из цикла супервизора при каждой смене шлюза
+    (`new=None` — маршрута по умолчанию сейчас нет).
+    """
+
+    def __init__(
+        self,
+        net: NetBackend,
+        gateway: str | None,
+        on_change: Callable[[str | None, str | None], None],
+        history: int = 20,
+    ) -> None:
+        self.net = net
+        self.gateway = gateway
+        self.on_change = on_change
+        self.changes: deque[GatewayChange] = deque(maxlen=history)
+        self.total = 0
+        self.monitor: RouteMonitor | None = None
+
+    def open(self) -> RouteMonitor:
+        self.monitor = self.net.monitor()
+        return self.monitor
+
+    def on_readable(self, _fileobj=None) -> GatewayChange | None:
+        if self.monitor is None or not self.monitor.changed():
+            return None
+        t0 = time.perf_counter()
+        new = self.net.default_gateway()
+        if new == self.gateway:
+            return None
+        old, self.gateway = self.gateway, new
+        self.on_change(old, new)
+        change = GatewayChange(time.time(), old, new, round((time.perf_counter() - t0) * 1000, 2))
+        self.changes.append(change)
+        self.total += 1
+        return change
+
+    def snapshot(self) -> dict:
+        return {"gateway": self.gateway, "changes": self.total, "recent": [asdict(c) for c in self.changes]}
+
+    def close(self) -> None:
+        if self.monitor is not None:
+            self.monitor.close()
+            self.monitor = None
@@ -0,0 +1,379 @@
+"""
+Установка portable-бинарников `sslocal` и `tun2socks`.
+
+- скачивание с докачкой (HTTP Range) в `<cache>/downloads/*.part`;
+- проверка архива по `<архив>.sha256`, если релиз его публикует (shadowsocks-rust);
+- адаптивный размер чанка;
+- потоковая распаковка нужного файла из архива прямо во временный файл + атомарный `os.replace`;
+- контентно-адресуемый кэш `<cache>/artifacts/blobs/<sha256>` с индексом по `name/version/arch`.
+"""
+
+import hashlib
+import os
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+
+import requests
+from rich.console import Console
+from rich.progress import Progress, SpinnerColumn, TextColumn
+
+from vpn_cli import tracing
+from vpn_cli.utils import (
+    SS_VERSION,
+    T2S_VERSION,
+    ensure_bin_dir_in_path,
+    find_binary,
+    get_architecture,
+    get_bin_dir,
+    get_cache_dir,
+    read_json,
+    write_json_atomic,
+)
+
+console = Console()
+
+ENV_MIRROR = "MY_VPN_MIRROR"
+GITHUB = "https://github.com"
+
+USER_AGENT = "my-vpn/0.1"
+MIN_CHUNK = 64 * 1024
+MAX_CHUNK = 4 * 1024 * 1024
+# Если чанк прочитан быстрее — увеличиваем размер, медленнее — уменьшаем
+TARGET_CHUNK_SECONDS = 0.1
+
+_index_lock = threading.Lock()
+
+@dataclass(frozen=True)
+class Artifact:
+    """Бинарник из релизного архива."""
+
+    name: str  # имя установленного файла (`sslocal`)
+    version: str
+    arch: str
+    path: str  # путь релиза на GitHub, без хоста
+    member: str  # имя файла внутри архива
+    checksum: bool = False  # релиз публикует рядом с архивом `<архив>.sha256`
+
+    @property
+    def filename(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/{self.version}/{self.arch}"
+
+    @property
+    def url(self) -> str:
+        base = os.environ.get(ENV_MIRROR, "").strip().rstrip("/") or GITHUB
+        return f"{base}/{self.path}"
+
+    @property
+    def checksum_url(self) -> str:
+        return self.url + ".sha256"
+
+def artifacts_dir() -> Path:
+    return get_cache_dir() / "artifacts"
+
+def _index_path() -> Path:
+    return artifacts_dir() / "index.json"
+
+def _blob_path(digest: str) -> Path:
+    return artifacts_dir() / "blobs" / digest
+
+def sha256_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+def cached_blob(artifact: Artifact) -> Path | None:
+    """Путь к закэшированному бинарнику, если он есть в индексе и хэш сходится."""
+    entry = (read_json(_index_path()) or {}).get(artifact.key)
+    if not isinstance(entry, dict):
+        return None
+    blob = _blob_path(str(entry.get("sha256", "")))
+    if blob.is_file() and sha256_file(blob) == entry["sha256"]:
+        return blob
+    return None
+
+def _remember(artifact: Artifact, digest: str, archive_digest: str) -> None:
+    with _index_lock:
+        index = read_json(_index_path()) or {}
+        index[artifact.key] = {"sha256": digest, "archive_sha256": archive_digest, "ts": int(time.time())}
+        write_json_atomic(_index_path(), index)
+
+def _next_chunk_size(size: int, elapsed: float) -> int:
+    if elapsed < TARGET_CHUNK_SECONDS / 2:
+        return min(size * 2, MAX_CHUNK)
+    if elapsed > TARGET_CHUNK_SECONDS * 2:
+        return max(size // 2, MIN_CHUNK)
+    return size
+
+def _range_total(value: str | None) -> int | None:
+    """Полный размер файла из `Content-Range` (`bytes */N` или `bytes a-b/N`)."""
+    total = (value or "").rpartition("/")[2].strip()
+    return int(total) if total.isdigit() else None
+
+def download_file(url: str, dest_path: Path, progress: Progress | None = None) -> None:
+    """
+    Скачать `url` в `dest_path` с докачкой: данные пишутся в `dest_path.part`,
+    при повторном запуске запрашивается только недостающий хвост (`Range`).
+    """
+    part = dest_path.with_name(dest_path.name + ".part")
+    offset = part.stat().st_size if part.exists() else 0
+    if not _fetch_part(url, part, offset, progress):
+        # `.part` не совпадает по размеру с файлом на сервере (другая версия, мусор) — качаем с нуля
+        part.unlink()
+        _fetch_part(url, part, 0, progress)
+    os.replace(part, dest_path)
+
+def _fetch_part(url: str, part: Path, offset: int, progress: Progress | None) -> bool:
+    """
+    Докачать `url` в `part`, начиная с `offset`.
+
+    Возвращает False, если сервер отверг диапазон (416) и `part` нельзя считать скачанным целиком.
+    """
+    headers = {"User-Agent": USER_AGENT}
+    if offset:
+        headers["Range"] = f"bytes={offset}-"
+
+    with tracing.span("download", "io", url=url, offset=offset) as sp, requests.get(
+        url, stream=True, timeout=(10, 60), headers=headers
+    ) as r:
+        sp["status"] = r.status_code
+        if r.status_code == 416 and offset:
+            # Докачивать нечего — только если `.part` ровно такого размера, как файл на сервере
+            return _range_total(r.headers.get("content-range")) == offset
+        r.raise_for_status()
+        if r.status_code != 206:
+            offset = 0  # сервер не поддерживает Range — качаем заново
+        total_len = int(r.headers.get("content-length", 0)) + offset
+
+        task = None
+        if progress is not None:
+            name = part.name.removesuffix(".part")
+            task = progress.add_task(f"Скачивание {name}...", total=total_len or None, completed=offset)
+
+        chunk_size = MIN_CHUNK
+        received = 0
+        with open(part, "ab" if offset else "wb") as f:
+            while True:
+                t0 = time.perf_counter()
+                chunk = r.raw.read(chunk_size, decode_content=True)
+                if not chunk:
+                    break
+                f.write(chunk)
+                received += len(chunk)
+                chunk_size = _next_chunk_size(chunk_size, time.perf_counter() - t0)
+                if task is not None:
+                    progress.update(task, advance=len(chunk))
+        sp["bytes"] = received
+        if task is not None:
+            progress.remove_task(task)
+    return True
+
+def _member_matches(name: str, member_name: str) -> bool:
+    return name == member_name or name.endswith("/" + member_name)
+
+def _extract_tar_member(archive_path: Path, member_name: str, dest) -> None:
+    """Потоково скопировать файл `member_name` из tar-архива в открытый файл `dest`."""
+    with tarfile.open(archive_path, "r|*") as tar:
+        for member in tar:
+            if member.isfile() and _member_matches(member.name, member_name):
+                fileobj = tar.extractfile(member)
+                if fileobj is None:
+                    raise RuntimeError(f"Cannot extract {member.name}")
+                shutil.copyfileobj(fileobj, dest, MAX_CHUNK)
+                return
+    raise FileNotFoundError(f"{member_name} not found in archive")
+
+def _extract_zip_member(archive_path: Path, member_name: str, dest) -> None:
+    """Потоково скопировать файл `member_name` из zip-архива в открытый файл `dest`."""
+    with zipfile.ZipFile(archive_path) as zip_ref:
+        for cand in zip_ref.infolist():
+            if _member_matches(cand.filename, member_name):
+                with zip_ref.open(cand) as src:
+                    shutil.copyfileobj(src, dest, MAX_CHUNK)
+                return
+    raise FileNotFoundError(f"{member_name} not found in archive")
+
+class _HashingWriter:
+    """Обёртка над файлом, считающая SHA-256 на лету."""
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.h = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self.h.update(data)
+        return self.f.write(data)
+
+def _extract_to_blob(artifact: Artifact, archive_path: Path) -> str:
+    """Распаковать бинарник в кэш; вернуть его SHA-256."""
+    blobs = _blob_path("x").parent
+    blobs.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=".extract.", dir=blobs)
+    try:
+        with tracing.span("extract", "io", archive=archive_path.name, member=artifact.member), os.fdopen(fd, "wb") as f:
+            writer = _HashingWriter(f)
+            if artifact.filename.endswith(".zip"):
+                _extract_zip_member(archive_path, artifact.member, writer)
+            else:
+                _extract_tar_member(archive_path, artifact.member, writer)
+            f.flush()
+            os.fsync(f.fileno())
+        digest = writer.h.hexdigest()
+        os.replace(tmp_name, _blob_path(digest))
+        return digest
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+def expected_sha256(artifact: Artifact) -> str | None:
+    """SHA-256 архива из `<архив>.sha256` релиза (None, если релиз его не публикует)."""
+    if not artifact.checksum:
+        return None
+    with tracing.span("checksum", "io", url=artifact.checksum_url), requests.get(
+        artifact.checksum_url, timeout=(10, 30), headers={"User-Agent": USER_AGENT}
+    ) as r:
+        r.raise_for_status()
+        # Формат sha256sum: `<hex>  <имя файла>`
+        digest = (r.text.split() or [""])[0].lower()
+    if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        raise RuntimeError(f"Malformed checksum file for {artifact.filename}")
+    return digest
+
+def fetch_artifact(artifact: Artifact, progress: Progress | None = None) -> Path:
+    """Вернуть путь к бинарнику в кэше, при необходимости скачав, проверив и распаковав его."""
+    blob = cached_blob(artifact)
+    if blob is not None:
+        return blob
+
+    expected = expected_sha256(artifact)
+    downloads = artifacts_dir() / "downloads"
+    downloads.mkdir(parents=True, exist_ok=True)
+    archive_path = downloads / artifact.filename
+    if not archive_path.exists():
+        download_file(artifact.url, archive_path, progress)
+
+    with tracing.span("sha256", "io", file=archive_path.name):
+        archive_digest = sha256_file(archive_path)
+    if expected and archive_digest != expected:
+        archive_path.unlink()
+        raise RuntimeError(f"SHA-256 mismatch for {artifact.filename}: {archive_digest}")
+    try:
+        digest = _extract_to_blob(artifact, archive_path)
+    except (tarfile.TarError, zipfile.BadZipFile, EOFError):
+        # Битый/недокачанный архив: удаляем, чтобы следующая попытка скачала заново
+        archive_path.unlink(missing_ok=True)
+        raise
+    _remember(artifact, digest, archive_digest)
+    archive_path.unlink(missing_ok=True)
+    return _blob_path(digest)
+
+def install_blob(blob: Path, install_path: Path) -> None:
+    """Атомарно установить бинарник из кэша в `install_path` (tmp-файл рядом + `os.replace`)."""
+    install_path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{install_path.name}.", dir=install_path.parent)
+    try:
+        with tracing.span("install", "io", path=str(install_path)), os.fdopen(fd, "wb") as dst, open(blob, "rb") as src:
+            shutil.copyfileobj(src, dst, MAX_CHUNK)
+        os.chmod(tmp_name, 0o755)
+        os.replace(tmp_name, install_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+
+def release_artifacts() -> tuple[Artifact, Artifact]:
+    """Описание релизных артефактов `sslocal` и `tun2socks` для текущей архитектуры."""
+    ss_arch, t2s_arch = get_architecture()
+    ss_file = f"shadowsocks-v{SS_VERSION}.{ss_arch}-unknown-linux-gnu.tar.xz"
+    t2s_file = f"tun2socks-linux-{t2s_arch}.zip"
+    return (
+        Artifact(
+            name="sslocal",
+            version=SS_VERSION,
+            arch=ss_arch,
+            path=f"shadowsocks/shadowsocks-rust/releases/download/v{SS_VERSION}/{ss_file}",
+            member="sslocal",
+            checksum=True,
+        ),
+        Artifact(
+            name="tun2socks",
+            version=T2S_VERSION,
+            arch=t2s_arch,
+            # В архиве лежит файл tun2socks-linux-amd64, нам надо его переименовать
+            path=f"xjasonlyu/tun2socks/releases/download/{T2S_VERSION}/{t2s_file}",
+            member=f"tun2socks-linux-{t2s_arch}",
+        ),
+    )
+
+def _installed_versions_path(bin_dir: Path) -> Path:
+    return bin_dir / ".versions.json"
+
+def _install_artifact(artifact: Artifact, bin_dir: Path, progress: Progress) -> Path:
+    """
+    Установить артефакт в `bin_dir`, если его там нет или там другая версия.
+
+    Бинарник из `PATH` (вне `bin_dir`) считается установленным пользователем и не трогается.
+    """
+    install_path = bin_dir / artifact.name
+    versions = read_json(_installed_versions_path(bin_dir)) or {}
+    existing = find_binary(artifact.name, bin_dir)
+    if existing and (Path(existing) != install_path or versions.get(artifact.name) in (None, artifact.key)):
+        return Path(existing)
+
+    console.print(f"[yellow]{artifact.name}: устанавливаем {artifact.version}...[/yellow]")
+    with tracing.span(f"install {artifact.name}", version=artifact.version):
+        blob = fetch_artifact(artifact, progress)
+        install_blob(blob, install_path)
+    console.print(f"[green]{artifact.name} установлен в {install_path}[/green]")
+    return install_path
+
+def check_and_install_deps() -> dict[str, Path]:
+    """Проверить наличие `sslocal`/`tun2socks` и установить их при необходимости (параллельно)."""
+    bin_dir = get_bin_dir()
+    artifacts = release_artifacts()
+    paths: dict[str, Path] = {}
+    errors: list[str] = []
+    with Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        transient=True,
+    ) as progress:
+        with ThreadPoolExecutor(max_workers=len(artifacts)) as pool:
+            futures = {a.name: pool.submit(_install_artifact, a, bin_dir, progress) for a in artifacts}
+            for name, future in futures.items():
+                try:
+                    paths[name] = future.result()
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+    if errors:
+        for err in errors:
+            console.print(f"[bold red]Ошибка установки[/bold red] {err}")
+        sys.exit(1)
+
+    versions = read_json(_installed_versions_path(bin_dir)) or {}
+    for artifact in artifacts:
+        if paths[artifact.name] == bin_dir / artifact.name:
+            versions[artifact.name] = artifact.key
+    if versions:
+        write_json_atomic(_installed_versions_path(bin_dir), versions)
+
+    ensure_bin_dir_in_path(bin_dir)
+    return {"bin_dir": bin_dir, "sslocal": paths["sslocal"], "tun2socks": paths["tun2socks"]}
@@ -0,0 +1,204 @@
+"""
+Журнал ресурсов, которые создал `start`: `<state_dir>/journal.json`.
+
+Каждый ресурс записывается (атомарной перезаписью файла) в момент создания, в порядке создания:
+
+- `process` — дочерний процесс: pid и время старта из `/proc/<pid>/stat` (чужой процесс с тем же
+  pid после перезагрузки или переполнения счётчика не совпадёт по времени старта и не будет убит)
+- `link` — TUN-интерфейс (пишется до создания: упасть между созданием и записью нельзя)
+- `pin` — маршрут до сервера через исходный шлюз
+- `routes` — маршруты и правила туннеля (сам набор хранит `RouteTable` в своём файле состояния)
+- `sysctl` — изменённый sysctl и его прежнее значение
+- `file` — переписанный системный файл (`/etc/resolv.conf` для DNS-стаба): прежнее содержимое
+  или цель симлинка
+
+Остановка демона, `stop` без демона и `recover` после `kill -9`/потери питания снимают ровно эти
+ресурсы — за один проход в обратном порядке, ничего чужого не трогая. Запись, которую снять не
+удалось, остаётся в журнале для повторного `recover`.
+"""
+
+import os
+import signal
+import time
+from pathlib import Path
+
+from vpn_cli.network import NetBackend, gateway_route
+from vpn_cli.routes import RouteTable
+from vpn_cli.utils import get_state_dir, read_json, write_json_atomic
+
+STATE_FILENAME = "journal.json"
+
+def process_start_time(pid: int) -> int | None:
+    """Время старта процесса в тиках с загрузки (поле 22 `/proc/<pid>/stat`); `None` — процесса нет."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except (OSError, IndexError):
+        return None
+    # После `)` идёт поле 3 (state), значит поле 22 — индекс 19; зомби считаем завершённым
+    if fields[0] == "Z":
+        return None
+    return int(fields[19])
+
+def process_matches(pid: int, start: int | None) -> bool:
+    """Жив ли именно тот процесс, что был записан (pid + время старта)."""
+    return start is not None and process_start_time(pid) == start
+
+def restore_file(path: Path, content: str | None, symlink: str | None) -> None:
+    """Вернуть файл как был: симлинк, прежнее содержимое или отсутствие файла."""
+    if symlink is not None:
+        tmp = path.with_name(f".{path.name}.my-vpn.tmp")
+        tmp.unlink(missing_ok=True)
+        tmp.symlink_to(symlink)
+        os.replace(tmp, path)
+    elif content is not None:
+        path.write_text(content)
+    else:
+        path.unlink(missing_ok=True)
+
+class Journal:
+    """Упорядоченный список созданных ресурсов; записи с одинаковыми `(kind, key)` заменяются на месте."""
+
+    def __init__(self, path: Path | None = None) -> None:
+        self.path = path if path is not None else get_state_dir() / STATE_FILENAME
+        self.meta: dict = {}
+        self.entries: list[dict] = []
+
+    @classmethod
+    def load(cls, path: Path | None = None) -> "Journal | None":
+        journal = cls(path)
+        data = read_json(journal.path)
+        if not isinstance(data, dict) or not isinstance(data.get("entries"), list):
+            return None
+        journal.entries = [e for e in data.pop("entries") if isinstance(e, dict) and "kind" in e]
+        journal.meta = data
+        return journal
+
+    def begin(self, **meta) -> None:
+        """Начать журнал заново для текущего процесса (`meta` — например, исходный шлюз)."""
+        pid = os.getpid()
+        self.meta = {"pid": pid, "pid_start": process_start_time(pid), "started": time.time(), **meta}
+        self.entries = []
+        self.save()
+
+    def owner_alive(self) -> bool:
+        """Жив ли процесс `my-vpn`, который вёл журнал."""
+        return process_matches(int(self.meta.get("pid") or 0), self.meta.get("pid_start"))
+
+    def set(self, **meta) -> None:
+        self.meta.update(meta)
+        self.save()
+
+    def record(self, kind: str, key: str, **fields) -> None:
+        entry = {"kind": kind, "key": str(key), **fields}
+        for i, old in enumerate(self.entries):
+            if old["kind"] == kind and old["key"] == entry["key"]:
+                if old == entry:
+                    return
+                self.entries[i] = entry
+                break
+        else:
+            self.entries.append(entry)
+        self.save()
+
+    def record_process(self, name: str, pid: int) -> None:
+        self.record("process", name, pid=pid, start=process_start_time(pid))
+
+    def forget(self, kind: str, key: str) -> None:
+        before = len(self.entries)
+        self.entries = [e for e in self.entries if not (e["kind"] == kind and e["key"] == str(key))]
+        if len(self.entries) != before:
+            self.save()
+
+    def save(self) -> None:
+        try:
+            write_json_atomic(self.path, {**self.meta, "entries": self.entries})
+        except OSError:
+            pass
+
+    def undo(self, net: NetBackend, timeout: float = 3.0) -> list[tuple[dict, str | None]]:
+        """
+        Снять ресурсы в обратном порядке. Процессам шлётся SIGTERM по ходу прохода, а дожидаются их
+        (и добивают SIGKILL) в конце — один общий таймаут вместо ожидания каждого по очереди.
+        Возвращает `(запись, ошибка или None)`; журнал удаляется, если всё снято.
+        """
+        report: list[tuple[dict, str | None]] = []
+        failed: list[dict] = []
+        signalled: list[dict] = []
+        for entry in reversed(self.entries):
+            try:
+                if self._undo_entry(entry, net):
+                    signalled.append(entry)
+                report.append((entry, None))
+            except Exception as e:
+                report.append((entry, str(e) or type(e).__name__))
+                failed.append(entry)
+        deadline = time.monotonic() + timeout
+        while signalled and time.monotonic() < deadline:
+            signalled = [e for e in signalled if process_matches(e["pid"], e["start"])]
+            if signalled:
+                time.sleep(0.02)
+        for entry in signalled:
+            try:
+                os.kill(entry["pid"], signal.SIGKILL)
+            except OSError:
+                pass
+
+        self.entries = [e for e in self.entries if e in failed]
+        if self.entries:
+            self.save()
+        else:
+            self.close()
+        return report
+
+    @staticmethod
+    def _undo_entry(entry: dict, net: NetBackend) -> bool:
+        """Снять один ресурс; `True` — процессу отправлен SIGTERM и его надо дождаться."""
+        kind, key = entry["kind"], entry["key"]
+        if kind == "process":
+            if not process_matches(entry["pid"], entry.get("start")):
+                return False
+            os.kill(entry["pid"], signal.SIGTERM)
+            return True
+        if kind == "link":
+            net.delete_link(key)
+        elif kind == "pin":
+            net.delete_routes([gateway_route(key, entry.get("via"))])
+        elif kind == "routes":
+            table = RouteTable(net, Path(key))
+            table.load()
+            table.clear()
+        elif kind == "sysctl":
+            if entry.get("value") is not None:
+                Path(key).write_text(str(entry["value"]))
+        elif kind == "file":
+            restore_file(Path(key), entry.get("content"), entry.get("symlink"))
+        else:
+            raise ValueError(f"неизвестная запись журнала: {kind}")
+        return False
+
+    def close(self) -> None:
+        """Все ресурсы сняты — журнал больше не нужен."""
+        self.entries = []
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+def describe(entry: dict) -> str:
+    """Одна запись журнала для вывода `recover`."""
+    kind, key = entry["kind"], entry["key"]
+    if kind == "process":
+        return f"процесс {key} (pid {entry.get('pid')})"
+    if kind == "link":
+        return f"интерфейс {key}"
+    if kind == "pin":
+        route = gateway_route(key, entry.get("via"))
+        return f"маршрут {key} dev {route.dev}" if route.dev else f"маршрут {key} via {route.via}"
+    if kind == "routes":
+        return "маршруты и правила туннеля"
+    if kind == "sysctl":
+        return f"{key} = {entry.get('value')}"
+    if kind == "file":
+        return f"файл {key}" + (f" -> {entry['symlink']}" if entry.get("symlink") else "")
+    return f"{kind} {key}"
@@ -0,0 +1,439 @@
+"""
+Логи `sslocal`/`tun2socks`: насос между детьми и диском.
+
+Дети пишут в пайпы, фоновый поток читает их через `selectors`, дописывает в файл
+буферизованно (сброс — раз за проход цикла, а не на каждую строку), ротирует файл по размеру
+и возрасту и держит в памяти кольцо последних строк. Строки разбираются на события
+(сбросы и отказы соединений, таймауты, ошибки UDP ASSOCIATE и т.п.) со счётчиками —
+их видно в `status`/`stats`/Prometheus без grep по гигабайтам логов.
+
+`follow` — хвост файлов через inotify (с переходом на новый файл после ротации).
+"""
+
+import os
+import re
+import selectors
+import struct
+import threading
+import time
+from collections import deque
+from typing import IO, Callable
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_MAX_AGE = 24 * 3600.0
+DEFAULT_BACKUPS = 3
+DEFAULT_RING_LINES = 1000
+RECENT_EVENTS = 200
+READ_CHUNK = 64 * 1024
+# Строка без перевода строки длиннее этого режется (защита от бесконечной строки в памяти)
+MAX_LINE = 16 * 1024
+
+# Порядок важен: строка относится к первому подошедшему событию
+EVENT_PATTERNS: list[tuple[str, str]] = [
+    ("udp_associate_failed", r"associat\w*\W.*(?:fail|error|refus|timed? ?out)|(?:fail|error)\w*\W.*associat"),
+    ("conn_reset", r"reset by peer|connection reset|econnreset|os error 104"),
+    ("conn_refused", r"connection refused|econnrefused|os error 111"),
+    ("timeout", r"timed out|i/o timeout|deadline exceeded|os error 110"),
+    ("unreachable", r"no route to host|network is unreachable|host is unreachable|os error 11[03]|os error 101"),
+    ("dns_error", r"no such host|(?:dns|resolv)\w*\W.*(?:fail|error)"),
+    ("broken_pipe", r"broken pipe|os error 32\b"),
+    ("error", r"\berror\b|\berr\b|\bfatal\b|\bpanic\b"),
+    ("warning", r"\bwarn(?:ing)?\b"),
+]
+_EVENT_RES = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in EVENT_PATTERNS]
+# Одна общая регулярка отсекает обычные строки за один проход
+_ANY_EVENT = re.compile("|".join(f"(?:{p})" for _, p in EVENT_PATTERNS), re.IGNORECASE)
+
+def classify(line: str) -> str | None:
+    """Тип события для строки лога (или `None`, если это обычная строка)."""
+    if not _ANY_EVENT.search(line):
+        return None
+    for name, regex in _EVENT_RES:
+        if regex.search(line):
+            return name
+    return None
+
+class RotatingLog:
+    """
+    Файл лога с ротацией `path` -> `path.1` -> ... -> `path.<backups>` по размеру и возрасту.
+    Запись буферизована; `flush()` вызывает насос.
+    """
+
+    def __init__(self, path: str, max_bytes: int = DEFAULT_MAX_BYTES, max_age: float = DEFAULT_MAX_AGE, backups: int = DEFAULT_BACKUPS) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.rotations = 0
+        self.f: IO[bytes] | None = None
+        self.size = 0
+        self.opened_at = 0.0
+        self._open()
+
+    def _open(self) -> None:
+        self.f = open(self.path, "ab")
+        self.size = os.fstat(self.f.fileno()).st_size
+        self.opened_at = time.time()
+
+    def _due(self) -> bool:
+        if self.max_bytes and self.size >= self.max_bytes:
+            return True
+        return bool(self.max_age) and self.size > 0 and time.time() - self.opened_at >= self.max_age
+
+    def rotate(self) -> None:
+        if self.f is not None:
+            self.f.close()
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                try:
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+                except FileNotFoundError:
+                    pass
+            try:
+                os.replace(self.path, f"{self.path}.1")
+            except FileNotFoundError:
+                pass
+        else:
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self.rotations += 1
+        self.f = open(self.path, "ab")
+        self.size = 0
+        self.opened_at = time.time()
+
+    def write(self, data: bytes) -> None:
+        if self.f is None:
+            return
+        if self._due():
+            self.rotate()
+        self.f.write(data)
+        self.size += len(data)
+
+    def flush(self) -> None:
+        if self.f is not None:
+            self.f.flush()
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+class LogPump:
+    """
+    Фоновый поток, читающий пайпы stdout/stderr компонентов.
+
+    `add(name, path)` — файл компонента; `attach(name, pipe)` — пайп только что запущенного
+    процесса (после перезапуска — новый, старый закроется сам по EOF).
+    """
+
+    def __init__(
+        self,
+        *,
+        ring_lines: int = DEFAULT_RING_LINES,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        max_age: float = DEFAULT_MAX_AGE,
+        backups: int = DEFAULT_BACKUPS,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.ring: deque = deque(maxlen=ring_lines)  # (ts, component, line)
+        self.recent: deque = deque(maxlen=RECENT_EVENTS)  # (ts, component, event, line)
+        self.counters: dict[str, dict[str, int]] = {}
+        self.lines: dict[str, int] = {}
+        self.files: dict[str, RotatingLog] = {}
+        self._partial: dict[int, bytes] = {}
+        self._selector = selectors.DefaultSelector()
+        self._lock = threading.Lock()
+        self._pending: list[tuple[str, IO[bytes]]] = []
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._deadline: float | None = None
+        self._thread: threading.Thread | None = None
+
+    def add(self, name: str, path: str) -> None:
+        # Компонент мог уже быть (снова тот же слот после `switch`) — файл и счётчики остаются
+        if name not in self.files:
+            self.files[name] = RotatingLog(path, self.max_bytes, self.max_age, self.backups)
+        self.counters.setdefault(name, {})
+        self.lines.setdefault(name, 0)
+
+    def attach(self, name: str, pipe: IO[bytes]) -> None:
+        """Начать читать `pipe` компонента `name` (можно звать из любого потока)."""
+        with self._lock:
+            self._pending.append((name, pipe))
+        self._wake()
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="log-pump", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 1.0) -> None:
+        """Дочитать пайпы (дети уже остановлены) не дольше `timeout` и закрыть файлы."""
+        self._deadline = time.monotonic() + timeout
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout + 0.5)
+        else:
+            self._selector.close()
+            os.close(self._wake_r)
+            os.close(self._wake_w)
+        for log in self.files.values():
+            log.close()
+
+    # --- данные для status/stats/logs ---
+
+    def tail(self, n: int = 100, component: str | None = None) -> list[dict]:
+        lines = [r for r in list(self.ring) if component is None or r[1] == component]
+        return [{"ts": ts, "component": comp, "line": line} for ts, comp, line in lines[-n:]] if n > 0 else []
+
+    def events(self, n: int = 20) -> dict:
+        recent = list(self.recent)[-n:] if n > 0 else []
+        return {
+            "counters": {name: dict(c) for name, c in list(self.counters.items())},
+            "lines": dict(self.lines),
+            "rotations": {name: log.rotations for name, log in self.files.items()},
+            "recent": [{"ts": ts, "component": comp, "event": ev, "line": line} for ts, comp, ev, line in recent],
+        }
+
+    # --- поток ---
+
+    def _wake(self) -> None:
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    def _registered_pipes(self) -> int:
+        return len(self._selector.get_map()) - 1
+
+    def _run(self) -> None:
+        try:
+            while True:
+                timeout = None
+                if self._deadline is not None:
+                    timeout = self._deadline - time.monotonic()
+                    if timeout <= 0 or not self._registered_pipes():
+                        break
+                for key, _ in self._selector.select(timeout):
+                    if key.data is None:
+                        self._drain_wake()
+                    else:
+                        self._read(key.fileobj, key.data)
+                for log in self.files.values():
+                    log.flush()
+        finally:
+            for key in list(self._selector.get_map().values()):
+                if key.data is not None:
+                    self._close(key.fileobj)
+            self._selector.close()
+            for fd in (self._wake_r, self._wake_w):
+                try:
+                    os.close(fd)
+                except OSError:
+                    pass
+
+    def _drain_wake(self) -> None:
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for name, pipe in pending:
+            os.set_blocking(pipe.fileno(), False)
+            self._selector.register(pipe, selectors.EVENT_READ, name)
+
+    def _close(self, pipe: IO[bytes]) -> None:
+        try:
+            self._selector.unregister(pipe)
+        except (KeyError, ValueError):
+            pass
+        pipe.close()
+
+    def _read(self, pipe: IO[bytes], name: str) -> None:
+        fd = pipe.fileno()
+        try:
+            data = os.read(fd, READ_CHUNK)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+        if not data:
+            rest = self._partial.pop(fd, b"")
+            if rest:
+                self._emit(name, rest + b"\n")
+            self._close(pipe)
+            return
+        # В файл и разбор идут только целые строки: ротация не режет строку пополам
+        buf = self._partial.pop(fd, b"") + data
+        cut = buf.rfind(b"\n") + 1
+        if not cut and len(buf) > MAX_LINE:
+            buf += b"\n"
+            cut = len(buf)
+        if cut < len(buf):
+            self._partial[fd] = buf[cut:]
+        if cut:
+            self._emit(name, buf[:cut])
+
+    def _emit(self, name: str, chunk: bytes) -> None:
+        log = self.files.get(name)
+        if log is not None:
+            log.write(chunk)
+        lines = chunk[:-1].split(b"\n")
+        now = time.time()
+        counters = self.counters.setdefault(name, {})
+        self.lines[name] = self.lines.get(name, 0) + len(lines)
+        for raw in lines:
+            line = raw.decode("utf-8", errors="replace").rstrip("\r")
+            self.ring.append((now, name, line))
+            event = classify(line)
+            if event is not None:
+                counters[event] = counters.get(event, 0) + 1
+                self.recent.append((now, name, event, line))
+
+# --- чтение файлов (без запущенного демона) и follow ---
+
+def tail_file(path: str, n: int) -> list[str]:
+    """Последние `n` строк файла: чтение с конца блоками, без прохода по всему файлу."""
+    try:
+        f = open(path, "rb")
+    except OSError:
+        return []
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        pos, data = end, b""
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(64 * 1024, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    return lines[-n:]
+
+# inotify(7)
+IN_MODIFY = 0x00000002
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """Минимальная обёртка над inotify через libc (ctypes загружается только для `follow`)."""
+
+    def __init__(self) -> None:
+        import ctypes
+        import ctypes.util
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+
+    def add_watch(self, path: str, mask: int) -> int:
+        import ctypes
+
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch {path}")
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> list[tuple[int, int, str]]:
+        """Блокирующе прочитать пачку событий: `(wd, mask, name)`."""
+        data = os.read(self.fd, 64 * 1024)
+        events, pos = [], 0
+        while pos + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, pos)
+            pos += _EVENT_HEADER.size
+            name = data[pos : pos + length].rstrip(b"\0").decode(errors="replace")
+            pos += length
+            events.append((wd, mask, name))
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+class _Followed:
+    def __init__(self, name: str, path: str) -> None:
+        self.name = name
+        self.path = path
+        self.f: IO[bytes] | None = None
+        self.wd: int | None = None
+        self.partial = b""
+
+    def stale(self) -> bool:
+        """По пути лежит уже другой файл (ротация) или файл появился, а мы его ещё не открыли."""
+        try:
+            return self.f is None or os.fstat(self.f.fileno()).st_ino != os.stat(self.path).st_ino
+        except OSError:
+            return False  # файла пока нет — дождёмся IN_CREATE
+
+    def reopen(self, inotify: Inotify, from_end: bool) -> None:
+        if self.wd is not None:
+            inotify.rm_watch(self.wd)
+            self.wd = None
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+        self.partial = b""
+        try:
+            self.f = open(self.path, "rb")
+        except OSError:
+            return
+        if from_end:
+            self.f.seek(0, os.SEEK_END)
+        self.wd = inotify.add_watch(self.path, IN_MODIFY | IN_MOVE_SELF | IN_DELETE_SELF)
+
+    def read_lines(self) -> list[str]:
+        if self.f is None:
+            return []
+        data = self.partial + self.f.read()
+        lines = data.split(b"\n")
+        self.partial = lines.pop()
+        return [line.decode("utf-8", errors="replace") for line in lines]
+
+def follow(files: dict[str, str], emit: Callable[[str, str], None]) -> None:
+    """
+    Выдавать новые строки файлов `{компонент: путь}` по мере появления (`emit(компонент, строка)`).
+
+    Файлы и их каталоги наблюдаются через inotify (никакого перечитывания по таймеру); после
+    ротации старый файл дочитывается, и хвост переходит на новый. Работает до Ctrl+C.
+    """
+    inotify = Inotify()
+    followed = [_Followed(name, path) for name, path in files.items()]
+    dirs: dict[int, str] = {}
+    try:
+        for item in followed:
+            item.reopen(inotify, from_end=True)
+        for directory in {os.path.dirname(os.path.abspath(p)) for p in files.values()}:
+            dirs[inotify.add_watch(directory, IN_CREATE | IN_MOVED_TO)] = directory
+        while True:
+            touched: dict[int, _Followed] = {}
+            for wd, _, name in inotify.read():
+                for i, item in enumerate(followed):
+                    if item.wd == wd or (
+                        wd in dirs and os.path.abspath(item.path) == os.path.join(dirs[wd], name)
+                    ):
+                        touched[i] = item
+            for item in touched.values():
+                for line in item.read_lines():
+                    emit(item.name, line)
+                if item.stale():
+                    item.reopen(inotify, from_end=False)
+                    for line in item.read_lines():
+                        emit(item.name, line)
+    finally:
+        for item in followed:
+            if item.f is not None:
+                item.f.close()
+        inotify.close()
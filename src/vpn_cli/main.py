@@ -1,49 +1,172 @@
+import contextlib
+import json
 import os
+import re
+import signal
 import sys
-import time
 import subprocess
-import socket
-import base64
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable
 
 import typer
-from dotenv import find_dotenv, load_dotenv
 from rich.console import Console
 from rich.panel import Panel
+from rich.table import Table
 
+from vpn_cli.cli import (
+    format_components as _format_components,
+    format_daemon_status,
+    format_dns as _format_dns,
+    format_pool as _format_pool,
+    format_quality,
+    format_events as _format_events,
+    format_routes as _format_routes,
+    load_env as _load_env,
+    wait_pid_exit as _wait_pid_exit,
+)
+from vpn_cli import tracing
+from vpn_cli.daemon import ControlError, ControlServer, Reply, request as daemon_request
+from vpn_cli.gateway import GatewayWatcher
+from vpn_cli.journal import Journal, describe as describe_journal_entry
+from vpn_cli.logs import LogPump, follow, tail_file
+from vpn_cli.metrics import MetricsSampler, MetricsServer, read_iface_counters, render_prometheus
+from vpn_cli.network import NetBackend, Route, gateway_route, get_backend, validate_dev, validate_ip
+from vpn_cli.routes import CompiledList, RouteTable, desired_routes, load_split_lists, read_route_stats
+from vpn_cli.readiness import (
+    PhaseTimer,
+    ReadinessError,
+    socks5_handshake,
+    tun2socks_attached,
+    tun_carrier,
+    wait_port_free,
+    wait_socks_ready,
+    wait_tun2socks_attached,
+    wait_tun_carrier,
+)
+from vpn_cli.tunnels import (
+    DEFAULT_TABLE as DEFAULT_TUNNEL_TABLE,
+    HASH_POLICY_PATH,
+    L4_HASH_POLICY,
+    TunQueues,
+    drain_routes,
+    drain_rules,
+    plan_tunnels,
+    set_multipath_hash_policy,
+    table_routes,
+    table_rules,
+    tun_addrs,
+    tun_devs,
+)
+from vpn_cli.placement import ENV_SSLOCAL_CPUS, ENV_TUN2SOCKS_CPUS, Placement, placement_from_env, split_cpus
+from vpn_cli.tuning import (
+    TUN_DEFAULT_MTU,
+    TUN_DEFAULT_TXQUEUELEN,
+    Tunables,
+    from_dict as from_tunables_dict,
+    get_profile,
+    load_profiles,
+    profile_servers,
+    resolve_tunables,
+    sslocal_args,
+    to_dict as tunables_dict,
+    tun2socks_args,
+    tun2socks_env,
+)
+from vpn_cli.supervisor import Component, Supervisor, SupervisorError, read_supervisor_state
+from vpn_cli.servers import load_server_urls, parse_ss_url, server_label
 from vpn_cli.utils import (
-    check_and_install_deps,
     ensure_bin_dir_in_path,
     find_binary,
     get_bin_dir,
-    get_env_file,
 )
 
+if TYPE_CHECKING:
+    from vpn_cli.dns import DnsStub
+    from vpn_cli.pool import UpstreamPool
+    from vpn_cli.quality import QualityMonitor
+
 app = typer.Typer(help="Personal VPN manager wrapping Shadowsocks & Tun2Socks")
 console = Console()
 
-def _load_env(env_file: str | None) -> None:
-    """Загрузить конфигурацию из `.env` по приоритетам CLI/окружения."""
-    if env_file:
-        load_dotenv(env_file)
-        return
-    default_env = get_env_file()
-    if default_env:
-        load_dotenv(default_env)
-        return
-    auto = find_dotenv(usecwd=True)
-    if auto:
-        load_dotenv(auto)
+# Тяжёлые модули (asyncio, requests в установщике, бенчмарк) импортируются внутри команд,
+# которым они нужны: `status`/`stop` не должны платить за них при каждом запуске.
+
+# `--env-file` из командной строки (нужен для `reload` в долгоживущем процессе)
+_env_file_opt: str | None = None
+
+LOG_PATHS = {"sslocal": "/tmp/my-vpn-sslocal.log", "tun2socks": "/tmp/my-vpn-tun2socks.log"}
+DAEMON_LOG_PATH = "/tmp/my-vpn-daemon.log"
+_COMPONENT_RE = re.compile(r"^(sslocal(-\d+)?|tun2socks(-\d+)?(\.q\d+)?)$")
 
 @app.callback()
 def _main(
+    ctx: typer.Context,
     env_file: str | None = typer.Option(
         None,
         "--env-file",
         help="Path to .env (default: $XDG_CONFIG_HOME/my-vpn/.env, then search upward from current directory)",
     ),
+    trace: str | None = typer.Option(
+        None, "--trace", help="Записать трассу фаз и внешних команд в Chrome trace JSON (env MY_VPN_TRACE)"
+    ),
+    trace_summary: bool = typer.Option(False, "--trace-summary", help="Сводка трассы по фазам в stderr"),
 ):
     """Точка входа CLI: подгружает `.env` перед выполнением команды."""
+    global _env_file_opt
+    _env_file_opt = env_file
+    t0 = tracing.now_us()
     _load_env(env_file)
+    trace = trace or os.getenv(tracing.ENV_TRACE) or None
+    if trace or trace_summary:
+        tracer = tracing.enable(trace, trace_summary)
+        tracer.add(".env", "phase", t0, tracing.now_us() - t0, {"env_file": env_file} if env_file else None)
+        tracer.command = (ctx.invoked_subcommand or "", t0)
+        ctx.call_on_close(_finish_trace)
+
+def _print_trace_summary(tracer: tracing.Tracer) -> None:
+    """Сводка трассы в stderr (stdout может быть JSON команды)."""
+    table = Table(title="Trace")
+    table.add_column("span")
+    table.add_column("kind")
+    table.add_column("calls", justify="right")
+    table.add_column("failed", justify="right")
+    table.add_column("total ms", justify="right")
+    table.add_column("max ms", justify="right")
+    for row in tracer.rows():
+        table.add_row(
+            row["name"],
+            row["cat"],
+            str(row["calls"]),
+            str(row["failed"] or ""),
+            f"{row['total_ms']:.1f}",
+            f"{row['max_ms']:.1f}",
+        )
+    if tracer.dropped:
+        table.caption = f"спанов сверх предела: {tracer.dropped}"
+    Console(stderr=True).print(table)
+    tracer.summary_printed = True
+
+def _trace_checkpoint() -> None:
+    """Записать трассу сейчас (готовность `start`: дальше демон может жить сколько угодно)."""
+    tracer = tracing.tracer()
+    if tracer is None:
+        return
+    try:
+        tracer.write()
+    except OSError as e:
+        console.print(f"[yellow]Трасса не записана: {e}[/yellow]")
+    if tracer.summary and not tracer.summary_printed:
+        _print_trace_summary(tracer)
+
+def _finish_trace() -> None:
+    tracer = tracing.tracer()
+    if tracer is None:
+        return
+    name, t0 = tracer.command
+    tracer.add(f"my-vpn {name}".strip(), "command", t0, tracing.now_us() - t0, {"argv": tracing.redact(sys.argv[1:])})
+    _trace_checkpoint()
 
 def _get_tun_dev() -> str:
     """Имя TUN-интерфейса (по умолчанию `tun0`)."""
@@ -60,18 +183,117 @@ def _get_socks_port() -> int:
     except ValueError:
         return 1080
 
+def _get_float_env(name: str, default: float) -> float:
+    """Прочитать положительное число с плавающей точкой из окружения (с дефолтом при ошибке)."""
+    try:
+        value = float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+def _get_socks_timeout() -> float:
+    """Сколько ждать готовности SOCKS5 от `sslocal`, сек (по умолчанию `5`)."""
+    return _get_float_env("SOCKS_READY_TIMEOUT", 5.0)
+
+def _get_tun_timeout() -> float:
+    """Сколько ждать подключения `tun2socks` к TUN и carrier, сек (по умолчанию `5`)."""
+    return _get_float_env("TUN_READY_TIMEOUT", 5.0)
+
+def _get_int_env(name: str, default: int) -> int:
+    """Прочитать неотрицательное целое из окружения (с дефолтом при ошибке)."""
+    try:
+        value = int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+    return value if value >= 0 else default
+
+def _get_bool_env(name: str, default: bool = False) -> bool:
+    """Флаг из окружения: `1`/`true`/`yes`/`on` или `0`/`false`/`no`/`off` (иначе — дефолт)."""
+    value = os.getenv(name, "").strip().lower()
+    if value in ("1", "true", "yes", "on"):
+        return True
+    if value in ("0", "false", "no", "off"):
+        return False
+    return default
+
+def _get_tunnel_count() -> int:
+    """Сколько туннелей поднимать (env `TUNNELS`, по умолчанию `1`)."""
+    return max(1, _get_int_env("TUNNELS", 1))
+
 def _reexec_with_sudo() -> None:
     """Перезапустить текущую команду через `sudo`, сохранив нужные переменные окружения."""
     preserve = ",".join(
         [
             "SS_URL",
+            "SS_URLS",
+            "SS_SUBSCRIPTION",
+            "PROBE_CACHE_TTL",
+            "RESOLVE_CACHE_TTL",
+            "RESOLVE_TIMEOUT",
             "SOCKS_PORT",
             "TUN_DEV",
             "TUN_ADDR",
+            "TUNNELS",
+            "TUNNEL_TABLE",
+            "SWITCH_GRACE",
+            "DNS_STUB",
+            "DNS_LISTEN",
+            "DNS_UPSTREAM",
+            "DNS_CACHE_SIZE",
+            "DNS_NEGATIVE_TTL",
+            "DNS_TIMEOUT",
+            "QUALITY_TARGETS",
+            "QUALITY_INTERVAL",
+            "QUALITY_TIMEOUT",
+            "QUALITY_WINDOWS",
+            "UPSTREAM_POOL",
+            "POOL_MIN",
+            "POOL_MAX",
+            "POOL_MAX_IDLE",
+            "POOL_WINDOW",
+            "POOL_CONNECT_TIMEOUT",
+            "POOL_TFO",
+            "PROFILE",
+            "TUN_MTU",
+            "TUN_TXQUEUELEN",
+            "TCP_SNDBUF",
+            "TCP_RCVBUF",
+            "TCP_AUTO_TUNING",
+            "UDP_TIMEOUT",
+            "SS_TCP_NO_DELAY",
+            "SS_TCP_FAST_OPEN",
+            "SS_SEND_BUFFER",
+            "SS_RECV_BUFFER",
+            "TUN_QUEUES",
+            "TUN2SOCKS_GOMAXPROCS",
+            "SS_WORKER_THREADS",
+            "SSLOCAL_CPUS",
+            "TUN2SOCKS_CPUS",
+            "DATAPATH_NICE",
+            "DATAPATH_IOPRIO",
+            "SOCKS_READY_TIMEOUT",
+            "TUN_READY_TIMEOUT",
+            "NET_BACKEND",
+            "SPLIT_INCLUDE",
+            "SPLIT_EXCLUDE",
+            "METRICS_PORT",
+            "METRICS_INTERVAL",
+            "LOG_MAX_BYTES",
+            "LOG_MAX_AGE",
+            "LOG_BACKUPS",
+            "LOG_RING_LINES",
+            "RESTART_MAX",
+            "RESTART_WINDOW",
+            "RESTART_BACKOFF_MAX",
             "MY_VPN_ENV_FILE",
             "MY_VPN_BIN_DIR",
             "XDG_CONFIG_HOME",
             "XDG_DATA_HOME",
+            "XDG_CACHE_HOME",
+            "XDG_STATE_HOME",
+            "MY_VPN_CONTROL_SOCKET",
+            tracing.ENV_TRACE,
+            tracing.ENV_TRACE_PARENT,
         ]
     )
     cmd = [
@@ -84,6 +306,9 @@ def _reexec_with_sudo() -> None:
         *sys.argv[1:],
     ]
     console.print("[yellow]Нужен root. Перезапускаю через sudo...[/yellow]")
+    if tracing.tracer() is not None:
+        # Спаны этого процесса пропадут вместе с ним; новый покажет, сколько занял перезапуск
+        os.environ[tracing.ENV_TRACE_PARENT] = str(tracing.now_us())
     try:
         os.execvp(cmd[0], cmd)
     except FileNotFoundError:
@@ -99,53 +324,34 @@ def check_root(*, sudo: bool) -> None:
     console.print("[bold red]Ошибка:[/bold red] Запускайте через sudo (или уберите `--no-sudo`).")
     raise typer.Exit(code=1)
 
-def parse_ss_url(url: str):
-    """
-    Распарсить `ss://` URL из конфигурации.
-
-    Возвращает: `(host, port, method, password, server_ip)`, где `server_ip` — результат DNS-резолва (если доступен).
-    """
-    if not url:
-        raise ValueError("URL is empty")
-    url = url.replace("ss://", "").split("#")[0].split("?")[0]
-    if url.endswith("/"):
-        url = url[:-1]
-
-    if "@" not in url:
-        raise ValueError("Неверный формат ss:// (нет @)")
-
-    userinfo, host_port = url.rsplit("@", 1)
-    host, port = host_port.rsplit(":", 1)
-
-    # Base64 decode
-    userinfo += "=" * (-len(userinfo) % 4)
-    normalized = userinfo.replace("-", "+").replace("_", "/")
-    decoded = base64.b64decode(normalized).decode("utf-8")
-    method, password = decoded.split(":", 1)
-
-    # Resolve IP
-    try:
-        server_ip = socket.gethostbyname(host)
-    except socket.gaierror:
-        server_ip = host
-
-    return host, port, method, password, server_ip
-
 def kill_process_on_port(port: int):
     """Освободить TCP порт, если он занят (best-effort, без падения при ошибках)."""
     try:
         # Ищем PID, слушающий порт
-        result = subprocess.check_output(f"ss -lptn 'sport = :{port}'", shell=True).decode()
+        result = tracing.check_output(f"ss -lptn 'sport = :{port}'", shell=True).decode()
         if f":{port}" in result:
             console.print(f"[yellow]Порт {port} занят. Очищаем...[/yellow]")
-            subprocess.run(f"fuser -k {port}/tcp", shell=True, stderr=subprocess.DEVNULL)
-            time.sleep(1)
+            tracing.run(f"fuser -k {port}/tcp", shell=True, stderr=subprocess.DEVNULL)
+            if not wait_port_free(port, timeout=2.0):
+                console.print(f"[yellow]Порт {port} всё ещё занят.[/yellow]")
     except Exception:
         pass
 
+def _print_timings(timer: PhaseTimer) -> None:
+    """Вывести таблицу длительностей фаз запуска."""
+    table = Table(title="Timings")
+    table.add_column("Phase")
+    table.add_column("ms", justify="right")
+    for name, duration in timer.phases:
+        table.add_row(name, f"{duration * 1000:.1f}")
+    table.add_row("[bold]total[/bold]", f"[bold]{timer.total() * 1000:.1f}[/bold]")
+    console.print(table)
+
 @app.command("install-deps")
 def install_deps():
     """Скачать `sslocal` и `tun2socks` в user-space (portable)."""
+    from vpn_cli.installer import check_and_install_deps
+
     if os.geteuid() == 0:
         console.print("[yellow]Подсказка:[/yellow] обычно лучше запускать install-deps без sudo.")
     deps = check_and_install_deps()
@@ -156,9 +362,384 @@ def install_deps():
         )
     )
 
+def _load_urls_or_exit() -> list[str]:
+    """Список серверов из конфигурации; при ошибке/пустом списке — выход с кодом 1."""
+    try:
+        urls = load_server_urls()
+    except OSError as e:
+        console.print(f"[red]Не удалось прочитать SS_SUBSCRIPTION:[/red] {e}")
+        raise typer.Exit(code=1)
+    if not urls:
+        console.print("[red]SS_URL не найден в .env[/red] (или задай SS_URLS / SS_SUBSCRIPTION)")
+        raise typer.Exit(code=1)
+    return urls
+
+def _fmt_ms(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+@app.command("probe")
+def probe(
+    samples: int = typer.Option(5, "--samples", "-n", min=1, help="Сколько TCP-соединений на сервер"),
+    timeout: float = typer.Option(2.0, "--timeout", help="Таймаут резолва/соединения, сек"),
+    cache: bool = typer.Option(True, "--cache/--no-cache", help="Использовать кэш результатов (env PROBE_CACHE_TTL)"),
+):
+    """Измерить задержку до всех серверов параллельно и ранжировать их."""
+    from vpn_cli.probe import probe_ranked
+
+    urls = _load_urls_or_exit()
+    results, cached = probe_ranked(urls, samples=samples, timeout=timeout, use_cache=cache)
+
+    table = Table(title="Probe (cached)" if cached else "Probe")
+    table.add_column("#", justify="right")
+    table.add_column("Server")
+    table.add_column("Address")
+    table.add_column("median ms", justify="right")
+    table.add_column("jitter ms", justify="right")
+    table.add_column("loss", justify="right")
+    table.add_column("error")
+    for i, r in enumerate(results, 1):
+        table.add_row(
+            str(i) if r.ok else "-",
+            r.label,
+            r.address or "-",
+            _fmt_ms(r.median_ms),
+            _fmt_ms(r.jitter_ms),
+            f"{r.loss:.0%}",
+            r.error or "",
+        )
+    console.print(table)
+    if not any(r.ok for r in results):
+        raise typer.Exit(code=1)
+
+def _print_json(data) -> None:
+    typer.echo(json.dumps(data, ensure_ascii=False, indent=2))
+
+def _split_host_port_opt(value: str, default_port: int) -> tuple[str, int]:
+    host, sep, port = value.rpartition(":")
+    if not sep or not port.isdigit():
+        return value.strip("[]"), default_port
+    return host.strip("[]"), int(port)
+
+@app.command("bench")
+def bench(
+    offline: bool = typer.Option(False, "--offline", help="Всё локально: встроенный сервер + незашифрованная SOCKS5-заглушка апстрима"),
+    target: str | None = typer.Option(None, "--target", help="Где запущен `my-vpn bench-serve` (host[:port])"),
+    socks_port: int | None = typer.Option(None, "--socks-port", help="Порт SOCKS5 `sslocal` (по умолчанию SOCKS_PORT)"),
+    device: str | None = typer.Option(None, "--device", help="Идти напрямую через TUN (SO_BINDTODEVICE, нужен root)"),
+    tests: str = typer.Option("upload,download,connect,rtt,udp", "--tests", help="Какие тесты запускать (через запятую)"),
+    size_mb: float = typer.Option(32.0, "--size-mb", min=0.001, help="Объём для upload/download, МиБ"),
+    streams: int = typer.Option(1, "--streams", min=1, help="Параллельных соединений в upload/download (объём делится поровну)"),
+    connections: int = typer.Option(200, "--connections", min=1, help="Сколько соединений в тесте connect"),
+    concurrency: int = typer.Option(16, "--concurrency", min=1, help="Параллельных соединений в тесте connect"),
+    pings: int = typer.Option(1000, "--pings", min=1, help="Запросов в тесте RTT"),
+    udp_count: int = typer.Option(1000, "--udp-count", min=1, help="Датаграмм в тесте UDP"),
+    timeout: float = typer.Option(10.0, "--timeout", help="Таймаут отдельной операции, сек"),
+    output: str | None = typer.Option(None, "--output", "-o", help="Сохранить результат в JSON-файл"),
+    baseline: str | None = typer.Option(None, "--baseline", help="JSON прошлого прогона для сравнения"),
+    tolerance: float = typer.Option(0.1, "--tolerance", help="Допустимое ухудшение относительно baseline (доля)"),
+    json_out: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+):
+    """Бенчмарк цепочки SOCKS/TUN: пропускная способность, соединения/с, RTT, UDP."""
+    import asyncio
+
+    from vpn_cli.bench import DEFAULT_PORT, TESTS, BenchConfig, compare, run_bench, save_report
+
+    selected = tuple(t.strip() for t in tests.split(",") if t.strip())
+    unknown = [t for t in selected if t not in TESTS]
+    if unknown:
+        console.print(f"[red]Неизвестные тесты:[/red] {', '.join(unknown)} (есть: {', '.join(TESTS)})")
+        raise typer.Exit(code=2)
+    if offline and (target or device or socks_port):
+        console.print("[red]--offline несовместим с --target/--device/--socks-port[/red]")
+        raise typer.Exit(code=2)
+    if not offline and not target:
+        console.print("[red]Укажи --target (где запущен `my-vpn bench-serve`) или --offline[/red]")
+        raise typer.Exit(code=2)
+
+    cfg = BenchConfig(
+        size=int(size_mb * 1024 * 1024),
+        streams=streams,
+        connections=connections,
+        concurrency=concurrency,
+        pings=pings,
+        udp_count=udp_count,
+        timeout=timeout,
+        tests=selected,
+    )
+    if target:
+        cfg.target, cfg.port = _split_host_port_opt(target, DEFAULT_PORT)
+        if device:
+            validate_dev(device)
+            cfg.device = device
+        else:
+            cfg.socks = ("127.0.0.1", socks_port or _get_socks_port())
+
+    report = asyncio.run(run_bench(cfg, offline=offline))
+    if output:
+        save_report(report, output)
+
+    regressions: list[str] = []
+    if baseline:
+        try:
+            with open(baseline) as f:
+                base = json.load(f)
+        except (OSError, ValueError) as e:
+            console.print(f"[red]Не удалось прочитать baseline:[/red] {e}")
+            raise typer.Exit(code=2)
+        regressions = compare(report.results, base.get("results", {}), tolerance)
+
+    if json_out:
+        _print_json({"meta": report.meta, "results": report.results, "errors": report.errors, "regressions": regressions})
+    else:
+        table = Table(title=f"Bench via {report.meta['via']} -> {report.meta['target']}")
+        table.add_column("metric")
+        table.add_column("value", justify="right")
+        for key, value in report.results.items():
+            table.add_row(key, f"{value:.3f}" if isinstance(value, float) else str(value))
+        console.print(table)
+        for name, err in report.errors.items():
+            console.print(f"[red]{name}:[/red] {err}")
+        for line in regressions:
+            console.print(f"[yellow]Регрессия:[/yellow] {line}")
+
+    if report.errors:
+        raise typer.Exit(code=1)
+    if regressions:
+        raise typer.Exit(code=3)
+
+@app.command("bench-serve")
+def bench_serve(
+    bind: str = typer.Option("0.0.0.0", "--bind", help="Адрес для прослушивания"),
+    port: int = typer.Option(9870, "--port", help="TCP/UDP-порт сервера бенчмарка"),
+):
+    """Запустить сервер для `bench` (на удалённой стороне туннеля)."""
+    import asyncio
+
+    from vpn_cli.bench import serve_forever
+
+    console.print(f"bench-serve: {bind}:{port} (tcp+udp), Ctrl+C для выхода")
+    try:
+        asyncio.run(serve_forever(bind, port))
+    except KeyboardInterrupt:
+        pass
+
+@app.command("bench-startup")
+def bench_startup(
+    module: str | None = typer.Option(None, "--module", help="Какой модуль импортировать (по умолчанию vpn_cli.cli)"),
+    runs: int = typer.Option(5, "--runs", min=1, help="Сколько прогонов (берётся лучший)"),
+    budget_ms: float | None = typer.Option(
+        None, "--budget-ms", help="Бюджет на импорт, мс (по умолчанию 50; 0 — не проверять)"
+    ),
+    json_out: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+):
+    """Время импорта точки входа CLI (`python -X importtime`); код 3, если бюджет превышен."""
+    # Умолчания — из `bench`, который сам импортируется лениво (в нём asyncio)
+    from vpn_cli.bench import STARTUP_BUDGET_MS, STARTUP_MODULE, measure_imports
+
+    module = module or STARTUP_MODULE
+    budget_ms = STARTUP_BUDGET_MS if budget_ms is None else budget_ms
+
+    try:
+        result = measure_imports(module, runs=runs)
+    except (subprocess.CalledProcessError, RuntimeError) as e:
+        console.print(f"[red]Не удалось измерить импорт {module}:[/red] {e}")
+        raise typer.Exit(code=2)
+    over = budget_ms > 0 and result["import_ms"] > budget_ms
+    result["budget_ms"] = budget_ms
+    result["over_budget"] = over
+
+    if json_out:
+        _print_json(result)
+    else:
+        table = Table(title=f"import {module}: {result['import_ms']:.1f} ms (лучший из {runs})")
+        table.add_column("module")
+        table.add_column("self ms", justify="right")
+        for row in result["heaviest"]:
+            table.add_row(row["module"], f"{row['self_ms']:.2f}")
+        console.print(table)
+        if over:
+            console.print(f"[yellow]Бюджет превышен:[/yellow] {result['import_ms']:.1f} > {budget_ms:.1f} ms")
+    if over:
+        raise typer.Exit(code=3)
+
+@app.command("profiles")
+def profiles(
+    json_out: bool = typer.Option(False, "--json", help="Вывести в JSON"),
+):
+    """Профили параметров data path (встроенные и из `profiles.json`) и итоговые значения из env."""
+    from vpn_cli.tuning import from_env, load_profiles, profiles_path
+
+    try:
+        env_values = tunables_dict(from_env())
+    except ValueError as e:
+        console.print(f"[red]Ошибка конфигурации:[/red] {e}")
+        raise typer.Exit(code=1)
+    data = {"path": str(profiles_path()), "env": env_values, "profiles": load_profiles()}
+    if json_out:
+        _print_json(data)
+        return
+    table = Table(title=f"Профили ({data['path']})")
+    table.add_column("profile")
+    table.add_column("settings")
+    table.add_row("(env)", _format_tunables(env_values))
+    for name, values in data["profiles"].items():
+        table.add_row(name, _format_tunables(values))
+    console.print(table)
+
+def _format_tunables(values: dict) -> str:
+    from vpn_cli.tuning import PROFILE_SERVER_KEY, profile_servers
+
+    settings = {k: v for k, v in values.items() if k != PROFILE_SERVER_KEY}
+    servers = profile_servers(values)
+    if servers:
+        # Ссылки `ss://` содержат пароль — показываем только имя сервера
+        settings[PROFILE_SERVER_KEY] = ",".join(server_label(s) if s.startswith("ss://") else s for s in servers)
+    return ", ".join(f"{k}={v}" for k, v in settings.items()) or "-"
+
+@app.command("autotune")
+def autotune(
+    target: str | None = typer.Option(None, "--target", help="Где запущен `my-vpn bench-serve` (host[:port])"),
+    profile: str = typer.Option("auto", "--profile", help="В какой профиль сохранить лучшую комбинацию"),
+    size_mb: float = typer.Option(8.0, "--size-mb", min=0.001, help="Объём upload/download на один прогон, МиБ"),
+    mtu_only: bool = typer.Option(False, "--mtu-only", help="Только найти path MTU до сервера"),
+    save: bool = typer.Option(True, "--save/--no-save", help="Сохранить результат в профиль"),
+    timeout: float = typer.Option(10.0, "--timeout", help="Таймаут отдельной операции бенчмарка, сек"),
+    sudo: bool = typer.Option(True, "--sudo/--no-sudo", help="Auto-reexec via sudo if needed"),
+    json_out: bool = typer.Option(False, "--json", help="Вывести результат в JSON"),
+):
+    """
+    Подобрать MTU и буферы: path MTU до сервера (ICMP с DF), затем перебор параметров на запущенном
+    `my-vpn` со встроенным тестом пропускной способности через TUN; лучшее — в профиль.
+    """
+    import asyncio
+
+    from vpn_cli.bench import DEFAULT_PORT, BenchConfig, run_bench
+    from vpn_cli.tuning import autotune as run_autotune, discover_path_mtu, from_dict, save_profile, sweep_stages
+
+    check_root(sudo=sudo)
+    status_resp = _daemon_or_exit("status")
+    server_ip = status_resp.get("server_ip")
+    result: dict = {"server_ip": server_ip}
+
+    pmtu = None
+    try:
+        pmtu = discover_path_mtu(server_ip)
+        result.update(path_mtu=pmtu.path_mtu, tun_mtu=pmtu.tun_mtu, pmtu_method=pmtu.method, pmtu_probes=pmtu.probes)
+    except (OSError, ValueError) as e:
+        result["pmtu_error"] = str(e)
+    if not json_out:
+        if pmtu is not None and pmtu.path_mtu:
+            console.print(
+                f"Path MTU до {server_ip}: [bold]{pmtu.path_mtu}[/bold] ({pmtu.method}, {pmtu.probes} проб), "
+                f"MTU TUN без фрагментации UDP: {pmtu.tun_mtu}"
+            )
+        else:
+            console.print(f"[yellow]Path MTU до {server_ip} не определён:[/yellow] {result.get('pmtu_error', 'нет ответа')}")
+    if mtu_only:
+        if json_out:
+            _print_json(result)
+        return
+    if not target:
+        console.print("[red]Укажи --target (где запущен `my-vpn bench-serve`) или --mtu-only[/red]")
+        raise typer.Exit(code=2)
+
+    host, port = _split_host_port_opt(target, DEFAULT_PORT)
+    devs = [t["tun_dev"] for t in status_resp.get("tunnels") or []] or [status_resp.get("tun_dev")]
+    original = from_dict(status_resp.get("tunables") or {})
+    runs: list[dict] = []
+
+    def measure(candidate: Tunables) -> float | None:
+        resp = daemon_request("tune", settings=tunables_dict(candidate))
+        if resp is None or not resp.get("ok") or not _wait_components_running(timeout):
+            return None
+        cfg = BenchConfig(
+            target=host,
+            port=port,
+            device=devs[0],
+            size=int(size_mb * 1024 * 1024),
+            timeout=timeout,
+            tests=("upload", "download"),
+        )
+        report = asyncio.run(run_bench(cfg))
+        if report.errors:
+            return None
+        return report.results["upload_mbps"] + report.results["download_mbps"]
+
+    def on_result(stage: str, value, score: float | None) -> None:
+        runs.append({"stage": stage, "value": value, "mbps": score})
+        if not json_out:
+            shown = "по умолчанию" if value is None else value
+            console.print(f"  {stage} = {shown}: " + (f"{score:.1f} Mbit/s" if score is not None else "[red]ошибка[/red]"))
+
+    best, best_score = run_autotune(original, sweep_stages(original, pmtu.tun_mtu if pmtu else None), measure, on_result)
+    result["runs"] = runs
+    if best_score is None:
+        daemon_request("tune", settings=tunables_dict(original))
+        if json_out:
+            _print_json(result)
+        else:
+            console.print("[red]Ни один прогон не удался[/red] — параметры возвращены. Проверь --target и `my-vpn bench`.")
+        raise typer.Exit(code=1)
+
+    daemon_request("tune", settings=tunables_dict(best), profile=profile)
+    result.update(best=tunables_dict(best), best_mbps=best_score, profile=profile)
+    if save:
+        result["saved"] = str(save_profile(profile, tunables_dict(best)))
+    if json_out:
+        _print_json(result)
+        return
+    console.print(f"[green]Лучшее:[/green] {_format_tunables(tunables_dict(best))} ({best_score:.1f} Mbit/s)")
+    if save:
+        console.print(f"Сохранено в профиль [bold]{profile}[/bold] ({result['saved']}): my-vpn start --profile {profile}")
+
+def _wait_components_running(timeout: float) -> bool:
+    """Дождаться, пока перезапущенные после `tune` компоненты станут готовы (`starting` -> `running`)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        resp = daemon_request("status")
+        if resp is None or not resp.get("ok"):
+            return False
+        states = [c.get("state") for c in (resp.get("components") or {}).values()]
+        if all(state == "running" for state in states):
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.1)
+
+def _daemon_or_exit(cmd: str, **params) -> dict:
+    """Запрос к запущенному `my-vpn`; если он не запущен или ответил ошибкой — выход с кодом 1."""
+    resp = daemon_request(cmd, **params)
+    if resp is None:
+        console.print("[red]my-vpn не запущен[/red] (нет управляющего сокета).")
+        raise typer.Exit(code=1)
+    if not resp.get("ok"):
+        console.print(f"[red]Ошибка:[/red] {resp.get('error')}")
+        raise typer.Exit(code=1)
+    return resp
+
 @app.command("status")
-def status():
+def status(
+    json_out: bool = typer.Option(False, "--json", help="Вывести состояние в JSON"),
+    quality: bool = typer.Option(False, "--quality", help="Пробы качества туннеля: успешность, джиттер, задержки"),
+):
     """Показать состояние: TUN-интерфейс, процессы, пути к бинарникам."""
+    resp = daemon_request("status", timeout=1.0)
+    if quality:
+        if resp is None or not resp.get("ok"):
+            console.print("[yellow]my-vpn не запущен — проб нет.[/yellow]")
+            raise typer.Exit(1)
+        if json_out:
+            _print_json(resp.get("quality"))
+            return
+        console.print(Panel(format_quality(resp.get("quality")), title="Quality"))
+        return
+    if resp is not None and resp.get("ok"):
+        if json_out:
+            _print_json(resp)
+            return
+        console.print(Panel(format_daemon_status(resp), title="Status"))
+        return
+
     tun_dev = _get_tun_dev()
     socks_port = _get_socks_port()
     bin_dir = get_bin_dir()
@@ -167,35 +748,286 @@ def status():
     ss_bin = find_binary("sslocal", bin_dir)
     tun_bin = find_binary("tun2socks", bin_dir)
 
-    tun_ok = subprocess.run(
-        f"ip link show {tun_dev}",
-        shell=True,
+    tun_ok = get_backend().link_exists(tun_dev)
+    ss_ok = tracing.run(
+        ["pgrep", "-f", f"sslocal.*:{socks_port}"],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     ).returncode == 0
-    ss_ok = subprocess.run(
-        f"pgrep -f \"sslocal.*:{socks_port}\"",
-        shell=True,
-        stdout=subprocess.DEVNULL,
-        stderr=subprocess.DEVNULL,
-    ).returncode == 0
-    t2s_ok = subprocess.run(
-        f"pgrep -f \"tun2socks.*{tun_dev}\"",
-        shell=True,
+    t2s_ok = tracing.run(
+        ["pgrep", "-f", f"tun2socks.*{tun_dev}"],
         stdout=subprocess.DEVNULL,
         stderr=subprocess.DEVNULL,
     ).returncode == 0
 
+    sup_state = read_supervisor_state()
+    route_stats = read_route_stats()
+    if json_out:
+        _print_json(
+            {
+                "ok": False,
+                "tun_dev": tun_dev,
+                "tun_up": tun_ok,
+                "sslocal_running": ss_ok,
+                "tun2socks_running": t2s_ok,
+                "components": (sup_state or {}).get("components", {}),
+                "routes": route_stats,
+            }
+        )
+        return
+
+    supervised = ""
+    if sup_state:
+        supervised = "\n" + _format_components(sup_state.get("components", {}))
+
     console.print(
         Panel(
             f"TUN_DEV: {tun_dev} ({'up' if tun_ok else 'down'})\n"
             f"sslocal: {ss_bin or 'not found'} ({'running' if ss_ok else 'stopped'})\n"
             f"tun2socks: {tun_bin or 'not found'} ({'running' if t2s_ok else 'stopped'})\n"
-            f"bin_dir: {bin_dir}",
+            f"bin_dir: {bin_dir}\n"
+            f"net backend: {get_backend().name}\n"
+            f"{_format_routes(route_stats)}"
+            f"{supervised}",
             title="Status",
         )
     )
 
+@app.command("stats")
+def stats(
+    json_out: bool = typer.Option(False, "--json", help="Вывести статистику в JSON"),
+):
+    """Счётчики трафика TUN и перезапусков (из запущенного `my-vpn`)."""
+    resp = _daemon_or_exit("stats")
+    if json_out:
+        _print_json(resp)
+        return
+    iface = resp.get("iface") or {}
+    console.print(
+        Panel(
+            f"uptime: {resp.get('uptime_s', 0):.0f}s\n"
+            f"rx: {iface.get('rx_bytes', 0)} B / {iface.get('rx_packets', 0)} pkts "
+            f"(errors {iface.get('rx_errors', 0)}, dropped {iface.get('rx_dropped', 0)})\n"
+            f"tx: {iface.get('tx_bytes', 0)} B / {iface.get('tx_packets', 0)} pkts "
+            f"(errors {iface.get('tx_errors', 0)}, dropped {iface.get('tx_dropped', 0)})\n"
+            f"{_format_dns(resp.get('dns'))}"
+            f"{_format_pool(resp.get('pool'))}"
+            f"{_format_events(resp.get('log_events'))}\n"
+            f"{_format_components(resp.get('components', {}))}",
+            title=f"Stats {resp.get('tun_dev')}",
+        )
+    )
+
+_SPARK = "▁▂▃▄▅▆▇█"
+
+def _sparkline(values: list[float], width: int = 40) -> str:
+    values = values[-width:]
+    peak = max(values, default=0.0)
+    if peak <= 0:
+        return _SPARK[0] * len(values)
+    return "".join(_SPARK[min(len(_SPARK) - 1, int(v / peak * (len(_SPARK) - 1)))] for v in values)
+
+def _fmt_bits(bytes_per_s: float) -> str:
+    bits = bytes_per_s * 8
+    for unit in ("bit/s", "Kbit/s", "Mbit/s", "Gbit/s"):
+        if bits < 1000 or unit == "Gbit/s":
+            return f"{bits:.1f} {unit}"
+        bits /= 1000
+    return f"{bits:.1f} Gbit/s"
+
+def _top_view(resp: dict) -> Table:
+    rates = resp.get("rates") or {}
+    iface = rates.get("iface") or {}
+    history = resp.get("history") or []
+
+    table = Table(
+        title=f"my-vpn top — {resp.get('tun_dev')}, uptime {resp.get('uptime_s', 0):.0f}s, окно {rates.get('window_s', 0):.1f}s",
+        expand=True,
+    )
+    table.add_column("")
+    table.add_column("rx", justify="right")
+    table.add_column("tx", justify="right")
+    table.add_row("throughput", _fmt_bits(iface.get("rx_bytes_per_s", 0)), _fmt_bits(iface.get("tx_bytes_per_s", 0)))
+    table.add_row("packets/s", f"{iface.get('rx_packets_per_s', 0):.0f}", f"{iface.get('tx_packets_per_s', 0):.0f}")
+    table.add_row("errors/s", f"{iface.get('rx_errors_per_s', 0):.1f}", f"{iface.get('tx_errors_per_s', 0):.1f}")
+    table.add_row("drops/s", f"{iface.get('rx_dropped_per_s', 0):.1f}", f"{iface.get('tx_dropped_per_s', 0):.1f}")
+    table.add_row("history", _sparkline([h["rx"] for h in history]), _sparkline([h["tx"] for h in history]))
+
+    procs = rates.get("procs") or {}
+    comps = resp.get("components") or {}
+    ptable = Table(expand=True)
+    ptable.add_column("component")
+    ptable.add_column("pid", justify="right")
+    ptable.add_column("CPU %", justify="right")
+    ptable.add_column("RSS MiB", justify="right")
+    ptable.add_column("I/O r/w KiB/s", justify="right")
+    ptable.add_column("restarts", justify="right")
+    for name, comp in comps.items():
+        p = procs.get(name) or {}
+        cpu = p.get("cpu_percent")
+        ptable.add_row(
+            name,
+            str(comp.get("pid") or "-"),
+            "-" if cpu is None else f"{cpu:.1f}",
+            f"{p.get('rss_bytes', 0) / 2**20:.1f}" if p else "-",
+            f"{p.get('io_read_per_s', 0) / 1024:.0f}/{p.get('io_write_per_s', 0) / 1024:.0f}" if p else "-",
+            str(comp.get("restarts", 0)),
+        )
+    outer = Table.grid(expand=True)
+    outer.add_row(table)
+    outer.add_row(ptable)
+    return outer
+
+@app.command("top")
+def top(
+    interval: float = typer.Option(1.0, "--interval", "-i", min=0.1, help="Период обновления, сек"),
+):
+    """Живой вид: скорость TUN, пакеты, ошибки/дропы, CPU% и RSS `sslocal`/`tun2socks`."""
+    from rich.live import Live
+
+    resp = _daemon_or_exit("metrics")
+    try:
+        with Live(_top_view(resp), console=console, refresh_per_second=4, screen=False) as live:
+            while True:
+                time.sleep(interval)
+                resp = daemon_request("metrics", timeout=1.0)
+                if resp is None or not resp.get("ok"):
+                    console.print("[yellow]my-vpn остановлен.[/yellow]")
+                    return
+                live.update(_top_view(resp))
+    except KeyboardInterrupt:
+        pass
+
+@app.command("logs")
+def logs(
+    component: str | None = typer.Argument(
+        None, help="sslocal или tun2socks, у дополнительных туннелей — sslocal-1, tun2socks-1, ..., у очередей TUN — tun2socks.q1, ... (по умолчанию все)"
+    ),
+    lines: int = typer.Option(50, "--lines", "-n", min=0, help="Сколько последних строк показать"),
+    follow_: bool = typer.Option(False, "--follow", "-f", help="Дальше печатать новые строки (inotify)"),
+    events: bool = typer.Option(False, "--events", help="Счётчики и последние события из логов (нужен запущенный my-vpn)"),
+    json_out: bool = typer.Option(False, "--json", help="Вывести в JSON (без --follow)"),
+):
+    """Последние строки логов `sslocal`/`tun2socks` (из памяти запущенного `my-vpn` или из файлов)."""
+    if component is not None and not _COMPONENT_RE.match(component):
+        console.print(f"[red]Неизвестный компонент:[/red] {component} (есть: {', '.join(LOG_PATHS)}, с суффиксами -N и .qN)")
+        raise typer.Exit(code=2)
+
+    if events:
+        resp = _daemon_or_exit("logs", lines=0, events=lines or 20)
+        data = resp.get("events") or {}
+        if json_out:
+            _print_json(data)
+            return
+        console.print(_format_events(data))
+        for ev in data.get("recent", []):
+            if component is None or ev["component"] == component:
+                typer.echo(f"{time.strftime('%H:%M:%S', time.localtime(ev['ts']))} [{ev['component']}] {ev['event']}: {ev['line']}")
+        return
+
+    resp = daemon_request("logs", lines=lines, component=component, timeout=1.0)
+    running = resp is not None and resp.get("ok")
+    if running:
+        paths = resp.get("paths") or {}
+    else:
+        # Без демона — компоненты по числу туннелей из конфигурации
+        paths = {name: _log_path(name) for t in range(_get_tunnel_count()) for name in _component_names(t)}
+    if component:
+        paths.setdefault(component, _log_path(component))
+    names = [component] if component else list(paths)
+    if running:
+        rows = [(r["component"], r["line"]) for r in resp.get("lines", [])]
+    else:
+        rows = [(name, line) for name in names for line in tail_file(paths[name], lines)] if lines else []
+    if json_out:
+        _print_json([{"component": name, "line": line} for name, line in rows])
+        return
+
+    def emit(name: str, line: str) -> None:
+        typer.echo(line if component else f"[{name}] {line}")
+
+    for name, line in rows:
+        emit(name, line)
+    if not follow_:
+        return
+    try:
+        follow({name: paths[name] for name in names}, emit)
+    except OSError as e:
+        console.print(f"[red]inotify недоступен:[/red] {e}")
+        raise typer.Exit(code=1)
+    except KeyboardInterrupt:
+        pass
+
+@app.command("reload")
+def reload(
+    json_out: bool = typer.Option(False, "--json", help="Вывести ответ в JSON"),
+):
+    """Перечитать `.env` в запущенном `my-vpn`; при смене сервера перезапускается только `sslocal`."""
+    resp = _daemon_or_exit("reload", timeout=30.0)
+    if json_out:
+        _print_json(resp)
+    elif resp.get("changed"):
+        if resp.get("server_changed"):
+            console.print(f"[green]Сервер переключён:[/green] {resp.get('server')}")
+        console.print(_format_routes(resp.get("routes")))
+    else:
+        console.print("Конфигурация не изменилась.")
+
+@app.command("switch")
+def switch(
+    target: str = typer.Argument(..., help="Профиль (его `server` и параметры), имя сервера (`#fragment`) или ss://-ссылка"),
+    grace: float = typer.Option(0.0, "--grace", help="Сколько секунд старый туннель доживает для открытых соединений (0 — SWITCH_GRACE)"),
+    json_out: bool = typer.Option(False, "--json", help="Вывести ответ в JSON"),
+):
+    """Переключить запущенный `my-vpn` на другой сервер/профиль без разрыва: новый туннель поднимается рядом со старым."""
+    resp = _daemon_or_exit("switch", target=target, grace=grace or None, timeout=60.0)
+    if json_out:
+        _print_json(resp)
+        return
+    console.print(
+        f"[green]Переключено:[/green] {resp.get('server')} ({resp.get('server_ip')}), {resp.get('tun_dev')}, "
+        f"profile {resp.get('profile') or '-'}"
+    )
+    console.print(
+        f"новый туннель готов за {resp.get('ready_ms', 0):.0f} ms, маршруты переключены за {resp.get('swap_ms', 0):.1f} ms; "
+        f"{', '.join(resp.get('draining') or []) or '-'} снимется через {resp.get('grace_s', 0):g}s"
+    )
+
+@app.command("routes")
+def routes(
+    json_out: bool = typer.Option(False, "--json", help="Вывести в JSON"),
+):
+    """Разобрать списки SPLIT_INCLUDE/SPLIT_EXCLUDE и показать, сколько сетей осталось после минимизации."""
+    t0 = time.perf_counter()
+    try:
+        include, exclude = load_split_lists()
+    except OSError as e:
+        console.print(f"[red]Не удалось прочитать список маршрутов:[/red] {e}")
+        raise typer.Exit(code=1)
+    compile_ms = (time.perf_counter() - t0) * 1000
+    data = {
+        "include": {"lines": include.lines, "networks": len(include.cidrs), "skipped": include.skipped, "cached": include.cached},
+        "exclude": {"lines": exclude.lines, "networks": len(exclude.cidrs), "skipped": exclude.skipped, "cached": exclude.cached},
+        "compile_ms": round(compile_ms, 1),
+        "installed": read_route_stats(),
+    }
+    if json_out:
+        _print_json(data)
+        return
+    table = Table(title=f"Split tunnel (compile {compile_ms:.1f} ms)")
+    table.add_column("list")
+    table.add_column("lines", justify="right")
+    table.add_column("networks", justify="right")
+    table.add_column("skipped", justify="right")
+    table.add_column("cached")
+    for name in ("include", "exclude"):
+        row = data[name]
+        table.add_row(name, str(row["lines"]), str(row["networks"]), str(row["skipped"]), "yes" if row["cached"] else "no")
+    console.print(table)
+    if not include.cidrs:
+        console.print("include пуст — через туннель идёт весь трафик (0.0.0.0/1 + 128.0.0.0/1).")
+    console.print(_format_routes(data["installed"]))
+
 @app.command("stop")
 def stop(
     sudo: bool = typer.Option(
@@ -204,24 +1036,1041 @@ def stop(
         help="Auto-reexec via sudo if needed",
     ),
 ):
-    """Остановить VPN: убить процессы, удалить TUN и маршрут до сервера (best-effort)."""
-    tun_dev = _get_tun_dev()
+    """Остановить VPN: через управляющий сокет, иначе убить процессы, удалить TUN и маршрут до сервера (best-effort)."""
+    resp = daemon_request("stop")
+    if resp is not None and resp.get("ok"):
+        console.print("Останавливаем запущенный my-vpn...")
+        if not _wait_pid_exit(int(resp["pid"]), timeout=15.0):
+            console.print("[yellow]my-vpn не завершился за 15 сек.[/yellow]")
+            raise typer.Exit(code=1)
+        console.print("Готово! VPN выключен, работаем напрямую.")
+        return
+
+    from vpn_cli.resolver import cached_addresses, clear_server_state, is_ipv4, load_server_state
+
+    journal = Journal.load()
+    if journal is not None:
+        check_root(sudo=sudo)
+        owner = int(journal.meta.get("pid") or 0)
+        if journal.owner_alive():
+            # Процесс жив, но управляющий сокет не ответил — пусть сам снимет свои ресурсы
+            console.print(f"my-vpn (pid {owner}) не отвечает на управляющий сокет, посылаем SIGTERM...")
+            os.kill(owner, signal.SIGTERM)
+            if not _wait_pid_exit(owner, timeout=15.0):
+                console.print("[yellow]my-vpn не завершился за 15 сек.[/yellow]")
+                raise typer.Exit(code=1)
+            journal = Journal.load()
+        if journal is not None and not _undo_journal(journal, get_backend()):
+            raise typer.Exit(code=1)
+        clear_server_state()
+        console.print("Готово! VPN выключен, работаем напрямую.")
+        return
+
+    # Журнала нет (его не вёл запуск старой версии) — очистка по именам процессов и конфигурации
+    count = _get_tunnel_count()
+    socks_port = _get_socks_port()
+    # Оба набора слотов: после `switch` туннели могут жить в слотах `count..2*count-1`
+    devs = tun_devs(_get_tun_dev(), count) + tun_devs(_get_tun_dev(), count, first=count)
     check_root(sudo=sudo)
     console.print("[1/2] Останавливаем процессы...")
-    subprocess.run("pkill sslocal", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-    subprocess.run("pkill tun2socks", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for i, dev in enumerate(devs):
+        for pattern in (rf"sslocal.*-b 127\.0\.0\.1:{socks_port + i}( |$)", f"tun2socks.*-device {dev}( |$)"):
+            tracing.run(["pkill", "-f", pattern], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
-    console.print(f"[2/2] Удаляем интерфейс {tun_dev}...")
-    subprocess.run(f"ip link delete {tun_dev}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    console.print(f"[2/2] Удаляем интерфейс {', '.join(devs)}...")
+    net = get_backend()
+    for dev in devs:
+        try:
+            net.delete_link(dev)
+        except Exception:
+            pass
+    try:
+        # Вместе с маршрутами снимаются и правила отдельных туннелей
+        route_table = RouteTable(net)
+        route_table.load()
+        route_table.clear()
+    except Exception:
+        pass
     try:
-        ss_url = os.getenv("SS_URL")
-        if ss_url:
-            _, _, _, _, server_ip = parse_ss_url(ss_url)
-            subprocess.run(f"ip route del {server_ip}", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Снимаем маршруты до адресов, которые реально использовал `start`, — без повторного резолва
+        states = load_server_state()
+        if states:
+            net.delete_routes([gateway_route(state.address, state.gateway) for state in states])
+            server_ips = set()
+        else:
+            # Состояния нет (старый запуск): все сконфигурированные серверы, адреса только из кэша
+            server_ips = set()
+            for url in load_server_urls():
+                host = parse_ss_url(url)[0]
+                server_ips.update([host] if _is_ip(host) else cached_addresses(host))
+        net.delete_routes([Route(ip) for ip in server_ips if is_ipv4(ip)])
+        clear_server_state()
     except Exception:
         pass
     console.print("Готово! VPN выключен, работаем напрямую.")
 
+def _undo_journal(journal, net, verbose: bool = False) -> bool:
+    """Снять ресурсы из журнала; напечатать то, что снять не удалось (и, с `verbose`, всё снятое)."""
+    ok = True
+    for entry, error in journal.undo(net):
+        if error:
+            ok = False
+            console.print(f"[yellow]{describe_journal_entry(entry)}: {error}[/yellow]")
+        elif verbose:
+            console.print(f"снято: {describe_journal_entry(entry)}")
+    return ok
+
+@app.command("recover")
+def recover(
+    dry_run: bool = typer.Option(False, "--dry-run", help="Только показать, что будет снято"),
+    sudo: bool = typer.Option(
+        True,
+        "--sudo/--no-sudo",
+        help="Auto-reexec via sudo if needed",
+    ),
+):
+    """Снять процессы, TUN, маршруты и правила, оставшиеся после аварийного завершения `my-vpn` (по журналу)."""
+    from vpn_cli.resolver import clear_server_state
+
+    journal = Journal.load()
+    if journal is None or not journal.entries:
+        console.print("Журнал пуст: снимать нечего.")
+        return
+    if journal.owner_alive():
+        console.print(f"[red]my-vpn ещё работает[/red] (pid {journal.meta.get('pid')}); остановите его: my-vpn stop")
+        raise typer.Exit(code=1)
+    if dry_run:
+        for entry in reversed(journal.entries):
+            console.print(describe_journal_entry(entry))
+        return
+    check_root(sudo=sudo)
+    ok = _undo_journal(journal, get_backend(), verbose=True)
+    clear_server_state()
+    if not ok:
+        console.print("Не всё удалось снять; записи остались в журнале — повторите `my-vpn recover`.")
+        raise typer.Exit(code=1)
+    console.print("Готово: ресурсы прошлого запуска сняты.")
+
+def _is_ip(value: str) -> bool:
+    try:
+        validate_ip(value)
+        return True
+    except ValueError:
+        return False
+
+def _daemonize(log_path: str) -> Callable[[bool, str], None]:
+    """
+    Уйти в фон. Родитель ждёт от потомка сообщения о готовности (или об ошибке)
+    и завершается с соответствующим кодом; потомок получает функцию `notify(ok, text)`.
+    """
+    ready_r, ready_w = os.pipe()
+    pid = os.fork()
+    if pid:
+        # Трассу (вместе со спанами до fork) пишет фоновый процесс
+        tracing.disable()
+        os.close(ready_w)
+        with os.fdopen(ready_r, "rb") as f:
+            msg = f.read().decode(errors="replace")
+        if msg.startswith("ok\n"):
+            console.print(Panel(msg[3:], title="VPN запущен в фоне"))
+            raise typer.Exit(0)
+        console.print(f"[red]Не удалось запустить VPN:[/red] {msg or 'фоновый процесс завершился'}")
+        console.print(f"Лог: {log_path}")
+        raise typer.Exit(1)
+
+    os.close(ready_r)
+    os.setsid()
+    if tracing.tracer() is not None:
+        tracing.tracer().after_fork()
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    log_fd = os.open(log_path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    os.dup2(log_fd, 1)
+    os.dup2(log_fd, 2)
+    os.close(devnull)
+    os.close(log_fd)
+
+    def notify(ok: bool, text: str = "") -> None:
+        nonlocal ready_w
+        if ready_w < 0:
+            return
+        try:
+            os.write(ready_w, (("ok\n" if ok else "") + text).encode())
+        finally:
+            os.close(ready_w)
+            ready_w = -1
+
+    return notify
+
+def _log_path(component: str) -> str:
+    """Файл лога компонента: `sslocal` -> `/tmp/my-vpn-sslocal.log`, `sslocal-1` -> `/tmp/my-vpn-sslocal-1.log`."""
+    return LOG_PATHS.get(component, f"/tmp/my-vpn-{component}.log")
+
+def _component_names(index: int) -> tuple[str, str]:
+    """Имена компонентов туннеля `index`: `sslocal`/`tun2socks`, дальше `sslocal-1`/`tun2socks-1`, ..."""
+    suffix = f"-{index}" if index else ""
+    return f"sslocal{suffix}", f"tun2socks{suffix}"
+
+def _match_servers(specs: list[str], urls: list[str]) -> list[str]:
+    """URL серверов по имени (`#fragment`, как в `probe`) или по самой `ss://`-ссылке."""
+    chosen = []
+    for spec in specs:
+        if spec.startswith("ss://"):
+            chosen.append(spec)
+            continue
+        match = [url for url in urls if server_label(url) == spec]
+        if not match:
+            raise ValueError(f"Нет профиля или сервера {spec!r} (серверы: {', '.join(map(server_label, urls)) or 'нет'})")
+        chosen.append(match[0])
+    return chosen
+
+def _sslocal_argv(
+    ss_bin: str, address: str, port: str, method: str, password: str, socks_port: int, tunables: Tunables
+) -> list[str]:
+    # `sslocal` получает уже выбранный адрес: сам он резолвил бы заново и мог попасть не на тот хост,
+    # до которого проложен маршрут
+    server = f"[{address}]:{port}" if ":" in address else f"{address}:{port}"
+    argv = [ss_bin, "-s", server, "-m", method, "-k", password, "-b", f"127.0.0.1:{socks_port}", "-U"]
+    return argv + sslocal_args(tunables)
+
+def _tun2socks_argv(tun_bin: str, device: str, socks_port: int, tunables: Tunables) -> list[str]:
+    # `device` — имя TUN или `fd://N` (очередь multi-queue TUN, дескриптор держит демон)
+    return [tun_bin, "-device", device, "-proxy", f"socks5://127.0.0.1:{socks_port}", *tun2socks_args(tunables)]
+
+def _start_dns_stub(socks_port: int, journal: Journal) -> "DnsStub | None":
+    """Поднять DNS-стаб и, если он на 53-м порту, направить на него систему (`/etc/resolv.conf`)."""
+    # asyncio и весь стаб — только когда он включён
+    from vpn_cli.dns import (
+        DEFAULT_CACHE_SIZE,
+        DEFAULT_LISTEN,
+        DEFAULT_NEGATIVE_TTL,
+        ENV_DNS_LISTEN,
+        RESOLV_CONF,
+        DnsStub,
+        SocksUpstream,
+        parse_host_port,
+        read_resolv_conf,
+        upstream_servers,
+        write_resolv_conf,
+    )
+
+    listen = parse_host_port(os.getenv(ENV_DNS_LISTEN, DEFAULT_LISTEN))
+    upstream = SocksUpstream(socks_port, upstream_servers(), timeout=_get_float_env("DNS_TIMEOUT", 2.0))
+    stub = DnsStub(
+        upstream,
+        listen,
+        cache_size=max(1, _get_int_env("DNS_CACHE_SIZE", DEFAULT_CACHE_SIZE)),
+        negative_ttl=_get_int_env("DNS_NEGATIVE_TTL", DEFAULT_NEGATIVE_TTL),
+    )
+    try:
+        stub.start()
+    except OSError as e:
+        console.print(f"[yellow]DNS-стаб не запущен ({listen[0]}:{listen[1]}): {e}[/yellow]")
+        return None
+    if listen[1] != 53:
+        console.print(f"DNS-стаб: {listen[0]}:{listen[1]} (не 53-й порт — resolv.conf не трогаем)")
+        return stub
+    # Прежний resolv.conf — в журнал до перезаписи: его вернут и остановка, и `recover`
+    journal.record("file", str(RESOLV_CONF), **read_resolv_conf())
+    try:
+        write_resolv_conf(listen[0])
+    except OSError as e:
+        console.print(f"[yellow]{RESOLV_CONF} не изменён: {e}[/yellow]")
+        journal.forget("file", str(RESOLV_CONF))
+    else:
+        console.print(f"DNS-стаб: {listen[0]}:{listen[1]}, {RESOLV_CONF} указывает на него")
+    return stub
+
+def _start_quality_monitor(socks_port: int) -> "QualityMonitor | None":
+    """Пробы к `QUALITY_TARGETS` через SOCKS-порт туннеля; пустой список — пробы выключены."""
+    from vpn_cli.quality import DEFAULT_TARGETS, DEFAULT_WINDOWS, ENV_QUALITY_TARGETS, QualityMonitor, parse_targets
+
+    try:
+        targets = parse_targets(os.getenv(ENV_QUALITY_TARGETS, DEFAULT_TARGETS))
+        windows = tuple(
+            int(w) for w in os.getenv("QUALITY_WINDOWS", ",".join(map(str, DEFAULT_WINDOWS))).split(",") if w.strip()
+        )
+    except ValueError as e:
+        console.print(f"[yellow]Пробы качества не запущены: {e}[/yellow]")
+        return None
+    if not targets:
+        return None
+    monitor = QualityMonitor(
+        socks_port,
+        targets,
+        interval=_get_float_env("QUALITY_INTERVAL", 30.0),
+        timeout=_get_float_env("QUALITY_TIMEOUT", 5.0),
+        windows=tuple(w for w in windows if w > 0) or DEFAULT_WINDOWS,
+    )
+    monitor.start()
+    return monitor
+
+def _start_upstream_pool() -> "UpstreamPool":
+    """Ретранслятор с прогретыми соединениями до серверов; порты для `sslocal` — `endpoint()`."""
+    from vpn_cli.pool import DEFAULT_MAX_IDLE, DEFAULT_WINDOW, UpstreamPool
+
+    pool = UpstreamPool(
+        min_size=_get_int_env("POOL_MIN", 1),
+        max_size=max(1, _get_int_env("POOL_MAX", 8)),
+        max_idle=_get_float_env("POOL_MAX_IDLE", DEFAULT_MAX_IDLE),
+        window=max(1, _get_int_env("POOL_WINDOW", DEFAULT_WINDOW)),
+        connect_timeout=_get_float_env("POOL_CONNECT_TIMEOUT", 5.0),
+        fastopen=_get_bool_env("POOL_TFO", True),
+    )
+    pool.start()
+    return pool
+
+@dataclass
+class _PendingSwitch:
+    """`switch` в работе: новый набор туннелей и кому ответить."""
+
+    plan: list
+    tunables: Tunables
+    profile: str | None
+    grace: float
+    reply: Reply
+    started: float = field(default_factory=time.perf_counter)
+    components: list[Component] = field(default_factory=list)
+
+class _Session:
+    """
+    Запущенный VPN: набор туннелей, сайдкары вокруг них и обработчики управляющего сокета.
+
+    Обработчики и колбэки вызываются по одному из цикла `Supervisor.run()`. Всё, что поднимают
+    `open()`/`bring_up()`, сразу регистрируется в `ExitStack`, и `close()` снимает это в обратном порядке.
+    """
+
+    def __init__(
+        self,
+        net: NetBackend,
+        plan: list,
+        *,
+        tunables: Tunables,
+        profile: str | None,
+        include: CompiledList,
+        exclude: CompiledList,
+        ss_bin: str,
+        tun_bin: str,
+        ss_placement: Placement,
+        tun_placement: Placement,
+        tun_dev: str,
+        tun_addr: str,
+        socks_port: int,
+        table_base: int,
+        socks_timeout: float,
+        tun_timeout: float,
+        detach: bool,
+        notify: Callable[[bool, str], None],
+    ) -> None:
+        self.net = net
+        self.plan = plan
+        self.devs = [t.dev for t in plan]
+        self.count = len(plan)
+        self.tunables, self.profile = tunables, profile
+        self.include, self.exclude = include, exclude
+        self.ss_bin, self.tun_bin = ss_bin, tun_bin
+        self.ss_placement, self.tun_placement = ss_placement, tun_placement
+        self.tun_dev, self.tun_addr, self.socks_port = tun_dev, tun_addr, socks_port
+        self.table_base = table_base
+        self.socks_timeout, self.tun_timeout = socks_timeout, tun_timeout
+        self.notify = notify
+
+        self.started = time.time()
+        self.gw: str | None = None
+        self.draining: list = []  # прежний набор туннелей после `switch`, пока доживают его соединения
+        self.info = {
+            "pid": os.getpid(),
+            "server": server_label(plan[0].url),
+            "server_ip": plan[0].address,
+            "tun_dev": tun_dev,
+            "socks_port": socks_port,
+            "backend": net.name,
+            "detached": detach,
+        }
+
+        # Поток насоса логов — только после fork в `_daemonize`
+        self.log_pump = LogPump(
+            ring_lines=_get_int_env("LOG_RING_LINES", 1000) or 1000,
+            max_bytes=_get_int_env("LOG_MAX_BYTES", 10 * 1024 * 1024),
+            max_age=_get_int_env("LOG_MAX_AGE", 24 * 3600),
+            backups=_get_int_env("LOG_BACKUPS", 3),
+        )
+        self.journal = Journal()
+        self.route_table = RouteTable(net)
+        self.watcher = GatewayWatcher(net, None, self._on_gateway_change)
+        self.sampler = MetricsSampler(self.devs, self._child_pids, interval=_get_float_env("METRICS_INTERVAL", 1.0))
+        self.metrics_server = MetricsServer(self._prometheus, port=_get_int_env("METRICS_PORT", 0))
+        self.control = ControlServer(
+            {
+                "status": self._h_status,
+                "stats": self._h_stats,
+                "metrics": self._h_metrics,
+                "logs": self._h_logs,
+                "stop": self._h_stop,
+                "tune": self._h_tune,
+            },
+            deferred={"reload": self._h_reload, "switch": self._h_switch},
+        )
+        self.supervisor: Supervisor | None = None
+        self.upstream_pool: "UpstreamPool | None" = None
+        self.dns_stub: "DnsStub | None" = None
+        self.quality: "QualityMonitor | None" = None
+        self.switch: _PendingSwitch | None = None
+        self.reloading = False
+        self._stack = contextlib.ExitStack()
+
+    # --- жизненный цикл ---
+
+    def open(self, *, pool: bool) -> None:
+        """Поднять сайдкары, нужные до запуска туннелей (пул, насос логов, управляющий сокет, журнал, метрики)."""
+        if pool:
+            with tracing.span("upstream pool"):
+                self.upstream_pool = _start_upstream_pool()
+            self._stack.callback(self.upstream_pool.stop)
+
+        components = self._tunnel_components(self.plan, self.tunables)
+        for comp in components:
+            self.log_pump.add(comp.name, comp.log_path)
+        self.log_pump.start()
+        self._stack.callback(self.log_pump.stop)
+
+        try:
+            self.control.open()
+        except (ControlError, OSError) as e:
+            console.print(f"[red]{e}[/red]")
+            self.notify(False, str(e))
+            raise typer.Exit(code=1)
+        self._stack.callback(self.control.close)
+
+        # Сокет наш — значит, другого `my-vpn` нет; ресурсы убитого без очистки (kill -9, питание) снимаем по журналу
+        stale = Journal.load()
+        if stale is not None and stale.entries and not stale.owner_alive():
+            report = stale.undo(self.net)
+            console.print(f"Сняты ресурсы прошлого запуска: {len(report)}")
+        self.journal.begin()
+        self._stack.callback(self._undo_journal)
+
+        self.supervisor = Supervisor(
+            components,
+            max_restarts=_get_int_env("RESTART_MAX", 5),
+            window=_get_float_env("RESTART_WINDOW", 60.0),
+            backoff_max=_get_float_env("RESTART_BACKOFF_MAX", 5.0),
+            journal=self.journal,
+        )
+        self._stack.callback(self.supervisor.shutdown)
+        self.control.serve(self.supervisor)
+
+        # Метрики: сэмплер в фоновом потоке, Prometheus — из того же цикла, что и управляющий сокет
+        self.sampler.start()
+        self._stack.callback(self.sampler.stop)
+        if self.metrics_server.port:
+            try:
+                self.metrics_server.serve(self.supervisor)
+                self.info["metrics"] = f"http://127.0.0.1:{self.metrics_server.port}/metrics"
+            except OSError as e:
+                console.print(f"[yellow]Prometheus-эндпоинт не поднят (порт {self.metrics_server.port}): {e}[/yellow]")
+            self._stack.callback(self.metrics_server.close)
+        signal.signal(signal.SIGTERM, lambda *_: self.supervisor.stop())
+
+    def bring_up(self, timer: PhaseTimer, *, dns: bool) -> None:
+        """Запустить туннели и проложить маршруты; бросает `ReadinessError`, если компонент не стал готов."""
+        plan, net, supervisor = self.plan, self.net, self.supervisor
+
+        # 1. Запуск SS Local (все туннели сразу, готовность ждём после)
+        with timer.phase("free SOCKS port"):
+            for t in plan:
+                kill_process_on_port(t.socks_port)
+
+        console.print("[green]Запуск shadowsocks...[/green]")
+        ss_procs = {t.index: supervisor.spawn(t.ss_name) for t in plan}
+
+        # Ждём, пока SOCKS5 реально начнёт отвечать, а не фиксированную секунду
+        with timer.phase("sslocal SOCKS5 ready"):
+            for t in plan:
+                wait_socks_ready(t.socks_port, self.socks_timeout, proc=ss_procs[t.index])
+
+        # 2. Настройка интерфейса
+        console.print(f"[green]Настройка {', '.join(self.devs)}...[/green]")
+        with timer.phase("TUN setup"):
+            for t in plan:
+                self.journal.record("link", t.dev)
+                net.setup_tun(t.dev, t.addr, mtu=self.tunables.mtu, txqueuelen=self.tunables.txqueuelen, queues=t.queues)
+                if t.tun_queues:
+                    t.tun_queues.attach()
+
+        # 3. Запуск Tun2Socks
+        console.print("[green]Запуск tun2socks...[/green]")
+        tun_procs = {}
+        for t in plan:
+            tun_procs[t.index] = [supervisor.spawn(name) for name in t.tun_names]
+        with timer.phase("tun2socks attached"):
+            for t in plan:
+                for proc in tun_procs[t.index]:
+                    wait_tun2socks_attached(proc, t.dev, self.tun_timeout)
+        with timer.phase("TUN carrier"):
+            for t in plan:
+                wait_tun_carrier(t.dev, self.tun_timeout, proc=tun_procs[t.index][0])
+
+        # 4. Маршрутизация — только когда весь путь SOCKS -> TUN готов
+        with timer.phase("routes"):
+            self.gw = net.default_gateway()
+            self.journal.set(gateway=self.gw)
+            if self.gw:
+                self._pin_servers(self.gw)
+            # TUN только что пересозданы: маршруты через них ушли вместе со старыми интерфейсами
+            self.route_table.load(fresh_devs=self.devs)
+            self.journal.record("routes", self.route_table.state_path)
+            self._apply_routes()
+            if self.count > 1:
+                hash_policy = set_multipath_hash_policy()
+                if hash_policy is not None and hash_policy != L4_HASH_POLICY:
+                    self.journal.record("sysctl", HASH_POLICY_PATH, value=hash_policy)
+
+        # Смена шлюза — по уведомлениям ядра, без опроса
+        self.watcher.gateway = self.gw
+        try:
+            supervisor.add_reader(self.watcher.open(), self._on_gateway_event)
+        except OSError as e:
+            console.print(f"[yellow]Слежение за шлюзом не запущено: {e}[/yellow]")
+        self._stack.callback(self.watcher.close)
+
+        if dns:
+            with tracing.span("DNS stub"):
+                self.dns_stub = _start_dns_stub(plan[0].socks_port, self.journal)
+            if self.dns_stub is not None:
+                self._stack.callback(self.dns_stub.stop)
+
+        # Пробы качества: ходит ли трафик через туннель, а не только живы ли процессы
+        self.quality = _start_quality_monitor(plan[0].socks_port)
+        if self.quality is not None:
+            self._stack.callback(self.quality.stop)
+
+    def close(self) -> None:
+        """Снять всё поднятое в обратном порядке."""
+        if self.switch is not None:
+            op, self.switch = self.switch, None
+            op.reply(RuntimeError("my-vpn остановлен до завершения switch"))
+        with tracing.span("teardown"):
+            self._stack.close()
+
+    def _undo_journal(self) -> None:
+        from vpn_cli.resolver import clear_server_state
+
+        # Ровно то, что создали (включая старый набор после `switch`), в обратном порядке
+        failed = [(entry, error) for entry, error in self.journal.undo(self.net) if error]
+        for entry, error in failed:
+            console.print(f"[yellow]Очистка: {describe_journal_entry(entry)}: {error}[/yellow]")
+        if failed:
+            console.print("Не всё удалось снять; повторите: my-vpn recover")
+        clear_server_state()
+
+    # --- туннели и маршруты ---
+
+    def _tun_ready(self, dev: str) -> Callable[[subprocess.Popen], bool]:
+        return lambda proc: tun2socks_attached(proc, dev) and tun_carrier(dev)
+
+    def _ss_argv(self, t, tunables: Tunables) -> list[str]:
+        # С пулом `sslocal` ходит к серверу через локальный ретранслятор с прогретыми соединениями
+        address, port = t.address, t.port
+        if self.upstream_pool is not None:
+            address, port = "127.0.0.1", str(self.upstream_pool.endpoint(t.address, int(t.port)))
+        return _sslocal_argv(self.ss_bin, address, port, t.method, t.password, t.socks_port, tunables)
+
+    def _tun_workers(self, t, tunables: Tunables) -> list[tuple[str, list[str], dict[str, str]]]:
+        """`tun2socks` туннеля: один на TUN или по одному на каждую очередь (`-device fd://N`)."""
+        devices = [f"fd://{fd}" for fd in t.tun_queues.fds] if t.tun_queues else [t.dev]
+        cpus = self.tun_placement.cpus
+        env = tun2socks_env(tunables, t.queues, len(cpus) if cpus else None)
+        return [
+            (name, _tun2socks_argv(self.tun_bin, device, t.socks_port, tunables), env)
+            for name, device in zip(t.tun_names, devices)
+        ]
+
+    def _tunnel_components(self, tunnels: list, tunables: Tunables) -> list[Component]:
+        components = []
+        for t in tunnels:
+            if t.queues > 1 and t.tun_queues is None:
+                t.tun_queues = TunQueues(t.dev, t.queues)
+            components.append(
+                Component(
+                    t.ss_name,
+                    self._ss_argv(t, tunables),
+                    _log_path(t.ss_name),
+                    ready=lambda proc, port=t.socks_port: socks5_handshake("127.0.0.1", port, timeout=0.1),
+                    ready_timeout=self.socks_timeout,
+                    pump=self.log_pump,
+                    placement=self.ss_placement or None,
+                )
+            )
+            # Ядра `TUN2SOCKS_CPUS` делятся между очередями: каждый `tun2socks` на своих
+            chunks = split_cpus(self.tun_placement.cpus, t.queues)
+            fds = [(fd,) for fd in t.tun_queues.fds] if t.tun_queues else [()]
+            for (name, argv, env), cpus, pass_fds in zip(self._tun_workers(t, tunables), chunks, fds):
+                placement = Placement(cpus, self.tun_placement.nice, self.tun_placement.ioprio)
+                components.append(
+                    Component(
+                        name,
+                        argv,
+                        _log_path(name),
+                        ready=self._tun_ready(t.dev),
+                        ready_timeout=self.tun_timeout,
+                        pump=self.log_pump,
+                        env=env,
+                        pass_fds=pass_fds,
+                        placement=placement or None,
+                    )
+                )
+        return components
+
+    def _tunnels_info(self) -> list[dict]:
+        return [
+            {
+                "index": t.index,
+                "server": server_label(t.url),
+                "server_ip": t.address,
+                "tun_dev": t.dev,
+                "socks_port": t.socks_port,
+                "table": t.table,
+            }
+            for t in self.plan
+        ]
+
+    def _components(self) -> dict:
+        return {name: comp.snapshot() for name, comp in self.supervisor.components.items()}
+
+    def _child_pids(self) -> dict[str, int]:
+        # Без `poll()`: процессы подбирает только цикл супервизора, сэмплер работает в другом потоке
+        return {
+            name: comp.proc.pid
+            for name, comp in self.supervisor.components.items()
+            if comp.proc is not None and comp.proc.returncode is None
+        }
+
+    def _prometheus(self) -> str:
+        return render_prometheus(
+            self.sampler,
+            self._components(),
+            log_events=self.log_pump.events(n=0),
+            dns=self.dns_stub.stats() if self.dns_stub is not None else None,
+            quality=self.quality.snapshot() if self.quality is not None else None,
+            pool=self.upstream_pool.snapshot() if self.upstream_pool is not None else None,
+        )
+
+    def _route_info(self) -> dict:
+        return {**self.route_table.stats, "include": len(self.include.cidrs), "exclude": len(self.exclude.cidrs)}
+
+    def _apply_routes(self) -> None:
+        self.route_table.apply(
+            desired_routes(self.devs, self.gw, self.include, self.exclude)
+            + table_routes(self.plan)
+            + drain_routes(self.draining, self.table_base),
+            table_rules(self.plan) + drain_rules(self.draining, self.table_base),
+        )
+
+    def _pin_servers(self, gateway: str) -> None:
+        from vpn_cli.resolver import ServerState, is_ipv4, save_server_state
+
+        # Туннель только IPv4: до IPv6-адреса сервера трафик и так идёт мимо TUN
+        pinned = {t.address: t.host for t in self.plan + self.draining if is_ipv4(t.address)}
+        for address in pinned:
+            self.journal.record("pin", address, via=gateway)
+        self.net.replace_routes([gateway_route(address, gateway) for address in pinned])
+        save_server_state([ServerState(host=host, address=address, gateway=gateway) for address, host in pinned.items()])
+
+    def _unpin_stale(self, gateway: str, stale: set[str]) -> None:
+        """Снять маршруты до серверов, которыми больше не пользуется ни один туннель."""
+        from vpn_cli.resolver import is_ipv4
+
+        self.net.delete_routes([gateway_route(address, gateway) for address in stale if is_ipv4(address)])
+        for address in stale:
+            self.journal.forget("pin", address)
+
+    def _retain_pool(self) -> None:
+        if self.upstream_pool is not None:
+            self.upstream_pool.retain({(t.address, int(t.port)) for t in self.plan + self.draining})
+
+    def _on_gateway_change(self, old: str | None, new: str | None) -> None:
+        """Сменилась сеть: маршруты до серверов и исключения split tunneling — на новый шлюз."""
+        self.gw = new
+        if old:
+            # Вместе с интерфейсом старого шлюза ядро могло удалить и маршруты через него
+            self.route_table.invalidate(old)
+        if new:
+            self.journal.set(gateway=new)
+            self._pin_servers(new)
+        self._apply_routes()
+        if self.upstream_pool is not None:
+            # Прогретые соединения открыты по старому пути
+            self.upstream_pool.flush()
+
+    def _on_gateway_event(self, fileobj) -> None:
+        try:
+            change = self.watcher.on_readable(fileobj)
+        except Exception as e:
+            console.print(f"[yellow]Перепривязка к новому шлюзу: {e}[/yellow]")
+            return
+        if change is not None:
+            console.print(
+                f"Шлюз: {change.old or 'нет'} -> {change.new or 'нет'}, маршруты перепривязаны за {change.repin_ms:.1f} ms"
+            )
+
+    # --- обработчики управляющего сокета ---
+
+    def _h_status(self, req: dict) -> dict:
+        resp = {
+            **self.info,
+            "gateway": self.gw,
+            "uptime_s": round(time.time() - self.started, 3),
+            "components": self._components(),
+            "routes": self._route_info(),
+            "log_events": self.log_pump.events(n=0),
+            "profile": self.profile,
+            "tunables": tunables_dict(self.tunables),
+            "gateway_watch": self.watcher.snapshot() if self.watcher.monitor is not None else None,
+            "dns": self.dns_stub.stats() if self.dns_stub is not None else None,
+            "quality": self.quality.snapshot() if self.quality is not None else None,
+            "pool": self.upstream_pool.snapshot() if self.upstream_pool is not None else None,
+        }
+        if self.count > 1:
+            resp["tunnels"] = self._tunnels_info()
+        if self.draining:
+            resp["draining"] = [t.dev for t in self.draining]
+        return resp
+
+    def _h_stats(self, req: dict) -> dict:
+        per_dev = {dev: read_iface_counters(dev) for dev in self.devs}
+        present = [c for c in per_dev.values() if c]
+        resp = {
+            "tun_dev": self.info["tun_dev"],
+            "uptime_s": round(time.time() - self.started, 3),
+            "iface": {key: sum(c[key] for c in present) for key in present[0]} if present else None,
+            "rates": self.sampler.rates(),
+            "log_events": self.log_pump.events(n=0),
+            "components": self._components(),
+            "dns": self.dns_stub.stats() if self.dns_stub is not None else None,
+            "pool": self.upstream_pool.snapshot() if self.upstream_pool is not None else None,
+        }
+        if self.count > 1:
+            resp["devs"] = per_dev
+        return resp
+
+    def _h_metrics(self, req: dict) -> dict:
+        return {
+            "tun_dev": self.info["tun_dev"],
+            "uptime_s": round(time.time() - self.started, 3),
+            **self.sampler.snapshot(points=int(req.get("points", 60))),
+            "components": self._components(),
+        }
+
+    def _h_logs(self, req: dict) -> dict:
+        return {
+            "lines": self.log_pump.tail(int(req.get("lines", 100)), req.get("component")),
+            "events": self.log_pump.events(n=int(req.get("events", 20))),
+            "paths": {name: comp.log_path for name, comp in self.supervisor.components.items()},
+        }
+
+    def _h_stop(self, req: dict) -> dict:
+        self.supervisor.stop()
+        return {"pid": os.getpid(), "stopping": True}
+
+    def _h_reload(self, req: dict, reply: Reply) -> None:
+        """
+        Перечитать `.env`: списки split tunneling и серверы. Чтение файлов и резолв — в рабочем потоке,
+        маршруты и перезапуск `sslocal` — в цикле супервизора; ответ уходит через `reply`.
+        """
+        from vpn_cli.resolver import resolve_server
+
+        self._ensure_idle()
+        self.reloading = True
+        plan = [(t.index, t.url) for t in self.plan]
+
+        def load() -> tuple:
+            _load_env(_env_file_opt, override=True)
+            include, exclude = load_split_lists()
+            urls = load_server_urls()
+            # Туннель, чей сервер пропал из конфигурации, переезжает на сервер с тем же номером по кругу
+            moved = {}
+            for index, url in plan:
+                if urls and url not in urls:
+                    new_url = urls[index % len(urls)]
+                    host, port, method, password = parse_ss_url(new_url)
+                    address = resolve_server(host, int(port), timeout=_get_float_env("RESOLVE_TIMEOUT", 2.0)).address
+                    moved[index] = (new_url, host, port, method, password, address)
+            return include, exclude, moved
+
+        def fail(error: Exception) -> None:
+            self.reloading = False
+            reply(error)
+
+        def apply(result: tuple) -> None:
+            self.reloading = False
+            reply(self._reload_apply(*result))
+
+        self._offload(load, apply, fail)
+
+    def _reload_apply(self, new_include: CompiledList, new_exclude: CompiledList, moved: dict) -> dict:
+        routes_changed = (new_include.cidrs, new_exclude.cidrs) != (self.include.cidrs, self.exclude.cidrs)
+        if routes_changed:
+            self.include, self.exclude = new_include, new_exclude
+            self._apply_routes()
+        if not moved:
+            return {
+                "changed": routes_changed,
+                "server_changed": False,
+                "server": self.info["server"],
+                "routes": self._route_info(),
+            }
+        current_gw = self.net.default_gateway() or self.gw
+        old_addresses = {t.address for t in self.plan}
+        moved_plan = [t for t in self.plan if t.index in moved]
+        for t in moved_plan:
+            t.url, t.host, t.port, t.method, t.password, t.address = moved[t.index]
+        if current_gw:
+            self._pin_servers(current_gw)
+        for t in moved_plan:
+            self.supervisor.components[t.ss_name].argv = self._ss_argv(t, self.tunables)
+            self.supervisor.restart(t.ss_name)
+        self._retain_pool()
+        stale = old_addresses - {t.address for t in self.plan}
+        if current_gw and stale:
+            self._unpin_stale(current_gw, stale)
+        self.info.update(server=server_label(self.plan[0].url), server_ip=self.plan[0].address)
+        return {"changed": True, "server_changed": True, "server": self.info["server"], "routes": self._route_info()}
+
+    def _h_tune(self, req: dict) -> dict:
+        """Заменить параметры data path на лету: MTU/очередь TUN сразу, остальное — перезапуском компонентов."""
+        self._ensure_idle()
+        new = from_tunables_dict(req.get("settings") or {})
+        if (new.tun_queues or 1) != self.plan[0].queues:
+            raise RuntimeError("число очередей TUN меняется только через switch или перезапуск")
+        old, self.tunables = self.tunables, new
+        self.profile = req.get("profile", self.profile)
+        if (old.mtu, old.txqueuelen) != (new.mtu, new.txqueuelen):
+            for dev in self.devs:
+                self.net.set_link(
+                    dev,
+                    mtu=new.mtu or TUN_DEFAULT_MTU,
+                    txqueuelen=TUN_DEFAULT_TXQUEUELEN if new.txqueuelen is None else new.txqueuelen,
+                )
+        restarted = []
+        for t in self.plan:
+            for name, argv, env in (
+                (t.ss_name, self._ss_argv(t, new), None),
+                *self._tun_workers(t, new),
+            ):
+                comp = self.supervisor.components[name]
+                if (comp.argv, comp.env) != (argv, env):
+                    comp.argv, comp.env = argv, env
+                    self.supervisor.restart(name)
+                    restarted.append(name)
+        return {"profile": self.profile, "tunables": tunables_dict(self.tunables), "restarted": restarted}
+
+    def _reap_draining(self) -> None:
+        """Конец grace: снять правила/маршруты старого набора, остановить его компоненты и удалить TUN."""
+        old = list(self.draining)
+        self.draining.clear()
+        try:
+            self._apply_routes()
+            for t in old:
+                for name in (*t.tun_names, t.ss_name):
+                    if name in self.supervisor.components:
+                        self.supervisor.remove(name)
+                if t.tun_queues:
+                    t.tun_queues.close()
+                self.net.delete_link(t.dev)
+                self.journal.forget("link", t.dev)
+            self._retain_pool()
+            current_gw = self.net.default_gateway() or self.gw
+            if current_gw:
+                self._pin_servers(current_gw)
+                self._unpin_stale(current_gw, {t.address for t in old} - {t.address for t in self.plan})
+        except Exception as e:
+            console.print(f"[yellow]Снятие старого туннеля после switch: {e}[/yellow]")
+        console.print(f"switch: старый набор ({', '.join(t.dev for t in old)}) снят")
+
+    def _h_switch(self, req: dict, reply: Reply) -> None:
+        """
+        Make-before-break: новый набор `sslocal`+`tun2socks` поднимается в свободных слотах (свои порты и TUN),
+        после проверок готовности маршруты `/1` и до сервера заменяются (`replace`, без окна без маршрута),
+        старый набор доживает `grace` секунд для уже открытых соединений и снимается.
+
+        Резолв и ожидание готовности идут в рабочем потоке, шаги с супервизором и сетью — в его цикле;
+        ответ клиенту уходит через `reply`, когда переключение закончено или откатено.
+        """
+        from vpn_cli.resolver import resolve_servers
+
+        self._ensure_idle()
+        if self.draining:
+            raise RuntimeError("предыдущий switch ещё не завершён: старый туннель доживает grace")
+        _load_env(_env_file_opt, override=True)
+        target = str(req.get("target") or "")
+        urls = load_server_urls()
+        profiles = load_profiles()
+        if target in profiles:
+            new_profile, new_tunables = resolve_tunables(target)
+            chosen = _match_servers(profile_servers(profiles[target]), urls)
+        else:
+            new_profile, new_tunables = self.profile, self.tunables
+            chosen = _match_servers([target], urls)
+        chosen = chosen or list(dict.fromkeys(t.url for t in self.plan))
+
+        first = self.count if self.plan[0].index < self.count else 0
+        parsed = {url: parse_ss_url(url) for url in chosen}
+        new_plan = plan_tunnels(
+            chosen,
+            parsed,
+            self.count,
+            base_dev=self.tun_dev,
+            base_addr=self.tun_addr,
+            base_port=self.socks_port,
+            table=self.table_base,
+            first=first,
+            queues=new_tunables.tun_queues or 1,
+        )
+        grace = float(req.get("grace") or _get_float_env("SWITCH_GRACE", 30.0))
+        self.switch = _PendingSwitch(new_plan, new_tunables, new_profile, grace, reply)
+
+        def resolve() -> dict:
+            targets = list(dict.fromkeys((t.host, int(t.port)) for t in new_plan))
+            resolutions = dict(zip(targets, resolve_servers(targets, timeout=_get_float_env("RESOLVE_TIMEOUT", 2.0))))
+            for t in new_plan:
+                kill_process_on_port(t.socks_port)
+            return resolutions
+
+        self._offload(resolve, self._switch_spawn_sslocal)
+
+    def _ensure_idle(self) -> None:
+        if self.switch is not None:
+            raise RuntimeError("идёт switch: повторите, когда он закончится")
+        if self.reloading:
+            raise RuntimeError("идёт reload: повторите, когда он закончится")
+
+    def _offload(
+        self,
+        work: Callable[[], object],
+        then: Callable[[object], None],
+        fail: Callable[[Exception], None] | None = None,
+    ) -> None:
+        """
+        Блокирующий `work()` — в рабочем потоке, `then(result)` — снова в цикле супервизора, чтобы тот
+        не стоял на резолве и ожидании готовности. Ошибка любой из половин уходит в `fail` (по умолчанию —
+        откат текущего `switch`).
+        """
+        fail = fail or self._switch_abort
+
+        def step(result) -> None:
+            try:
+                then(result)
+            except Exception as e:
+                fail(e)
+
+        def run() -> None:
+            try:
+                result = work()
+            except Exception as e:
+                self.supervisor.call_later(0, lambda e=e: fail(e))
+            else:
+                self.supervisor.call_later(0, lambda: step(result))
+
+        threading.Thread(target=run, name="offload", daemon=True).start()
+
+    def _switch_spawn_sslocal(self, resolutions: dict) -> None:
+        op = self.switch
+        for t in op.plan:
+            t.address = resolutions[(t.host, int(t.port))].address
+        op.components = self._tunnel_components(op.plan, op.tunables)
+        for comp in op.components:
+            self.supervisor.add(comp)
+            self.log_pump.add(comp.name, comp.log_path)
+        procs = {t.index: self.supervisor.spawn(t.ss_name) for t in op.plan}
+
+        def wait() -> None:
+            for t in op.plan:
+                wait_socks_ready(t.socks_port, self.socks_timeout, proc=procs[t.index])
+
+        self._offload(wait, self._switch_spawn_tun2socks)
+
+    def _switch_spawn_tun2socks(self, _) -> None:
+        op = self.switch
+        procs = {}
+        for t in op.plan:
+            self.journal.record("link", t.dev)
+            self.net.setup_tun(t.dev, t.addr, mtu=op.tunables.mtu, txqueuelen=op.tunables.txqueuelen, queues=t.queues)
+            if t.tun_queues:
+                t.tun_queues.attach()
+            procs[t.index] = [self.supervisor.spawn(name) for name in t.tun_names]
+
+        def wait() -> None:
+            for t in op.plan:
+                for proc in procs[t.index]:
+                    wait_tun2socks_attached(proc, t.dev, self.tun_timeout)
+                wait_tun_carrier(t.dev, self.tun_timeout, proc=procs[t.index][0])
+
+        self._offload(wait, self._switch_swap)
+
+    def _switch_abort(self, error: Exception) -> None:
+        """Новый набор не поднялся: снять то, что успели создать, и остаться на текущем."""
+        op, self.switch = self.switch, None
+        if op is None:
+            return
+        if not op.components:
+            # Упали на резолве — ничего ещё не запущено
+            op.reply(error)
+            return
+        for comp in op.components:
+            if comp.name in self.supervisor.components:
+                self.supervisor.remove(comp.name)
+        for t in op.plan:
+            if t.tun_queues:
+                t.tun_queues.close()
+            self.net.delete_link(t.dev)
+            self.journal.forget("link", t.dev)
+        self._retain_pool()
+        op.reply(RuntimeError(f"новый туннель не прошёл проверки, остаёмся на текущем: {error}"))
+
+    def _switch_swap(self, _) -> None:
+        op, self.switch = self.switch, None
+        ready_ms = (time.perf_counter() - op.started) * 1000
+
+        # Переключение: сначала маршрут до нового сервера, потом `/1` (и таблицы) на новые TUN
+        t1 = time.perf_counter()
+        self.draining.extend(self.plan)
+        self.plan, self.devs = op.plan, [t.dev for t in op.plan]
+        self.tunables, self.profile = op.tunables, op.profile
+        current_gw = self.net.default_gateway() or self.gw
+        if current_gw:
+            self._pin_servers(current_gw)
+        self._apply_routes()
+        swap_ms = (time.perf_counter() - t1) * 1000
+        if self.upstream_pool is not None:
+            # До закрепления маршрута соединения к новому серверу могли уйти через старый туннель
+            self.upstream_pool.flush({(t.address, int(t.port)) for t in self.plan})
+        self.sampler.set_devs(self.devs)
+        self.info.update(
+            server=server_label(self.plan[0].url),
+            server_ip=self.plan[0].address,
+            tun_dev=self.plan[0].dev,
+            socks_port=self.plan[0].socks_port,
+        )
+        if self.dns_stub is not None:
+            self.dns_stub.set_socks_port(self.plan[0].socks_port)
+        if self.quality is not None:
+            self.quality.set_socks_port(self.plan[0].socks_port)
+        self.supervisor.call_later(op.grace, self._reap_draining)
+        op.reply(
+            {
+                "server": self.info["server"],
+                "server_ip": self.info["server_ip"],
+                "tun_dev": self.info["tun_dev"],
+                "socks_port": self.info["socks_port"],
+                "profile": self.profile,
+                "ready_ms": round(ready_ms, 1),
+                "swap_ms": round(swap_ms, 1),
+                "draining": [t.dev for t in self.draining],
+                "grace_s": op.grace,
+            }
+        )
+
 @app.command("start")
 def start(
     install_deps: bool = typer.Option(False, "--install-deps", help="Скачать deps (лучше запускать без sudo)"),
@@ -230,31 +2079,146 @@ def start(
         "--sudo/--no-sudo",
         help="Auto-reexec via sudo if needed",
     ),
+    socks_timeout: float | None = typer.Option(
+        None,
+        "--socks-timeout",
+        help="Таймаут готовности SOCKS5, сек (env SOCKS_READY_TIMEOUT, по умолчанию 5)",
+    ),
+    tun_timeout: float | None = typer.Option(
+        None,
+        "--tun-timeout",
+        help="Таймаут подключения tun2socks к TUN, сек (env TUN_READY_TIMEOUT, по умолчанию 5)",
+    ),
+    timings: bool = typer.Option(False, "--timings", help="Показать длительность фаз готовности"),
+    auto: bool = typer.Option(False, "--auto", help="Выбрать сервер с наименьшей задержкой (см. `my-vpn probe`)"),
+    detach: bool = typer.Option(False, "--detach", "-d", help="Работать в фоне (управление: status/stop/reload/stats)"),
+    tunnels: int | None = typer.Option(
+        None,
+        "--tunnels",
+        min=1,
+        help="Сколько туннелей поднять, трафик делится между ними ECMP (env TUNNELS, по умолчанию 1)",
+    ),
+    profile: str | None = typer.Option(
+        None, "--profile", help="Профиль параметров data path (env PROFILE; см. `my-vpn profiles`)"
+    ),
+    dns: bool | None = typer.Option(
+        None,
+        "--dns/--no-dns",
+        help="Локальный кэширующий DNS-стаб через туннель (env DNS_STUB, по умолчанию выключен)",
+    ),
+    pool: bool | None = typer.Option(
+        None,
+        "--pool/--no-pool",
+        help="Пул прогретых TCP-соединений до сервера перед sslocal (env UPSTREAM_POOL, по умолчанию выключен)",
+    ),
 ):
     """Запустить VPN: поднять TUN, запустить `sslocal` + `tun2socks`, прописать маршруты."""
     tun_dev = _get_tun_dev()
     tun_addr = _get_tun_addr()
     socks_port = _get_socks_port()
+    count = tunnels or _get_tunnel_count()
+    socks_timeout = socks_timeout or _get_socks_timeout()
+    tun_timeout = tun_timeout or _get_tun_timeout()
     check_root(sudo=sudo)
+    from vpn_cli.probe import probe_ranked, rank_urls
+    from vpn_cli.resolver import ResolveError, resolve_servers
+
+    timer = PhaseTimer()
+    try:
+        devs = [validate_dev(dev) for dev in tun_devs(validate_dev(tun_dev), count)]
+        tun_addrs(tun_addr, count)
+        profile, tunables = resolve_tunables(profile)
+        ss_placement = placement_from_env(ENV_SSLOCAL_CPUS)
+        tun_placement = placement_from_env(ENV_TUN2SOCKS_CPUS)
+        net = get_backend()
+    except ValueError as e:
+        console.print(f"[red]Ошибка конфигурации:[/red] {e}")
+        raise typer.Exit(code=1)
 
     bin_dir = get_bin_dir()
     ensure_bin_dir_in_path(bin_dir)
 
     if install_deps:
+        from vpn_cli.installer import check_and_install_deps
+
         check_and_install_deps()
 
-    ss_url = os.getenv("SS_URL")
-    if not ss_url:
-        console.print("[red]SS_URL не найден в .env[/red]")
+    with tracing.span("load servers"):
+        urls = _load_urls_or_exit()
+    chosen = urls[:1] if count == 1 else urls
+    try:
+        pinned_servers = _match_servers(profile_servers(get_profile(profile)), urls) if profile else []
+    except ValueError as e:
+        console.print(f"[red]Ошибка конфигурации:[/red] {e}")
         raise typer.Exit(code=1)
+    if pinned_servers:
+        chosen = pinned_servers
+    elif auto and len(urls) > 1:
+        with timer.phase("probe servers"):
+            results, cached = probe_ranked(urls)
+        ranked = rank_urls(urls, results)
+        if not ranked:
+            console.print("[red]Ни один сервер не ответил.[/red] Подробности: my-vpn probe --no-cache")
+            raise typer.Exit(code=1)
+        chosen = ranked[:count]
+        winner = results[0]
+        console.print(
+            f"Выбран сервер: [bold]{server_label(chosen[0])}[/bold] "
+            f"(median {_fmt_ms(winner.median_ms)} ms, jitter {_fmt_ms(winner.jitter_ms)} ms"
+            f"{', из кэша' if cached else ''})"
+        )
+        if len(chosen) > 1:
+            console.print(f"Ещё туннели через: {', '.join(server_label(u) for u in chosen[1:])}")
 
     try:
-        host, port, method, password, server_ip = parse_ss_url(ss_url)
+        parsed = {url: parse_ss_url(url) for url in chosen}
     except Exception as e:
         console.print(f"[red]Ошибка парсинга URL:[/red] {e}")
         raise typer.Exit(code=1)
+    table_base = _get_int_env("TUNNEL_TABLE", DEFAULT_TUNNEL_TABLE)
+    plan = plan_tunnels(
+        chosen,
+        parsed,
+        count,
+        base_dev=tun_dev,
+        base_addr=tun_addr,
+        base_port=socks_port,
+        table=table_base,
+        queues=tunables.tun_queues or 1,
+    )
+
+    # Каждый сервер резолвится один раз, все — параллельно
+    targets = list(dict.fromkeys((t.host, int(t.port)) for t in plan))
+    try:
+        with timer.phase("resolve server"):
+            resolutions = dict(zip(targets, resolve_servers(targets, timeout=_get_float_env("RESOLVE_TIMEOUT", 2.0))))
+    except (ResolveError, ValueError) as e:
+        console.print(f"[red]{e}[/red]")
+        raise typer.Exit(code=1)
+    for t in plan:
+        t.address = resolutions[(t.host, int(t.port))].address
+    summary = []
+    for (host, port), resolved in resolutions.items():
+        resolve_note = resolved.source
+        if resolved.reachable is False:
+            resolve_note += ", ни один адрес не ответил"
+        method = next(t.method for t in plan if (t.host, int(t.port)) == (host, port))
+        summary.append(f"Server: {host} ({resolved.address}, {resolve_note})\nMethod: {method}")
+    if count > 1:
+        summary.append(f"Tunnels: {count} ({', '.join(devs)}), SOCKS {socks_port}-{socks_port + count - 1}")
+    console.print(Panel("\n".join(summary), title="Config Parsed"))
 
-    console.print(Panel(f"Server: {host} ({server_ip})\nMethod: {method}", title="Config Parsed"))
+    try:
+        with timer.phase("split lists"):
+            include, exclude = load_split_lists()
+    except OSError as e:
+        console.print(f"[red]Не удалось прочитать список маршрутов:[/red] {e}")
+        raise typer.Exit(code=1)
+    if include.cidrs or exclude.cidrs:
+        console.print(
+            f"Split tunnel: include {len(include.cidrs)}, exclude {len(exclude.cidrs)} сетей"
+            f"{' (из кэша)' if include.cached or exclude.cached else ''}"
+        )
 
     ss_bin = find_binary("sslocal", bin_dir)
     tun_bin = find_binary("tun2socks", bin_dir)
@@ -265,81 +2229,74 @@ def start(
         console.print("Можно переопределить через env `MY_VPN_BIN_DIR=/path/to/bin`.")
         raise typer.Exit(code=1)
 
-    ss_log_path = "/tmp/my-vpn-sslocal.log"
-    tun_log_path = "/tmp/my-vpn-tun2socks.log"
+    notify: Callable[[bool, str], None] = lambda ok, text="": None
+    if detach:
+        notify = _daemonize(DAEMON_LOG_PATH)
 
-    # 1. Запуск SS Local
-    kill_process_on_port(socks_port)
-
-    console.print("[green]Запуск shadowsocks...[/green]")
-    ss_log = open(ss_log_path, "ab", buffering=0)
-    ss_proc = subprocess.Popen(
-        [ss_bin, "-s", f"{host}:{port}", "-m", method, "-k", password, "-b", f"127.0.0.1:{socks_port}", "-U"],
-        stdout=ss_log,
-        stderr=subprocess.STDOUT,
+    session = _Session(
+        net,
+        plan,
+        tunables=tunables,
+        profile=profile,
+        include=include,
+        exclude=exclude,
+        ss_bin=ss_bin,
+        tun_bin=tun_bin,
+        ss_placement=ss_placement,
+        tun_placement=tun_placement,
+        tun_dev=tun_dev,
+        tun_addr=tun_addr,
+        socks_port=socks_port,
+        table_base=table_base,
+        socks_timeout=socks_timeout,
+        tun_timeout=tun_timeout,
+        detach=detach,
+        notify=notify,
     )
-
-    # Даем время на старт
-    time.sleep(1)
-    if ss_proc.poll() is not None:
-        console.print(f"[red]SSLocal упал при старте![/red] Лог: {ss_log_path}")
-        raise typer.Exit(1)
-
     try:
-        # 2. Настройка интерфейса
-        console.print(f"[green]Настройка {tun_dev}...[/green]")
-        subprocess.run(f"ip link delete {tun_dev}", shell=True, stderr=subprocess.DEVNULL)
-        subprocess.check_call(f"ip tuntap add dev {tun_dev} mode tun", shell=True)
-        subprocess.check_call(f"ip addr add {tun_addr} dev {tun_dev}", shell=True)
-        subprocess.check_call(f"ip link set dev {tun_dev} up", shell=True)
-
-        # 3. Запуск Tun2Socks
-        console.print("[green]Запуск tun2socks...[/green]")
-        subprocess.run(
-            f"pkill -f \"tun2socks.*{tun_dev}\"",
-            shell=True,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-        )
-        tun_log = open(tun_log_path, "ab", buffering=0)
-        tun_proc = subprocess.Popen(
-            [tun_bin, "-device", tun_dev, "-proxy", f"socks5://127.0.0.1:{socks_port}"],
-            stdout=tun_log,
-            stderr=subprocess.STDOUT,
-        )
-
-        # 4. Маршрутизация
-        gw = subprocess.check_output("ip route show default | awk '/default/ {print $3}'", shell=True).decode().strip()
-        if gw:
-            subprocess.run(f"ip route replace {server_ip} via {gw}", shell=True, stderr=subprocess.DEVNULL)
-
-        subprocess.run(f"ip route replace 0.0.0.0/1 dev {tun_dev}", shell=True)
-        subprocess.run(f"ip route replace 128.0.0.0/1 dev {tun_dev}", shell=True)
+        session.open(pool=pool if pool is not None else _get_bool_env("UPSTREAM_POOL"))
+        session.bring_up(timer, dns=dns if dns is not None else _get_bool_env("DNS_STUB"))
 
+        if timings:
+            _print_timings(timer)
+        _trace_checkpoint()
         console.print("[bold green]VPN ПОДКЛЮЧЕН![/bold green] Нажми Ctrl+C для выхода.")
+        tunnels_line = f"Tunnels: {count} (ECMP)\n" if count > 1 else ""
+        notify(
+            True,
+            f"pid: {os.getpid()}\nServer: {session.info['server']} ({plan[0].address})\n"
+            f"TUN_DEV: {', '.join(devs)}\n{tunnels_line}ready in {timer.total() * 1000:.0f} ms\n"
+            f"Управление: my-vpn status | stats | reload | stop",
+        )
 
-        while True:
-            time.sleep(1)
-            if ss_proc.poll() is not None or tun_proc.poll() is not None:
-                raise Exception(f"Один из процессов упал! Логи: {ss_log_path}, {tun_log_path}")
+        # Упавший компонент перезапускается на месте; TUN и маршруты остаются
+        session.supervisor.run()
 
+    except ReadinessError as e:
+        logs_hint = ", ".join(comp.log_path for comp in session.supervisor.components.values())
+        console.print(f"[red]Ошибка готовности: {e}[/red] Логи: {logs_hint}")
+        notify(False, f"Ошибка готовности: {e}\nЛоги: {logs_hint}")
+        if timings:
+            _print_timings(timer)
+        raise typer.Exit(1)
+    except typer.Exit:
+        raise
     except KeyboardInterrupt:
         console.print("\n[yellow]Остановка...[/yellow]")
+    except SupervisorError as e:
+        # Ненулевой код: для systemd и скриптов упавший VPN — не штатная остановка (очистка — в finally)
+        console.print(f"[red]Перезапуски исчерпаны:[/red] {e}")
+        notify(False, f"Перезапуски исчерпаны: {e}")
+        raise typer.Exit(1)
     except Exception as e:
         console.print(f"[red]Ошибка в рантайме: {e}[/red]")
+        notify(False, f"Ошибка: {e}")
+        raise typer.Exit(1)
     finally:
         console.print("Очистка ресурсов...")
-        if "ss_proc" in locals():
-            ss_proc.terminate()
-        if "tun_proc" in locals():
-            tun_proc.terminate()
-        if "ss_log" in locals():
-            ss_log.close()
-        if "tun_log" in locals():
-            tun_log.close()
-        subprocess.run(f"ip link delete {tun_dev}", shell=True, stderr=subprocess.DEVNULL)
-        if "server_ip" in locals() and "gw" in locals():
-            subprocess.run(f"ip route del {server_ip}", shell=True, stderr=subprocess.DEVNULL)
+        notify(False, "остановлен до готовности")
+        # Сайдкары и ресурсы из журнала — в обратном порядке, сколько бы ни успели поднять
+        session.close()
 
 if __name__ == "__main__":
     app()
@@ -0,0 +1,509 @@
+"""
+Метрики туннеля: периодический сэмплер счётчиков TUN и процессов `sslocal`/`tun2socks`.
+
+Сэмплы лежат в кольцевом буфере фиксированного размера; из них считаются скользящие
+скорости (трафик, пакеты, ошибки/дропы, CPU%). Наружу — Prometheus-текст на локальном
+порту (`METRICS_PORT`) и команда `metrics` управляющего сокета (для `my-vpn top`).
+"""
+
+import os
+import socket
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable
+
+from vpn_cli.daemon import read_request, send_and_close
+
+if TYPE_CHECKING:
+    from vpn_cli.supervisor import Supervisor
+
+IFACE_FIELDS = (
+    "rx_bytes",
+    "rx_packets",
+    "rx_errors",
+    "rx_dropped",
+    "tx_bytes",
+    "tx_packets",
+    "tx_errors",
+    "tx_dropped",
+)
+CLK_TCK = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+def read_iface_counters(dev: str) -> dict[str, int] | None:
+    """Счётчики интерфейса из `/proc/net/dev` (учитывает текущий network namespace)."""
+    try:
+        lines = Path("/proc/net/dev").read_text().splitlines()[2:]
+    except OSError:
+        return None
+    for line in lines:
+        name, _, rest = line.partition(":")
+        if name.strip() != dev:
+            continue
+        f = [int(x) for x in rest.split()]
+        return {
+            "rx_bytes": f[0],
+            "rx_packets": f[1],
+            "rx_errors": f[2],
+            "rx_dropped": f[3],
+            "tx_bytes": f[8],
+            "tx_packets": f[9],
+            "tx_errors": f[10],
+            "tx_dropped": f[11],
+        }
+    return None
+
+class IfaceReader:
+    """
+    Счётчики TUN из `/sys/class/net/<dev>/statistics/*`: файлы открываются один раз и читаются
+    `pread`. Если sysfs недоступен (или смонтирован из другого netns) — `/proc/net/dev`.
+    """
+
+    def __init__(self, dev: str) -> None:
+        self.dev = dev
+        self.fds: dict[str, int] = {}
+
+    def _open(self) -> bool:
+        base = Path("/sys/class/net") / self.dev / "statistics"
+        try:
+            for name in IFACE_FIELDS:
+                self.fds[name] = os.open(base / name, os.O_RDONLY)
+        except OSError:
+            self.close()
+            return False
+        return True
+
+    def read(self) -> dict[str, int] | None:
+        if not self.fds and not self._open():
+            return read_iface_counters(self.dev)
+        try:
+            return {name: int(os.pread(fd, 32, 0)) for name, fd in self.fds.items()}
+        except (OSError, ValueError):
+            # Интерфейс пересоздан — откроем заново на следующем тике
+            self.close()
+            return read_iface_counters(self.dev)
+
+    def close(self) -> None:
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds.clear()
+
+def read_proc(pid: int) -> dict[str, int] | None:
+    """CPU (тики), RSS и I/O процесса из `/proc/<pid>/{stat,status,io}`."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read().rsplit(")", 1)[1].split()
+        sample = {"cpu_ticks": int(stat[11]) + int(stat[12]), "rss_bytes": int(stat[21]) * PAGE_SIZE}
+    except (OSError, IndexError, ValueError):
+        return None
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    sample["rss_bytes"] = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                if key in ("rchar", "wchar", "read_bytes", "write_bytes"):
+                    sample[f"io_{key}"] = int(value)
+    except (OSError, ValueError):
+        pass  # /proc/<pid>/io доступен только владельцу/root
+    return sample
+
+@dataclass(slots=True)
+class Sample:
+    t: float
+    iface: dict[str, int] | None
+    procs: dict[str, dict[str, int]] = field(default_factory=dict)
+    pids: dict[str, int] = field(default_factory=dict)
+    devs: dict[str, dict[str, int] | None] = field(default_factory=dict)  # по интерфейсам (iface — сумма)
+
+def _rate(new: float, old: float, dt: float) -> float:
+    # Счётчик мог сброситься (пересоздан интерфейс, перезапущен процесс) — тогда скорость 0, а не минус
+    return max(0.0, (new - old) / dt) if dt > 0 else 0.0
+
+class MetricsSampler:
+    """
+    Фоновый поток, раз в `interval` секунд кладёт сэмпл в кольцевой буфер на `size` элементов.
+    Интерфейсов может быть несколько (туннели): `iface` сэмпла — их сумма.
+    """
+
+    def __init__(
+        self,
+        dev: str | list[str],
+        pids: Callable[[], dict[str, int]],
+        *,
+        interval: float = 1.0,
+        size: int = 300,
+    ) -> None:
+        self.devs = [dev] if isinstance(dev, str) else list(dev)
+        self.readers = {d: IfaceReader(d) for d in self.devs}
+        self.dev = self.devs[0]
+        self.pids = pids
+        self.interval = interval
+        self.samples: deque[Sample] = deque(maxlen=size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="metrics", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def set_devs(self, devs: list[str]) -> None:
+        """Сменить набор интерфейсов на лету (после `switch`); счётчики новых начинаются с нуля."""
+        old = self.readers
+        self.readers = {d: IfaceReader(d) for d in devs}
+        self.devs, self.dev = list(devs), devs[0]
+        for reader in old.values():
+            reader.close()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join(timeout=self.interval + 1)
+        for reader in self.readers.values():
+            reader.close()
+
+    def sample(self) -> Sample:
+        pids = self.pids()
+        devs = {d: reader.read() for d, reader in self.readers.items()}
+        present = [c for c in devs.values() if c is not None]
+        iface = {key: sum(c[key] for c in present) for key in IFACE_FIELDS} if present else None
+        s = Sample(t=time.monotonic(), iface=iface, pids=pids, devs=devs)
+        for name, pid in pids.items():
+            proc = read_proc(pid)
+            if proc is not None:
+                s.procs[name] = proc
+        self.samples.append(s)
+        return s
+
+    def _loop(self) -> None:
+        next_at = time.monotonic()
+        while not self._stop.is_set():
+            self.sample()
+            next_at += self.interval
+            self._stop.wait(max(0.0, next_at - time.monotonic()))
+
+    def _pair(self, window: float, usable: Callable[[Sample], bool] = lambda s: True) -> tuple[Sample, Sample] | None:
+        """Последний сэмпл и самый свежий из тех, что старше его хотя бы на `window` секунд (или самый старый)."""
+        # `list()` снимает копию атомарно (под GIL), поток сэмплера может дописывать буфер параллельно
+        samples = [s for s in list(self.samples) if usable(s)]
+        if len(samples) < 2:
+            return None
+        new = samples[-1]
+        old = samples[0]
+        for s in reversed(samples[:-1]):
+            old = s
+            if new.t - s.t >= window:
+                break
+        return old, new
+
+    def _iface_rates(self, window: float, get: Callable[[Sample], dict[str, int] | None]) -> dict[str, float]:
+        # До появления TUN сэмплы без счётчиков — для скоростей интерфейса их пропускаем
+        pair = self._pair(window, lambda s: get(s) is not None)
+        if pair is None:
+            return {}
+        old, new = pair
+        return {f"{key}_per_s": _rate(get(new)[key], get(old)[key], new.t - old.t) for key in IFACE_FIELDS}
+
+    def rates(self, window: float = 5.0) -> dict:
+        """Скользящие скорости за `window` секунд: трафик/пакеты/ошибки TUN и CPU%/RSS/I/O процессов."""
+        iface = self._iface_rates(window, lambda s: s.iface)
+        devs = {d: self._iface_rates(window, lambda s, d=d: s.devs.get(d)) for d in self.devs} if len(self.devs) > 1 else {}
+
+        pair = self._pair(window)
+        if pair is None:
+            return {"window_s": 0.0, "iface": iface, "devs": devs, "procs": {}}
+        old, new = pair
+        dt = new.t - old.t
+        procs: dict[str, dict] = {}
+        for name, cur in new.procs.items():
+            prev = old.procs.get(name)
+            same = prev is not None and old.pids.get(name) == new.pids.get(name)
+            procs[name] = {
+                "pid": new.pids.get(name),
+                "cpu_percent": _rate(cur["cpu_ticks"], prev["cpu_ticks"], dt) / CLK_TCK * 100 if same else 0.0,
+                "rss_bytes": cur["rss_bytes"],
+                "io_read_per_s": _rate(cur.get("io_rchar", 0), prev.get("io_rchar", 0), dt) if same else 0.0,
+                "io_write_per_s": _rate(cur.get("io_wchar", 0), prev.get("io_wchar", 0), dt) if same else 0.0,
+            }
+        return {"window_s": round(dt, 3), "iface": iface, "devs": devs, "procs": procs}
+
+    def history(self, points: int = 60) -> list[dict]:
+        """Скорости rx/tx (байт/с) между соседними сэмплами — для графиков в `top`."""
+        samples = list(self.samples)[-(points + 1) :]
+        out = []
+        for old, new in zip(samples, samples[1:]):
+            if not (old.iface and new.iface):
+                continue
+            dt = new.t - old.t
+            out.append(
+                {
+                    "rx": _rate(new.iface["rx_bytes"], old.iface["rx_bytes"], dt),
+                    "tx": _rate(new.iface["tx_bytes"], old.iface["tx_bytes"], dt),
+                }
+            )
+        return out
+
+    def snapshot(self, window: float = 5.0, points: int = 60) -> dict:
+        latest = self.samples[-1] if self.samples else None
+        return {
+            "interval_s": self.interval,
+            "samples": len(self.samples),
+            "counters": latest.iface if latest else None,
+            "rates": self.rates(window),
+            "history": self.history(points),
+        }
+
+def _fmt_value(value: float) -> str:
+    # Счётчики — целые: без экспоненты, иначе большие значения теряют точность
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(round(float(value), 6))
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def render_prometheus(
+    sampler: MetricsSampler,
+    components: dict[str, dict],
+    window: float = 5.0,
+    log_events: dict | None = None,
+    dns: dict | None = None,
+    quality: dict | None = None,
+    pool: dict | None = None,
+) -> str:
+    """Метрики в текстовом формате Prometheus (exposition format 0.0.4)."""
+    lines: list[str] = []
+
+    def metric(name: str, kind: str, help_text: str, values: list[tuple[str, float]]) -> None:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            lines.append(f"{name}{{{labels}}} {_fmt_value(value)}" if labels else f"{name} {_fmt_value(value)}")
+
+    latest = sampler.samples[-1] if sampler.samples else None
+    counters = {d: c for d, c in (latest.devs.items() if latest else ()) if c}
+    for key in IFACE_FIELDS if counters else ():
+        direction, what = key.split("_", 1)
+        metric(
+            f"myvpn_tun_{key}_total",
+            "counter",
+            f"TUN {direction} {what}",
+            [(f'dev="{_escape(d)}"', c[key]) for d, c in counters.items()],
+        )
+    rates = sampler.rates(window)
+    per_dev = rates["devs"] or {sampler.dev: rates["iface"]}
+    for key in IFACE_FIELDS:
+        values = [(f'dev="{_escape(d)}"', r[f"{key}_per_s"]) for d, r in per_dev.items() if r]
+        if values:
+            metric(f"myvpn_tun_{key}_rate", "gauge", f"TUN {key}_per_s over {window:g}s", values)
+
+    procs = rates["procs"]
+    metric(
+        "myvpn_component_up",
+        "gauge",
+        "1 if the component is running",
+        [(f'component="{_escape(n)}"', 1 if c.get("state") == "running" else 0) for n, c in components.items()],
+    )
+    metric(
+        "myvpn_component_restarts_total",
+        "counter",
+        "Unplanned restarts",
+        [(f'component="{_escape(n)}"', c.get("restarts", 0)) for n, c in components.items()],
+    )
+    metric(
+        "myvpn_component_downtime_seconds_total",
+        "counter",
+        "Accumulated downtime",
+        [(f'component="{_escape(n)}"', c.get("downtime_s", 0.0)) for n, c in components.items()],
+    )
+    if latest:
+        metric(
+            "myvpn_process_cpu_seconds_total",
+            "counter",
+            "User+system CPU time",
+            [(f'component="{_escape(n)}"', p["cpu_ticks"] / CLK_TCK) for n, p in latest.procs.items()],
+        )
+    metric(
+        "myvpn_process_cpu_percent",
+        "gauge",
+        f"CPU usage over {window:g}s",
+        [(f'component="{_escape(n)}"', p["cpu_percent"]) for n, p in procs.items()],
+    )
+    metric(
+        "myvpn_process_resident_memory_bytes",
+        "gauge",
+        "Resident set size",
+        [(f'component="{_escape(n)}"', p["rss_bytes"]) for n, p in procs.items()],
+    )
+    if log_events:
+        metric(
+            "myvpn_log_lines_total",
+            "counter",
+            "Log lines written by the component",
+            [(f'component="{_escape(n)}"', v) for n, v in log_events.get("lines", {}).items()],
+        )
+        metric(
+            "myvpn_log_events_total",
+            "counter",
+            "Parsed log events (connection resets, refusals, timeouts, UDP associate failures, ...)",
+            [
+                (f'component="{_escape(n)}",event="{_escape(ev)}"', v)
+                for n, counters in log_events.get("counters", {}).items()
+                for ev, v in sorted(counters.items())
+            ],
+        )
+    if dns:
+        for key, help_text in (
+            ("queries", "Queries answered by the local DNS stub"),
+            ("hits", "Answers served from the cache (including negative)"),
+            ("negative_hits", "NXDOMAIN/NODATA answers served from the cache"),
+            ("misses", "Queries forwarded upstream"),
+            ("coalesced", "Queries that joined an identical upstream query in flight"),
+            ("prefetches", "Cache refreshes started before TTL expiry"),
+            ("servfails", "SERVFAIL answers after upstream failure"),
+            ("upstream_errors", "Upstream timeouts and SOCKS5 errors"),
+        ):
+            metric(f"myvpn_dns_{key}_total", "counter", help_text, [("", dns.get(key, 0))])
+        metric("myvpn_dns_cache_entries", "gauge", "Entries in the DNS answer cache", [("", dns.get("cache_entries", 0))])
+        if dns.get("hit_rate") is not None:
+            metric("myvpn_dns_cache_hit_ratio", "gauge", "Cache hits / queries since start", [("", dns["hit_rate"])])
+        for key, help_text in (("latency_ms", "all queries"), ("miss_latency_ms", "cache misses")):
+            values = [(f'quantile="{int(p[1:]) / 100:g}"', v / 1000) for p, v in (dns.get(key) or {}).items() if v is not None]
+            if values:
+                name = "myvpn_dns_lookup_seconds" if key == "latency_ms" else "myvpn_dns_upstream_lookup_seconds"
+                metric(name, "gauge", f"Lookup latency quantiles over recent {help_text}", values)
+    upstreams = (pool or {}).get("upstreams") or []
+    if upstreams:
+        labels = [(f'server="{_escape(u["server"])}"', u) for u in upstreams]
+        for key, help_text in (
+            ("sessions", "Connections from sslocal through the upstream pool"),
+            ("hits", "Sessions handed a pre-established connection"),
+            ("misses", "Sessions that had to open a new connection"),
+            ("recycled", "Idle pooled connections replaced before the idle timeout"),
+            ("idle_lost", "Idle pooled connections closed by the server or the path"),
+            ("dial_errors", "Failed connection attempts to the server"),
+        ):
+            metric(f"myvpn_pool_{key}_total", "counter", help_text, [(l, u[key]) for l, u in labels])
+        metric(
+            "myvpn_pool_saved_seconds_total",
+            "counter",
+            "Estimated connection setup time saved by pool hits",
+            [(l, u["saved_ms"] / 1000) for l, u in labels],
+        )
+        for key, help_text in (
+            ("idle", "Pre-established connections waiting in the pool"),
+            ("target", "Current adaptive pool size"),
+            ("active", "Sessions currently relayed"),
+        ):
+            metric(f"myvpn_pool_{key}", "gauge", help_text, [(l, u[key]) for l, u in labels])
+        values = [(l, u["hit_rate"]) for l, u in labels if u.get("hit_rate") is not None]
+        if values:
+            metric("myvpn_pool_hit_ratio", "gauge", "Pool hits / sessions since start", values)
+        values = [
+            (f'{l},quantile="{int(p[1:]) / 100:g}"', u["connect_ms"][p] / 1000)
+            for l, u in labels
+            for p in ("p50", "p90", "p99")
+            if p in (u.get("connect_ms") or {})
+        ]
+        if values:
+            metric("myvpn_pool_connect_seconds", "gauge", "Upstream TCP connect time quantiles since start", values)
+    targets = (quality or {}).get("targets") or []
+    if targets:
+        labels = {t["target"]: f'target="{_escape(t["target"])}"' for t in targets}
+        metric(
+            "myvpn_quality_probes_total",
+            "counter",
+            "Probes through the tunnel",
+            [(labels[t["target"]], t["probes"]) for t in targets],
+        )
+        metric(
+            "myvpn_quality_failures_total",
+            "counter",
+            "Failed probes (SOCKS5 CONNECT or first byte)",
+            [(labels[t["target"]], t["failures"]) for t in targets],
+        )
+        for key, help_text in (("success_rate", "Share of successful probes"), ("jitter_ms", "Connect latency jitter")):
+            values = [
+                (f'{labels[t["target"]]},window="{w}"', v if key == "success_rate" else v / 1000)
+                for t in targets
+                for w, stats in (t.get("windows") or {}).items()
+                if (v := stats.get(key)) is not None
+            ]
+            name = "myvpn_quality_success_ratio" if key == "success_rate" else "myvpn_quality_jitter_seconds"
+            if values:
+                metric(name, "gauge", f"{help_text} over the sliding window", values)
+        for key, what in (("connect_ms", "connect"), ("first_byte_ms", "first_byte")):
+            values = [
+                (f'{labels[t["target"]]},quantile="{p / 100:g}"', h[f"p{p}"] / 1000)
+                for t in targets
+                if (h := t.get(key) or {}).get("count")
+                for p in (50, 90, 99)
+            ]
+            if values:
+                metric(f"myvpn_quality_{what}_seconds", "gauge", f"Probe {what} latency quantiles since start", values)
+    return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """
+    Prometheus-эндпоинт `GET /metrics` на локальном порту. Как и `ControlServer`,
+    обслуживается из цикла `Supervisor` (`serve`), без отдельного потока; запрос читается без блокировки.
+    """
+
+    def __init__(self, render: Callable[[], str], host: str = "127.0.0.1", port: int = 0) -> None:
+        self.render = render
+        self.host = host
+        self.port = port
+        self.sock: socket.socket | None = None
+        self.loop: "Supervisor | None" = None
+
+    def open(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(16)
+        sock.setblocking(False)
+        self.port = sock.getsockname()[1]
+        self.sock = sock
+        return sock
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def serve(self, loop: "Supervisor") -> None:
+        self.loop = loop
+        loop.add_reader(self.open(), self.on_readable)
+
+    def on_readable(self, sock: socket.socket) -> None:
+        try:
+            conn, _ = sock.accept()
+        except BlockingIOError:
+            return
+        read_request(self.loop, conn, b"\r\n\r\n", lambda head: self._respond(conn, head), limit=8192)
+
+    def _respond(self, conn: socket.socket, head: bytes | None) -> None:
+        if head is None:
+            conn.close()
+            return
+        parts = head.split(b"\r\n", 1)[0].split()
+        path = parts[1].split(b"?", 1)[0] if len(parts) > 1 else b""
+        if path in (b"/metrics", b"/"):
+            status, body = "200 OK", self.render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        send_and_close(
+            conn,
+            f"HTTP/1.0 {status}\r\n"
+            f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode()
+            + body,
+        )
@@ -0,0 +1,498 @@
+"""
+Минимальный клиент rtnetlink поверх `socket.AF_NETLINK` (без внешних зависимостей).
+
+Умеет ровно то, что нужно `my-vpn`: ссылки (up/delete), адреса, маршруты (в том числе
+multipath/ECMP), правила policy routing и дамп таблицы маршрутизации. Запросы отправляются пачками (окно — один `send`) и подтверждаются пачкой.
+`NetlinkMonitor` подписывается на уведомления ядра об интерфейсах и маршрутах (multicast-группы).
+"""
+
+import errno
+import fcntl
+import ipaddress
+import os
+import socket
+import struct
+from dataclasses import dataclass
+
+# --- netlink ---
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x1
+NLM_F_ACK = 0x4
+NLM_F_DUMP = 0x300
+NLM_F_REPLACE = 0x100
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+# --- rtnetlink message types ---
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_NEWADDR = 20
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWRULE = 32
+RTM_DELRULE = 33
+
+# Multicast-группы уведомлений (`bind` с маской групп)
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_ROUTE = 0x40
+# Не тип ядра: уведомления потеряны (`ENOBUFS`), состояние надо перечитать целиком
+OVERRUN = -1
+
+# --- attributes ---
+IFLA_MTU = 4
+IFLA_TXQLEN = 13
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_MULTIPATH = 9
+RTA_TABLE = 15
+
+FRA_SRC = 2
+FRA_PRIORITY = 6
+FRA_FWMARK = 10
+FRA_TABLE = 15
+FRA_FWMASK = 16
+FR_ACT_TO_TBL = 1
+
+RT_TABLE_MAIN = 254
+RTPROT_BOOT = 3
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_LINK = 253
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+IFF_UP = 0x1
+
+# --- TUN ioctl (tuntap создаётся только через /dev/net/tun, rtnetlink этого не умеет) ---
+TUNSETIFF = 0x400454CA
+TUNSETPERSIST = 0x400454CB
+IFF_TUN = 0x0001
+IFF_NO_PI = 0x1000
+IFF_MULTI_QUEUE = 0x0100
+
+# Размер одного `send` при пакетной отправке: каждый ACK — отдельный skb (~1 КиБ в учёте rcvbuf),
+# поэтому окно держим небольшим, чтобы ACK целого окна влезали в буфер приёма
+BATCH_BYTES = 8 * 1024
+RCVBUF = 1 << 20
+
+SOL_NETLINK = 270
+NETLINK_CAP_ACK = 10
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_RTATTR = struct.Struct("=HH")
+_IFINFOMSG = struct.Struct("=BxHiII")
+_IFADDRMSG = struct.Struct("=BBBBI")
+_RTMSG = struct.Struct("=BBBBBBBBI")
+_RTNEXTHOP = struct.Struct("=HBBi")
+_FIBRULEHDR = struct.Struct("=BBBBBBBBI")
+
+class NetlinkError(OSError):
+    """Ядро отклонило netlink-запрос (errno из ответа NLMSG_ERROR)."""
+
+def _align(length: int) -> int:
+    return (length + 3) & ~3
+
+def _attr(kind: int, payload: bytes) -> bytes:
+    length = _RTATTR.size + len(payload)
+    return _RTATTR.pack(length, kind) + payload + b"\0" * (_align(length) - length)
+
+def _parse_attrs(data: bytes) -> dict[int, bytes]:
+    attrs: dict[int, bytes] = {}
+    offset = 0
+    while offset + _RTATTR.size <= len(data):
+        length, kind = _RTATTR.unpack_from(data, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[kind & 0x7FFF] = data[offset + _RTATTR.size : offset + length]
+        offset += _align(length)
+    return attrs
+
+def _ip(addr: str) -> ipaddress.IPv4Address | ipaddress.IPv6Address:
+    return ipaddress.ip_address(addr)
+
+def _packed_ip(addr: str) -> bytes:
+    try:
+        return socket.inet_pton(socket.AF_INET, addr)
+    except OSError:
+        return _ip(addr).packed
+
+def _parse_dst(dst: str) -> tuple[int, int, bytes]:
+    """
+    `(family, prefixlen, адрес сети)` из `a.b.c.d[/len]`. Для IPv4 — быстрый путь через `inet_pton`
+    (на десятках тысяч маршрутов разбор через `ipaddress` — основная стоимость), иначе `ipaddress`.
+    """
+    addr, _, plen = dst.partition("/")
+    try:
+        packed = socket.inet_pton(socket.AF_INET, addr)
+        prefixlen = int(plen) if plen else 32
+        if not 0 <= prefixlen <= 32:
+            raise ValueError(f"Некорректная длина префикса: {dst!r}")
+        mask = (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+        network = (int.from_bytes(packed, "big") & mask).to_bytes(4, "big")
+        return socket.AF_INET, prefixlen, network
+    except OSError:
+        net = ipaddress.ip_network(dst, strict=False)
+        family = socket.AF_INET if net.version == 4 else socket.AF_INET6
+        return family, net.prefixlen, net.network_address.packed
+
+def ifindex(dev: str) -> int:
+    """Индекс интерфейса по имени (`OSError`, если интерфейса нет)."""
+    return socket.if_nametoindex(dev)
+
+def create_tun(dev: str, flags: int = 0) -> None:
+    """Создать persistent TUN-устройство через `/dev/net/tun` (аналог `ip tuntap add … mode tun`)."""
+    fd = os.open("/dev/net/tun", os.O_RDWR)
+    try:
+        ifr = struct.pack("16sH", dev.encode(), IFF_TUN | IFF_NO_PI | flags)
+        fcntl.ioctl(fd, TUNSETIFF, ifr)
+        fcntl.ioctl(fd, TUNSETPERSIST, 1)
+    finally:
+        os.close(fd)
+
+def open_tun_queue(dev: str) -> int:
+    """Открыть ещё одну очередь multi-queue TUN `dev` и вернуть её дескриптор."""
+    fd = os.open("/dev/net/tun", os.O_RDWR | os.O_CLOEXEC)
+    try:
+        fcntl.ioctl(fd, TUNSETIFF, struct.pack("16sH", dev.encode(), IFF_TUN | IFF_NO_PI | IFF_MULTI_QUEUE))
+    except OSError:
+        os.close(fd)
+        raise
+    return fd
+
+@dataclass
+class RouteEntry:
+    """Маршрут из дампа таблицы маршрутизации ядра."""
+
+    family: int
+    dst: str | None
+    dst_len: int
+    gateway: str | None
+    oif: int | None
+    table: int
+    priority: int
+
+class NetlinkSocket:
+    """NETLINK_ROUTE-сокет с батчевой отправкой запросов."""
+
+    def __init__(self) -> None:
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        self.sock.bind((0, 0))
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+            # ACK без копии исходного запроса
+            self.sock.setsockopt(SOL_NETLINK, NETLINK_CAP_ACK, 1)
+        except OSError:
+            pass
+        self._seq = 0
+
+    def close(self) -> None:
+        self.sock.close()
+
+    def __enter__(self) -> "NetlinkSocket":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def _next_seq(self) -> int:
+        self._seq += 1
+        return self._seq
+
+    def _pack(self, msg_type: int, flags: int, payload: bytes) -> tuple[int, bytes]:
+        seq = self._next_seq()
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(payload), msg_type, flags, seq, 0)
+        return seq, header + payload
+
+    def _messages(self):
+        """Итерировать по сообщениям из ядра: `(type, flags, seq, payload)`."""
+        while True:
+            data = self.sock.recv(1 << 16)
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, flags, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    return
+                yield msg_type, flags, seq, data[offset + _NLMSGHDR.size : offset + length]
+                offset += _align(length)
+
+    def batch(self, requests: list[tuple[int, int, bytes]], ignore: tuple[int, ...] = ()) -> None:
+        """
+        Отправить запросы `(type, flags, payload)` пачками и дождаться всех ACK.
+
+        Запросы склеиваются в окна до `BATCH_BYTES`: одно окно — один `send`, затем чтение его ACK.
+        Так десятки тысяч маршрутов проходят без переполнения буферов сокета (`ENOBUFS`).
+
+        Ошибки с errno из `ignore` (например, `ESRCH` при удалении отсутствующего маршрута)
+        игнорируются; первая прочая ошибка поднимается как `NetlinkError` после чтения всех ответов.
+        """
+        first_error: NetlinkError | None = None
+        pending: dict[int, int] = {}
+        buf = bytearray()
+        for i, (msg_type, flags, payload) in enumerate(requests):
+            seq, packed = self._pack(msg_type, flags | NLM_F_REQUEST | NLM_F_ACK, payload)
+            pending[seq] = msg_type
+            buf += packed
+            if len(buf) >= BATCH_BYTES or i == len(requests) - 1:
+                self.sock.sendall(bytes(buf))
+                buf.clear()
+                error = self._collect_acks(pending, ignore)
+                if first_error is None:
+                    first_error = error
+        if first_error is not None:
+            raise first_error
+
+    def _collect_acks(self, pending: dict[int, int], ignore: tuple[int, ...]) -> NetlinkError | None:
+        first_error: NetlinkError | None = None
+        for msg_type, _, seq, payload in self._messages():
+            if msg_type != NLMSG_ERROR or seq not in pending:
+                continue
+            del pending[seq]
+            (code,) = struct.unpack_from("=i", payload)
+            if code and -code not in ignore and first_error is None:
+                first_error = NetlinkError(-code, os.strerror(-code))
+            if not pending:
+                break
+        return first_error
+
+    def dump(self, msg_type: int, payload: bytes):
+        """Выполнить DUMP-запрос и вернуть payload'ы всех ответных сообщений."""
+        seq, packed = self._pack(msg_type, NLM_F_REQUEST | NLM_F_DUMP, payload)
+        self.sock.sendall(packed)
+        for reply_type, _, reply_seq, reply in self._messages():
+            if reply_seq != seq:
+                continue
+            if reply_type == NLMSG_DONE:
+                return
+            if reply_type == NLMSG_ERROR:
+                (code,) = struct.unpack_from("=i", reply)
+                if code:
+                    raise NetlinkError(-code, os.strerror(-code))
+                return
+            yield reply
+
+# --- конструкторы запросов ---
+
+def link_set_up(index: int) -> tuple[int, int, bytes]:
+    return RTM_NEWLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, IFF_UP, IFF_UP)
+
+def link_set(index: int, *, mtu: int | None = None, txqlen: int | None = None) -> tuple[int, int, bytes]:
+    payload = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0)
+    if mtu is not None:
+        payload += _attr(IFLA_MTU, struct.pack("=I", mtu))
+    if txqlen is not None:
+        payload += _attr(IFLA_TXQLEN, struct.pack("=I", txqlen))
+    return RTM_NEWLINK, 0, payload
+
+def link_delete(index: int) -> tuple[int, int, bytes]:
+    return RTM_DELLINK, 0, _IFINFOMSG.pack(socket.AF_UNSPEC, 0, index, 0, 0)
+
+def addr_add(index: int, cidr: str) -> tuple[int, int, bytes]:
+    iface = ipaddress.ip_interface(cidr)
+    family = socket.AF_INET if iface.version == 4 else socket.AF_INET6
+    packed = iface.ip.packed
+    payload = _IFADDRMSG.pack(family, iface.network.prefixlen, 0, RT_SCOPE_UNIVERSE, index)
+    payload += _attr(IFA_LOCAL, packed) + _attr(IFA_ADDRESS, packed)
+    return RTM_NEWADDR, NLM_F_CREATE | NLM_F_REPLACE, payload
+
+def _route_payload(
+    dst: str,
+    *,
+    oif: int | None,
+    gateway: str | None,
+    table: int,
+    metric: int | None,
+    protocol: int = RTPROT_BOOT,
+    scope: int | None = None,
+    nexthops: list[int] | None = None,
+) -> bytes:
+    family, prefixlen, network = _parse_dst(dst)
+    if scope is None:
+        scope = RT_SCOPE_UNIVERSE if gateway else RT_SCOPE_LINK
+    payload = _RTMSG.pack(
+        family,
+        prefixlen,
+        0,
+        0,
+        table if table < 256 else 0,
+        protocol,
+        scope,
+        RTN_UNICAST,
+        0,
+    )
+    if prefixlen:
+        payload += _attr(RTA_DST, network)
+    if table >= 256:
+        payload += _attr(RTA_TABLE, struct.pack("=I", table))
+    if gateway:
+        payload += _attr(RTA_GATEWAY, _packed_ip(gateway))
+    if oif is not None:
+        payload += _attr(RTA_OIF, struct.pack("=I", oif))
+    if metric is not None:
+        payload += _attr(RTA_PRIORITY, struct.pack("=I", metric))
+    if nexthops:
+        payload += _attr(RTA_MULTIPATH, multipath(nexthops))
+    return payload
+
+def multipath(oifs: list[int], weight: int = 1) -> bytes:
+    """Тело `RTA_MULTIPATH`: по `rtnexthop` на интерфейс, равные веса (ECMP)."""
+    return b"".join(_RTNEXTHOP.pack(_RTNEXTHOP.size, 0, weight - 1, oif) for oif in oifs)
+
+def route_replace(
+    dst: str,
+    *,
+    oif: int | None = None,
+    gateway: str | None = None,
+    table: int = RT_TABLE_MAIN,
+    metric: int | None = None,
+    nexthops: list[int] | None = None,
+) -> tuple[int, int, bytes]:
+    payload = _route_payload(dst, oif=oif, gateway=gateway, table=table, metric=metric, nexthops=nexthops)
+    return RTM_NEWROUTE, NLM_F_CREATE | NLM_F_REPLACE, payload
+
+def route_delete(
+    dst: str,
+    *,
+    oif: int | None = None,
+    gateway: str | None = None,
+    table: int = RT_TABLE_MAIN,
+    metric: int | None = None,
+) -> tuple[int, int, bytes]:
+    # Как `ip route del`: RT_SCOPE_NOWHERE — не фильтровать по scope, иначе маршрут через шлюз
+    # не найдётся, если шлюз в запросе не указан
+    payload = _route_payload(dst, oif=oif, gateway=gateway, table=table, metric=metric, scope=RT_SCOPE_NOWHERE)
+    return RTM_DELROUTE, 0, payload
+
+def _rule_payload(fwmark: int | None, table: int, priority: int, family: int, src: str | None) -> bytes:
+    src_len, src_attr = 0, b""
+    if src is not None:
+        family, src_len, packed = _parse_dst(src)
+        src_attr = _attr(FRA_SRC, packed)
+    payload = _FIBRULEHDR.pack(family, 0, src_len, 0, table if table < 256 else 0, 0, 0, FR_ACT_TO_TBL, 0)
+    payload += _attr(FRA_PRIORITY, struct.pack("=I", priority)) + src_attr
+    if fwmark is not None:
+        payload += _attr(FRA_FWMARK, struct.pack("=I", fwmark))
+        payload += _attr(FRA_FWMASK, struct.pack("=I", 0xFFFFFFFF))
+    payload += _attr(FRA_TABLE, struct.pack("=I", table))
+    return payload
+
+def rule_add(
+    fwmark: int | None, table: int, priority: int, family: int = socket.AF_INET, *, src: str | None = None
+) -> tuple[int, int, bytes]:
+    """`ip rule add [from <src>] [fwmark <fwmark>] lookup <table> priority <priority>` (`EEXIST`, если уже есть)."""
+    return RTM_NEWRULE, NLM_F_CREATE | NLM_F_EXCL, _rule_payload(fwmark, table, priority, family, src)
+
+def rule_delete(
+    fwmark: int | None, table: int, priority: int, family: int = socket.AF_INET, *, src: str | None = None
+) -> tuple[int, int, bytes]:
+    return RTM_DELRULE, 0, _rule_payload(fwmark, table, priority, family, src)
+
+def _first_nexthop(body: bytes) -> tuple[bytes | None, int | None]:
+    """Первый next hop из `RTA_MULTIPATH` со шлюзом: `(RTA_GATEWAY, ifindex)`; без шлюзов — `(None, ifindex первого)`."""
+    first_oif = None
+    offset = 0
+    while offset + _RTNEXTHOP.size <= len(body):
+        length, _, _, oif = _RTNEXTHOP.unpack_from(body, offset)
+        if length < _RTNEXTHOP.size:
+            break
+        gw = _parse_attrs(body[offset + _RTNEXTHOP.size : offset + length]).get(RTA_GATEWAY)
+        if gw:
+            return gw, oif
+        if first_oif is None:
+            first_oif = oif
+        offset += _align(length)
+    return None, first_oif
+
+def parse_route(payload: bytes) -> RouteEntry | None:
+    """Разобрать `rtmsg` (ответ дампа или уведомление); `None` — не unicast-маршрут."""
+    rt_family, dst_len, _, _, table, _, _, rt_type, _ = _RTMSG.unpack_from(payload)
+    if rt_type != RTN_UNICAST:
+        return None
+    attrs = _parse_attrs(payload[_RTMSG.size :])
+    if RTA_TABLE in attrs:
+        (table,) = struct.unpack("=I", attrs[RTA_TABLE])
+    dst = attrs.get(RTA_DST)
+    gw = attrs.get(RTA_GATEWAY)
+    oif = struct.unpack("=I", attrs[RTA_OIF])[0] if RTA_OIF in attrs else None
+    if gw is None and RTA_MULTIPATH in attrs:
+        # ECMP-маршрут: шлюзы и интерфейсы лежат в next hop'ах
+        gw, hop_oif = _first_nexthop(attrs[RTA_MULTIPATH])
+        oif = oif if oif is not None else hop_oif
+    prio = attrs.get(RTA_PRIORITY)
+    return RouteEntry(
+        family=rt_family,
+        dst=socket.inet_ntop(rt_family, dst) if dst else None,
+        dst_len=dst_len,
+        gateway=socket.inet_ntop(rt_family, gw) if gw else None,
+        oif=oif,
+        table=table,
+        priority=struct.unpack("=I", prio)[0] if prio else 0,
+    )
+
+def dump_routes(nl: NetlinkSocket, family: int = socket.AF_INET) -> list[RouteEntry]:
+    """Прочитать таблицы маршрутизации ядра для `family`."""
+    request = _RTMSG.pack(family, 0, 0, 0, 0, 0, 0, 0, 0)
+    return [entry for entry in map(parse_route, nl.dump(RTM_GETROUTE, request)) if entry is not None]
+
+def default_route(nl: NetlinkSocket, family: int = socket.AF_INET) -> RouteEntry | None:
+    """
+    Маршрут по умолчанию из main-таблицы с наименьшей метрикой: через шлюз (у ECMP — первый next hop
+    со шлюзом) либо прямо в интерфейс (`default dev ppp0`).
+    """
+    defaults = [
+        r
+        for r in dump_routes(nl, family)
+        if r.dst_len == 0 and r.table == RT_TABLE_MAIN and (r.gateway or r.oif)
+    ]
+    if not defaults:
+        return None
+    return min(defaults, key=lambda r: r.priority)
+
+IGNORE_MISSING = (errno.ENODEV, errno.ESRCH, errno.ENOENT)
+
+class NetlinkMonitor:
+    """Неблокирующий сокет уведомлений rtnetlink: ядро само сообщает об изменениях, опрашивать не нужно."""
+
+    def __init__(self, groups: int = RTMGRP_LINK | RTMGRP_IPV4_ROUTE) -> None:
+        self.sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RCVBUF)
+            self.sock.bind((0, groups))
+            self.sock.setblocking(False)
+        except OSError:
+            self.sock.close()
+            raise
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def read(self) -> list[tuple[int, bytes]]:
+        """Вычитать все накопившиеся уведомления: `(type, payload)`; `(OVERRUN, b"")` — часть потеряна."""
+        events: list[tuple[int, bytes]] = []
+        while True:
+            try:
+                data = self.sock.recv(1 << 16)
+            except BlockingIOError:
+                return events
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                events.append((OVERRUN, b""))
+                continue
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, _, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    break
+                events.append((msg_type, data[offset + _NLMSGHDR.size : offset + length]))
+                offset += _align(length)
+
+    def close(self) -> None:
+        self.sock.close()
@@ -0,0 +1,458 @@
+"""
+Сетевые бэкенды: управление TUN-интерфейсом и маршрутами.
+
+- `NetlinkBackend` — напрямую через rtnetlink (без fork/exec и без shell).
+- `IpBackend` — через утилиту `ip` (fallback, если netlink недоступен).
+
+Выбор: env `NET_BACKEND=auto|netlink|ip` (по умолчанию `auto`).
+"""
+
+import errno
+import ipaddress
+import os
+import re
+import socket
+import subprocess
+from dataclasses import dataclass
+
+from vpn_cli import netlink, tracing
+
+ENV_NET_BACKEND = "NET_BACKEND"
+
+_DEV_RE = re.compile(r"^[A-Za-z0-9_.-]{1,15}$")
+_BATCH_FAILED_RE = re.compile(r"^Command failed -:(\d+)$")
+
+# Ответы `ip` на строки пачки, которые значат «уже так»: удалять нечего / добавлять незачем
+IP_MISSING = ("No such process", "No such file or directory", "Cannot find device")
+IP_EXISTS = ("File exists",)
+
+# Шлюз по умолчанию без адреса (point-to-point: `default dev ppp0`) хранится как `dev <имя>`
+GATEWAY_DEV = "dev "
+
+class NetworkError(OSError):
+    """`ip` не выполнил команду; для `ip -batch` в сообщении — каждая упавшая строка и ответ `ip` на неё."""
+
+@dataclass(frozen=True)
+class Route:
+    """Маршрут: `dst` через интерфейс `dev` и/или шлюз `via`, либо ECMP через интерфейсы `nexthops`."""
+
+    dst: str
+    dev: str | None = None
+    via: str | None = None
+    table: int | None = None
+    metric: int | None = None
+    nexthops: tuple[str, ...] = ()
+
+@dataclass(frozen=True)
+class Rule:
+    """Правило policy routing: пакеты с `fwmark` (и/или с адреса `src`) ищут маршрут в таблице `table`."""
+
+    fwmark: int | None
+    table: int
+    priority: int
+    src: str | None = None
+
+def gateway_route(dst: str, gateway: str | None) -> Route:
+    """Маршрут до `dst` через шлюз по умолчанию: `via <адрес>` либо `dev <имя>` для линка без шлюза."""
+    if gateway and gateway.startswith(GATEWAY_DEV):
+        return Route(dst, dev=gateway.removeprefix(GATEWAY_DEV))
+    return Route(dst, via=gateway)
+
+def validate_dev(dev: str) -> str:
+    """Проверить имя интерфейса (до 15 символов, без пробелов/спецсимволов)."""
+    if not _DEV_RE.match(dev):
+        raise ValueError(f"Некорректное имя интерфейса: {dev!r}")
+    return dev
+
+def validate_ip(addr: str) -> str:
+    """Проверить, что `addr` — IP-адрес (а не имя хоста/мусор)."""
+    return str(ipaddress.ip_address(addr))
+
+class NetBackend:
+    """Интерфейс сетевого бэкенда."""
+
+    name = "base"
+
+    def link_exists(self, dev: str) -> bool:
+        raise NotImplementedError
+
+    def delete_link(self, dev: str) -> None:
+        """Удалить интерфейс (отсутствие интерфейса — не ошибка)."""
+        raise NotImplementedError
+
+    def setup_tun(
+        self, dev: str, addr: str, *, mtu: int | None = None, txqueuelen: int | None = None, queues: int = 1
+    ) -> None:
+        """
+        Пересоздать TUN `dev`, назначить адрес `addr` (и MTU/длину очереди, если заданы) и поднять интерфейс.
+        `queues > 1` — TUN с несколькими очередями (`IFF_MULTI_QUEUE`); очереди открывает `TunQueues`.
+        """
+        raise NotImplementedError
+
+    def set_link(self, dev: str, *, mtu: int | None = None, txqueuelen: int | None = None) -> None:
+        """Поменять MTU и/или длину очереди передачи интерфейса на лету."""
+        raise NotImplementedError
+
+    def default_gateway(self) -> str | None:
+        """Шлюз маршрута по умолчанию: адрес либо `dev <имя>`, если маршрут ведёт прямо в интерфейс."""
+        raise NotImplementedError
+
+    def replace_routes(self, routes: list[Route]) -> None:
+        """Установить (replace) все маршруты одной пачкой."""
+        raise NotImplementedError
+
+    def delete_routes(self, routes: list[Route]) -> None:
+        """Удалить маршруты одной пачкой (отсутствующие пропускаются)."""
+        raise NotImplementedError
+
+    def add_rules(self, rules: list[Rule]) -> None:
+        """Добавить правила (уже существующие пропускаются)."""
+        raise NotImplementedError
+
+    def delete_rules(self, rules: list[Rule]) -> None:
+        """Удалить правила (отсутствующие пропускаются)."""
+        raise NotImplementedError
+
+    def monitor(self) -> "RouteMonitor":
+        """Подписаться на изменения маршрутов по умолчанию и интерфейсов (для `select`)."""
+        raise NotImplementedError
+
+class RouteMonitor:
+    """Источник событий «маршрут по умолчанию мог измениться»: `fileno()` для `select`, `changed()` — вычитать."""
+
+    def fileno(self) -> int:
+        raise NotImplementedError
+
+    def changed(self) -> bool:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+class NetlinkRouteMonitor(RouteMonitor):
+    def __init__(self) -> None:
+        self.nl = netlink.NetlinkMonitor()
+
+    def fileno(self) -> int:
+        return self.nl.fileno()
+
+    def changed(self) -> bool:
+        changed = False
+        for msg_type, payload in self.nl.read():
+            if msg_type in (netlink.RTM_NEWROUTE, netlink.RTM_DELROUTE):
+                # Свои `/1`, маршруты до серверов и таблицы туннелей сюда не попадают — нет обратной связи
+                entry = netlink.parse_route(payload)
+                changed = changed or (entry is not None and entry.dst_len == 0 and entry.table == netlink.RT_TABLE_MAIN)
+            elif msg_type in (netlink.RTM_NEWLINK, netlink.RTM_DELLINK, netlink.OVERRUN):
+                changed = True
+        return changed
+
+    def close(self) -> None:
+        self.nl.close()
+
+class IpRouteMonitor(RouteMonitor):
+    """`ip monitor route link` в фоне: строка на событие."""
+
+    _LINK_RE = re.compile(r"^\d+: ")
+
+    def __init__(self) -> None:
+        self.proc = subprocess.Popen(
+            ["ip", "-4", "monitor", "route", "link"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        os.set_blocking(self.proc.stdout.fileno(), False)
+        self._buf = b""
+
+    def fileno(self) -> int:
+        return self.proc.stdout.fileno()
+
+    def changed(self) -> bool:
+        try:
+            while chunk := os.read(self.fileno(), 1 << 16):
+                self._buf += chunk
+        except BlockingIOError:
+            pass
+        *lines, self._buf = self._buf.split(b"\n")
+        changed = False
+        for line in lines:
+            text = line.decode(errors="replace").removeprefix("Deleted ")
+            changed = changed or text.startswith("default") or bool(self._LINK_RE.match(text))
+        return changed
+
+    def close(self) -> None:
+        self.proc.terminate()
+        self.proc.wait()
+        self.proc.stdout.close()
+
+class NetlinkBackend(NetBackend):
+    """Бэкенд на rtnetlink: всё в одном процессе, запросы батчатся."""
+
+    name = "netlink"
+
+    def link_exists(self, dev: str) -> bool:
+        try:
+            netlink.ifindex(dev)
+            return True
+        except OSError:
+            return False
+
+    def delete_link(self, dev: str) -> None:
+        try:
+            index = netlink.ifindex(validate_dev(dev))
+        except OSError:
+            return
+        with netlink.NetlinkSocket() as nl:
+            nl.batch([netlink.link_delete(index)], ignore=netlink.IGNORE_MISSING)
+
+    def setup_tun(
+        self, dev: str, addr: str, *, mtu: int | None = None, txqueuelen: int | None = None, queues: int = 1
+    ) -> None:
+        validate_dev(dev)
+        self.delete_link(dev)
+        netlink.create_tun(dev, netlink.IFF_MULTI_QUEUE if queues > 1 else 0)
+        index = netlink.ifindex(dev)
+        requests = [netlink.addr_add(index, addr)]
+        if mtu is not None or txqueuelen is not None:
+            requests.append(netlink.link_set(index, mtu=mtu, txqlen=txqueuelen))
+        with netlink.NetlinkSocket() as nl:
+            nl.batch([*requests, netlink.link_set_up(index)])
+
+    def set_link(self, dev: str, *, mtu: int | None = None, txqueuelen: int | None = None) -> None:
+        if mtu is None and txqueuelen is None:
+            return
+        index = netlink.ifindex(validate_dev(dev))
+        with netlink.NetlinkSocket() as nl:
+            nl.batch([netlink.link_set(index, mtu=mtu, txqlen=txqueuelen)])
+
+    def default_gateway(self) -> str | None:
+        with netlink.NetlinkSocket() as nl:
+            entry = netlink.default_route(nl)
+        if entry is None:
+            return None
+        if entry.gateway:
+            return entry.gateway
+        try:
+            return GATEWAY_DEV + socket.if_indextoname(entry.oif)
+        except OSError:
+            # Интерфейс исчез между дампом и запросом имени
+            return None
+
+    def _route_kwargs(self, route: Route, cache: dict) -> dict:
+        # `cache` живёт одну пачку: индекс интерфейса и проверка шлюза — один раз на значение
+        oif = gateway = None
+        if route.dev:
+            oif = self._oif(route.dev, cache)
+        if route.via:
+            key = ("via", route.via)
+            if key not in cache:
+                cache[key] = validate_ip(route.via)
+            gateway = cache[key]
+        return {
+            "oif": oif,
+            "gateway": gateway,
+            "table": route.table or netlink.RT_TABLE_MAIN,
+            "metric": route.metric,
+        }
+
+    def _oif(self, dev: str, cache: dict) -> int:
+        key = ("dev", dev)
+        if key not in cache:
+            cache[key] = netlink.ifindex(validate_dev(dev))
+        return cache[key]
+
+    def replace_routes(self, routes: list[Route]) -> None:
+        cache: dict = {}
+        requests = []
+        for r in routes:
+            kwargs = self._route_kwargs(r, cache)
+            if r.nexthops:
+                kwargs["nexthops"] = [self._oif(dev, cache) for dev in r.nexthops]
+            requests.append(netlink.route_replace(r.dst, **kwargs))
+        with netlink.NetlinkSocket() as nl:
+            nl.batch(requests)
+
+    def delete_routes(self, routes: list[Route]) -> None:
+        cache: dict = {}
+        requests = []
+        for r in routes:
+            try:
+                kwargs = self._route_kwargs(r, cache)
+            except OSError:
+                # Интерфейс уже удалён — вместе с ним ушли и маршруты через него
+                continue
+            requests.append(netlink.route_delete(r.dst, **kwargs))
+        with netlink.NetlinkSocket() as nl:
+            nl.batch(requests, ignore=netlink.IGNORE_MISSING)
+
+    def add_rules(self, rules: list[Rule]) -> None:
+        with netlink.NetlinkSocket() as nl:
+            nl.batch([netlink.rule_add(r.fwmark, r.table, r.priority, src=r.src) for r in rules], ignore=(errno.EEXIST,))
+
+    def delete_rules(self, rules: list[Rule]) -> None:
+        with netlink.NetlinkSocket() as nl:
+            nl.batch(
+                [netlink.rule_delete(r.fwmark, r.table, r.priority, src=r.src) for r in rules],
+                ignore=netlink.IGNORE_MISSING,
+            )
+
+    def monitor(self) -> RouteMonitor:
+        return NetlinkRouteMonitor()
+
+class IpBackend(NetBackend):
+    """Fallback-бэкенд через `ip` (argv-списки, без shell)."""
+
+    name = "ip"
+
+    def _run(self, *args: str, check: bool = True, input: str | None = None) -> subprocess.CompletedProcess:
+        return tracing.run(
+            ["ip", *args],
+            check=check,
+            input=input,
+            text=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL if not check else None,
+        )
+
+    def link_exists(self, dev: str) -> bool:
+        return self._run("link", "show", validate_dev(dev), check=False).returncode == 0
+
+    def delete_link(self, dev: str) -> None:
+        self._run("link", "delete", validate_dev(dev), check=False)
+
+    def setup_tun(
+        self, dev: str, addr: str, *, mtu: int | None = None, txqueuelen: int | None = None, queues: int = 1
+    ) -> None:
+        validate_dev(dev)
+        ipaddress.ip_interface(addr)
+        self.delete_link(dev)
+        self._run("tuntap", "add", "dev", dev, "mode", "tun", *(["multi_queue"] if queues > 1 else []))
+        self._run("addr", "add", addr, "dev", dev)
+        self.set_link(dev, mtu=mtu, txqueuelen=txqueuelen)
+        self._run("link", "set", "dev", dev, "up")
+
+    def set_link(self, dev: str, *, mtu: int | None = None, txqueuelen: int | None = None) -> None:
+        args = []
+        if mtu is not None:
+            args += ["mtu", str(int(mtu))]
+        if txqueuelen is not None:
+            args += ["txqueuelen", str(int(txqueuelen))]
+        if args:
+            self._run("link", "set", "dev", validate_dev(dev), *args)
+
+    def default_gateway(self) -> str | None:
+        out = self._run("route", "show", "default", check=False).stdout
+        for line in out.splitlines():
+            # У ECMP-маршрута next hop'ы — отдельными строками `nexthop via ... dev ...`
+            parts = line.split()
+            if "via" in parts:
+                return parts[parts.index("via") + 1]
+            if parts[:1] == ["default"] and "dev" in parts:
+                return GATEWAY_DEV + parts[parts.index("dev") + 1]
+        return None
+
+    def _route_args(self, route: Route, nexthops: bool = True) -> list[str]:
+        args = [str(ipaddress.ip_network(route.dst, strict=False))]
+        if route.via:
+            args += ["via", validate_ip(route.via)]
+        if route.dev:
+            args += ["dev", validate_dev(route.dev)]
+        if route.table:
+            args += ["table", str(int(route.table))]
+        if route.metric is not None:
+            args += ["metric", str(int(route.metric))]
+        if nexthops:
+            for dev in route.nexthops:
+                args += ["nexthop", "dev", validate_dev(dev), "weight", "1"]
+        return args
+
+    def _batch(self, lines: list[str], ignore: tuple[str, ...] = ()) -> None:
+        """
+        `ip -force -batch -` — один процесс на всю пачку; `-force` выполняет строки и после ошибки.
+
+        На каждую упавшую строку `ip` пишет в stderr ответ и `Command failed -:<номер>`.
+        Строки, чей ответ содержит одну из подстрок `ignore`, считаются выполненными;
+        остальные поднимаются одним `NetworkError`.
+        """
+        if not lines:
+            return
+        result = tracing.run(
+            ["ip", "-force", "-batch", "-"],
+            input="\n".join(lines) + "\n",
+            text=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        if result.returncode == 0:
+            return
+        failed = []
+        matched = False
+        message: list[str] = []
+        for line in result.stderr.splitlines():
+            m = _BATCH_FAILED_RE.match(line.strip())
+            if m is None:
+                message.append(line.strip())
+                continue
+            matched = True
+            reason = "; ".join(message)
+            message = []
+            if not any(s in reason for s in ignore):
+                failed.append(f"{lines[int(m.group(1)) - 1]}: {reason}")
+        if not matched:
+            # Ненулевой код без разбора по строкам: `ip` упал целиком
+            raise NetworkError(errno.EIO, f"ip -batch: код выхода {result.returncode}: {result.stderr.strip()}")
+        if failed:
+            raise NetworkError(errno.EIO, "ip -batch: не выполнены строки:\n" + "\n".join(failed))
+
+    def replace_routes(self, routes: list[Route]) -> None:
+        self._batch([" ".join(["route", "replace", *self._route_args(r)]) for r in routes])
+
+    def delete_routes(self, routes: list[Route]) -> None:
+        self._batch([" ".join(["route", "del", *self._route_args(r, nexthops=False)]) for r in routes], IP_MISSING)
+
+    def _rule_args(self, rule: Rule) -> list[str]:
+        args = ["from", str(ipaddress.ip_network(rule.src))] if rule.src else []
+        if rule.fwmark is not None:
+            args += ["fwmark", str(int(rule.fwmark))]
+        return args + ["lookup", str(int(rule.table)), "priority", str(int(rule.priority))]
+
+    @staticmethod
+    def _rule_show(rule: Rule) -> str:
+        """Строка правила в выводе `ip rule show` (после нормализации пробелов)."""
+        src = str(ipaddress.ip_network(rule.src)).removesuffix("/32") if rule.src else "all"
+        fwmark = f" fwmark {rule.fwmark:#x}" if rule.fwmark is not None else ""
+        return f"{rule.priority}: from {src}{fwmark} lookup {rule.table}"
+
+    def add_rules(self, rules: list[Rule]) -> None:
+        # `ip rule add` не отвечает EEXIST, а создаёт дубль — уже существующие пропускаем
+        existing = {" ".join(line.split()) for line in self._run("rule", "show", check=False).stdout.splitlines()}
+        self._batch(
+            [
+                " ".join(["rule", "add", *self._rule_args(r)])
+                for r in rules
+                if self._rule_show(r) not in existing
+            ],
+            IP_EXISTS,
+        )
+
+    def delete_rules(self, rules: list[Rule]) -> None:
+        self._batch([" ".join(["rule", "del", *self._rule_args(r)]) for r in rules], IP_MISSING)
+
+    def monitor(self) -> RouteMonitor:
+        return IpRouteMonitor()
+
+def _netlink_available() -> bool:
+    try:
+        with netlink.NetlinkSocket():
+            return True
+    except OSError:
+        return False
+
+def get_backend(name: str | None = None) -> NetBackend:
+    """Выбрать сетевой бэкенд по имени или env `NET_BACKEND` (`auto` — netlink, если доступен)."""
+    name = (name or os.getenv(ENV_NET_BACKEND, "auto")).strip().lower()
+    if name == "ip":
+        return IpBackend()
+    if name == "netlink":
+        return NetlinkBackend()
+    if name != "auto":
+        raise ValueError(f"Неизвестный NET_BACKEND: {name!r} (ожидается auto|netlink|ip)")
+    return NetlinkBackend() if _netlink_available() else IpBackend()
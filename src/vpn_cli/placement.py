@@ -0,0 +1,165 @@
+"""
+Размещение процессов data path по CPU: привязка к ядрам или NUMA-узлу, `nice` и приоритет ввода-вывода.
+
+`sslocal` и `tun2socks` — единственные горячие процессы; на хосте с другими нагрузками их имеет смысл
+держать на своих ядрах (и на узле, к которому подключена сетевая карта), а фоновые задачи — отодвинуть.
+Всё задаётся env:
+
+- `SSLOCAL_CPUS`, `TUN2SOCKS_CPUS` — `0-3,8` или `node:0` (все CPU NUMA-узла)
+- `DATAPATH_NICE` — `nice` детей (-20..19)
+- `DATAPATH_IOPRIO` — класс и уровень ввода-вывода: `be:4`, `rt:0`, `idle`
+
+Применяется к уже запущенному ребёнку ко всем его потокам (`/proc/<pid>/task`): `preexec_fn` в
+многопоточном демоне небезопасен. Потоки, созданные позже, наследуют маску и приоритет от родительского.
+"""
+
+import os
+import platform
+from dataclasses import dataclass
+from pathlib import Path
+
+ENV_SSLOCAL_CPUS = "SSLOCAL_CPUS"
+ENV_TUN2SOCKS_CPUS = "TUN2SOCKS_CPUS"
+ENV_NICE = "DATAPATH_NICE"
+ENV_IOPRIO = "DATAPATH_IOPRIO"
+NODE_PATH = Path("/sys/devices/system/node")
+
+IOPRIO_CLASSES = {"rt": 1, "be": 2, "idle": 3}
+IOPRIO_CLASS_SHIFT = 13
+IOPRIO_WHO_PROCESS = 1
+# Номер `ioprio_set` зависит от архитектуры; в `os` этого вызова нет
+_IOPRIO_SET = {"x86_64": 251, "i686": 289, "i386": 289, "aarch64": 30, "armv7l": 314, "ppc64le": 273, "riscv64": 30}
+
+def parse_cpulist(text: str) -> list[int]:
+    """`0-3,8,10-11` -> `[0, 1, 2, 3, 8, 10, 11]` (формат `cpulist` в sysfs и `taskset -c`)."""
+    cpus: set[int] = set()
+    for part in "".join(text.split()).split(","):
+        if not part:
+            continue
+        low, sep, high = part.partition("-")
+        if not low.isdigit() or (sep and not high.isdigit()):
+            raise ValueError(f"Некорректный список CPU: {text!r}")
+        cpus.update(range(int(low), int(high if sep else low) + 1))
+    if not cpus:
+        raise ValueError(f"Пустой список CPU: {text!r}")
+    return sorted(cpus)
+
+def format_cpulist(cpus: list[int]) -> str:
+    """`[0, 1, 2, 3, 8]` -> `0-3,8`."""
+    parts, start = [], None
+    for i, cpu in enumerate(cpus):
+        if start is None:
+            start = cpu
+        if i + 1 == len(cpus) or cpus[i + 1] != cpu + 1:
+            parts.append(str(start) if start == cpu else f"{start}-{cpu}")
+            start = None
+    return ",".join(parts)
+
+def parse_cpus(spec: str) -> list[int]:
+    """`0-3,8` или `node:N` (CPU NUMA-узла `N` из sysfs)."""
+    spec = spec.strip()
+    if spec.startswith("node:"):
+        node = spec[5:]
+        try:
+            return parse_cpulist((NODE_PATH / f"node{int(node)}" / "cpulist").read_text())
+        except (ValueError, OSError):
+            raise ValueError(f"NUMA-узел не найден: {spec!r}")
+    return parse_cpulist(spec)
+
+def parse_ioprio(spec: str) -> tuple[int, int]:
+    """`be:4` -> `(2, 4)`; `idle` — без уровня."""
+    cls, _, level = spec.strip().lower().partition(":")
+    if cls not in IOPRIO_CLASSES:
+        raise ValueError(f"Неизвестный класс ввода-вывода: {spec!r} (есть: {', '.join(IOPRIO_CLASSES)})")
+    value = int(level) if level else (0 if cls == "idle" else 4)
+    if not 0 <= value <= 7:
+        raise ValueError(f"Уровень ввода-вывода вне 0..7: {spec!r}")
+    return IOPRIO_CLASSES[cls], value
+
+def split_cpus(cpus: list[int] | None, parts: int) -> list[list[int] | None]:
+    """Разделить набор на `parts` непересекающихся частей (очереди TUN); ядер меньше — всем весь набор."""
+    if cpus is None or parts <= 1 or len(cpus) < parts:
+        return [cpus] * parts
+    share, rest = divmod(len(cpus), parts)
+    chunks, start = [], 0
+    for i in range(parts):
+        end = start + share + (1 if i < rest else 0)
+        chunks.append(cpus[start:end])
+        start = end
+    return chunks
+
+def _ioprio_set(tid: int, cls: int, level: int) -> None:
+    number = _IOPRIO_SET.get(platform.machine())
+    if number is None:
+        raise OSError(f"ioprio_set: неизвестный номер вызова для {platform.machine()}")
+    import ctypes
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(number, IOPRIO_WHO_PROCESS, tid, (cls << IOPRIO_CLASS_SHIFT) | level) != 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+@dataclass
+class Placement:
+    """Где и с каким приоритетом работает процесс; `None` — не трогать."""
+
+    cpus: list[int] | None = None
+    nice: int | None = None
+    ioprio: tuple[int, int] | None = None
+
+    def __bool__(self) -> bool:
+        return self.cpus is not None or self.nice is not None or self.ioprio is not None
+
+    def apply(self, pid: int) -> str | None:
+        """
+        Применить ко всем потокам `pid`; вернуть текст ошибки или `None`.
+        Два прохода: поток, созданный во время первого от ещё не перенастроенного, ловится вторым.
+        """
+        error = None
+        for _ in range(2):
+            try:
+                tids = [int(name) for name in os.listdir(f"/proc/{pid}/task")]
+            except OSError:
+                return None  # процесс уже завершился — разбирается супервизор
+            for tid in tids:
+                try:
+                    if self.cpus is not None:
+                        os.sched_setaffinity(tid, self.cpus)
+                    if self.nice is not None:
+                        os.setpriority(os.PRIO_PROCESS, tid, self.nice)
+                    if self.ioprio is not None:
+                        _ioprio_set(tid, *self.ioprio)
+                except ProcessLookupError:
+                    continue
+                except OSError as e:
+                    error = str(e)
+        return error
+
+    def describe(self) -> dict:
+        data: dict = {}
+        if self.cpus is not None:
+            data["cpus"] = format_cpulist(self.cpus)
+        if self.nice is not None:
+            data["nice"] = self.nice
+        if self.ioprio is not None:
+            cls = next(name for name, value in IOPRIO_CLASSES.items() if value == self.ioprio[0])
+            data["ioprio"] = cls if cls == "idle" else f"{cls}:{self.ioprio[1]}"
+        return data
+
+def placement_from_env(cpus_key: str) -> Placement:
+    """Размещение из env: набор CPU из `cpus_key`, `nice`/ioprio — общие для всего data path."""
+    cpus = os.getenv(cpus_key, "").strip()
+    nice = os.getenv(ENV_NICE, "").strip()
+    ioprio = os.getenv(ENV_IOPRIO, "").strip()
+    placement = Placement(
+        cpus=parse_cpus(cpus) if cpus else None,
+        nice=int(nice) if nice else None,
+        ioprio=parse_ioprio(ioprio) if ioprio else None,
+    )
+    if placement.nice is not None and not -20 <= placement.nice <= 19:
+        raise ValueError(f"{ENV_NICE} вне диапазона -20..19: {placement.nice}")
+    if placement.cpus is not None:
+        unknown = set(placement.cpus) - os.sched_getaffinity(0)
+        if unknown:
+            raise ValueError(f"{cpus_key}: CPU {format_cpulist(sorted(unknown))} недоступны процессу")
+    return placement
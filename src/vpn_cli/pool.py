@@ -0,0 +1,526 @@
+"""
+Пул заранее установленных TCP-соединений до сервера (`UPSTREAM_POOL=1` или `start --pool`).
+
+Каждый новый поток из `tun2socks` заставляет `sslocal` открыть к серверу новое TCP-соединение: на канале
+с большим RTT это лишний круг рукопожатия на каждый короткий запрос. В Shadowsocks первым пишет клиент,
+сервер до первых байт молчит, поэтому соединение можно открыть заранее и отдать сеансу, который появится
+позже. `sslocal` направляется на локальный ретранслятор (`-s 127.0.0.1:<порт>`), а тот держит пул
+соединений до закреплённого `server_ip:port` и склеивает с ними входящие:
+
+- размер пула — число соединений за самую загруженную секунду последних `POOL_WINDOW` секунд (умноженное
+  на время установки, если оно дольше секунды), в пределах `POOL_MIN`..`POOL_MAX`
+- соединение, пролежавшее в пуле около `POOL_MAX_IDLE` секунд, заменяется свежим раньше, чем его закроет
+  по простою сервер или NAT
+- на промахе (пул пуст) соединение открывается с TCP Fast Open, где он есть: SYN уходит вместе с первыми
+  байтами `sslocal`
+- UDP (`sslocal -U`) пересылается к серверу как есть
+
+Счётчики — доля попаданий, сэкономленное на рукопожатиях время, гистограмма времени установки — в `status`,
+`stats` и Prometheus. Ретранслятор — лишнее копирование в user space: он для каналов с большим RTT и
+множеством коротких соединений, а не ради пропускной способности.
+"""
+
+import asyncio
+import math
+import random
+import socket
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+from vpn_cli.histogram import Histogram
+
+DEFAULT_MIN = 1
+DEFAULT_MAX = 8
+DEFAULT_MAX_IDLE = 20.0
+DEFAULT_WINDOW = 30
+MAINTAIN_INTERVAL = 0.5
+RETRY_MAX = 30.0
+UDP_IDLE = 120.0
+EWMA_ALPHA = 0.2
+# Linux: `connect()` сразу успешен, SYN уходит с первыми данными (с cookie сервера — в одном пакете)
+TCP_FASTOPEN_CONNECT = getattr(socket, "TCP_FASTOPEN_CONNECT", 30)
+TFO_SYSCTL = Path("/proc/sys/net/ipv4/tcp_fastopen")
+
+def tfo_client_enabled() -> bool:
+    """Разрешён ли TFO для исходящих соединений (бит 1 в `net.ipv4.tcp_fastopen`)."""
+    try:
+        return bool(int(TFO_SYSCTL.read_text()) & 1)
+    except (OSError, ValueError):
+        return False
+
+# --- склейка соединений ---
+
+class _Side(asyncio.Protocol):
+    """Одна сторона склейки: прочитанное пишется в `peer` с обратным давлением; до пары — копится."""
+
+    def __init__(self) -> None:
+        self.transport: asyncio.Transport | None = None
+        self.peer: _Side | None = None
+        self.buffer: list[bytes] = []
+        self.eof = False
+        self.lost = False
+        self.expires = 0.0
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        self.transport = transport
+
+    def data_received(self, data: bytes) -> None:
+        if self.peer is not None:
+            self.peer.transport.write(data)
+        else:
+            self.buffer.append(data)
+
+    def eof_received(self) -> bool:
+        self.eof = True
+        if self.peer is not None:
+            self._forward_eof()
+        return True  # полузакрытие: в обратную сторону данные ещё идут
+
+    def connection_lost(self, exc) -> None:
+        self.lost = True
+        if self.peer is not None and not self.peer.lost:
+            self.peer.transport.close()
+
+    def pause_writing(self) -> None:
+        if self.peer is not None:
+            self.peer.transport.pause_reading()
+
+    def resume_writing(self) -> None:
+        if self.peer is not None:
+            self.peer.transport.resume_reading()
+
+    def _forward_eof(self) -> None:
+        if self.peer.eof:
+            self.transport.close()
+            self.peer.transport.close()
+        elif self.peer.transport.can_write_eof():
+            self.peer.transport.write_eof()
+
+    def usable(self) -> bool:
+        """Соединение из пула ещё годно: сервер его не закрыл и ничего не прислал."""
+        return not (self.lost or self.eof or self.buffer)
+
+    def pair(self, other: "_Side") -> None:
+        self.peer, other.peer = other, self
+        for side in (self, other):
+            if side.buffer:
+                side.peer.transport.write(b"".join(side.buffer))
+                side.buffer.clear()
+        for side in (self, other):
+            if side.lost:
+                side.peer.transport.close()
+            elif side.eof:
+                side._forward_eof()
+
+    def close(self) -> None:
+        if self.transport is not None and not self.lost:
+            self.transport.close()
+
+class _Inbound(_Side):
+    """Соединение от `sslocal`: сразу получает соединение из пула или ждёт нового."""
+
+    def __init__(self, upstream: "Upstream") -> None:
+        super().__init__()
+        self.upstream = upstream
+
+    def connection_made(self, transport: asyncio.Transport) -> None:
+        super().connection_made(transport)
+        self.upstream.session(self)
+
+    def connection_lost(self, exc) -> None:
+        super().connection_lost(exc)
+        self.upstream.clients.discard(self)
+
+class _UdpFlow(asyncio.DatagramProtocol):
+    """UDP одного сокета `sslocal` к серверу: свой исходящий сокет, ответы — обратно клиенту."""
+
+    def __init__(self, listener: asyncio.DatagramTransport, client) -> None:
+        self.listener = listener
+        self.client = client
+        self.transport: asyncio.DatagramTransport | None = None
+        self.pending: list[bytes] = []
+        self.last = time.monotonic()
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+        for data in self.pending:
+            transport.sendto(data)
+        self.pending.clear()
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.last = time.monotonic()
+        self.listener.sendto(data, self.client)
+
+    def error_received(self, exc) -> None:
+        pass  # ICMP unreachable: UDP без гарантий, `sslocal` разберётся сам
+
+    def send(self, data: bytes) -> None:
+        self.last = time.monotonic()
+        if self.transport is not None:
+            self.transport.sendto(data)
+        else:
+            self.pending.append(data)
+
+class _UdpListener(asyncio.DatagramProtocol):
+    def __init__(self, upstream: "Upstream") -> None:
+        self.upstream = upstream
+        self.transport: asyncio.DatagramTransport | None = None
+
+    def connection_made(self, transport: asyncio.DatagramTransport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        flows = self.upstream.udp_flows
+        flow = flows.get(addr)
+        if flow is None:
+            flow = flows[addr] = _UdpFlow(self.transport, addr)
+            self.upstream.spawn(self.upstream.open_udp_flow(flow))
+        flow.send(data)
+
+    def error_received(self, exc) -> None:
+        pass
+
+# --- пул до одного сервера ---
+
+class Upstream:
+    """Прогретые соединения до одного сервера и локальный порт, на который смотрит `sslocal`."""
+
+    def __init__(
+        self,
+        address: str,
+        port: int,
+        min_size: int = DEFAULT_MIN,
+        max_size: int = DEFAULT_MAX,
+        max_idle: float = DEFAULT_MAX_IDLE,
+        window: int = DEFAULT_WINDOW,
+        connect_timeout: float = 5.0,
+        fastopen: bool = True,
+    ) -> None:
+        self.address = address
+        self.port = port
+        self.family = socket.AF_INET6 if ":" in address else socket.AF_INET
+        self.min_size = min_size
+        self.max_size = max(max_size, min_size)
+        self.max_idle = max_idle
+        self.window = window
+        self.connect_timeout = connect_timeout
+        self.fastopen = fastopen
+        self.listen_port = 0
+        self.idle: deque[_Side] = deque()  # от старых к новым
+        self.clients: set[_Inbound] = set()
+        self.udp_flows: dict = {}
+        self.dialing = 0
+        self.hits = self.misses = self.recycled = self.idle_lost = self.dial_errors = 0
+        self.saved_ms = 0.0
+        self.connect = Histogram()
+        self.connect_ewma: float | None = None  # мс, по соединениям в пул (TFO-промахи не в счёт)
+        self.last_error: str | None = None
+        self.arrivals: deque[list[int]] = deque()  # [секунда, новых сеансов]
+        self._failures = 0
+        self._retry_at = 0.0
+        self._tasks: set[asyncio.Task] = set()
+        self._server: asyncio.AbstractServer | None = None
+        self._udp: asyncio.DatagramTransport | None = None
+        self._wake: asyncio.Event | None = None
+
+    def spawn(self, coro) -> None:
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def open(self) -> None:
+        """TCP и UDP на одном локальном порту (`sslocal -U` шлёт UDP туда же, куда TCP)."""
+        loop = asyncio.get_running_loop()
+        for _ in range(10):
+            server = await loop.create_server(lambda: _Inbound(self), "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                self._udp, _ = await loop.create_datagram_endpoint(
+                    lambda: _UdpListener(self), local_addr=("127.0.0.1", port)
+                )
+            except OSError:
+                server.close()  # UDP-порт с тем же номером занят — берём другой
+                continue
+            self._server, self.listen_port = server, port
+            break
+        else:
+            raise OSError("не нашлось свободного порта TCP+UDP для ретранслятора пула")
+        self._wake = asyncio.Event()
+        self.spawn(self._maintain())
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        if self._server is not None:
+            self._server.close()
+        if self._udp is not None:
+            self._udp.close()
+        for side in self.idle:
+            side.close()
+        self.idle.clear()
+        for client in list(self.clients):
+            client.close()
+        for flow in self.udp_flows.values():
+            if flow.transport is not None:
+                flow.transport.close()
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=1.0)
+
+    def flush(self) -> None:
+        """Сменился путь до сервера (шлюз, маршрут): прогретые соединения — по старому, открыть заново."""
+        for side in self.idle:
+            side.close()
+        self.idle.clear()
+        self._failures, self._retry_at = 0, 0.0
+        self._wake.set()
+
+    # --- размер пула ---
+
+    def target(self, now: float) -> int:
+        since = int(now) - self.window
+        peak = max((n for second, n in self.arrivals if second > since), default=0)
+        # Пока новое соединение устанавливается, сеансы продолжают приходить: при setup > 1 с запас больше
+        setup_s = (self.connect_ewma or 0.0) / 1000
+        return max(self.min_size, min(self.max_size, math.ceil(peak * max(1.0, setup_s))))
+
+    def _arrival(self) -> None:
+        second = int(time.monotonic())
+        if self.arrivals and self.arrivals[-1][0] == second:
+            self.arrivals[-1][1] += 1
+            return
+        self.arrivals.append([second, 1])
+        while self.arrivals[0][0] <= second - self.window:
+            self.arrivals.popleft()
+
+    async def _maintain(self) -> None:
+        while True:
+            now = time.monotonic()
+            keep: deque[_Side] = deque()
+            for side in self.idle:
+                if not side.usable():
+                    side.close()
+                    self.idle_lost += 1
+                elif now >= side.expires:
+                    side.close()
+                    self.recycled += 1
+                else:
+                    keep.append(side)
+            want = self.target(now)
+            while len(keep) > want:
+                keep.popleft().close()
+            self.idle = keep
+            # Замена доживающим заказывается заранее, чтобы пул не пустел на время рукопожатия
+            lead = max(MAINTAIN_INTERVAL, (self.connect_ewma or 0.0) / 1000)
+            fresh = sum(1 for side in keep if side.expires > now + lead)
+            if now >= self._retry_at:
+                for _ in range(want - fresh - self.dialing):
+                    self.spawn(self._refill())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), MAINTAIN_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    # --- соединения ---
+
+    async def _dial(self, fastopen: bool) -> _Side:
+        loop = asyncio.get_running_loop()
+        sock = socket.socket(self.family, socket.SOCK_STREAM)
+        try:
+            sock.setblocking(False)
+            if fastopen:
+                try:
+                    sock.setsockopt(socket.IPPROTO_TCP, TCP_FASTOPEN_CONNECT, 1)
+                except OSError:
+                    self.fastopen = False  # ядро без TCP_FASTOPEN_CONNECT: дальше обычный connect
+            await asyncio.wait_for(loop.sock_connect(sock, (self.address, self.port)), self.connect_timeout)
+            _, side = await loop.create_connection(_Side, sock=sock)
+        except BaseException:
+            sock.close()
+            raise
+        return side
+
+    def _dial_failed(self, e: BaseException) -> None:
+        self.dial_errors += 1
+        self.last_error = f"таймаут {self.connect_timeout:g} с" if isinstance(e, asyncio.TimeoutError) else str(e)
+        self._failures += 1
+        self._retry_at = time.monotonic() + min(RETRY_MAX, MAINTAIN_INTERVAL * 2**self._failures)
+
+    async def _refill(self) -> None:
+        # Без TFO: с ним `connect()` вернулся бы до рукопожатия, а смысл пула — пройти его заранее
+        self.dialing += 1
+        t0 = time.perf_counter()
+        try:
+            side = await self._dial(fastopen=False)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._dial_failed(e)
+            return
+        finally:
+            self.dialing -= 1
+        ms = (time.perf_counter() - t0) * 1000
+        self.connect.record(ms)
+        self.connect_ewma = ms if self.connect_ewma is None else self.connect_ewma + EWMA_ALPHA * (ms - self.connect_ewma)
+        self._failures = 0
+        # Разброс срока жизни: соединения, открытые разом, не уходят на замену тоже разом
+        side.expires = time.monotonic() + self.max_idle * random.uniform(0.8, 1.0)
+        self.idle.append(side)
+
+    def session(self, client: _Inbound) -> None:
+        """Новый сеанс `sslocal`: самое старое живое соединение из пула, иначе — новое (с TFO)."""
+        self.clients.add(client)
+        self._arrival()
+        self._wake.set()
+        while self.idle:
+            side = self.idle.popleft()
+            if side.usable():
+                self.hits += 1
+                self.saved_ms += self.connect_ewma or 0.0
+                client.pair(side)
+                return
+            side.close()
+            self.idle_lost += 1
+        self.misses += 1
+        self.spawn(self._cold(client))
+
+    async def _cold(self, client: _Inbound) -> None:
+        try:
+            side = await self._dial(fastopen=self.fastopen)
+        except (OSError, asyncio.TimeoutError) as e:
+            self._dial_failed(e)
+            client.close()
+            return
+        if client.lost:
+            side.close()
+            return
+        client.pair(side)
+
+    async def open_udp_flow(self, flow: _UdpFlow) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.create_datagram_endpoint(lambda: flow, remote_addr=(self.address, self.port))
+        except OSError as e:
+            self.last_error = str(e)
+            self.udp_flows.pop(flow.client, None)
+            return
+        # Поток живёт, пока через него что-то идёт
+        while True:
+            await asyncio.sleep(UDP_IDLE / 4)
+            if time.monotonic() - flow.last > UDP_IDLE:
+                flow.transport.close()
+                self.udp_flows.pop(flow.client, None)
+                return
+
+    def snapshot(self) -> dict:
+        sessions = self.hits + self.misses
+        return {
+            "server": f"[{self.address}]:{self.port}" if ":" in self.address else f"{self.address}:{self.port}",
+            "listen": f"127.0.0.1:{self.listen_port}",
+            "idle": len(self.idle),
+            "dialing": self.dialing,
+            "target": self.target(time.monotonic()),
+            "active": len(self.clients),
+            "sessions": sessions,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / sessions, 4) if sessions else None,
+            "saved_ms": round(self.saved_ms, 1),
+            "recycled": self.recycled,
+            "idle_lost": self.idle_lost,
+            "dial_errors": self.dial_errors,
+            "last_error": self.last_error,
+            "fastopen": self.fastopen,
+            "udp_flows": len(self.udp_flows),
+            "connect_ms": self.connect.summary(),
+        }
+
+async def _snapshots(upstreams: list[Upstream]) -> list[dict]:
+    return [upstream.snapshot() for upstream in upstreams]
+
+class UpstreamPool:
+    """Ретрансляторы с пулами по серверам (`endpoint`) в одном фоновом потоке asyncio."""
+
+    def __init__(
+        self,
+        min_size: int = DEFAULT_MIN,
+        max_size: int = DEFAULT_MAX,
+        max_idle: float = DEFAULT_MAX_IDLE,
+        window: int = DEFAULT_WINDOW,
+        connect_timeout: float = 5.0,
+        fastopen: bool = True,
+    ) -> None:
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.window = window
+        self.connect_timeout = connect_timeout
+        self.fastopen = fastopen and tfo_client_enabled()
+        self.upstreams: dict[tuple[str, int], Upstream] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="upstream-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        loop, self._loop = self._loop, None
+        for upstream in self.upstreams.values():
+            asyncio.run_coroutine_threadsafe(upstream.close(), loop).result(timeout=2.0)
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=2.0)
+        loop.close()
+
+    def endpoint(self, address: str, port: int) -> int:
+        """Локальный порт ретранслятора до `address:port`; первый вызов поднимает его и начинает прогрев."""
+        key = (address, int(port))
+        if key not in self.upstreams:
+            upstream = Upstream(
+                address,
+                int(port),
+                min_size=self.min_size,
+                max_size=self.max_size,
+                max_idle=self.max_idle,
+                window=self.window,
+                connect_timeout=self.connect_timeout,
+                fastopen=self.fastopen,
+            )
+            asyncio.run_coroutine_threadsafe(upstream.open(), self._loop).result(timeout=5.0)
+            self.upstreams[key] = upstream
+        return self.upstreams[key].listen_port
+
+    def retain(self, keys: set[tuple[str, int]]) -> None:
+        """Закрыть ретрансляторы серверов, которыми больше не пользуется ни один `sslocal`."""
+        for key in [key for key in self.upstreams if key not in keys]:
+            upstream = self.upstreams.pop(key)
+            asyncio.run_coroutine_threadsafe(upstream.close(), self._loop).result(timeout=2.0)
+
+    def flush(self, keys: set[tuple[str, int]] | None = None) -> None:
+        for key, upstream in self.upstreams.items():
+            if keys is None or key in keys:
+                self._loop.call_soon_threadsafe(upstream.flush)
+
+    def snapshot(self) -> dict:
+        # `idle`, `arrivals` и счётчики ретрансляторов меняет цикл пула: снимок собирается в нём
+        upstreams = list(self.upstreams.values())
+        if self._loop is not None:
+            upstreams = asyncio.run_coroutine_threadsafe(_snapshots(upstreams), self._loop).result(timeout=2.0)
+        else:
+            upstreams = [upstream.snapshot() for upstream in upstreams]
+        hits = sum(u["hits"] for u in upstreams)
+        sessions = sum(u["sessions"] for u in upstreams)
+        return {
+            "min": self.min_size,
+            "max": self.max_size,
+            "max_idle_s": self.max_idle,
+            "fastopen": self.fastopen,
+            "sessions": sessions,
+            "hits": hits,
+            "hit_rate": round(hits / sessions, 4) if sessions else None,
+            "saved_ms": round(sum(u["saved_ms"] for u in upstreams), 1),
+            "upstreams": upstreams,
+        }
@@ -0,0 +1,164 @@
+"""
+Конкурентная проба серверов: резолв (`vpn_cli.resolver`, с кэшем) + серия TCP-соединений к каждому серверу,
+ранжирование по медианной задержке и джиттеру, кэш результатов с TTL.
+"""
+
+import asyncio
+import hashlib
+import os
+import statistics
+import time
+from dataclasses import asdict, dataclass, field
+
+from vpn_cli.resolver import ResolveError, resolve_host
+from vpn_cli.servers import server_label, split_host_port
+from vpn_cli.utils import get_cache_dir, read_json, write_json_atomic
+
+ENV_PROBE_CACHE_TTL = "PROBE_CACHE_TTL"
+DEFAULT_CACHE_TTL = 600.0
+CACHE_FILENAME = "probe.json"
+
+def url_key(url: str) -> str:
+    """Ключ сервера для кэша: в кэш не пишем сами URL (в них пароли)."""
+    return hashlib.sha256(url.encode()).hexdigest()[:16]
+
+@dataclass
+class ProbeResult:
+    """Результат пробы одного сервера (задержки в миллисекундах)."""
+
+    key: str
+    label: str
+    host: str
+    port: int
+    address: str | None = None
+    resolve_ms: float | None = None
+    samples_ms: list[float] = field(default_factory=list)
+    failures: int = 0
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.samples_ms)
+
+    @property
+    def median_ms(self) -> float | None:
+        return statistics.median(self.samples_ms) if self.samples_ms else None
+
+    @property
+    def jitter_ms(self) -> float | None:
+        """Средний модуль разницы соседних замеров (как в RFC 3550, без сглаживания)."""
+        if len(self.samples_ms) < 2:
+            return 0.0 if self.samples_ms else None
+        diffs = [abs(b - a) for a, b in zip(self.samples_ms, self.samples_ms[1:])]
+        return sum(diffs) / len(diffs)
+
+    @property
+    def loss(self) -> float:
+        total = len(self.samples_ms) + self.failures
+        return self.failures / total if total else 1.0
+
+async def _connect_rtt(address: str, port: int, timeout: float) -> float:
+    t0 = time.perf_counter()
+    _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    rtt = (time.perf_counter() - t0) * 1000
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return rtt
+
+async def probe_server(url: str, samples: int = 5, timeout: float = 2.0, interval: float = 0.05) -> ProbeResult:
+    """Резолв + `samples` последовательных TCP-соединений к серверу."""
+    host, port = split_host_port(url)
+    result = ProbeResult(key=url_key(url), label=server_label(url), host=host, port=port)
+    try:
+        res = await resolve_host(host, timeout=timeout)
+    except ResolveError as e:
+        result.error = f"resolve: {e}"
+        return result
+    result.resolve_ms = res.resolve_ms
+    result.address = res.addresses[0]
+
+    for i in range(samples):
+        if i:
+            await asyncio.sleep(interval)
+        try:
+            result.samples_ms.append(await _connect_rtt(result.address, port, timeout))
+        except (OSError, asyncio.TimeoutError) as e:
+            result.failures += 1
+            result.error = f"connect: {e or 'timeout'}"
+    if result.ok:
+        result.error = None
+    return result
+
+async def probe_all(urls: list[str], samples: int = 5, timeout: float = 2.0, concurrency: int = 32) -> list[ProbeResult]:
+    """Пробить все серверы параллельно (не более `concurrency` одновременно)."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(url: str) -> ProbeResult:
+        async with sem:
+            return await probe_server(url, samples=samples, timeout=timeout)
+
+    return list(await asyncio.gather(*(_one(u) for u in urls)))
+
+def rank(results: list[ProbeResult]) -> list[ProbeResult]:
+    """Упорядочить: сначала живые по (медиана, джиттер, потери), затем недоступные."""
+    return sorted(
+        results,
+        key=lambda r: (not r.ok, r.median_ms or 0.0, r.jitter_ms or 0.0, r.loss),
+    )
+
+def get_cache_ttl() -> float:
+    """TTL кэша проб, сек (env `PROBE_CACHE_TTL`, по умолчанию 600)."""
+    try:
+        return float(os.getenv(ENV_PROBE_CACHE_TTL, str(DEFAULT_CACHE_TTL)))
+    except ValueError:
+        return DEFAULT_CACHE_TTL
+
+def _fleet_key(urls: list[str]) -> str:
+    return hashlib.sha256("\n".join(sorted(urls)).encode()).hexdigest()[:16]
+
+def load_cached(urls: list[str], ttl: float | None = None) -> list[ProbeResult] | None:
+    """Результаты из кэша, если они сняты для того же набора серверов и не старше TTL."""
+    ttl = get_cache_ttl() if ttl is None else ttl
+    data = read_json(get_cache_dir() / CACHE_FILENAME)
+    if not isinstance(data, dict) or data.get("fleet") != _fleet_key(urls):
+        return None
+    if time.time() - float(data.get("ts", 0)) > ttl:
+        return None
+    try:
+        return [ProbeResult(**item) for item in data.get("results", [])]
+    except TypeError:
+        return None
+
+def save_cache(urls: list[str], results: list[ProbeResult]) -> None:
+    """Сохранить результаты проб (best-effort)."""
+    try:
+        write_json_atomic(
+            get_cache_dir() / CACHE_FILENAME,
+            {"fleet": _fleet_key(urls), "ts": time.time(), "results": [asdict(r) for r in results]},
+        )
+    except OSError:
+        pass
+
+def probe_ranked(
+    urls: list[str],
+    *,
+    samples: int = 5,
+    timeout: float = 2.0,
+    use_cache: bool = True,
+) -> tuple[list[ProbeResult], bool]:
+    """Ранжированные результаты (из кэша или свежие). Второй элемент — `True`, если из кэша."""
+    if use_cache:
+        cached = load_cached(urls)
+        if cached is not None:
+            return rank(cached), True
+    results = rank(asyncio.run(probe_all(urls, samples=samples, timeout=timeout)))
+    save_cache(urls, results)
+    return results, False
+
+def rank_urls(urls: list[str], results: list[ProbeResult]) -> list[str]:
+    """URL живых серверов в порядке ранжированных результатов."""
+    by_key = {url_key(u): u for u in urls}
+    return [by_key[r.key] for r in results if r.ok and r.key in by_key]
@@ -0,0 +1,244 @@
+"""
+Активные пробы качества туннеля.
+
+Супервизор знает, что процессы живы, но не что через них ходит трафик. `QualityMonitor` раз в
+`QUALITY_INTERVAL` секунд открывает SOCKS5 CONNECT через локальный порт `sslocal` к каждой цели из
+`QUALITY_TARGETS` и меряет:
+
+- время установления соединения (SOCKS5-рукопожатие + CONNECT до цели через сервер)
+- время до первого байта ответа: `http://` — HEAD-запрос, `tls://`/`https://` — ClientHello,
+  `tcp://` — только соединение
+
+Задержки копятся в `Histogram`, доля успешных проб и джиттер — по скользящим окнам
+(`QUALITY_WINDOWS`). Пробы идут из одного фонового потока asyncio и большую часть времени спят.
+"""
+
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from vpn_cli.histogram import Histogram
+from vpn_cli.socks5 import socks5_connect
+
+ENV_QUALITY_TARGETS = "QUALITY_TARGETS"
+DEFAULT_TARGETS = "tls://1.1.1.1:443,http://connectivitycheck.gstatic.com/generate_204"
+DEFAULT_INTERVAL = 30.0
+DEFAULT_WINDOWS = (60, 300, 900)
+DEFAULT_PORTS = {"http": 80, "https": 443, "tls": 443}
+
+# --- цели и пробы ---
+
+@dataclass
+class Target:
+    spec: str
+    scheme: str
+    host: str
+    port: int
+    path: str = "/"
+
+def parse_target(spec: str) -> Target:
+    """`tls://1.1.1.1:443`, `http://host/path`, `tcp://host:port`; без схемы — `tcp://`."""
+    spec = spec.strip()
+    parts = urlsplit(spec if "://" in spec else f"tcp://{spec}")
+    scheme = parts.scheme.lower()
+    if scheme not in ("tcp", "tls", "https", "http"):
+        raise ValueError(f"неизвестная схема цели пробы: {spec}")
+    port = parts.port or DEFAULT_PORTS.get(scheme)
+    if not parts.hostname or not port:
+        raise ValueError(f"у цели пробы нет хоста или порта: {spec}")
+    return Target(spec, scheme, parts.hostname, port, parts.path or "/")
+
+def parse_targets(raw: str) -> list[Target]:
+    return [parse_target(item) for item in raw.replace(" ", ",").split(",") if item.strip()]
+
+def _client_hello(host: str) -> bytes:
+    """ClientHello с SNI `host` — на него сервер отвечает сразу, сертификат не проверяем."""
+    import ssl  # нужен только целям tls://
+
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    incoming, outgoing = ssl.MemoryBIO(), ssl.MemoryBIO()
+    tls = context.wrap_bio(incoming, outgoing, server_hostname=host)
+    try:
+        tls.do_handshake()
+    except ssl.SSLWantReadError:
+        pass
+    return outgoing.read()
+
+def _request(target: Target) -> bytes | None:
+    if target.scheme == "http":
+        return (
+            f"HEAD {target.path} HTTP/1.1\r\nHost: {target.host}\r\nUser-Agent: my-vpn-probe\r\n"
+            f"Connection: close\r\n\r\n"
+        ).encode()
+    if target.scheme in ("tls", "https"):
+        return _client_hello(target.host)
+    return None
+
+@dataclass
+class ProbeResult:
+    at: float
+    ok: bool
+    connect_ms: float | None = None
+    first_byte_ms: float | None = None
+    error: str | None = None
+
+async def probe_once(socks: tuple[str, int], target: Target, timeout: float, request: bytes | None) -> ProbeResult:
+    """Одна проба: CONNECT через SOCKS5 и (если есть запрос) ожидание первого байта ответа."""
+    at = time.time()
+    t0 = time.perf_counter()
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(socks5_connect(socks, target.host, target.port), timeout)
+        connect_ms = (time.perf_counter() - t0) * 1000
+        if request is None:
+            return ProbeResult(at, True, connect_ms)
+        t1 = time.perf_counter()
+        writer.write(request)
+        if not await asyncio.wait_for(reader.read(1), timeout):
+            return ProbeResult(at, False, connect_ms, error="соединение закрыто без ответа")
+        return ProbeResult(at, True, connect_ms, (time.perf_counter() - t1) * 1000)
+    except asyncio.TimeoutError:
+        return ProbeResult(at, False, error=f"таймаут {timeout:g} с")
+    except asyncio.IncompleteReadError:
+        return ProbeResult(at, False, error="SOCKS5: соединение закрыто")
+    except (OSError, ConnectionError) as e:
+        return ProbeResult(at, False, error=str(e) or type(e).__name__)
+    finally:
+        if writer is not None:
+            writer.close()
+
+# --- статистика по цели ---
+
+def window_stats(results: list[ProbeResult]) -> dict:
+    """Доля успешных проб, джиттер (средняя разность соседних задержек, RFC 3550) и медиана в окне."""
+    if not results:
+        return {"probes": 0}
+    connects = [r.connect_ms for r in results if r.ok]
+    jitter = (
+        sum(abs(b - a) for a, b in zip(connects, connects[1:])) / (len(connects) - 1) if len(connects) > 1 else None
+    )
+    ordered = sorted(connects)
+    return {
+        "probes": len(results),
+        "success_rate": round(len(connects) / len(results), 4),
+        "jitter_ms": None if jitter is None else round(jitter, 3),
+        "connect_p50_ms": round(ordered[len(ordered) // 2], 3) if ordered else None,
+    }
+
+class TargetStats:
+    def __init__(self, target: Target, maxlen: int) -> None:
+        self.target = target
+        self.request = _request(target)
+        self.connect = Histogram()
+        self.first_byte = Histogram()
+        self.recent: deque[ProbeResult] = deque(maxlen=maxlen)
+        self.probes = self.failures = 0
+        self.last_error: str | None = None
+        self.last_ok: float | None = None
+
+    def add(self, result: ProbeResult) -> None:
+        self.recent.append(result)
+        self.probes += 1
+        if not result.ok:
+            self.failures += 1
+            self.last_error = result.error
+            return
+        self.last_ok = result.at
+        self.connect.record(result.connect_ms)
+        if result.first_byte_ms is not None:
+            self.first_byte.record(result.first_byte_ms)
+
+    def snapshot(self, windows: tuple[int, ...], now: float) -> dict:
+        recent = list(self.recent)  # копия: поток проб может дописывать в это время
+        last = recent[-1] if recent else None
+        return {
+            "target": self.target.spec,
+            "probes": self.probes,
+            "failures": self.failures,
+            "last_ok": last.ok if last else None,
+            "last_error": self.last_error,
+            "last_ok_at": self.last_ok,
+            "windows": {
+                _window_label(w): window_stats([r for r in recent if now - r.at <= w]) for w in windows
+            },
+            "connect_ms": self.connect.summary(),
+            "first_byte_ms": self.first_byte.summary(),
+        }
+
+def _window_label(seconds: int) -> str:
+    return f"{seconds // 60}m" if seconds % 60 == 0 else f"{seconds}s"
+
+class QualityMonitor:
+    """Пробы ко всем целям раз в `interval` секунд из фонового потока asyncio."""
+
+    def __init__(
+        self,
+        socks_port: int,
+        targets: list[Target],
+        interval: float = DEFAULT_INTERVAL,
+        timeout: float = 5.0,
+        windows: tuple[int, ...] = DEFAULT_WINDOWS,
+    ) -> None:
+        self.socks = ("127.0.0.1", socks_port)
+        self.interval = interval
+        self.timeout = min(timeout, interval)
+        self.windows = windows
+        maxlen = math.ceil(max(windows) / interval) + 1
+        self.targets = [TargetStats(t, maxlen) for t in targets]
+        self.rounds = 0
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._thread: threading.Thread | None = None
+        self._task: asyncio.Task | None = None
+
+    def start(self) -> None:
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="quality", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        self._task = self._loop.create_task(self._probe_forever())
+        try:
+            self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+        self._loop.call_soon_threadsafe(self._task.cancel)
+        self._thread.join(timeout=2.0)
+        self._loop = None
+
+    def set_socks_port(self, port: int) -> None:
+        """Пробовать через новый `sslocal` (после `switch`)."""
+        self.socks = ("127.0.0.1", port)
+
+    async def _probe_forever(self) -> None:
+        # Первая проба — сразу, дальше с небольшим разбросом, чтобы хосты парка не били в цели синхронно
+        while True:
+            results = await asyncio.gather(
+                *(probe_once(self.socks, t.target, self.timeout, t.request) for t in self.targets)
+            )
+            for stats, result in zip(self.targets, results):
+                stats.add(result)
+            self.rounds += 1
+            await asyncio.sleep(self.interval * random.uniform(0.9, 1.1))
+
+    def snapshot(self) -> dict:
+        now = time.time()
+        return {
+            "socks": f"{self.socks[0]}:{self.socks[1]}",
+            "interval_s": self.interval,
+            "rounds": self.rounds,
+            "windows": [_window_label(w) for w in self.windows],
+            "targets": [t.snapshot(self.windows, now) for t in self.targets],
+        }
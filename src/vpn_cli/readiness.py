@@ -0,0 +1,152 @@
+import fcntl
+import os
+import socket
+import struct
+import subprocess
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from vpn_cli import tracing
+
+# Интервал опроса по умолчанию: достаточно мелкий, чтобы не терять время на старте,
+# и достаточно крупный, чтобы не крутить CPU впустую.
+POLL_INTERVAL = 0.02
+
+SOCKS5_GREETING = b"\x05\x01\x00"  # VER=5, NMETHODS=1, METHOD=NO AUTH
+SOCKS5_NO_AUTH_REPLY = b"\x05\x00"
+
+SIOCGIFFLAGS = 0x8913
+IFF_RUNNING = 0x40
+
+class ReadinessError(RuntimeError):
+    """Компонент не стал готов за отведённое время (или умер в процессе ожидания)."""
+
+def _ensure_alive(proc: subprocess.Popen | None, name: str) -> None:
+    if proc is not None and proc.poll() is not None:
+        raise ReadinessError(f"{name} завершился с кодом {proc.returncode} до готовности")
+
+def socks5_handshake(host: str, port: int, timeout: float = 0.5) -> bool:
+    """Одна попытка SOCKS5-приветствия: `True`, если сервер ответил `05 00`."""
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.settimeout(timeout)
+            sock.sendall(SOCKS5_GREETING)
+            reply = b""
+            while len(reply) < 2:
+                chunk = sock.recv(2 - len(reply))
+                if not chunk:
+                    return False
+                reply += chunk
+            return reply == SOCKS5_NO_AUTH_REPLY
+    except OSError:
+        return False
+
+def wait_port_free(port: int, timeout: float, host: str = "127.0.0.1") -> bool:
+    """Дождаться, пока на `host:port` перестанут принимать соединения. `True` — порт свободен."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with socket.create_connection((host, port), timeout=POLL_INTERVAL * 5):
+                pass
+        except OSError:
+            return True
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+
+def wait_socks_ready(
+    port: int,
+    timeout: float,
+    proc: subprocess.Popen | None = None,
+    host: str = "127.0.0.1",
+) -> None:
+    """Опрашивать локальный SOCKS5-порт приветствием, пока он не ответит корректно."""
+    deadline = time.monotonic() + timeout
+    while True:
+        _ensure_alive(proc, "sslocal")
+        if socks5_handshake(host, port):
+            return
+        if time.monotonic() >= deadline:
+            raise ReadinessError(f"SOCKS5 на {host}:{port} не ответил за {timeout:.1f}с")
+        time.sleep(POLL_INTERVAL)
+
+def tun_carrier(dev: str) -> bool:
+    """
+    Есть ли carrier у интерфейса (для TUN — к нему подключён хотя бы один процесс).
+
+    Читаем флаги через `SIOCGIFFLAGS`: в отличие от `/sys/class/net`, это работает
+    в любом network namespace и не требует лишних процессов.
+    """
+    try:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            req = struct.pack("16sH", dev.encode()[:15], 0)
+            res = fcntl.ioctl(sock.fileno(), SIOCGIFFLAGS, req)
+    except OSError:
+        return False
+    flags = struct.unpack("16sH", res[:18])[1]
+    return bool(flags & IFF_RUNNING)
+
+def process_has_tun_fd(pid: int) -> bool | None:
+    """
+    Открыт ли у процесса `/dev/net/tun`.
+
+    Возвращает `None`, если `/proc/<pid>/fd` прочитать нельзя (нет прав и т.п.).
+    """
+    fd_dir = Path(f"/proc/{pid}/fd")
+    try:
+        entries = list(fd_dir.iterdir())
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            if os.readlink(entry) == "/dev/net/tun":
+                return True
+        except OSError:
+            continue
+    return False
+
+def tun2socks_attached(proc: subprocess.Popen, dev: str) -> bool:
+    """Открыл ли `tun2socks` TUN-устройство (если `/proc` недоступен — судим по carrier)."""
+    attached = process_has_tun_fd(proc.pid)
+    return bool(attached) or (attached is None and tun_carrier(dev))
+
+def wait_tun2socks_attached(proc: subprocess.Popen, dev: str, timeout: float) -> None:
+    """Дождаться, пока `tun2socks` откроет TUN-устройство."""
+    deadline = time.monotonic() + timeout
+    while True:
+        _ensure_alive(proc, "tun2socks")
+        if tun2socks_attached(proc, dev):
+            return
+        if time.monotonic() >= deadline:
+            raise ReadinessError(f"tun2socks не подключился к {dev} за {timeout:.1f}с")
+        time.sleep(POLL_INTERVAL)
+
+def wait_tun_carrier(dev: str, timeout: float, proc: subprocess.Popen | None = None) -> None:
+    """Дождаться carrier на TUN-интерфейсе."""
+    deadline = time.monotonic() + timeout
+    while True:
+        _ensure_alive(proc, "tun2socks")
+        if tun_carrier(dev):
+            return
+        if time.monotonic() >= deadline:
+            raise ReadinessError(f"{dev}: нет carrier за {timeout:.1f}с")
+        time.sleep(POLL_INTERVAL)
+
+class PhaseTimer:
+    """Замеры длительности фаз запуска (для `start --timings`)."""
+
+    def __init__(self) -> None:
+        self.phases: list[tuple[str, float]] = []
+
+    @contextmanager
+    def phase(self, name: str):
+        t0 = time.perf_counter()
+        try:
+            with tracing.span(name):
+                yield
+        finally:
+            self.phases.append((name, time.perf_counter() - t0))
+
+    def total(self) -> float:
+        return sum(d for _, d in self.phases)
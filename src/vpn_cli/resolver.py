@@ -0,0 +1,266 @@
+"""
+Резолв адреса сервера: A/AAAA параллельно через `getaddrinfo` с таймаутом, кэш на диске
+с TTL, выбор самого быстрого доступного адреса (happy eyeballs, RFC 8305) и запись
+использованного адреса, чтобы `stop` снимал ровно тот маршрут, который ставил `start`.
+
+Функция поиска (`lookup`) подменяется — например, заглушкой со скриптованными ответами.
+"""
+
+import asyncio
+import ipaddress
+import os
+import socket
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Awaitable, Callable
+
+from vpn_cli.utils import get_cache_dir, get_state_dir, read_json, write_json_atomic
+
+ENV_RESOLVE_CACHE_TTL = "RESOLVE_CACHE_TTL"
+DEFAULT_CACHE_TTL = 300.0
+CACHE_FILENAME = "resolve.json"
+STATE_FILENAME = "server.json"
+# RFC 8305: пауза перед следующей попыткой соединения
+ATTEMPT_DELAY = 0.25
+
+Lookup = Callable[[str, int], Awaitable[list[str]]]
+Connect = Callable[[str, int, float], Awaitable[object]]
+
+class ResolveError(OSError):
+    """Имя не разрешилось, а в кэше (даже устаревшем) ничего нет."""
+
+@dataclass
+class Resolution:
+    host: str
+    addresses: list[str]
+    source: str  # literal | dns | cache | stale-cache
+    resolve_ms: float = 0.0
+    address: str | None = None  # выбранный адрес
+    reachable: bool | None = None  # удалось ли к нему подключиться (None — не проверяли)
+
+async def system_lookup(host: str, family: int) -> list[str]:
+    """
+    Адреса `host` семейства `family` через системный `getaddrinfo`.
+
+    Вызов идёт в отдельном daemon-потоке, а не в пуле `run_in_executor`: `asyncio.run` при
+    выходе ждёт пул, и зависший резолвер держал бы `start` несмотря на таймаут.
+    """
+    loop = asyncio.get_running_loop()
+    future: asyncio.Future = loop.create_future()
+
+    def _set(result, error) -> None:
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _worker() -> None:
+        try:
+            infos = socket.getaddrinfo(host, None, family=family, type=socket.SOCK_STREAM)
+            result, error = list(dict.fromkeys(info[4][0] for info in infos)), None
+        except OSError as e:
+            result, error = None, e
+        try:
+            loop.call_soon_threadsafe(_set, result, error)
+        except RuntimeError:
+            pass  # цикл уже закрыт — ответ никому не нужен
+
+    threading.Thread(target=_worker, name=f"resolve-{host}", daemon=True).start()
+    return await future
+
+def get_cache_ttl() -> float:
+    """TTL кэша резолва, сек (env `RESOLVE_CACHE_TTL`, по умолчанию 300)."""
+    try:
+        return float(os.getenv(ENV_RESOLVE_CACHE_TTL, str(DEFAULT_CACHE_TTL)))
+    except ValueError:
+        return DEFAULT_CACHE_TTL
+
+def interleave(v6: list[str], v4: list[str]) -> list[str]:
+    """Чередовать семейства, начиная с IPv6 (порядок попыток по RFC 8305)."""
+    out: list[str] = []
+    for i in range(max(len(v6), len(v4))):
+        out += v6[i : i + 1] + v4[i : i + 1]
+    return out
+
+def _load_cache() -> dict:
+    data = read_json(get_cache_dir() / CACHE_FILENAME)
+    return data if isinstance(data, dict) else {}
+
+def cached_addresses(host: str) -> list[str]:
+    """Адреса из кэша без учёта TTL (для `stop`: никакого сетевого резолва)."""
+    entry = _load_cache().get(host)
+    return list(entry.get("addresses", [])) if isinstance(entry, dict) else []
+
+def _save_cache(host: str, addresses: list[str]) -> None:
+    cache = _load_cache()
+    cache[host] = {"addresses": addresses, "ts": time.time()}
+    try:
+        write_json_atomic(get_cache_dir() / CACHE_FILENAME, cache)
+    except OSError:
+        pass
+
+async def resolve_host(
+    host: str,
+    *,
+    timeout: float = 2.0,
+    lookup: Lookup | None = None,
+    use_cache: bool = True,
+    ttl: float | None = None,
+) -> Resolution:
+    """
+    Разрешить `host` в список адресов (IPv6 и IPv4 вперемешку).
+
+    Свежий кэш отвечает сразу; иначе A и AAAA запрашиваются параллельно, каждый с `timeout`.
+    Если DNS не ответил, используется устаревший кэш (запуск без сети/при медленном резолвере).
+    """
+    try:
+        return Resolution(host=host, addresses=[str(ipaddress.ip_address(host))], source="literal")
+    except ValueError:
+        pass
+
+    ttl = get_cache_ttl() if ttl is None else ttl
+    entry = _load_cache().get(host) if use_cache else None
+    if isinstance(entry, dict) and entry.get("addresses") and time.time() - float(entry.get("ts", 0)) <= ttl:
+        return Resolution(host=host, addresses=list(entry["addresses"]), source="cache")
+
+    lookup = lookup or system_lookup
+    t0 = time.perf_counter()
+    v6, v4 = await asyncio.gather(
+        asyncio.wait_for(lookup(host, socket.AF_INET6), timeout),
+        asyncio.wait_for(lookup(host, socket.AF_INET), timeout),
+        return_exceptions=True,
+    )
+    resolve_ms = (time.perf_counter() - t0) * 1000
+    errors = [r for r in (v6, v4) if isinstance(r, BaseException)]
+    addresses = interleave(
+        [] if isinstance(v6, BaseException) else list(v6),
+        [] if isinstance(v4, BaseException) else list(v4),
+    )
+    if addresses:
+        _save_cache(host, addresses)
+        return Resolution(host=host, addresses=addresses, source="dns", resolve_ms=resolve_ms)
+    if isinstance(entry, dict) and entry.get("addresses"):
+        return Resolution(host=host, addresses=list(entry["addresses"]), source="stale-cache", resolve_ms=resolve_ms)
+    reason = "; ".join(str(e) or type(e).__name__ for e in errors) or "нет адресов"
+    raise ResolveError(f"Не удалось разрешить {host}: {reason}")
+
+async def _tcp_connect(address: str, port: int, timeout: float) -> str:
+    _, writer = await asyncio.wait_for(asyncio.open_connection(address, port), timeout)
+    writer.close()
+    return address
+
+async def happy_eyeballs(
+    addresses: list[str],
+    port: int,
+    *,
+    delay: float = ATTEMPT_DELAY,
+    timeout: float = 2.0,
+    connect: Connect | None = None,
+) -> str | None:
+    """
+    Поочерёдно (с шагом `delay`) начать TCP-соединения к адресам; вернуть первый, к которому
+    удалось подключиться. Неудачная попытка сразу запускает следующую. `None` — никто не ответил.
+    """
+    connect = connect or _tcp_connect
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    queue = list(addresses)
+    running: set[asyncio.Future] = set()
+    started: dict[asyncio.Future, str] = {}
+    try:
+        while queue or running:
+            if queue:
+                address = queue.pop(0)
+                task = asyncio.ensure_future(connect(address, port, timeout))
+                started[task] = address
+                running.add(task)
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            done, running = await asyncio.wait(
+                running,
+                timeout=min(delay, remaining) if queue else remaining,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    return started[task]
+    finally:
+        for task in running:
+            task.cancel()
+    return None
+
+async def resolve_server_async(
+    host: str,
+    port: int,
+    *,
+    timeout: float = 2.0,
+    lookup: Lookup | None = None,
+    connect: Connect | None = None,
+    use_cache: bool = True,
+) -> Resolution:
+    """Резолв + выбор адреса. Если адрес один, соединение не проверяется."""
+    res = await resolve_host(host, timeout=timeout, lookup=lookup, use_cache=use_cache)
+    if len(res.addresses) == 1:
+        res.address = res.addresses[0]
+        return res
+    best = await happy_eyeballs(res.addresses, port, timeout=timeout, connect=connect)
+    res.reachable = best is not None
+    res.address = best or res.addresses[0]
+    return res
+
+def resolve_server(host: str, port: int, **kwargs) -> Resolution:
+    """Синхронная обёртка над `resolve_server_async`."""
+    return asyncio.run(resolve_server_async(host, port, **kwargs))
+
+def resolve_servers(targets: list[tuple[str, int]], **kwargs) -> list[Resolution]:
+    """Резолв нескольких серверов параллельно (порядок результатов — как у `targets`)."""
+
+    async def _all() -> list[Resolution]:
+        return list(await asyncio.gather(*(resolve_server_async(host, port, **kwargs) for host, port in targets)))
+
+    return asyncio.run(_all())
+
+def is_ipv4(address: str) -> bool:
+    try:
+        return ipaddress.ip_address(address).version == 4
+    except ValueError:
+        return False
+
+# --- адрес, реально использованный запущенным VPN ---
+
+@dataclass
+class ServerState:
+    host: str
+    address: str
+    gateway: str | None = None
+
+def save_server_state(states: list[ServerState]) -> None:
+    """Записать адреса серверов всех туннелей (с шлюзами, через которые проложены маршруты)."""
+    try:
+        write_json_atomic(get_state_dir() / STATE_FILENAME, {"servers": [asdict(s) for s in states]})
+    except OSError:
+        pass
+
+def load_server_state() -> list[ServerState]:
+    data = read_json(get_state_dir() / STATE_FILENAME)
+    if not isinstance(data, dict):
+        return []
+    # Одиночный объект — формат до появления нескольких туннелей
+    items = data.get("servers") if "servers" in data else [data]
+    states = []
+    for item in items if isinstance(items, list) else []:
+        try:
+            states.append(ServerState(**item))
+        except TypeError:
+            continue
+    return states
+
+def clear_server_state() -> None:
+    try:
+        (get_state_dir() / STATE_FILENAME).unlink()
+    except OSError:
+        pass
@@ -0,0 +1,219 @@
+"""
+Split tunneling: списки CIDR (include/exclude) и их установка пачкой с применением только разницы.
+
+- `SPLIT_INCLUDE` — через туннель идут только эти сети (без него — весь трафик, маршруты `/1`).
+- `SPLIT_EXCLUDE` — эти сети идут мимо туннеля, через исходный шлюз.
+
+Пересечения решает ядро: выигрывает более специфичный префикс.
+Списки минимизируются `ipaddress.collapse_addresses`; скомпилированная форма кэшируется
+по хэшу содержимого файлов, так что перезапуск не парсит десятки тысяч строк заново.
+"""
+
+import hashlib
+import ipaddress
+import os
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from vpn_cli.network import NetBackend, Route, Rule, gateway_route
+from vpn_cli.utils import get_cache_dir, get_state_dir, read_json, write_json_atomic
+
+ENV_SPLIT_INCLUDE = "SPLIT_INCLUDE"
+ENV_SPLIT_EXCLUDE = "SPLIT_EXCLUDE"
+STATE_FILENAME = "routes.json"
+FULL_TUNNEL = ("0.0.0.0/1", "128.0.0.0/1")
+
+@dataclass
+class CompiledList:
+    """Минимизированный список сетей (только IPv4: туннель и маршруты у нас IPv4)."""
+
+    cidrs: list[str]
+    lines: int = 0
+    skipped: int = 0
+    cached: bool = False
+
+def list_paths(env_name: str) -> list[Path]:
+    """Файлы списка из env (несколько — через запятую)."""
+    return [Path(p.strip()).expanduser() for p in os.getenv(env_name, "").split(",") if p.strip()]
+
+def parse_cidrs(text: str) -> tuple[list[ipaddress.IPv4Network], int, int]:
+    """
+    Разобрать список: одна сеть или адрес на строку, `#` — комментарий.
+    Возвращает `(сети, число строк с данными, число пропущенных)`; IPv6 и мусор пропускаются.
+    """
+    nets: list[ipaddress.IPv4Network] = []
+    lines = skipped = 0
+    for line in text.splitlines():
+        line = line.split("#", 1)[0].strip()
+        if not line:
+            continue
+        lines += 1
+        try:
+            net = ipaddress.ip_network(line, strict=False)
+        except ValueError:
+            skipped += 1
+            continue
+        if net.version != 4:
+            skipped += 1
+            continue
+        nets.append(net)
+    return nets, lines, skipped
+
+def compile_list(paths: list[Path]) -> CompiledList:
+    """Прочитать и минимизировать список (или взять готовый из кэша по хэшу содержимого)."""
+    if not paths:
+        return CompiledList(cidrs=[])
+    contents = [p.read_bytes() for p in paths]
+    digest = hashlib.sha256()
+    for data in contents:
+        digest.update(hashlib.sha256(data).digest())
+    cache_path = get_cache_dir() / "routes" / f"{digest.hexdigest()[:32]}.json"
+
+    cached = read_json(cache_path)
+    if isinstance(cached, dict) and isinstance(cached.get("cidrs"), list):
+        return CompiledList(
+            cidrs=cached["cidrs"],
+            lines=int(cached.get("lines", 0)),
+            skipped=int(cached.get("skipped", 0)),
+            cached=True,
+        )
+
+    nets: list[ipaddress.IPv4Network] = []
+    lines = skipped = 0
+    for data in contents:
+        parsed, n_lines, n_skipped = parse_cidrs(data.decode("utf-8", errors="replace"))
+        nets += parsed
+        lines += n_lines
+        skipped += n_skipped
+    compiled = CompiledList(
+        cidrs=[str(n) for n in ipaddress.collapse_addresses(nets)],
+        lines=lines,
+        skipped=skipped,
+    )
+    try:
+        write_json_atomic(cache_path, {"cidrs": compiled.cidrs, "lines": lines, "skipped": skipped}, indent=None)
+    except OSError:
+        pass
+    return compiled
+
+def load_split_lists() -> tuple[CompiledList, CompiledList]:
+    """Скомпилированные `(include, exclude)` из env `SPLIT_INCLUDE`/`SPLIT_EXCLUDE`."""
+    return compile_list(list_paths(ENV_SPLIT_INCLUDE)), compile_list(list_paths(ENV_SPLIT_EXCLUDE))
+
+def desired_routes(devs: str | list[str], gateway: str | None, include: CompiledList, exclude: CompiledList) -> list[Route]:
+    """
+    Полный набор маршрутов туннеля (без маршрута до самого сервера — он ставится отдельно).
+    Если TUN-интерфейсов несколько, каждый маршрут — ECMP через все (ядро раскладывает потоки по хэшу).
+    """
+    devs = [devs] if isinstance(devs, str) else list(devs)
+    bypass = set(exclude.cidrs) if gateway else set()
+    if len(devs) == 1:
+        routes = [Route(cidr, dev=devs[0]) for cidr in (include.cidrs or FULL_TUNNEL) if cidr not in bypass]
+    else:
+        nexthops = tuple(devs)
+        routes = [Route(cidr, nexthops=nexthops) for cidr in (include.cidrs or FULL_TUNNEL) if cidr not in bypass]
+    routes += [gateway_route(cidr, gateway) for cidr in exclude.cidrs if gateway]
+    return routes
+
+class RouteTable:
+    """
+    Установленные маршруты туннеля. Набор хранится в `<state_dir>/routes.json`,
+    поэтому изменение списка (или рестарт) применяет только разницу.
+    """
+
+    def __init__(self, net: NetBackend, state_path: Path | None = None) -> None:
+        self.net = net
+        self.state_path = state_path if state_path is not None else get_state_dir() / STATE_FILENAME
+        self.installed: set[Route] = set()
+        self.rules: set[Rule] = set()
+        self.stats: dict = {}
+
+    def load(self, fresh_devs: list[str] | tuple[str, ...] = ()) -> None:
+        """
+        Поднять установленный набор из состояния. Маршруты через интерфейсы `fresh_devs`
+        отбрасываются: они только что пересозданы, и ядро удалило маршруты вместе со старыми.
+        """
+        data = read_json(self.state_path)
+        if not isinstance(data, dict):
+            return
+        for item in data.get("routes", []):
+            # [dst, dev, via] — формат до появления таблиц и ECMP
+            dst, dev, via, table, nexthops = (list(item) + [None, []])[:5]
+            if dev in fresh_devs or any(d in fresh_devs for d in nexthops):
+                continue
+            self.installed.add(Route(dst, dev=dev, via=via, table=table, nexthops=tuple(nexthops)))
+        for item in data.get("rules", []):
+            # [fwmark, table, priority] — до правил по адресу источника
+            fwmark, table, priority, src = (list(item) + [None])[:4]
+            self.rules.add(Rule(fwmark, table, priority, src))
+
+    def apply(self, desired: list[Route], rules: list[Rule] = ()) -> dict:
+        """Привести маршруты (и правила policy routing) к `desired`: добавить недостающие, удалить лишние."""
+        t0 = time.perf_counter()
+        wanted = set(desired)
+        to_add = [r for r in desired if r not in self.installed]
+        added_keys = {(r.dst, r.table) for r in to_add}
+        # Маршрут с тем же dst в той же таблице, но другим шлюзом/интерфейсом уже заменён `replace`
+        to_del = [r for r in self.installed if r not in wanted and (r.dst, r.table) not in added_keys]
+        self.net.replace_routes(to_add)
+        self.installed.update(to_add)
+        self.net.delete_routes(to_del)
+        self.installed.difference_update(to_del)
+        self.installed -= {r for r in self.installed if r not in wanted}
+
+        wanted_rules = set(rules)
+        self.net.add_rules([r for r in rules if r not in self.rules])
+        self.net.delete_rules([r for r in self.rules if r not in wanted_rules])
+        self.rules = wanted_rules
+        self.stats = {
+            "installed": len(self.installed),
+            "added": len(to_add),
+            "removed": len(to_del),
+            "rules": len(self.rules),
+            "apply_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "applied_at": time.time(),
+        }
+        self.save()
+        return self.stats
+
+    def invalidate(self, gateway: str) -> None:
+        """Забыть маршруты через шлюз `gateway` (ядро могло удалить их с интерфейсом): следующий `apply` поставит их заново."""
+        hop = gateway_route("", gateway)
+        self.installed = {r for r in self.installed if (r.via, r.dev) != (hop.via, hop.dev)}
+
+    def clear(self) -> None:
+        """Снять все установленные маршруты и правила и забыть состояние."""
+        self.net.delete_routes(list(self.installed))
+        self.installed.clear()
+        if self.rules:
+            self.net.delete_rules(list(self.rules))
+            self.rules.clear()
+        try:
+            self.state_path.unlink()
+        except OSError:
+            pass
+
+    def save(self) -> None:
+        try:
+            write_json_atomic(
+                self.state_path,
+                {
+                    "routes": sorted(
+                        ([r.dst, r.dev, r.via, r.table, list(r.nexthops)] for r in self.installed),
+                        key=lambda x: (x[0], x[1] or "", x[2] or "", x[3] or 0),
+                    ),
+                    "rules": sorted(([r.fwmark, r.table, r.priority, r.src] for r in self.rules), key=lambda x: x[2]),
+                    "stats": self.stats,
+                },
+                indent=None,
+            )
+        except OSError:
+            pass
+
+def read_route_stats(path: Path | None = None) -> dict | None:
+    """Статистика последнего применения маршрутов (для `status` без запущенного демона)."""
+    data = read_json(path if path is not None else get_state_dir() / STATE_FILENAME)
+    if not isinstance(data, dict):
+        return None
+    return data.get("stats") or None
@@ -0,0 +1,92 @@
+import base64
+import os
+import re
+from pathlib import Path
+from urllib.parse import unquote
+
+ENV_SS_URL = "SS_URL"
+ENV_SS_URLS = "SS_URLS"
+ENV_SS_SUBSCRIPTION = "SS_SUBSCRIPTION"
+
+_SPLIT_RE = re.compile(r"[\s,]+")
+
+def _b64decode(data: str) -> bytes:
+    """Base64 (обычный или urlsafe, с паддингом или без)."""
+    data = data.strip()
+    data += "=" * (-len(data) % 4)
+    return base64.b64decode(data.replace("-", "+").replace("_", "/"))
+
+def parse_ss_url(url: str):
+    """
+    Распарсить `ss://` URL из конфигурации.
+
+    Возвращает: `(host, port, method, password)`. Имя не резолвится — это делает `vpn_cli.resolver`.
+    """
+    if not url:
+        raise ValueError("URL is empty")
+    url = url.replace("ss://", "").split("#")[0].split("?")[0]
+    if url.endswith("/"):
+        url = url[:-1]
+
+    if "@" not in url:
+        raise ValueError("Неверный формат ss:// (нет @)")
+
+    userinfo, host_port = url.rsplit("@", 1)
+    host, port = host_port.rsplit(":", 1)
+
+    # Base64 decode
+    decoded = _b64decode(userinfo).decode("utf-8")
+    method, password = decoded.split(":", 1)
+
+    return host.strip("[]"), port, method, password
+
+def split_host_port(url: str) -> tuple[str, int]:
+    """Достать `(host, port)` из `ss://` URL без DNS-резолва."""
+    body = url.replace("ss://", "").split("#")[0].split("?")[0].rstrip("/")
+    if "@" not in body:
+        raise ValueError("Неверный формат ss:// (нет @)")
+    host, port = body.rsplit("@", 1)[1].rsplit(":", 1)
+    return host.strip("[]"), int(port)
+
+def server_label(url: str) -> str:
+    """Человекочитаемое имя сервера: `#fragment` из URL или `host:port`."""
+    if "#" in url:
+        name = unquote(url.split("#", 1)[1]).strip()
+        if name:
+            return name
+    try:
+        host, port = split_host_port(url)
+        return f"{host}:{port}"
+    except ValueError:
+        return url[:32]
+
+def _split_urls(text: str) -> list[str]:
+    return [part for part in _SPLIT_RE.split(text) if part.startswith("ss://")]
+
+def parse_subscription(text: str) -> list[str]:
+    """
+    Разобрать подписку: список `ss://` (по одному на строку) либо тот же список,
+    закодированный целиком в base64 (распространённый формат SIP002-подписок).
+    """
+    urls = _split_urls(text)
+    if urls:
+        return urls
+    try:
+        return _split_urls(_b64decode("".join(text.split())).decode("utf-8"))
+    except (ValueError, UnicodeDecodeError):
+        return []
+
+def load_server_urls() -> list[str]:
+    """
+    Все сконфигурированные серверы, без дублей, в порядке приоритета:
+    `SS_URL`, затем `SS_URLS` (через пробел/запятую/перенос строки), затем файл `SS_SUBSCRIPTION`.
+    """
+    urls: list[str] = []
+    single = os.getenv(ENV_SS_URL, "").strip()
+    if single:
+        urls.append(single)
+    urls += _split_urls(os.getenv(ENV_SS_URLS, ""))
+    sub_path = os.getenv(ENV_SS_SUBSCRIPTION, "").strip()
+    if sub_path:
+        urls += parse_subscription(Path(sub_path).expanduser().read_text())
+    return list(dict.fromkeys(urls))
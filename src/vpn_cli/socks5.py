@@ -0,0 +1,86 @@
+"""
+Клиент SOCKS5 (RFC 1928) поверх asyncio: CONNECT и UDP ASSOCIATE без аутентификации —
+ровно то, что отдаёт `sslocal -b ... -U`. Нужен бенчмарку, DNS-стабу и пробам качества.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import struct
+
+def pack_addr(host: str, port: int) -> bytes:
+    try:
+        ip = ipaddress.ip_address(host)
+        atyp = b"\x01" if ip.version == 4 else b"\x04"
+        return atyp + ip.packed + struct.pack("!H", port)
+    except ValueError:
+        raw = host.encode()
+        return b"\x03" + bytes([len(raw)]) + raw + struct.pack("!H", port)
+
+async def read_addr(reader: asyncio.StreamReader) -> tuple[str, int]:
+    atyp = (await reader.readexactly(1))[0]
+    if atyp == 1:
+        host = socket.inet_ntop(socket.AF_INET, await reader.readexactly(4))
+    elif atyp == 4:
+        host = socket.inet_ntop(socket.AF_INET6, await reader.readexactly(16))
+    else:
+        host = (await reader.readexactly((await reader.readexactly(1))[0])).decode()
+    (port,) = struct.unpack("!H", await reader.readexactly(2))
+    return host, port
+
+def udp_header(host: str, port: int) -> bytes:
+    """Заголовок датаграммы для UDP-релея: `RSV(2) FRAG(1) ATYP ADDR PORT`."""
+    return b"\0\0\0" + pack_addr(host, port)
+
+def parse_udp_header(data: bytes) -> tuple[str, int, bytes]:
+    """Разобрать заголовок SOCKS5 UDP: `RSV(2) FRAG(1) ATYP ADDR PORT DATA`."""
+    atyp = data[3]
+    if atyp == 1:
+        host, off = socket.inet_ntop(socket.AF_INET, data[4:8]), 8
+    elif atyp == 4:
+        host, off = socket.inet_ntop(socket.AF_INET6, data[4:20]), 20
+    else:
+        n = data[4]
+        host, off = data[5 : 5 + n].decode(), 5 + n
+    (port,) = struct.unpack("!H", data[off : off + 2])
+    return host, port, data[off + 2 :]
+
+async def _greet(proxy: tuple[str, int]) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    reader, writer = await asyncio.open_connection(*proxy)
+    writer.write(b"\x05\x01\x00")
+    await writer.drain()
+    if await reader.readexactly(2) != b"\x05\x00":
+        writer.close()
+        raise ConnectionError("SOCKS5: метод без аутентификации отклонён")
+    return reader, writer
+
+async def socks5_connect(proxy: tuple[str, int], host: str, port: int) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """Открыть TCP-соединение к `host:port` через SOCKS5 (без аутентификации)."""
+    reader, writer = await _greet(proxy)
+    writer.write(b"\x05\x01\x00" + pack_addr(host, port))
+    await writer.drain()
+    head = await reader.readexactly(3)
+    if head[1] != 0:
+        writer.close()
+        raise ConnectionError(f"SOCKS5 CONNECT: код {head[1]}")
+    await read_addr(reader)
+    return reader, writer
+
+async def socks5_udp_associate(
+    proxy: tuple[str, int],
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter, tuple[str, int]]:
+    """
+    UDP ASSOCIATE: вернуть управляющее TCP-соединение и адрес UDP-релея.
+    Ассоциация живёт, пока соединение открыто; EOF на `reader` — релей закрыт.
+    """
+    reader, writer = await _greet(proxy)
+    writer.write(b"\x05\x03\x00" + pack_addr("0.0.0.0", 0))
+    await writer.drain()
+    head = await reader.readexactly(3)
+    if head[1] != 0:
+        writer.close()
+        raise ConnectionError(f"SOCKS5 UDP ASSOCIATE: код {head[1]}")
+    relay_host, relay_port = await read_addr(reader)
+    if relay_host in ("0.0.0.0", "::"):
+        relay_host = proxy[0]
+    return reader, writer, (relay_host, relay_port)
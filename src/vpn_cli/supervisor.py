@@ -0,0 +1,423 @@
+"""
+Событийный супервизор дочерних процессов (`sslocal`, `tun2socks`).
+
+Выход ребёнка ловится сразу: через pidfd (`os.pidfd_open` + `selectors`), а на старых ядрах —
+через `SIGCHLD` и `signal.set_wakeup_fd`. Упавший компонент перезапускается отдельно
+(TUN и маршруты не трогаются) с экспоненциальной задержкой и бюджетом падений.
+Готовность перезапущенного компонента опрашивается из того же цикла с дедлайном — цикл не блокируется.
+"""
+
+import os
+import selectors
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from vpn_cli import tracing
+from vpn_cli.journal import Journal
+from vpn_cli.logs import LogPump
+from vpn_cli.placement import Placement
+from vpn_cli.readiness import POLL_INTERVAL
+from vpn_cli.utils import get_state_dir, read_json, write_json_atomic
+
+STATE_FILENAME = "supervisor.json"
+
+class SupervisorError(RuntimeError):
+    """Компонент исчерпал бюджет падений — дальше перезапускать бессмысленно."""
+
+@dataclass
+class Component:
+    """Управляемый дочерний процесс."""
+
+    name: str
+    argv: list[str]
+    log_path: str
+    # Неблокирующая проверка готовности после перезапуска (True — готов) и сколько её ждать
+    ready: Callable[[subprocess.Popen], bool] | None = None
+    ready_timeout: float = 5.0
+    # Насос логов: вывод идёт через пайп (ротация, кольцо строк, события); без него — прямо в файл
+    pump: LogPump | None = None
+    # Добавки к окружению (`GOMAXPROCS`), дескрипторы для ребёнка (очереди TUN) и размещение по CPU
+    env: dict[str, str] | None = None
+    pass_fds: tuple[int, ...] = ()
+    placement: Placement | None = None
+
+    proc: subprocess.Popen | None = None
+    log: object = None
+    pidfd: int | None = None
+    started_at: float = 0.0
+    down_since: float | None = None
+    restarts: int = 0
+    downtime: float = 0.0
+    last_exit: int | None = None
+    crashes: deque = field(default_factory=deque)
+    streak: int = 0  # падения подряд (для экспоненциальной задержки)
+    placement_error: str | None = None
+
+    def start(self) -> subprocess.Popen:
+        with tracing.span(f"spawn {self.name}", "process", argv=tracing.redact(self.argv)) as sp:
+            env = {**os.environ, **self.env} if self.env else None
+            if self.pump is not None:
+                self.proc = subprocess.Popen(
+                    self.argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=env, pass_fds=self.pass_fds
+                )
+                self.pump.attach(self.name, self.proc.stdout)
+            else:
+                if self.log is None:
+                    self.log = open(self.log_path, "ab", buffering=0)
+                self.proc = subprocess.Popen(
+                    self.argv, stdout=self.log, stderr=subprocess.STDOUT, env=env, pass_fds=self.pass_fds
+                )
+            if self.placement:
+                self.placement_error = self.placement.apply(self.proc.pid)
+            sp["pid"] = self.proc.pid
+        self.started_at = time.monotonic()
+        return self.proc
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def terminate(self, timeout: float = 3.0) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+                self.proc.wait()
+        if self.log is not None:
+            self.log.close()
+            self.log = None
+
+    def snapshot(self) -> dict:
+        downtime = self.downtime
+        if self.down_since is not None:
+            downtime += time.monotonic() - self.down_since
+        state = "down"
+        if self.alive():
+            state = "starting" if self.down_since is not None else "running"
+        return {
+            "pid": self.proc.pid if self.alive() else None,
+            "state": state,
+            "restarts": self.restarts,
+            "downtime_s": round(downtime, 3),
+            "last_exit": self.last_exit,
+            "log": self.log_path,
+            **({"placement": self.placement.describe()} if self.placement else {}),
+            **({"placement_error": self.placement_error} if self.placement_error else {}),
+        }
+
+class Supervisor:
+    """Следит за компонентами и перезапускает упавшие по одному."""
+
+    def __init__(
+        self,
+        components: list[Component],
+        *,
+        max_restarts: int = 5,
+        window: float = 60.0,
+        backoff_base: float = 0.1,
+        backoff_max: float = 5.0,
+        stable_after: float = 10.0,
+        state_path: Path | None = None,
+        journal: Journal | None = None,
+    ) -> None:
+        self.components = {c.name: c for c in components}
+        self.max_restarts = max_restarts
+        self.window = window
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stable_after = stable_after
+        self.state_path = state_path if state_path is not None else get_state_dir() / STATE_FILENAME
+        # Каждый (пере)запущенный процесс попадает в журнал ресурсов — его снимет `stop`/`recover`
+        self.journal = journal
+
+        self.selector = selectors.DefaultSelector()
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self._use_pidfd = hasattr(os, "pidfd_open")
+        self._pending: dict[str, float] = {}
+        # Перезапущенные компоненты, ждущие готовности: имя -> дедлайн
+        self._starting: dict[str, float] = {}
+        self._timers: list[tuple[float, Callable[[], None]]] = []
+        self._timers_lock = threading.Lock()
+        self._stopping = False
+        self._old_wakeup_fd: int | None = None
+
+    # --- жизненный цикл ---
+
+    def spawn(self, name: str) -> subprocess.Popen:
+        """Запустить компонент без ожидания готовности (её проверяет вызывающий код)."""
+        comp = self.components[name]
+        proc = comp.start()
+        self._journal_started(comp)
+        self._watch(comp)
+        self.write_state()
+        return proc
+
+    def add(self, comp: Component) -> None:
+        """Взять под наблюдение ещё один компонент (запускать — `spawn`)."""
+        self.components[comp.name] = comp
+
+    def remove(self, name: str) -> None:
+        """Остановить компонент и больше за ним не следить."""
+        comp = self.components.pop(name)
+        self._unwatch(comp)
+        self._pending.pop(name, None)
+        self._starting.pop(name, None)
+        comp.terminate()
+        if self.journal is not None:
+            self.journal.forget("process", name)
+        self.write_state()
+
+    def call_later(self, delay: float, callback: Callable[[], None]) -> None:
+        """Вызвать `callback()` из цикла `run()` через `delay` секунд (можно звать из любого потока)."""
+        with self._timers_lock:
+            self._timers.append((time.monotonic() + delay, callback))
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    def add_reader(self, fileobj, callback: Callable) -> None:
+        """Обслуживать ещё один дескриптор в том же цикле (`callback(fileobj)` при готовности к чтению)."""
+        self.selector.register(fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj) -> None:
+        try:
+            self.selector.unregister(fileobj)
+        except (KeyError, ValueError):
+            pass
+
+    def restart(self, name: str) -> None:
+        """
+        Плановый перезапуск компонента (например, после reload); в бюджет падений не входит.
+
+        Возвращается сразу после запуска процесса: готовность дожидается цикл `run()`.
+        """
+        comp = self.components[name]
+        self._unwatch(comp)
+        self._pending.pop(name, None)
+        self._starting.pop(name, None)
+        comp.terminate()
+        comp.down_since = time.monotonic()
+        self._restart(comp, planned=True)
+
+    def stop(self) -> None:
+        """Попросить `run()` завершиться (можно вызывать из другого потока/обработчика сигнала)."""
+        self._stopping = True
+        try:
+            os.write(self._wake_w, b"\0")
+        except OSError:
+            pass
+
+    def run(self) -> None:
+        """Главный цикл: ждать событий о выходе детей и отложенных перезапусков."""
+        if not self._use_pidfd:
+            self._install_sigchld()
+        try:
+            while not self._stopping:
+                events = self.selector.select(self._next_timeout())
+                for key, _ in events:
+                    if key.data is None:
+                        self._drain_wake()
+                        if not self._use_pidfd:
+                            self._reap_all()
+                    elif isinstance(key.data, Component):
+                        self._on_exit(key.data)
+                    else:
+                        key.data(key.fileobj)
+                self._check_starting()
+                self._run_due_restarts()
+                self._run_due_timers()
+        finally:
+            if not self._use_pidfd:
+                self._restore_sigchld()
+
+    def shutdown(self) -> None:
+        """Остановить все компоненты и освободить дескрипторы."""
+        for comp in reversed(list(self.components.values())):
+            self._unwatch(comp)
+            comp.terminate()
+        self.selector.close()
+        for fd in (self._wake_r, self._wake_w):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        # `call_later` из запоздавшего рабочего потока не должен писать в чужой дескриптор с тем же номером
+        self._wake_r = self._wake_w = -1
+        try:
+            self.state_path.unlink()
+        except OSError:
+            pass
+
+    # --- наблюдение за процессами ---
+
+    def _watch(self, comp: Component) -> None:
+        if not self._use_pidfd or comp.proc is None:
+            return
+        try:
+            comp.pidfd = os.pidfd_open(comp.proc.pid)
+        except OSError:
+            # Процесс уже успел завершиться — обработаем на ближайшей итерации
+            self._pending.setdefault(comp.name, time.monotonic())
+            return
+        self.selector.register(comp.pidfd, selectors.EVENT_READ, comp)
+
+    def _unwatch(self, comp: Component) -> None:
+        if comp.pidfd is None:
+            return
+        try:
+            self.selector.unregister(comp.pidfd)
+        except (KeyError, ValueError):
+            pass
+        os.close(comp.pidfd)
+        comp.pidfd = None
+
+    def _install_sigchld(self) -> None:
+        signal.signal(signal.SIGCHLD, lambda *_: None)
+        self._old_wakeup_fd = signal.set_wakeup_fd(self._wake_w)
+
+    def _restore_sigchld(self) -> None:
+        signal.set_wakeup_fd(self._old_wakeup_fd if self._old_wakeup_fd is not None else -1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+
+    def _drain_wake(self) -> None:
+        try:
+            while os.read(self._wake_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def _reap_all(self) -> None:
+        for comp in self.components.values():
+            if comp.proc is not None and comp.down_since is None and comp.proc.poll() is not None:
+                self._on_exit(comp)
+
+    # --- перезапуски ---
+
+    def _on_exit(self, comp: Component) -> None:
+        self._unwatch(comp)
+        self._starting.pop(comp.name, None)
+        now = time.monotonic()
+        comp.last_exit = comp.proc.wait() if comp.proc is not None else None
+        if comp.down_since is None:
+            comp.down_since = now
+        if now - comp.started_at >= self.stable_after:
+            comp.streak = 0
+        comp.streak += 1
+
+        comp.crashes.append(now)
+        while comp.crashes and now - comp.crashes[0] > self.window:
+            comp.crashes.popleft()
+        self.write_state()
+        if len(comp.crashes) > self.max_restarts:
+            raise SupervisorError(
+                f"{comp.name} упал {len(comp.crashes)} раз за {self.window:.0f}с (код {comp.last_exit}). Лог: {comp.log_path}"
+            )
+
+        # Первый перезапуск — сразу, дальше экспоненциально
+        delay = 0.0 if comp.streak == 1 else min(self.backoff_max, self.backoff_base * 2 ** (comp.streak - 2))
+        self._pending[comp.name] = now + delay
+
+    def _next_timeout(self) -> float | None:
+        due = [*self._pending.values(), *(when for when, _ in self._timers)]
+        if self._starting:
+            due.append(time.monotonic() + POLL_INTERVAL)
+        if not due:
+            return None
+        return max(0.0, min(due) - time.monotonic())
+
+    def _run_due_timers(self) -> None:
+        now = time.monotonic()
+        with self._timers_lock:
+            due = [cb for when, cb in self._timers if when <= now]
+            self._timers = [(when, cb) for when, cb in self._timers if when > now]
+        for callback in due:
+            callback()
+
+    def _run_due_restarts(self) -> None:
+        now = time.monotonic()
+        for name, due in list(self._pending.items()):
+            if due > now:
+                continue
+            del self._pending[name]
+            comp = self.components[name]
+            if comp.down_since is None:
+                # Сюда попадаем, если процесс умер до регистрации pidfd
+                if comp.alive():
+                    continue
+                self._on_exit(comp)
+                continue
+            self._restart(comp)
+
+    def _restart(self, comp: Component, planned: bool = False) -> None:
+        if not planned:
+            comp.restarts += 1
+        comp.start()
+        self._journal_started(comp)
+        self._watch(comp)
+        if comp.ready is None:
+            self._mark_up(comp)
+            return
+        self._starting[comp.name] = time.monotonic() + comp.ready_timeout
+        self.write_state()
+
+    def _check_starting(self) -> None:
+        """Опросить готовность перезапущенных компонентов; не успевший к дедлайну считается упавшим."""
+        now = time.monotonic()
+        for name, deadline in list(self._starting.items()):
+            comp = self.components[name]
+            if not comp.alive():
+                self._on_exit(comp)
+            elif comp.ready(comp.proc):
+                del self._starting[name]
+                self._mark_up(comp)
+            elif now >= deadline:
+                comp.proc.kill()
+                self._on_exit(comp)
+
+    def _mark_up(self, comp: Component) -> None:
+        comp.downtime += time.monotonic() - comp.down_since
+        comp.down_since = None
+        self.write_state()
+
+    def _journal_started(self, comp: Component) -> None:
+        if self.journal is not None and comp.proc is not None:
+            self.journal.record_process(comp.name, comp.proc.pid)
+
+    # --- состояние для `status` ---
+
+    def write_state(self) -> None:
+        try:
+            write_json_atomic(
+                self.state_path,
+                {
+                    "pid": os.getpid(),
+                    "updated": time.time(),
+                    "components": {name: c.snapshot() for name, c in self.components.items()},
+                },
+            )
+        except OSError:
+            pass
+
+def read_supervisor_state(path: Path | None = None) -> dict | None:
+    """Прочитать состояние супервизора, если его процесс ещё жив."""
+    data = read_json(path if path is not None else get_state_dir() / STATE_FILENAME)
+    if not isinstance(data, dict):
+        return None
+    try:
+        os.kill(int(data.get("pid", 0)), 0)
+    except PermissionError:
+        pass  # процесс root-а: жив, просто сигнал слать нельзя
+    except (OSError, ValueError):
+        return None
+    return data
@@ -0,0 +1,197 @@
+"""
+Трассировка фаз и внешних команд: куда ушло время `start` (sudo, `.env`, резолв, `sslocal`, TUN, маршруты).
+
+Включается глобальной опцией `--trace out.json` (или env `MY_VPN_TRACE`) и/или `--trace-summary`.
+Каждая фаза (`PhaseTimer.phase`), запуск ребёнка, вызов `ip`/`ss`/`pkill`, скачивание и распаковка
+бинарников — спан с длительностью, аргументами и кодом выхода. Результат — Chrome trace JSON
+(открывается в Perfetto и `chrome://tracing`) и/или сводная таблица по именам спанов.
+
+Выключенная трассировка стоит одну проверку глобальной переменной на спан: `span()` возвращает
+один и тот же пустой контекст, ничего не аллоцируя. Модуль импортируется и быстрым путём CLI,
+поэтому `json`/`subprocess` подгружаются только при использовании.
+"""
+
+import os
+import threading
+import time
+
+ENV_TRACE = "MY_VPN_TRACE"
+# Момент (мкс, CLOCK_MONOTONIC), с которого процесс перезапускает себя через sudo: новый процесс
+# показывает этот промежуток отдельным спаном
+ENV_TRACE_PARENT = "MY_VPN_TRACE_PARENT"
+# Демон с включённой трассировкой живёт долго: спаны сверх предела только считаются
+MAX_SPANS = 100_000
+_SECRET_FLAGS = {"-k", "--password"}
+
+def now_us() -> int:
+    # CLOCK_MONOTONIC общий для всех процессов: спаны родителя до sudo/fork и потомка на одной оси
+    return time.monotonic_ns() // 1000
+
+def redact(argv: list[str]) -> list[str]:
+    """argv без пароля (`sslocal -k ...`)."""
+    return ["***" if i and str(argv[i - 1]) in _SECRET_FLAGS else str(arg) for i, arg in enumerate(argv)]
+
+class _NullArgs(dict):
+    """Аргументы спана при выключенной трассировке: записи молча выбрасываются."""
+
+    def __setitem__(self, key, value) -> None:
+        pass
+
+    def update(self, *args, **kwargs) -> None:
+        pass
+
+class _NullSpan:
+    __slots__ = ()
+    _args = _NullArgs()
+
+    def __enter__(self) -> dict:
+        return self._args
+
+    def __exit__(self, *exc) -> bool:
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "cat", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, cat: str, args: dict) -> None:
+        self.tracer, self.name, self.cat, self.args = tracer, name, cat, args
+
+    def __enter__(self) -> dict:
+        self.start = now_us()
+        return self.args
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc is not None:
+            self.args.setdefault("error", f"{exc_type.__name__}: {exc}" if str(exc) else exc_type.__name__)
+        self.tracer.add(self.name, self.cat, self.start, now_us() - self.start, self.args)
+        return False
+
+class Tracer:
+    """Собирает завершённые спаны (`ph: "X"` в терминах Chrome trace)."""
+
+    def __init__(self, path: str | None = None, summary: bool = False) -> None:
+        self.path = path
+        self.summary = summary
+        self.pid = os.getpid()
+        self.events: list[dict] = []
+        self.dropped = 0
+        self.summary_printed = False
+        self.command = ("", now_us())  # имя команды CLI и её начало — для корневого спана
+        self._lock = threading.Lock()
+        parent = os.environ.pop(ENV_TRACE_PARENT, "")
+        if parent.isdigit():
+            self.add("sudo re-exec", "process", int(parent), now_us() - int(parent))
+
+    def add(self, name: str, cat: str, start_us: int, dur_us: int, args: dict | None = None) -> None:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start_us,
+            "dur": dur_us,
+            "pid": self.pid,
+            "tid": threading.get_native_id(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            if len(self.events) >= MAX_SPANS:
+                self.dropped += 1
+                return
+            self.events.append(event)
+
+    def span(self, name: str, cat: str, args: dict) -> _Span:
+        return _Span(self, name, cat, args)
+
+    def after_fork(self) -> None:
+        """В потомке `fork`: спаны родителя остаются, новые пишутся под новым pid."""
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def chrome_trace(self) -> dict:
+        with self._lock:
+            events = list(self.events)
+        pids = {e["pid"] for e in events} | {self.pid}
+        meta = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": f"my-vpn {pid}"}} for pid in pids]
+        return {
+            "traceEvents": meta + events,
+            "displayTimeUnit": "ms",
+            "otherData": {"dropped_spans": self.dropped},
+        }
+
+    def write(self) -> None:
+        if not self.path:
+            return
+        import json
+
+        tmp = os.path.join(os.path.dirname(self.path) or ".", f".{os.path.basename(self.path)}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.chrome_trace(), f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+    def rows(self) -> list[dict]:
+        """Сводка по именам спанов: вызовы, суммарное/максимальное время; по убыванию суммы."""
+        totals: dict[tuple[str, str], dict] = {}
+        with self._lock:
+            events = list(self.events)
+        for e in events:
+            row = totals.setdefault(
+                (e["cat"], e["name"]),
+                {"name": e["name"], "cat": e["cat"], "calls": 0, "failed": 0, "total_ms": 0.0, "max_ms": 0.0},
+            )
+            ms = e["dur"] / 1000
+            row["calls"] += 1
+            row["total_ms"] += ms
+            row["max_ms"] = max(row["max_ms"], ms)
+            args = e.get("args", {})
+            if args.get("exit_code") or "error" in args:
+                row["failed"] += 1
+        return sorted(totals.values(), key=lambda r: r["total_ms"], reverse=True)
+
+_tracer: Tracer | None = None
+
+def enable(path: str | None = None, summary: bool = False) -> Tracer:
+    global _tracer
+    _tracer = Tracer(path, summary)
+    return _tracer
+
+def tracer() -> Tracer | None:
+    return _tracer
+
+def disable() -> None:
+    """Перестать собирать спаны (родитель после `fork`: трассу пишет потомок)."""
+    global _tracer
+    _tracer = None
+
+def span(name: str, cat: str = "phase", **args):
+    """Контекст спана; внутри можно дописать аргументы (`sp["exit_code"] = ...`)."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, cat, args)
+
+def run(args, **kwargs) -> "subprocess.CompletedProcess":
+    """`subprocess.run` со спаном: команда и код выхода."""
+    import subprocess
+
+    if _tracer is None:
+        return subprocess.run(args, **kwargs)
+    # Строка — команда для shell: в аргументах как есть, имя спана — первое слово
+    argv = [args] if isinstance(args, str) else redact(list(args))
+    name = os.path.basename(args.split()[0] if isinstance(args, str) else str(args[0]))
+    with _tracer.span(name, "subprocess", {"argv": argv}) as sp:
+        try:
+            result = subprocess.run(args, **kwargs)
+        except subprocess.CalledProcessError as e:
+            sp["exit_code"] = e.returncode
+            raise
+        sp["exit_code"] = result.returncode
+        return result
+
+def check_output(args, **kwargs) -> bytes:
+    """`subprocess.check_output` со спаном (ненулевой код — `CalledProcessError`, как обычно)."""
+    import subprocess
+
+    kwargs.setdefault("stdout", subprocess.PIPE)
+    return run(args, check=True, **kwargs).stdout
@@ -0,0 +1,402 @@
+"""
+Параметры data path (MTU, буферы, таймауты) и профили.
+
+Базовые значения берутся из env (`TUN_MTU`, `TCP_SNDBUF`, ...), профиль (`--profile NAME` или env `PROFILE`)
+переопределяет заданные в нём поля. Профили — встроенные и пользовательские из
+`~/.config/my-vpn/profiles.json` (туда же `my-vpn autotune` сохраняет найденную комбинацию).
+Профиль может задавать и сервер (`"server"`) — тогда `my-vpn switch <профиль>` переключает на него.
+Не заданный нигде параметр не передаётся вовсе — остаётся значение по умолчанию `tun2socks`/`sslocal`/ядра.
+
+Path MTU до сервера ищется ICMP echo с DF (`IP_PMTUDISC_DO`) бинарным поиском по размеру пакета.
+"""
+
+import errno
+import os
+import re
+import select
+import socket
+import struct
+import time
+from dataclasses import asdict, dataclass, fields
+from pathlib import Path
+from typing import Callable
+
+from vpn_cli.utils import get_config_dir, read_json, write_json_atomic
+
+ENV_PROFILE = "PROFILE"
+PROFILES_FILENAME = "profiles.json"
+# Ключ профиля, который не параметр data path, а сервер(ы) — для `start --profile` и `switch`
+PROFILE_SERVER_KEY = "server"
+# Значения ядра для нового TUN — к ним возвращаемся, когда параметр снят на лету
+TUN_DEFAULT_MTU = 1500
+TUN_DEFAULT_TXQUEUELEN = 500
+
+@dataclass
+class Tunables:
+    """Настраиваемые параметры; `None` — не трогать (значение по умолчанию компонента)."""
+
+    mtu: int | None = None  # MTU TUN и `tun2socks -mtu`
+    txqueuelen: int | None = None  # длина очереди передачи TUN
+    tcp_sndbuf: int | None = None  # `tun2socks -tcp-sndbuf`, байт
+    tcp_rcvbuf: int | None = None  # `tun2socks -tcp-rcvbuf`, байт
+    tcp_auto_tuning: bool | None = None  # `tun2socks -tcp-auto-tuning`
+    udp_timeout: int | None = None  # `tun2socks -udp-timeout` и `sslocal --udp-timeout`, сек
+    ss_no_delay: bool | None = None  # `sslocal --tcp-no-delay`
+    ss_fast_open: bool | None = None  # `sslocal --tcp-fast-open`
+    ss_send_buffer: int | None = None  # `sslocal --outbound-send-buffer-size`, байт
+    ss_recv_buffer: int | None = None  # `sslocal --outbound-recv-buffer-size`, байт
+    tun_queues: int | None = None  # очередей multi-queue TUN (по процессу `tun2socks` на очередь)
+    gomaxprocs: int | None = None  # `GOMAXPROCS` для `tun2socks`
+    ss_worker_threads: int | None = None  # `sslocal --worker-threads`
+
+ENV_KEYS = {
+    "mtu": "TUN_MTU",
+    "txqueuelen": "TUN_TXQUEUELEN",
+    "tcp_sndbuf": "TCP_SNDBUF",
+    "tcp_rcvbuf": "TCP_RCVBUF",
+    "tcp_auto_tuning": "TCP_AUTO_TUNING",
+    "udp_timeout": "UDP_TIMEOUT",
+    "ss_no_delay": "SS_TCP_NO_DELAY",
+    "ss_fast_open": "SS_TCP_FAST_OPEN",
+    "ss_send_buffer": "SS_SEND_BUFFER",
+    "ss_recv_buffer": "SS_RECV_BUFFER",
+    "tun_queues": "TUN_QUEUES",
+    "gomaxprocs": "TUN2SOCKS_GOMAXPROCS",
+    "ss_worker_threads": "SS_WORKER_THREADS",
+}
+_SIZE_FIELDS = {"tcp_sndbuf", "tcp_rcvbuf", "ss_send_buffer", "ss_recv_buffer"}
+_BOOL_FIELDS = {"tcp_auto_tuning", "ss_no_delay", "ss_fast_open"}
+# Предел ядра на число очередей TUN (`MAX_TAP_QUEUES`)
+MAX_TUN_QUEUES = 256
+_SIZE_RE = re.compile(r"^(\d+)\s*([kmg]?)(?:i?b)?$", re.IGNORECASE)
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2, "g": 1024**3}
+
+BUILTIN_PROFILES: dict[str, dict] = {
+    # Толстый канал с большой задержкой: окна TCP под BDP, длинная очередь TUN
+    "throughput": {
+        "mtu": 1500,
+        "txqueuelen": 1000,
+        "tcp_sndbuf": 4 * 1024**2,
+        "tcp_rcvbuf": 4 * 1024**2,
+        "tcp_auto_tuning": True,
+        "ss_send_buffer": 4 * 1024**2,
+        "ss_recv_buffer": 4 * 1024**2,
+    },
+    # Интерактивный трафик: без Nagle, TFO, короткая очередь
+    "latency": {
+        "txqueuelen": 100,
+        "ss_no_delay": True,
+        "ss_fast_open": True,
+    },
+}
+
+def parse_size(value) -> int:
+    """Размер в байтах: `4194304`, `512K`, `4M`, `4MiB`."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    m = _SIZE_RE.match(str(value).strip())
+    if not m:
+        raise ValueError(f"Некорректный размер: {value!r}")
+    return int(m.group(1)) * _SIZE_UNITS[m.group(2).lower()]
+
+def _parse_bool(value) -> bool:
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in ("1", "true", "yes", "on"):
+        return True
+    if text in ("0", "false", "no", "off"):
+        return False
+    raise ValueError(f"Некорректное логическое значение: {value!r}")
+
+def _parse_field(name: str, value):
+    if name in _BOOL_FIELDS:
+        return _parse_bool(value)
+    number = parse_size(value) if name in _SIZE_FIELDS else int(value)
+    if name == "mtu" and not 576 <= number <= 65535:
+        raise ValueError(f"MTU вне диапазона 576..65535: {number}")
+    if name == "tun_queues" and number > MAX_TUN_QUEUES:
+        raise ValueError(f"Очередей TUN больше {MAX_TUN_QUEUES}: {number}")
+    if number < 0 or (number == 0 and name != "txqueuelen"):
+        raise ValueError(f"{name}: ожидается положительное число, получено {number}")
+    return number
+
+def from_dict(data: dict) -> Tunables:
+    """Параметры из словаря профиля (неизвестные ключи — ошибка, чтобы опечатка не терялась молча)."""
+    known = {f.name for f in fields(Tunables)}
+    unknown = set(data) - known
+    if unknown:
+        raise ValueError(f"Неизвестные параметры: {', '.join(sorted(unknown))}")
+    return Tunables(**{name: _parse_field(name, value) for name, value in data.items() if value is not None})
+
+def from_env() -> Tunables:
+    """Параметры из env (`TUN_MTU`, `TCP_SNDBUF`, ...)."""
+    data = {}
+    for name, key in ENV_KEYS.items():
+        value = os.getenv(key, "").strip()
+        if value:
+            data[name] = value
+    return from_dict(data)
+
+def to_dict(tunables: Tunables) -> dict:
+    """Только заданные поля."""
+    return {k: v for k, v in asdict(tunables).items() if v is not None}
+
+def merged(base: Tunables, override: Tunables) -> Tunables:
+    """`base`, поверх которого заданы поля `override`."""
+    return Tunables(**{**asdict(base), **to_dict(override)})
+
+def tun2socks_args(tunables: Tunables) -> list[str]:
+    args = []
+    if tunables.mtu is not None:
+        args += ["-mtu", str(tunables.mtu)]
+    if tunables.tcp_sndbuf is not None:
+        args += ["-tcp-sndbuf", str(tunables.tcp_sndbuf)]
+    if tunables.tcp_rcvbuf is not None:
+        args += ["-tcp-rcvbuf", str(tunables.tcp_rcvbuf)]
+    if tunables.tcp_auto_tuning:
+        args.append("-tcp-auto-tuning")
+    if tunables.udp_timeout is not None:
+        args += ["-udp-timeout", f"{tunables.udp_timeout}s"]
+    return args
+
+def sslocal_args(tunables: Tunables) -> list[str]:
+    args = []
+    if tunables.ss_no_delay:
+        args.append("--tcp-no-delay")
+    if tunables.ss_fast_open:
+        args.append("--tcp-fast-open")
+    if tunables.udp_timeout is not None:
+        args += ["--udp-timeout", str(tunables.udp_timeout)]
+    if tunables.ss_send_buffer is not None:
+        args += ["--outbound-send-buffer-size", str(tunables.ss_send_buffer)]
+    if tunables.ss_recv_buffer is not None:
+        args += ["--outbound-recv-buffer-size", str(tunables.ss_recv_buffer)]
+    if tunables.ss_worker_threads is not None:
+        args += ["--worker-threads", str(tunables.ss_worker_threads)]
+    return args
+
+def tun2socks_env(tunables: Tunables, queues: int = 1, cpus: int | None = None) -> dict[str, str]:
+    """
+    `GOMAXPROCS` для каждого `tun2socks`: заданный явно или, когда процессов несколько (очереди TUN),
+    доступные ядра поровну — иначе каждый Go-рантайм заведёт по потоку на все ядра и они будут толкаться.
+    """
+    if tunables.gomaxprocs is not None:
+        return {"GOMAXPROCS": str(tunables.gomaxprocs)}
+    if queues > 1:
+        return {"GOMAXPROCS": str(max(1, (cpus or len(os.sched_getaffinity(0))) // queues))}
+    return {}
+
+# --- профили ---
+
+def profiles_path() -> Path:
+    return get_config_dir() / PROFILES_FILENAME
+
+def load_profiles() -> dict[str, dict]:
+    """Встроенные профили, поверх — пользовательские из `profiles.json`."""
+    data = read_json(profiles_path())
+    user = data.get("profiles") if isinstance(data, dict) else None
+    profiles = {name: dict(values) for name, values in BUILTIN_PROFILES.items()}
+    if isinstance(user, dict):
+        profiles.update({name: values for name, values in user.items() if isinstance(values, dict)})
+    return profiles
+
+def get_profile(name: str) -> dict:
+    profiles = load_profiles()
+    if name not in profiles:
+        raise ValueError(f"Профиль {name!r} не найден (есть: {', '.join(sorted(profiles)) or 'нет'})")
+    return profiles[name]
+
+def profile_servers(values: dict) -> list[str]:
+    """Серверы профиля (`"server"`: URL, имя из `#fragment` или их список); пусто — сервер не меняется."""
+    servers = values.get(PROFILE_SERVER_KEY) or []
+    return [servers] if isinstance(servers, str) else [str(s) for s in servers]
+
+def save_profile(name: str, values: dict) -> Path:
+    """Записать параметры пользовательского профиля `name` (его `server`, если был, остаётся)."""
+    path = profiles_path()
+    data = read_json(path)
+    if not isinstance(data, dict) or not isinstance(data.get("profiles"), dict):
+        data = {"profiles": {}}
+    old = data["profiles"].get(name)
+    if isinstance(old, dict) and PROFILE_SERVER_KEY in old:
+        values = {PROFILE_SERVER_KEY: old[PROFILE_SERVER_KEY], **values}
+    data["profiles"][name] = values
+    write_json_atomic(path, data)
+    return path
+
+def resolve_tunables(profile: str | None = None) -> tuple[str | None, Tunables]:
+    """Итоговые параметры: env, поверх — профиль (`profile` или env `PROFILE`)."""
+    name = profile or os.getenv(ENV_PROFILE, "").strip() or None
+    tunables = from_env()
+    if name:
+        values = {k: v for k, v in get_profile(name).items() if k != PROFILE_SERVER_KEY}
+        tunables = merged(tunables, from_dict(values))
+    return name, tunables
+
+# --- path MTU ---
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+IP_MTU_DISCOVER = 10
+IP_PMTUDISC_DO = 2
+IP_MTU = 14
+IPV4_ICMP_HEADERS = 28  # IPv4 20 + ICMP 8
+MIN_MTU = 576
+# UDP через shadowsocks (AEAD): снаружи IPv4+UDP 28, соль 32, адрес назначения до 19 (IPv6), тег 16;
+# внутренние IP+UDP 28 байт уже входят в MTU TUN
+SS_UDP_OVERHEAD = 28 + 32 + 19 + 16 - 28
+
+@dataclass
+class PathMtu:
+    """Результат поиска path MTU."""
+
+    address: str
+    path_mtu: int | None
+    probes: int
+    method: str  # "icmp" | "kernel" (ICMP недоступен — значение из таблицы маршрутов ядра)
+
+    @property
+    def tun_mtu(self) -> int | None:
+        """MTU TUN, при котором UDP через shadowsocks не фрагментируется."""
+        return max(MIN_MTU, self.path_mtu - SS_UDP_OVERHEAD) if self.path_mtu else None
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b"\0"
+    total = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+def _echo_packet(ident: int, seq: int, size: int) -> bytes:
+    payload = b"\xa5" * (size - IPV4_ICMP_HEADERS)
+    header = struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return struct.pack("!BBHHH", ICMP_ECHO_REQUEST, 0, _checksum(header + payload), ident, seq) + payload
+
+def _icmp_socket() -> tuple[socket.socket, bool]:
+    """Непривилегированный ping-сокет (`net.ipv4.ping_group_range`), иначе raw (нужен root)."""
+    try:
+        return socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP), False
+    except PermissionError:
+        return socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP), True
+
+def _kernel_mtu(sock: socket.socket) -> int | None:
+    try:
+        return sock.getsockopt(socket.IPPROTO_IP, IP_MTU)
+    except OSError:
+        return None
+
+def discover_path_mtu(address: str, *, timeout: float = 1.0, retries: int = 2, max_mtu: int = 9000) -> PathMtu:
+    """
+    Бинарный поиск наибольшего пакета с DF, на который `address` отвечает echo reply.
+
+    Ядро отказывает в отправке (`EMSGSIZE`) пакетов больше MTU интерфейса или уже известного
+    path MTU (после ICMP fragmentation needed) — верхняя граница сразу сужается до него.
+    Молча пропавший пакет (black hole) переспрашивается `retries` раз и считается слишком большим.
+    """
+    sock, raw = _icmp_socket()
+    probes = 0
+    try:
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, IP_PMTUDISC_DO)
+        sock.connect((address, 0))
+        ident = os.getpid() & 0xFFFF
+        seq = 0
+
+        def fits(size: int) -> bool:
+            nonlocal probes, seq, hi
+            for _ in range(retries + 1):
+                seq = (seq + 1) & 0xFFFF
+                probes += 1
+                try:
+                    sock.send(_echo_packet(ident, seq, size))
+                except OSError as e:
+                    if e.errno != errno.EMSGSIZE:
+                        raise
+                    hi = min(hi, (_kernel_mtu(sock) or size) + 1)
+                    return False
+                deadline = time.monotonic() + timeout
+                while (left := deadline - time.monotonic()) > 0:
+                    if not select.select([sock], [], [], left)[0]:
+                        break
+                    data = sock.recv(65535)
+                    if raw:
+                        data = data[(data[0] & 0x0F) * 4 :]
+                    if len(data) < 8:
+                        continue
+                    kind, _, _, reply_ident, reply_seq = struct.unpack("!BBHHH", data[:8])
+                    # Ping-сокет сам подменяет идентификатор, сверяем только номер
+                    if kind == ICMP_ECHO_REPLY and reply_seq == seq and (not raw or reply_ident == ident):
+                        return True
+            return False
+
+        hi = max_mtu + 1  # первый размер, который точно не проходит
+        first = min(max_mtu, _kernel_mtu(sock) or max_mtu)
+        if fits(first):
+            return PathMtu(address, first, probes, "icmp")
+        if not fits(MIN_MTU):
+            # ICMP режется по дороге — остаётся то, что знает ядро
+            return PathMtu(address, _kernel_mtu(sock), probes, "kernel")
+        lo = MIN_MTU
+        hi = min(hi, first)
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if fits(mid):
+                lo = mid
+            else:
+                hi = min(hi, mid)
+        return PathMtu(address, lo, probes, "icmp")
+    finally:
+        sock.close()
+
+# --- autotune ---
+
+def sweep_stages(base: Tunables, safe_mtu: int | None) -> list[tuple[str, list]]:
+    """
+    Кандидаты для покоординатного перебора: MTU (не больше безопасного для UDP), буферы `tun2socks`,
+    буферы `sslocal`, длина очереди TUN. `None` — значение по умолчанию компонента.
+    """
+    mtus = [safe_mtu] if safe_mtu else []
+    mtus += [m for m in (1500, base.mtu) if m and (safe_mtu is None or m <= safe_mtu) and m not in mtus]
+    buffers = [None, 1024**2, 4 * 1024**2, 16 * 1024**2]
+    return [
+        ("mtu", mtus or [None]),
+        ("tcp_buffers", buffers),
+        ("ss_buffers", buffers),
+        ("txqueuelen", [None, 1000, 5000]),
+    ]
+
+def with_value(tunables: Tunables, stage: str, value) -> Tunables:
+    """Параметры с подставленным значением этапа (буферы — парой send/recv)."""
+    data = asdict(tunables)
+    if stage == "tcp_buffers":
+        data.update(tcp_sndbuf=value, tcp_rcvbuf=value)
+    elif stage == "ss_buffers":
+        data.update(ss_send_buffer=value, ss_recv_buffer=value)
+    else:
+        data[stage] = value
+    return Tunables(**data)
+
+def autotune(
+    base: Tunables,
+    stages: list[tuple[str, list]],
+    measure: Callable[[Tunables], float | None],
+    on_result: Callable[[str, object, float | None], None] = lambda stage, value, score: None,
+) -> tuple[Tunables, float | None]:
+    """
+    Покоординатный перебор: на каждом этапе меряем всех кандидатов при лучших значениях
+    предыдущих этапов и оставляем лучшего. `measure` возвращает оценку (больше — лучше)
+    или `None`, если прогон не удался.
+    """
+    best, best_score = base, None
+    for stage, values in stages:
+        stage_best, stage_score = best, None
+        for value in values:
+            candidate = with_value(best, stage, value)
+            score = measure(candidate)
+            on_result(stage, value, score)
+            if score is not None and (stage_score is None or score > stage_score):
+                stage_best, stage_score = candidate, score
+        if stage_score is not None:
+            best, best_score = stage_best, stage_score
+    return best, best_score
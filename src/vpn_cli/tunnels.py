@@ -0,0 +1,195 @@
+"""
+Несколько туннелей одновременно (`TUNNELS=N` или `start --tunnels N`).
+
+У каждого туннеля свой `sslocal` (свой SOCKS-порт), свой `tun2socks` и TUN-интерфейс,
+свои логи и своя таблица маршрутизации с правилом `from <адрес TUN> lookup <table>`
+(сокет, привязанный к адресу туннеля, уходит строго через него). Остальной трафик раскладывается
+по туннелям ECMP-маршрутами; хэш по L4 (`fib_multipath_hash_policy=1`) разносит по
+туннелям отдельные соединения, а не только разные адреса назначения.
+
+При `N=1` всё как раньше: `TUN_DEV`, `SOCKS_PORT`, компоненты `sslocal`/`tun2socks`,
+без отдельных таблиц и правил.
+
+`TUN_QUEUES=N` — TUN с N очередями (`IFF_MULTI_QUEUE`): ядро раскладывает потоки по очередям,
+на каждую — свой `tun2socks` (`tun2socks`, `tun2socks.q1`, ...), и data path одного туннеля
+занимает несколько ядер.
+"""
+
+import ipaddress
+import os
+import re
+from dataclasses import dataclass
+from pathlib import Path
+
+from vpn_cli import netlink
+from vpn_cli.network import Route, Rule
+
+DEFAULT_TABLE = 1000
+RULE_PRIORITY = 10000
+# Правила по адресу источника для старого набора туннелей на время `switch`
+DRAIN_PRIORITY = 9000
+HASH_POLICY_PATH = Path("/proc/sys/net/ipv4/fib_multipath_hash_policy")
+# 1 — хэш по L4 (адреса + порты): соединения к одному хосту расходятся по разным туннелям
+L4_HASH_POLICY = "1"
+
+_TRAILING_DIGITS = re.compile(r"(\d+)$")
+
+@dataclass
+class Tunnel:
+    """Один туннель: сервер, локальный SOCKS-порт, TUN и таблица маршрутизации."""
+
+    index: int
+    url: str
+    host: str
+    port: str
+    method: str
+    password: str
+    socks_port: int
+    dev: str
+    addr: str
+    table: int | None = None  # None — одиночный туннель, отдельной таблицы нет
+    address: str | None = None  # выбранный адрес сервера (после резолва)
+    queues: int = 1  # очередей TUN = процессов `tun2socks`
+    tun_queues: "TunQueues | None" = None  # дескрипторы очередей (при `queues > 1`)
+
+    @property
+    def suffix(self) -> str:
+        return "" if self.index == 0 else f"-{self.index}"
+
+    @property
+    def ss_name(self) -> str:
+        return f"sslocal{self.suffix}"
+
+    @property
+    def tun_name(self) -> str:
+        return f"tun2socks{self.suffix}"
+
+    @property
+    def tun_names(self) -> list[str]:
+        """`tun2socks` на каждую очередь TUN: `tun2socks[-N]`, дальше `tun2socks[-N].q1`, ..."""
+        return [self.tun_name] + [f"{self.tun_name}.q{q}" for q in range(1, self.queues)]
+
+class TunQueues:
+    """
+    Очереди multi-queue TUN, которые держит демон. `tun2socks` получает очередь через `-device fd://N`,
+    поэтому номера дескрипторов резервируются заранее (`/dev/null`) и в argv не меняются; после
+    создания TUN (`attach`) на их место через `dup2` встают настоящие очереди. Упавший `tun2socks`
+    перезапускается на той же очереди, пока её держит демон.
+    """
+
+    def __init__(self, dev: str, count: int) -> None:
+        self.dev = dev
+        self.fds = [os.open(os.devnull, os.O_RDONLY | os.O_CLOEXEC) for _ in range(count)]
+
+    def attach(self) -> None:
+        for fd in self.fds:
+            queue = netlink.open_tun_queue(self.dev)
+            os.dup2(queue, fd, inheritable=False)
+            os.close(queue)
+
+    def close(self) -> None:
+        for fd in self.fds:
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+        self.fds = []
+
+def tun_devs(base: str, count: int, first: int = 0) -> list[str]:
+    """
+    Имена TUN для слотов `first..first+count-1`: `tun0` -> `tun0, tun1, ...`; `vpn` -> `vpn0, vpn1, ...`
+    (одиночный туннель в слоте 0 — как есть).
+    """
+    if count == 1 and first == 0:
+        return [base]
+    m = _TRAILING_DIGITS.search(base)
+    prefix, start = (base[: m.start()], int(m.group(1))) if m else (base, 0)
+    return [f"{prefix}{start + i}" for i in range(first, first + count)]
+
+def tun_addrs(base: str, count: int, first: int = 0) -> list[str]:
+    """Адреса TUN в соседних подсетях: `10.255.0.2/24` -> `10.255.1.2/24`, `10.255.2.2/24`, ..."""
+    iface = ipaddress.ip_interface(base)
+    step = iface.network.num_addresses
+    return [f"{iface.ip + i * step}/{iface.network.prefixlen}" for i in range(first, first + count)]
+
+def plan_tunnels(
+    urls: list[str],
+    parsed: dict[str, tuple[str, str, str, str]],
+    count: int,
+    *,
+    base_dev: str,
+    base_addr: str,
+    base_port: int,
+    table: int = DEFAULT_TABLE,
+    first: int = 0,
+    queues: int = 1,
+) -> list[Tunnel]:
+    """
+    Разложить `count` туннелей по серверам `urls` по кругу (серверов может быть меньше —
+    тогда к одному серверу идёт несколько `sslocal`). `parsed[url]` — `(host, port, method, password)`.
+
+    Туннели занимают слоты `first..first+count-1`: от слота зависят TUN, его подсеть, SOCKS-порт,
+    таблица и имена компонентов — так `switch` поднимает новый набор рядом со старым.
+    """
+    devs = tun_devs(base_dev, count, first)
+    addrs = tun_addrs(base_addr, count, first)
+    tunnels = []
+    for i in range(count):
+        url = urls[i % len(urls)]
+        host, port, method, password = parsed[url]
+        index = first + i
+        tunnels.append(
+            Tunnel(
+                index=index,
+                url=url,
+                host=host,
+                port=port,
+                method=method,
+                password=password,
+                socks_port=base_port + index,
+                dev=devs[i],
+                addr=addrs[i],
+                table=table + index if count > 1 else None,
+                queues=queues,
+            )
+        )
+    return tunnels
+
+def table_routes(tunnels: list[Tunnel]) -> list[Route]:
+    """Маршрут по умолчанию в таблице каждого туннеля (для трафика с его адреса)."""
+    return [Route("0.0.0.0/0", dev=t.dev, table=t.table) for t in tunnels if t.table is not None]
+
+def table_rules(tunnels: list[Tunnel]) -> list[Rule]:
+    """
+    `from <адрес TUN> lookup <table>` для каждого туннеля: сокет, привязанный к адресу туннеля
+    (`curl --interface tun1`), уходит через этот туннель, а не туда, куда его разложил бы ECMP.
+    """
+    return [
+        Rule(None, t.table, RULE_PRIORITY + t.index, src=str(ipaddress.ip_interface(t.addr).ip))
+        for t in tunnels
+        if t.table is not None
+    ]
+
+def drain_routes(tunnels: list[Tunnel], table: int = DEFAULT_TABLE) -> list[Route]:
+    """Маршрут по умолчанию через старый TUN в его таблице — для соединений, которые ещё идут через него."""
+    return [Route("0.0.0.0/0", dev=t.dev, table=t.table or table + t.index) for t in tunnels]
+
+def drain_rules(tunnels: list[Tunnel], table: int = DEFAULT_TABLE) -> list[Rule]:
+    """
+    `from <адрес старого TUN> lookup <его таблица>`: уже открытые сокеты привязаны к адресу старого TUN,
+    и после переключения маршрутов их пакеты должны уходить туда же, а не в новый `tun2socks`.
+    """
+    return [
+        Rule(None, t.table or table + t.index, DRAIN_PRIORITY + t.index, src=str(ipaddress.ip_interface(t.addr).ip))
+        for t in tunnels
+    ]
+
+def set_multipath_hash_policy(value: str = L4_HASH_POLICY) -> str | None:
+    """Выставить `fib_multipath_hash_policy` (per-netns sysctl); вернуть прежнее значение или `None`."""
+    try:
+        old = HASH_POLICY_PATH.read_text().strip()
+        if old != value:
+            HASH_POLICY_PATH.write_text(value)
+        return old
+    except OSError:
+        return None
@@ -0,0 +1,195 @@
+"""Общие фикстуры."""
+
+import asyncio
+import base64
+import os
+import shutil
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+SRC = str(Path(__file__).resolve().parent.parent / "src")
+FAKEBIN = Path(__file__).resolve().parent / "fakebin"
+
+# Пролог сценариев CLI: uplink с маршрутом по умолчанию (как у обычной машины) и вызов `my-vpn`
+SCENARIO_PRELUDE = """
+import json, subprocess, sys, time
+
+def ip(*args):
+    return subprocess.run(["ip", *args], check=True, capture_output=True, text=True).stdout
+
+def vpn(*args):
+    return subprocess.run([sys.executable, "-m", "vpn_cli.cli", *args], capture_output=True, text=True)
+
+def journal():
+    return json.load(open(sys.argv[1]))
+
+ip("link", "set", "lo", "up")
+ip("link", "add", "up0", "type", "veth", "peer", "name", "up1")
+ip("addr", "add", "198.51.100.2/24", "dev", "up0")
+ip("link", "set", "up0", "up")
+ip("link", "set", "up1", "up")
+ip("route", "add", "default", "via", "198.51.100.1", "dev", "up0", "onlink")
+"""
+
+
+def _can_unshare_net() -> bool:
+    if shutil.which("unshare") is None or not os.path.exists("/dev/net/tun"):
+        return False
+    return subprocess.run(["unshare", "-n", "true"], capture_output=True).returncode == 0
+
+
+@pytest.fixture(scope="session")
+def netns():
+    """
+    Выполнить код в отдельном network namespace (`unshare -n`) и вернуть его stdout.
+    Без прав на namespace (или без `/dev/net/tun`) тест пропускается.
+    """
+    if not _can_unshare_net():
+        pytest.skip("нужны права на network namespace и /dev/net/tun")
+
+    def run(code: str, *args: str, env: dict[str, str] | None = None) -> str:
+        result = subprocess.run(
+            ["unshare", "-n", sys.executable, "-c", textwrap.dedent(code), *args],
+            capture_output=True,
+            text=True,
+            timeout=60,
+            env={**os.environ, **(env or {}), "PYTHONPATH": SRC},
+        )
+        assert result.returncode == 0, result.stderr
+        return result.stdout
+
+    return run
+
+
+@pytest.fixture
+def scenario(netns, tmp_path):
+    """
+    Сценарий `my-vpn` в namespace с uplink: подставные `sslocal`/`tun2socks` из `tests/fakebin`,
+    свои каталоги state/cache/config и `.env` с содержимым `env_file`. В коде доступны
+    `ip(...)`, `vpn(...)` и `journal()`.
+    """
+
+    def run(code: str, env_file: str) -> str:
+        (tmp_path / "vpn.env").write_text(env_file)
+        env = {
+            "MY_VPN_BIN_DIR": str(FAKEBIN),
+            "MY_VPN_ENV_FILE": str(tmp_path / "vpn.env"),
+            "XDG_STATE_HOME": str(tmp_path / "state"),
+            "XDG_CACHE_HOME": str(tmp_path / "cache"),
+            "XDG_CONFIG_HOME": str(tmp_path / "config"),
+        }
+        journal = str(tmp_path / "state" / "my-vpn" / "journal.json")
+        return netns(SCENARIO_PRELUDE + textwrap.dedent(code), journal, env=env)
+
+    return run
+
+
+@pytest.fixture(scope="session")
+def ss_url():
+    """`ss://`-ссылка на сервер `host` с именем `label`."""
+
+    def make(host: str, label: str) -> str:
+        userinfo = base64.b64encode(b"aes-256-gcm:pw").decode()
+        return f"ss://{userinfo}@{host}:8388#{label}"
+
+    return make
+
+
+@pytest.fixture
+def background_loop():
+    """
+    Цикл asyncio в отдельном потоке — для заглушек апстрима рядом с кодом, у которого свой поток.
+    Возвращает `run(coro)`: выполнить корутину в этом цикле и дождаться результата.
+    """
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    def run(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=5)
+
+    yield run
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(2)
+    loop.close()
+
+
+class LoopbackServers:
+    """Заглушки на 127.0.0.1 в фоновом цикле (`background_loop`): `tcp`/`udp`/`socks` возвращают порт."""
+
+    def __init__(self, run) -> None:
+        self.run = run
+        self.opened: list = []
+
+    def tcp(self, handler, port: int = 0) -> int:
+        server = self.run(asyncio.start_server(handler, "127.0.0.1", port))
+        self.opened.append(server)
+        return server.sockets[0].getsockname()[1]
+
+    def udp(self, protocol_factory, port: int = 0) -> int:
+        async def open_udp():
+            loop = asyncio.get_running_loop()
+            transport, _ = await loop.create_datagram_endpoint(protocol_factory, local_addr=("127.0.0.1", port))
+            return transport
+
+        transport = self.run(open_udp())
+        self.opened.append(transport)
+        return transport.get_extra_info("sockname")[1]
+
+    def socks(self) -> int:
+        """Незашифрованная SOCKS5-заглушка вместо `sslocal` (CONNECT и UDP ASSOCIATE)."""
+        from vpn_cli.bench import start_socks_standin
+
+        server, port = self.run(start_socks_standin())
+        self.opened.append(server)
+        return port
+
+    def close(self) -> None:
+        async def close_all():
+            for server in self.opened:
+                server.close()
+
+        self.run(close_all())
+
+
+@pytest.fixture
+def loopback(background_loop):
+    servers = LoopbackServers(background_loop)
+    yield servers
+    servers.close()
+
+
+@pytest.fixture
+def wait_for():
+    """`wait_for(predicate, timeout)`: ждать, пока условие не станет истинным; по таймауту — падение теста."""
+
+    def wait(predicate, timeout: float = 5.0) -> None:
+        deadline = time.monotonic() + timeout
+        while not predicate() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert predicate()
+
+    return wait
+
+
+@pytest.fixture
+def supervisor_loop(tmp_path):
+    """
+    Цикл `Supervisor` без компонентов в отдельном потоке — для серверов, которые обслуживаются из него.
+    Регистрировать в нём дескрипторы — через `call_later`, как и из любого чужого потока.
+    """
+    from vpn_cli.supervisor import Supervisor
+
+    loop = Supervisor([], state_path=tmp_path / "supervisor.json")
+    thread = threading.Thread(target=loop.run, daemon=True)
+    thread.start()
+    yield loop
+    loop.stop()
+    thread.join(2)
+    loop.shutdown()
@@ -0,0 +1,34 @@
+"""Бенчмарк в режиме `--offline`: встроенный сервер и SOCKS5-заглушка на loopback."""
+
+import asyncio
+
+from vpn_cli.bench import BenchConfig, compare, percentile, run_bench
+
+
+def test_offline_run_covers_every_test():
+    cfg = BenchConfig(size=256 * 1024, streams=2, connections=20, concurrency=4, pings=50, udp_count=50, timeout=5.0)
+    report = asyncio.run(run_bench(cfg, offline=True))
+    assert report.errors == {}
+    assert report.meta["offline"] and report.meta["via"].startswith("socks5://127.0.0.1:")
+    results = report.results
+    assert results["upload_mbps"] > 0 and results["download_mbps"] > 0
+    assert results["connect_failures"] == 0
+    assert results["rtt_p50_ms"] <= results["rtt_p99_ms"]
+    assert results["udp_loss"] == 0
+
+
+def test_percentile_nearest_rank():
+    values = [float(v) for v in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 99.5) == 100.0
+    assert percentile([7.0], 99) == 7.0
+    assert percentile([], 50) is None
+
+
+def test_compare_flags_regressions_in_the_right_direction():
+    baseline = {"download_mbps": 100.0, "rtt_p50_ms": 1.0, "udp_loss": 0.0, "download_bytes": 10}
+    current = {"download_mbps": 80.0, "rtt_p50_ms": 0.5, "udp_loss": 0.2, "download_bytes": 1}
+    regressions = compare(current, baseline, tolerance=0.1)
+    assert [r.split(":")[0] for r in regressions] == ["download_mbps", "udp_loss"]
+    assert compare(current, baseline, tolerance=0.5) == []
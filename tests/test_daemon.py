@@ -0,0 +1,97 @@
+"""Управляющий сокет: обычные и отложенные ответы, молчащий клиент не задерживает цикл."""
+
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from vpn_cli.daemon import ControlServer, request
+
+
+@pytest.fixture
+def serve(tmp_path, supervisor_loop):
+    servers = []
+
+    def start(handlers, deferred=None) -> ControlServer:
+        server = ControlServer(handlers, tmp_path / "control.sock", deferred=deferred)
+        server.open()
+        ready = threading.Event()
+        supervisor_loop.call_later(0, lambda: (server.serve(supervisor_loop), ready.set()))
+        assert ready.wait(2)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def test_handler_result_and_error(serve, tmp_path):
+    def fail(req):
+        raise RuntimeError("нельзя")
+
+    server = serve({"echo": lambda req: {"value": req["value"]}, "fail": fail})
+    assert request("echo", path=server.path, value=3) == {"ok": True, "value": 3}
+    assert request("fail", path=server.path) == {"ok": False, "error": "нельзя"}
+    assert request("nope", path=server.path)["ok"] is False
+
+
+def test_deferred_reply_does_not_block_other_requests(serve):
+    pending = []
+    server = serve({"status": lambda req: {"state": "up"}}, deferred={"slow": lambda req, reply: pending.append(reply)})
+
+    result = {}
+    client = threading.Thread(target=lambda: result.update(request("slow", path=server.path, timeout=5)))
+    client.start()
+    while not pending:
+        assert client.is_alive()
+        time.sleep(0.01)
+    # Пока `slow` ждёт ответа, сокет обслуживает другие команды
+    assert request("status", path=server.path) == {"ok": True, "state": "up"}
+    pending[0]({"done": True})
+    client.join(5)
+    assert result == {"ok": True, "done": True}
+
+
+def test_deferred_error_reply(serve):
+    def reject(req, reply):
+        reply(RuntimeError("занято"))
+
+    server = serve({}, deferred={"slow": reject})
+    assert request("slow", path=server.path) == {"ok": False, "error": "занято"}
+
+
+def test_silent_client_does_not_block_the_loop(serve):
+    server = serve({"status": lambda req: {"state": "up"}})
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as silent:
+        silent.connect(str(server.path))
+        t0 = time.monotonic()
+        assert request("status", path=server.path) == {"ok": True, "state": "up"}
+        assert time.monotonic() - t0 < 0.5
+        # Не дождавшись запроса, сервер закрывает соединение
+        silent.settimeout(3)
+        assert silent.recv(1) == b""
+
+
+def test_reload_moves_the_server(scenario, ss_url):
+    out = scenario(
+        f"""
+        import os
+        try:
+            assert vpn("start", "--detach", "--no-sudo").returncode == 0
+            with open(os.environ["MY_VPN_ENV_FILE"], "w") as f:
+                f.write("SS_URL={ss_url('203.0.113.8', 'b')}\\n")
+            reloaded = json.loads(vpn("reload", "--json").stdout)
+            pins = sorted(l.split()[0] for l in ip("route").splitlines() if l.startswith("203."))
+            status = json.loads(vpn("status", "--json").stdout)
+        finally:
+            vpn("stop")
+        print(json.dumps({{"reload": reloaded, "pins": pins, "server_ip": status["server_ip"]}}))
+        """,
+        f"SS_URL={ss_url('203.0.113.7', 'a')}\n",
+    )
+    result = json.loads(out.splitlines()[-1])
+    assert result["reload"]["server_changed"] and result["reload"]["server"] == "b"
+    assert result["pins"] == ["203.0.113.8"] and result["server_ip"] == "203.0.113.8"
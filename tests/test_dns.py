@@ -0,0 +1,151 @@
+"""DNS-стаб: TTL и отрицательные ответы, кэш, склейка запросов в полёте, UDP и TCP через SOCKS5-заглушку."""
+
+import asyncio
+import socket
+import struct
+import time
+
+import pytest
+
+from vpn_cli.dns import AnswerCache, CacheEntry, DnsStub, SocksUpstream, parse_host_port, parse_query, scan_response
+
+RCODE_NXDOMAIN = 3
+
+
+def query(name: str, qid: int = 1, qtype: int = 1) -> bytes:
+    labels = b"".join(bytes([len(part)]) + part.encode() for part in name.split("."))
+    return struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0) + labels + b"\0" + struct.pack("!HH", qtype, 1)
+
+
+def response(q: bytes, ttl: int = 300) -> bytes:
+    """Ответ апстрима: A 192.0.2.10 либо NXDOMAIN с SOA (MINIMUM 30) для имён `missing.*`."""
+    key, qend = parse_query(q)
+    if key[0].startswith("missing."):
+        soa = b"\0\0" + struct.pack("!IIIII", 1, 7200, 900, 86400, 30)
+        record = b"\xc0\x0c" + struct.pack("!HHIH", 6, 1, 3600, len(soa)) + soa
+        counts, rcode = (0, 1), RCODE_NXDOMAIN
+    else:
+        record = b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, ttl, 4) + socket.inet_aton("192.0.2.10")
+        counts, rcode = (1, 0), 0
+    header = struct.pack("!HHHHHH", struct.unpack_from("!H", q)[0], 0x8180 | rcode, 1, *counts, 0)
+    return header + q[12:qend] + record
+
+
+def ttl_of(msg: bytes) -> int:
+    return scan_response(msg)[0][0][1]
+
+
+def test_scan_response_ttls():
+    q = query("example.com")
+    ttls, answer_ttl, negative_ttl = scan_response(response(q, ttl=120))
+    assert answer_ttl == 120 and negative_ttl is None and len(ttls) == 1
+    # Отрицательный ответ живёт min(TTL записи SOA, MINIMUM) — RFC 2308
+    assert scan_response(response(query("missing.example")))[1:] == (None, 30)
+    assert parse_host_port("[::1]:5353") == ("::1", 5353) and parse_host_port("1.1.1.1") == ("1.1.1.1", 53)
+
+
+def test_cached_answer_ages_and_expires():
+    q = query("Example.COM", qid=7)
+    upstream = response(query("example.com", qid=99), ttl=60)
+    key, qend = parse_query(q)
+    cache = AnswerCache(size=1)
+    cache.put(key, CacheEntry(q, upstream, scan_response(upstream)[0], stored=100.0, ttl=60, negative=False))
+
+    answer = cache.get(key, now=130.0).answer(q, qend, now=130.0)
+    assert struct.unpack_from("!H", answer)[0] == 7  # ID клиента
+    assert answer[12:qend] == q[12:qend]  # регистр имени из запроса (0x20)
+    assert ttl_of(answer) == 30
+    assert cache.get(key, now=160.0) is None and len(cache) == 0
+
+    # LRU: новая запись вытесняет старую
+    cache.put(key, CacheEntry(q, upstream, [], 100.0, 60, False))
+    cache.put(("other", 1, 1), CacheEntry(q, upstream, [], 100.0, 60, False))
+    assert cache.get(key, now=101.0) is None
+
+
+class FakeDns(asyncio.DatagramProtocol):
+    """Апстрим DNS: отвечает с задержкой, чтобы одинаковые запросы успели склеиться."""
+
+    def __init__(self, queries: list[str]) -> None:
+        self.queries = queries
+
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.queries.append(parse_query(data)[0][0])
+        asyncio.get_running_loop().call_later(0.2, self.transport.sendto, response(data), addr)
+
+
+@pytest.fixture
+def upstream(loopback):
+    """SOCKS5-заглушка и DNS-апстрим (UDP и TCP на одном порту): `(socks_port, dns_port, queries)`."""
+    queries: list[str] = []
+
+    async def handle_tcp(reader, writer):
+        (length,) = struct.unpack("!H", await reader.readexactly(2))
+        data = await reader.readexactly(length)
+        queries.append("tcp:" + parse_query(data)[0][0])
+        writer.write(struct.pack("!H", len(response(data))) + response(data))
+        await writer.drain()
+        writer.close()
+
+    port = loopback.tcp(handle_tcp)
+    loopback.udp(lambda: FakeDns(queries), port)
+    return loopback.socks(), port, queries
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def ask(listen: tuple[str, int], packets: list[bytes]) -> list[bytes]:
+    socks = []
+    for packet in packets:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.settimeout(3)
+        s.sendto(packet, listen)
+        socks.append(s)
+    answers = [s.recv(4096) for s in socks]
+    for s in socks:
+        s.close()
+    return answers
+
+
+def ask_tcp(listen: tuple[str, int], packet: bytes) -> bytes:
+    with socket.create_connection(listen, timeout=3) as s:
+        s.sendall(struct.pack("!H", len(packet)) + packet)
+        (length,) = struct.unpack("!H", s.recv(2))
+        data = b""
+        while len(data) < length:
+            data += s.recv(length - len(data))
+        return data
+
+
+def test_stub_through_socks(upstream):
+    socks_port, dns_port, queries = upstream
+    listen = ("127.0.0.1", free_port())
+    stub = DnsStub(SocksUpstream(socks_port, [("127.0.0.1", dns_port)]), listen)
+    stub.start()
+    try:
+        # Два одинаковых запроса в полёте — к апстриму уходит один
+        first = ask(listen, [query("example.com", qid=1), query("example.com", qid=2)])
+        assert [struct.unpack_from("!H", a)[0] for a in first] == [1, 2]
+        time.sleep(1.1)
+        cached = ask(listen, [query("example.com", qid=3)])[0]
+        assert ttl_of(cached) == 299
+
+        for _ in range(2):  # второй — из отрицательного кэша
+            missing = ask(listen, [query("missing.example")])[0]
+            assert struct.unpack_from("!H", missing, 2)[0] & 0xF == RCODE_NXDOMAIN
+        assert ttl_of(ask_tcp(listen, query("tcp.example"))) == 300
+
+        stats = stub.stats()
+    finally:
+        stub.stop()
+    assert queries == ["example.com", "missing.example", "tcp:tcp.example"]
+    assert stats["listen"] == f"127.0.0.1:{listen[1]}"
+    assert (stats["queries"], stats["hits"], stats["negative_hits"], stats["misses"]) == (6, 2, 1, 4)
+    assert stats["coalesced"] == 1 and stats["servfails"] == 0 and stats["cache_entries"] == 3
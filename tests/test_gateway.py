@@ -0,0 +1,87 @@
+"""Слежение за шлюзом: переход фиксируется один раз, маршрут до сервера уходит на новый шлюз."""
+
+import json
+
+from vpn_cli.gateway import GatewayWatcher
+from vpn_cli.network import NetBackend, RouteMonitor
+
+
+class FakeMonitor(RouteMonitor):
+    def __init__(self) -> None:
+        self.pending = 0
+
+    def changed(self) -> bool:
+        changed, self.pending = self.pending > 0, 0
+        return changed
+
+    def close(self) -> None:
+        self.pending = -1
+
+
+class FakeNet(NetBackend):
+    def __init__(self, gateway: str | None) -> None:
+        self.gateway = gateway
+        self.mon = FakeMonitor()
+
+    def monitor(self) -> RouteMonitor:
+        return self.mon
+
+    def default_gateway(self) -> str | None:
+        return self.gateway
+
+
+def test_watcher_reports_only_real_changes():
+    net = FakeNet("192.0.2.1")
+    seen: list[tuple[str | None, str | None]] = []
+    watcher = GatewayWatcher(net, "192.0.2.1", lambda old, new: seen.append((old, new)), history=2)
+    assert watcher.on_readable() is None  # монитор ещё не открыт
+    watcher.open()
+
+    net.mon.pending = 1  # событие без смены шлюза (например, наш собственный маршрут)
+    assert watcher.on_readable() is None
+    for gateway in ("192.0.2.254", None, "192.0.2.1"):
+        net.gateway, net.mon.pending = gateway, 1
+        assert watcher.on_readable().new == gateway
+    assert watcher.on_readable() is None  # уведомлений нет
+
+    assert seen == [("192.0.2.1", "192.0.2.254"), ("192.0.2.254", None), (None, "192.0.2.1")]
+    snapshot = watcher.snapshot()
+    assert snapshot["gateway"] == "192.0.2.1" and snapshot["changes"] == 3
+    assert [(c["old"], c["new"]) for c in snapshot["recent"]] == seen[1:]
+    watcher.close()
+    assert watcher.monitor is None and net.mon.pending == -1
+
+
+def test_repin_on_gateway_change(scenario, ss_url):
+    out = scenario(
+        """
+        def pin():
+            return ip("route", "show", "203.0.113.7").strip()
+
+        try:
+            assert vpn("start", "--detach", "--no-sudo").returncode == 0
+            before = pin()
+            # Смена сети: второй uplink и маршрут по умолчанию через него
+            ip("link", "add", "wl0", "type", "veth", "peer", "name", "wl1")
+            ip("addr", "add", "198.51.101.2/24", "dev", "wl0")
+            ip("link", "set", "wl0", "up")
+            ip("link", "set", "wl1", "up")
+            ip("route", "replace", "default", "via", "198.51.101.1", "dev", "wl0")
+            deadline = time.monotonic() + 5
+            while "198.51.101.1" not in pin() and time.monotonic() < deadline:
+                time.sleep(0.05)
+            after = pin()
+            status = json.loads(vpn("status", "--json").stdout)
+        finally:
+            vpn("stop")
+        print(json.dumps({"before": before, "after": after, "watch": status["gateway_watch"], "final": pin()}))
+        """,
+        f"SS_URL={ss_url('203.0.113.7', 'a')}\n",
+    )
+    result = json.loads(out.splitlines()[-1])
+    assert "via 198.51.100.1 dev up0" in result["before"]
+    assert "via 198.51.101.1 dev wl0" in result["after"]
+    watch = result["watch"]
+    assert watch["gateway"] == "198.51.101.1" and watch["changes"] >= 1
+    assert (watch["recent"][-1]["old"], watch["recent"][-1]["new"]) == ("198.51.100.1", "198.51.101.1")
+    assert result["final"] == ""
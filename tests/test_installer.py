@@ -0,0 +1,153 @@
+"""Установщик против локального HTTP-зеркала с поддержкой Range."""
+
+import hashlib
+import io
+import tarfile
+import threading
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from vpn_cli import installer
+from vpn_cli.installer import Artifact
+
+
+class Mirror:
+    """Файлы по путям + журнал заголовков `Range` пришедших запросов."""
+
+    def __init__(self) -> None:
+        self.files: dict[str, bytes] = {}
+        self.ranges: list[str | None] = []
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    state = Mirror()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            data = state.files.get(self.path.lstrip("/"))
+            rng = self.headers.get("Range")
+            state.ranges.append(rng)
+            if data is None:
+                self.send_error(404)
+                return
+            start = int(rng.removeprefix("bytes=").rstrip("-")) if rng else 0
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(data)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206 if rng else 200)
+            if rng:
+                self.send_header("Content-Range", f"bytes {start}-{len(data) - 1}/{len(data)}")
+            self.send_header("Content-Length", str(len(data) - start))
+            self.end_headers()
+            self.wfile.write(data[start:])
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv(installer.ENV_MIRROR, f"http://127.0.0.1:{server.server_port}")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    yield state
+    server.shutdown()
+    server.server_close()
+
+
+def _tar_xz(member: str, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w:xz") as tar:
+        info = tarfile.TarInfo(member)
+        info.size = len(data)
+        tar.addfile(info, io.BytesIO(data))
+    return buf.getvalue()
+
+
+def _zip(member: str, data: bytes) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        zf.writestr(member, data)
+    return buf.getvalue()
+
+
+PAYLOAD = bytes(range(256)) * 4096  # 1 МиБ
+
+
+def test_download_resumes_from_part(mirror, tmp_path):
+    mirror.files["f.bin"] = PAYLOAD
+    dest = tmp_path / "f.bin"
+    (tmp_path / "f.bin.part").write_bytes(PAYLOAD[:1000])
+    installer.download_file(Artifact("f", "1", "x", "f.bin", "f").url, dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert mirror.ranges == ["bytes=1000-"]
+    assert not (tmp_path / "f.bin.part").exists()
+
+
+def test_download_416_complete_part_is_kept(mirror, tmp_path):
+    mirror.files["f.bin"] = PAYLOAD
+    dest = tmp_path / "f.bin"
+    (tmp_path / "f.bin.part").write_bytes(PAYLOAD)
+    installer.download_file(Artifact("f", "1", "x", "f.bin", "f").url, dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert mirror.ranges == [f"bytes={len(PAYLOAD)}-"]
+
+
+def test_download_416_stale_part_restarts(mirror, tmp_path):
+    mirror.files["f.bin"] = PAYLOAD
+    dest = tmp_path / "f.bin"
+    # Хвост от другой, более длинной версии файла
+    (tmp_path / "f.bin.part").write_bytes(b"x" * (len(PAYLOAD) + 10))
+    installer.download_file(Artifact("f", "1", "x", "f.bin", "f").url, dest)
+    assert dest.read_bytes() == PAYLOAD
+    assert mirror.ranges == [f"bytes={len(PAYLOAD) + 10}-", None]
+
+
+def test_download_without_part_raises_on_http_error(mirror, tmp_path):
+    with pytest.raises(installer.requests.HTTPError):
+        installer.download_file(Artifact("f", "1", "x", "missing.bin", "f").url, tmp_path / "missing.bin")
+    assert not (tmp_path / "missing.bin").exists()
+
+
+def test_fetch_artifact_verifies_checksum(mirror):
+    binary = b"\x7fELF sslocal"
+    archive = _tar_xz("sslocal", binary)
+    artifact = Artifact("sslocal", "1.0", "x86_64", "rel/ss.tar.xz", "sslocal", checksum=True)
+    mirror.files["rel/ss.tar.xz"] = archive
+    mirror.files["rel/ss.tar.xz.sha256"] = f"{hashlib.sha256(archive).hexdigest()}  ss.tar.xz\n".encode()
+
+    blob = installer.fetch_artifact(artifact)
+    assert blob.read_bytes() == binary
+    assert installer.cached_blob(artifact) == blob
+
+    # Повторный вызов берёт бинарник из кэша без сети
+    requests_before = len(mirror.ranges)
+    assert installer.fetch_artifact(artifact) == blob
+    assert len(mirror.ranges) == requests_before
+
+
+def test_fetch_artifact_rejects_checksum_mismatch(mirror):
+    artifact = Artifact("sslocal", "1.0", "x86_64", "rel/ss.tar.xz", "sslocal", checksum=True)
+    mirror.files["rel/ss.tar.xz"] = _tar_xz("sslocal", b"tampered")
+    mirror.files["rel/ss.tar.xz.sha256"] = f"{'0' * 64}  ss.tar.xz\n".encode()
+
+    with pytest.raises(RuntimeError, match="SHA-256 mismatch"):
+        installer.fetch_artifact(artifact)
+    assert installer.cached_blob(artifact) is None
+    assert not (installer.artifacts_dir() / "downloads" / "ss.tar.xz").exists()
+
+
+def test_fetch_artifact_zip_member_and_install(mirror, tmp_path):
+    binary = b"\x7fELF tun2socks"
+    artifact = Artifact("tun2socks", "v2", "amd64", "rel/t2s.zip", "tun2socks-linux-amd64")
+    mirror.files["rel/t2s.zip"] = _zip("tun2socks-linux-amd64", binary)
+
+    blob = installer.fetch_artifact(artifact)
+    target = tmp_path / "bin" / "tun2socks"
+    installer.install_blob(blob, target)
+    assert target.read_bytes() == binary
+    assert target.stat().st_mode & 0o111
@@ -0,0 +1,92 @@
+"""Журнал ресурсов: порядок отката, чужие процессы с тем же pid, восстановление после `kill -9`."""
+
+import json
+import subprocess
+import sys
+
+from vpn_cli.journal import Journal, process_start_time
+from vpn_cli.network import NetBackend
+
+
+class RecordingBackend(NetBackend):
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, object]] = []
+
+    def delete_link(self, dev):
+        self.calls.append(("link", dev))
+
+    def delete_routes(self, routes):
+        self.calls.append(("routes", [(r.dst, r.via) for r in routes]))
+
+
+def test_undo_in_reverse_order(tmp_path):
+    journal = Journal(tmp_path / "journal.json")
+    journal.begin(gateway="192.0.2.1")
+    sysctl, resolv = tmp_path / "hash_policy", tmp_path / "resolv.conf"
+    sysctl.write_text("1")
+    resolv.write_text("nameserver 127.0.0.53\n")
+    journal.record("sysctl", str(sysctl), value="0")
+    journal.record("pin", "203.0.113.7", via="192.0.2.1")
+    journal.record("link", "tun0")
+    journal.record("file", str(resolv), content="nameserver 9.9.9.9\n", symlink=None)
+    journal.record("pin", "203.0.113.7", via="192.0.2.254")  # тот же ключ — замена на месте
+
+    loaded = Journal.load(tmp_path / "journal.json")
+    assert loaded.meta["gateway"] == "192.0.2.1" and loaded.owner_alive()
+    assert [e["kind"] for e in loaded.entries] == ["sysctl", "pin", "link", "file"]
+
+    net = RecordingBackend()
+    report = loaded.undo(net)
+    assert [error for _, error in report] == [None] * 4
+    assert net.calls == [("link", "tun0"), ("routes", [("203.0.113.7", "192.0.2.254")])]
+    assert sysctl.read_text() == "0" and resolv.read_text() == "nameserver 9.9.9.9\n"
+    assert not (tmp_path / "journal.json").exists()
+
+
+def test_undo_stops_only_the_recorded_process(tmp_path):
+    proc = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    journal = Journal(tmp_path / "journal.json")
+    journal.begin()
+    journal.record_process("sslocal", proc.pid)
+    # Тот же pid, но другое время старта — это уже чужой процесс, его не трогаем
+    journal.record("process", "reused", pid=proc.pid, start=process_start_time(proc.pid) + 1)
+    journal.undo(RecordingBackend(), timeout=5)
+    assert proc.wait(5) == -15
+
+
+def test_failed_entries_stay_for_the_next_recover(tmp_path):
+    journal = Journal(tmp_path / "journal.json")
+    journal.begin()
+    journal.record("link", "tun0")
+    journal.record("bogus", "x")
+    report = journal.undo(RecordingBackend())
+    assert [e["kind"] for e, error in report if error] == ["bogus"]
+    assert [e["kind"] for e in Journal.load(tmp_path / "journal.json").entries] == ["bogus"]
+
+
+def test_recover_after_kill(scenario, ss_url):
+    out = scenario(
+        """
+        import os, signal
+        assert vpn("start", "--detach", "--no-sudo").returncode == 0
+        started = [e["kind"] for e in journal()["entries"]]
+        os.kill(journal()["pid"], signal.SIGKILL)
+        time.sleep(0.3)
+        left = ip("-br", "link").count("tun0")
+        recovered = vpn("recover", "--no-sudo").returncode
+        time.sleep(0.3)
+        print(json.dumps({
+            "started": started,
+            "left": left,
+            "recovered": recovered,
+            "links": ip("-br", "link").count("tun"),
+            "routes": [l for l in ip("route").splitlines() if "tun" in l or l.startswith("203.")],
+            "procs": subprocess.run(["pgrep", "-f", "[f]akebin/"], capture_output=True).stdout.decode().split(),
+        }))
+        """,
+        f"SS_URL={ss_url('203.0.113.7', 'a')}\n",
+    )
+    result = json.loads(out.splitlines()[-1])
+    assert {"process", "link", "pin", "routes"} <= set(result["started"])
+    assert result["left"] == 1 and result["recovered"] == 0
+    assert result["links"] == 0 and result["routes"] == [] and result["procs"] == []
@@ -0,0 +1,74 @@
+"""Логи компонентов: насос пайпов, ротация, разбор событий, хвост и follow."""
+
+import subprocess
+import sys
+import threading
+import time
+
+from vpn_cli.logs import LogPump, RotatingLog, classify, follow, tail_file
+
+
+def test_classify():
+    assert classify("2024-01-01 ERROR connection reset by peer") == "conn_reset"
+    assert classify("udp associate failed: timeout") == "udp_associate_failed"
+    assert classify("dial tcp: i/o timeout") == "timeout"
+    assert classify("WARN slow upstream") == "warning"
+    assert classify("listening on 127.0.0.1:1080") is None
+
+
+def test_rotation_by_size(tmp_path):
+    path = tmp_path / "sslocal.log"
+    log = RotatingLog(str(path), max_bytes=10, max_age=0, backups=2)
+    for i in range(4):
+        log.write(f"line-{i}-xx\n".encode())
+    log.close()
+    assert log.rotations == 3
+    assert path.read_text() == "line-3-xx\n"
+    assert (tmp_path / "sslocal.log.1").read_text() == "line-2-xx\n"
+    assert (tmp_path / "sslocal.log.2").read_text() == "line-1-xx\n"
+    assert not (tmp_path / "sslocal.log.3").exists()
+
+
+def test_pump_writes_whole_lines_and_counts_events(tmp_path):
+    path = tmp_path / "tun2socks.log"
+    pump = LogPump(ring_lines=3)
+    pump.add("tun2socks", str(path))
+    pump.start()
+    script = "import sys,time; w=sys.stdout.write; w('ok 1\\nconnection refu'); sys.stdout.flush(); time.sleep(0.1); w('sed\\nok 2\\ntail')"
+    proc = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+    pump.attach("tun2socks", proc.stdout)
+    proc.wait()
+    pump.stop()
+
+    assert path.read_text() == "ok 1\nconnection refused\nok 2\ntail\n"
+    assert [r["line"] for r in pump.tail(10)] == ["connection refused", "ok 2", "tail"]
+    events = pump.events()
+    assert events["counters"] == {"tun2socks": {"conn_refused": 1}}
+    assert events["lines"] == {"tun2socks": 4}
+
+
+def test_tail_file(tmp_path):
+    path = tmp_path / "big.log"
+    path.write_text("".join(f"{i}\n" for i in range(100_000)))
+    assert tail_file(str(path), 3) == ["99997", "99998", "99999"]
+    assert tail_file(str(tmp_path / "missing.log"), 3) == []
+
+
+def test_follow_survives_rotation(tmp_path):
+    path = tmp_path / "sslocal.log"
+    path.write_text("old\n")
+    seen: list[str] = []
+    threading.Thread(target=follow, args=({"sslocal": str(path)}, lambda name, line: seen.append(line)), daemon=True).start()
+    time.sleep(0.2)
+
+    log = RotatingLog(str(path), max_bytes=0, max_age=0, backups=1)
+    log.write(b"before\n")
+    log.flush()
+    log.rotate()
+    log.write(b"after\n")
+    log.close()
+
+    deadline = time.monotonic() + 5
+    while seen != ["before", "after"] and time.monotonic() < deadline:
+        time.sleep(0.02)
+    assert seen == ["before", "after"]
@@ -0,0 +1,78 @@
+"""Сэмплер метрик: скорости по кольцевому буферу и экспорт в формате Prometheus."""
+
+import os
+import socket
+import threading
+import time
+
+from vpn_cli.metrics import IFACE_FIELDS, MetricsSampler, MetricsServer, Sample, render_prometheus
+
+
+def _counters(rx: int, tx: int) -> dict[str, int]:
+    return {key: 0 for key in IFACE_FIELDS} | {"rx_bytes": rx, "tx_bytes": tx}
+
+
+def _sampler(*samples: Sample) -> MetricsSampler:
+    sampler = MetricsSampler("tun0", lambda: {})
+    sampler.samples.extend(samples)
+    return sampler
+
+
+def test_rates_use_the_window_and_survive_counter_reset():
+    proc = {"cpu_ticks": 0, "rss_bytes": 4096}
+    sampler = _sampler(
+        Sample(0.0, None),  # TUN ещё не поднят
+        Sample(1.0, _counters(1000, 0), {"sslocal": proc}, {"sslocal": 10}),
+        Sample(2.0, _counters(3000, 500), {"sslocal": proc}, {"sslocal": 10}),
+        Sample(3.0, _counters(6000, 1000), {"sslocal": proc}, {"sslocal": 10}),
+    )
+    rates = sampler.rates(window=2.0)
+    assert rates["window_s"] == 2.0
+    assert rates["iface"]["rx_bytes_per_s"] == 2500.0
+    assert rates["procs"]["sslocal"]["rss_bytes"] == 4096
+    assert [h["rx"] for h in sampler.history()] == [2000.0, 3000.0]
+
+    # Интерфейс пересоздан, счётчики начались с нуля: скорость 0, а не отрицательная
+    sampler.samples.append(Sample(4.0, _counters(10, 10)))
+    assert sampler.history()[-1] == {"rx": 0.0, "tx": 0.0}
+
+
+def test_live_sample_reads_loopback_and_own_process():
+    sampler = MetricsSampler("lo", lambda: {"self": os.getpid()})
+    sample = sampler.sample()
+    assert sample.iface is not None and set(IFACE_FIELDS) <= set(sample.iface)
+    assert sample.procs["self"]["rss_bytes"] > 0
+
+
+def test_prometheus_exposition():
+    sampler = _sampler(Sample(0.0, _counters(100, 200), devs={"tun0": _counters(100, 200)}))
+    text = render_prometheus(sampler, {})
+    assert "# TYPE myvpn_tun_rx_bytes_total counter" in text
+    assert 'myvpn_tun_rx_bytes_total{dev="tun0"} 100' in text
+    assert text.endswith("\n")
+
+
+def test_metrics_server_serves_http(supervisor_loop):
+    server = MetricsServer(lambda: "myvpn_up 1\n")
+    ready = threading.Event()
+    supervisor_loop.call_later(0, lambda: (server.serve(supervisor_loop), ready.set()))
+    assert ready.wait(2)
+
+    def fetch(path: str) -> bytes:
+        with socket.create_connection(("127.0.0.1", server.port), timeout=2) as conn:
+            conn.sendall(f"GET {path} HTTP/1.1\r\nHost: x\r\n\r\n".encode())
+            data = b""
+            while chunk := conn.recv(4096):
+                data += chunk
+            return data
+
+    try:
+        # Скрейпер, который подключился и молчит, не задерживает остальных
+        with socket.create_connection(("127.0.0.1", server.port), timeout=2):
+            t0 = time.monotonic()
+            reply = fetch("/metrics")
+            assert time.monotonic() - t0 < 0.5
+        assert reply.startswith(b"HTTP/1.0 200 OK") and reply.endswith(b"\r\n\r\nmyvpn_up 1\n")
+        assert fetch("/nope").startswith(b"HTTP/1.0 404")
+    finally:
+        server.close()
@@ -0,0 +1,153 @@
+"""Сетевые бэкенды: кодирование netlink-запросов и разбор ошибок `ip -batch`."""
+
+import socket
+import struct
+import subprocess
+
+import pytest
+
+from vpn_cli import netlink, tracing
+from vpn_cli.network import IpBackend, NetworkError, Route, Rule, gateway_route
+
+
+def test_route_replace_round_trip():
+    msg_type, flags, payload = netlink.route_replace("10.1.2.0/24", oif=7, gateway="10.0.0.1", table=1000, metric=50)
+    assert msg_type == netlink.RTM_NEWROUTE
+    assert flags == netlink.NLM_F_CREATE | netlink.NLM_F_REPLACE
+    entry = netlink.parse_route(payload)
+    assert (entry.family, entry.dst, entry.dst_len) == (socket.AF_INET, "10.1.2.0", 24)
+    assert (entry.gateway, entry.oif, entry.table, entry.priority) == ("10.0.0.1", 7, 1000, 50)
+
+
+def test_default_route_has_no_dst_and_small_table_in_header():
+    _, _, payload = netlink.route_replace("0.0.0.0/0", oif=3)
+    entry = netlink.parse_route(payload)
+    assert (entry.dst, entry.dst_len, entry.table) == (None, 0, netlink.RT_TABLE_MAIN)
+    assert netlink.RTA_TABLE not in netlink._parse_attrs(payload[netlink._RTMSG.size :])
+
+
+def test_multipath_nexthops():
+    _, _, payload = netlink.route_replace("0.0.0.0/1", nexthops=[4, 5])
+    attrs = netlink._parse_attrs(payload[netlink._RTMSG.size :])
+    body = attrs[netlink.RTA_MULTIPATH]
+    hops = [netlink._RTNEXTHOP.unpack_from(body, i) for i in range(0, len(body), netlink._RTNEXTHOP.size)]
+    assert [(length, oif) for length, _, _, oif in hops] == [(netlink._RTNEXTHOP.size, 4), (netlink._RTNEXTHOP.size, 5)]
+
+
+def test_rule_by_source_address():
+    msg_type, flags, payload = netlink.rule_add(None, 1001, 10001, src="10.255.1.2")
+    assert msg_type == netlink.RTM_NEWRULE and flags & netlink.NLM_F_EXCL
+    family, _, src_len, *_ = netlink._FIBRULEHDR.unpack_from(payload)
+    attrs = netlink._parse_attrs(payload[netlink._FIBRULEHDR.size :])
+    assert (family, src_len) == (socket.AF_INET, 32)
+    assert attrs[netlink.FRA_SRC] == socket.inet_aton("10.255.1.2")
+    assert struct.unpack("=I", attrs[netlink.FRA_TABLE]) == (1001,)
+    assert struct.unpack("=I", attrs[netlink.FRA_PRIORITY]) == (10001,)
+    assert netlink.FRA_FWMARK not in attrs
+
+
+def test_attrs_are_aligned():
+    payload = netlink._attr(1, b"\x01\x02\x03")
+    assert len(payload) == 8
+    assert netlink._parse_attrs(payload + netlink._attr(2, b"ab")) == {1: b"\x01\x02\x03", 2: b"ab"}
+
+
+@pytest.fixture
+def ip_batch(monkeypatch):
+    """Подменить `ip -batch`: вернуть заданные код и stderr, запомнить строки пачки."""
+    calls = []
+
+    def install(returncode: int = 0, stderr: str = ""):
+        def run(args, **kwargs):
+            calls.append(kwargs["input"].splitlines())
+            return subprocess.CompletedProcess(args, returncode, None, stderr)
+
+        monkeypatch.setattr(tracing, "run", run)
+        return calls
+
+    return install
+
+
+def test_ip_batch_reports_failed_lines(ip_batch):
+    ip_batch(1, 'Error: Nexthop has invalid gateway.\nCommand failed -:2\nCannot find device "nope"\nCommand failed -:3\n')
+    routes = [Route("10.1.0.0/24", dev="tun0"), Route("10.2.0.0/24", via="10.77.0.1"), Route("10.3.0.0/24", dev="nope")]
+    with pytest.raises(NetworkError) as exc:
+        IpBackend().replace_routes(routes)
+    message = str(exc.value)
+    assert "10.1.0.0/24" not in message
+    assert "route replace 10.2.0.0/24 via 10.77.0.1: Error: Nexthop has invalid gateway." in message
+    assert 'route replace 10.3.0.0/24 dev nope: Cannot find device "nope"' in message
+
+
+def test_ip_batch_ignores_only_expected_errors(ip_batch):
+    calls = ip_batch(1, "RTNETLINK answers: No such process\nCommand failed -:1\n")
+    IpBackend().delete_routes([Route("10.1.0.0/24", dev="tun0")])
+    assert calls == [["route del 10.1.0.0/24 dev tun0"]]
+
+    ip_batch(1, "RTNETLINK answers: File exists\nCommand failed -:1\n")
+    with pytest.raises(NetworkError, match="File exists"):
+        IpBackend().replace_routes([Route("10.1.0.0/24", dev="tun0")])
+
+
+def test_ip_batch_failure_without_line_numbers(ip_batch):
+    ip_batch(255, "Object \"bogus\" is unknown\n")
+    with pytest.raises(NetworkError, match="код выхода 255"):
+        IpBackend().delete_rules([Rule(None, 1000, 10000, src="10.255.0.2")])
+
+
+def test_multipath_default_takes_the_first_gateway():
+    hops = b"".join(
+        netlink._RTNEXTHOP.pack(netlink._RTNEXTHOP.size + 8, 0, 0, oif) + netlink._attr(netlink.RTA_GATEWAY, socket.inet_aton(gw))
+        for oif, gw in ((4, "192.0.2.1"), (5, "198.51.100.1"))
+    )
+    payload = netlink._RTMSG.pack(socket.AF_INET, 0, 0, 0, netlink.RT_TABLE_MAIN, 0, 0, netlink.RTN_UNICAST, 0)
+    entry = netlink.parse_route(payload + netlink._attr(netlink.RTA_MULTIPATH, hops))
+    assert (entry.dst_len, entry.gateway, entry.oif) == (0, "192.0.2.1", 4)
+    # ECMP без шлюзов (наши `/1` через несколько TUN) — только интерфейс первого next hop
+    _, _, payload = netlink.route_replace("0.0.0.0/1", nexthops=[4, 5])
+    assert (netlink.parse_route(payload).gateway, netlink.parse_route(payload).oif) == (None, 4)
+
+
+def test_ip_default_gateway(monkeypatch):
+    outputs = {
+        "plain": "default via 192.0.2.1 dev eth0 proto dhcp metric 600\n",
+        "multipath": "default proto static metric 100 \n\tnexthop via 192.0.2.1 dev eth0 weight 1 \n\tnexthop via 198.51.100.1 dev eth1 weight 1 \n",
+        "ppp": "default dev ppp0 scope link \n",
+        "none": "",
+    }
+    seen = {}
+    for name, stdout in outputs.items():
+        monkeypatch.setattr(tracing, "run", lambda args, **kwargs: subprocess.CompletedProcess(args, 0, stdout, ""))
+        seen[name] = IpBackend().default_gateway()
+    assert seen == {"plain": "192.0.2.1", "multipath": "192.0.2.1", "ppp": "dev ppp0", "none": None}
+
+
+def test_gateway_route():
+    assert gateway_route("203.0.113.7", "192.0.2.1") == Route("203.0.113.7", via="192.0.2.1")
+    assert gateway_route("203.0.113.7", "dev ppp0") == Route("203.0.113.7", dev="ppp0")
+
+
+def test_default_gateway_in_namespace(netns):
+    out = netns(
+        """
+        import subprocess
+        from vpn_cli.network import IpBackend, NetlinkBackend, gateway_route
+
+        net = NetlinkBackend()
+        net.setup_tun("tun0", "10.255.0.2/24")
+        net.setup_tun("tun1", "10.255.1.2/24")
+        ip = lambda *args: subprocess.run(["ip", *args], check=True)
+        show = lambda: print(NetlinkBackend().default_gateway(), IpBackend().default_gateway())
+
+        ip("route", "add", "default", "dev", "tun0")
+        show()
+        net.replace_routes([gateway_route("203.0.113.7", NetlinkBackend().default_gateway())])
+        print(subprocess.check_output(["ip", "route", "show", "203.0.113.7"], text=True).strip())
+        ip("route", "replace", "default", "nexthop", "via", "10.255.1.1", "dev", "tun1", "nexthop", "via", "10.255.0.1", "dev", "tun0")
+        show()
+        """
+    )
+    lines = out.splitlines()
+    assert lines[0] == "dev tun0 dev tun0"
+    assert lines[1].startswith("203.0.113.7 dev tun0")
+    assert lines[2] == "10.255.1.1 10.255.1.1"
@@ -0,0 +1,88 @@
+"""Размещение data path: списки CPU, NUMA-узлы, ioprio, деление ядер между очередями и применение к потокам."""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+from vpn_cli import placement
+from vpn_cli.placement import (
+    Placement,
+    format_cpulist,
+    parse_cpulist,
+    parse_cpus,
+    parse_ioprio,
+    placement_from_env,
+    split_cpus,
+)
+
+
+def test_cpulists():
+    assert parse_cpulist("0-3, 8,10-11\n") == [0, 1, 2, 3, 8, 10, 11]
+    assert format_cpulist([0, 1, 2, 3, 8, 10, 11]) == "0-3,8,10-11"
+    for bad in ("", "a-3", "1-"):
+        with pytest.raises(ValueError):
+            parse_cpulist(bad)
+
+
+def test_numa_node(tmp_path, monkeypatch):
+    (tmp_path / "node1").mkdir()
+    (tmp_path / "node1" / "cpulist").write_text("4-7\n")
+    monkeypatch.setattr(placement, "NODE_PATH", tmp_path)
+    assert parse_cpus("node:1") == [4, 5, 6, 7]
+    with pytest.raises(ValueError, match="NUMA"):
+        parse_cpus("node:0")
+
+
+def test_ioprio():
+    assert parse_ioprio("be:4") == (2, 4) and parse_ioprio("RT") == (1, 4) and parse_ioprio("idle") == (3, 0)
+    with pytest.raises(ValueError, match="класс"):
+        parse_ioprio("fast")
+    with pytest.raises(ValueError, match="0..7"):
+        parse_ioprio("be:9")
+
+
+def test_split_cpus_between_queues():
+    assert split_cpus([0, 1, 2, 3, 4], 2) == [[0, 1, 2], [3, 4]]
+    assert split_cpus([0, 1], 3) == [[0, 1]] * 3  # ядер меньше, чем очередей
+    assert split_cpus(None, 2) == [None, None]
+
+
+def test_placement_from_env(monkeypatch):
+    cpu = min(os.sched_getaffinity(0))
+    monkeypatch.setenv("SSLOCAL_CPUS", str(cpu))
+    monkeypatch.setenv("DATAPATH_NICE", "5")
+    monkeypatch.setenv("DATAPATH_IOPRIO", "idle")
+    p = placement_from_env("SSLOCAL_CPUS")
+    assert p.describe() == {"cpus": str(cpu), "nice": 5, "ioprio": "idle"}
+    assert not placement_from_env("TUN2SOCKS_CPUS").cpus
+
+    monkeypatch.setenv("DATAPATH_NICE", "25")
+    with pytest.raises(ValueError, match="-20..19"):
+        placement_from_env("SSLOCAL_CPUS")
+    monkeypatch.delenv("DATAPATH_NICE")
+    monkeypatch.setenv("SSLOCAL_CPUS", "4096")
+    with pytest.raises(ValueError, match="недоступны"):
+        placement_from_env("SSLOCAL_CPUS")
+
+
+def test_apply_to_every_thread():
+    script = (
+        "import threading, time\n"
+        "for _ in range(3): threading.Thread(target=time.sleep, args=(30,), daemon=True).start()\n"
+        "print(flush=True); time.sleep(30)"
+    )
+    proc = subprocess.Popen([sys.executable, "-c", script], stdout=subprocess.PIPE)
+    try:
+        proc.stdout.readline()  # потоки уже созданы
+        cpu = min(os.sched_getaffinity(0))
+        assert Placement(cpus=[cpu], nice=10).apply(proc.pid) is None
+        tids = [int(t) for t in os.listdir(f"/proc/{proc.pid}/task")]
+        assert len(tids) == 4
+        assert all(os.sched_getaffinity(tid) == {cpu} for tid in tids)
+        assert all(os.getpriority(os.PRIO_PROCESS, tid) == 10 for tid in tids)
+    finally:
+        proc.kill()
+        proc.wait()
+    assert Placement(nice=10).apply(proc.pid) is None  # процесс уже завершился
@@ -0,0 +1,86 @@
+"""Пул соединений до сервера: размер по пиковой секунде, прогрев, попадания, flush и UDP через ретранслятор."""
+
+import asyncio
+import socket
+
+import pytest
+
+from vpn_cli.pool import Upstream, UpstreamPool
+
+
+def test_target_follows_the_busiest_second():
+    upstream = Upstream("127.0.0.1", 8388, min_size=1, max_size=8, window=30)
+    assert upstream.target(1000.0) == 1
+    upstream.arrivals.extend([[960, 7], [980, 3], [999, 2]])
+    assert upstream.target(1000.0) == 3  # секунда 960 уже вне окна
+    # Установка дольше секунды: за время рукопожатия придут ещё сеансы
+    upstream.connect_ewma = 2500.0
+    assert upstream.target(1000.0) == 8
+    assert Upstream("::1", 8388).snapshot()["server"] == "[::1]:8388"
+
+
+class UdpEcho(asyncio.DatagramProtocol):
+    def connection_made(self, transport) -> None:
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr) -> None:
+        self.transport.sendto(data, addr)
+
+
+@pytest.fixture
+def server(loopback):
+    """Подставной сервер: TCP-эхо (считает принятые соединения) и UDP-эхо на том же порту."""
+    accepted: list[int] = []
+
+    async def handle(reader, writer):
+        accepted.append(1)
+        try:
+            while data := await reader.read(4096):
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    port = loopback.tcp(handle)
+    loopback.udp(UdpEcho, port)
+    return port, accepted
+
+
+def test_pool_relays_through_warm_connections(server, wait_for):
+    port, accepted = server
+    pool = UpstreamPool(min_size=2, max_size=4, fastopen=False)
+    pool.start()
+    try:
+        listen = pool.endpoint("127.0.0.1", port)
+        assert pool.endpoint("127.0.0.1", port) == listen
+        wait_for(lambda: pool.snapshot()["upstreams"][0]["idle"] == 2)
+        assert len(accepted) == 2
+
+        # Сеанс получает прогретое соединение: новых подключений к серверу на нём нет
+        with socket.create_connection(("127.0.0.1", listen), timeout=3) as s:
+            s.sendall(b"ping")
+            assert s.recv(4) == b"ping"
+        snapshot = pool.snapshot()
+        assert (snapshot["sessions"], snapshot["hits"], snapshot["hit_rate"]) == (1, 1, 1.0)
+        upstream = snapshot["upstreams"][0]
+        assert upstream["listen"] == f"127.0.0.1:{listen}" and upstream["connect_ms"]["count"] >= 2
+
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as u:
+            u.settimeout(3)
+            u.sendto(b"udp", ("127.0.0.1", listen))
+            assert u.recv(16) == b"udp"
+        assert pool.snapshot()["upstreams"][0]["udp_flows"] == 1
+
+        # Смена пути: прогретые соединения открываются заново
+        wait_for(lambda: pool.snapshot()["upstreams"][0]["idle"] == 2)
+        before = len(accepted)
+        pool.flush()
+        wait_for(lambda: len(accepted) >= before + 2 and pool.snapshot()["upstreams"][0]["idle"] == 2)
+
+        pool.retain(set())
+        assert pool.snapshot()["upstreams"] == []
+        with pytest.raises(OSError):
+            socket.create_connection(("127.0.0.1", listen), timeout=1).close()
+    finally:
+        pool.stop()
@@ -0,0 +1,63 @@
+"""Проба серверов против подставных слушателей на loopback."""
+
+import base64
+import socket
+
+import pytest
+
+from vpn_cli import probe
+from vpn_cli.probe import ProbeResult, probe_ranked, rank, rank_urls
+
+
+def _url(port: int, label: str) -> str:
+    userinfo = base64.b64encode(b"aes-256-gcm:pw").decode()
+    return f"ss://{userinfo}@127.0.0.1:{port}#{label}"
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+
+
+@pytest.fixture
+def live_port():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    sock.listen(64)
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+@pytest.fixture
+def dead_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_probe_ranks_live_server_first(cache_dir, live_port, dead_port):
+    dead, live = _url(dead_port, "dead"), _url(live_port, "live")
+    results, cached = probe_ranked([dead, live], samples=3, timeout=1.0)
+    assert not cached
+    assert [r.label for r in results] == ["live", "dead"]
+    assert len(results[0].samples_ms) == 3 and results[0].address == "127.0.0.1"
+    assert results[1].loss == 1.0 and results[1].error.startswith("connect:")
+    assert rank_urls([dead, live], results) == [live]
+
+
+def test_probe_results_are_cached_per_fleet(cache_dir, live_port, dead_port):
+    urls = [_url(live_port, "live")]
+    first, _ = probe_ranked(urls, samples=1)
+    again, cached = probe_ranked(urls, samples=1)
+    assert cached and [r.key for r in again] == [r.key for r in first]
+    # Другой набор серверов — кэш не подходит
+    assert probe.load_cached(urls + [_url(dead_port, "dead")]) is None
+    assert probe.load_cached(urls, ttl=-1) is None
+
+
+def test_rank_orders_by_median_then_jitter():
+    steady = ProbeResult("a", "steady", "h", 1, samples_ms=[10.0, 10.0, 10.0])
+    jittery = ProbeResult("b", "jittery", "h", 1, samples_ms=[5.0, 10.0, 15.0])
+    fast = ProbeResult("c", "fast", "h", 1, samples_ms=[2.0, 3.0])
+    down = ProbeResult("d", "down", "h", 1, failures=3)
+    assert [r.label for r in rank([down, jittery, steady, fast])] == ["fast", "steady", "jittery", "down"]
@@ -0,0 +1,87 @@
+"""Пробы качества: гистограмма задержек, разбор целей, окна и монитор через SOCKS5-заглушку."""
+
+import socket
+
+import pytest
+
+from vpn_cli.histogram import Histogram
+from vpn_cli.quality import ProbeResult, QualityMonitor, Target, parse_targets, window_stats
+
+
+def test_histogram_relative_error():
+    h = Histogram()
+    assert h.percentile(50) is None and h.summary() == {"count": 0}
+    for ms in range(1, 1001):
+        h.record(float(ms))
+    for pct, exact in ((50, 500), (90, 900), (99, 990)):
+        assert abs(h.percentile(pct) - exact) / exact <= 1 / 32
+    # Крайние корзины не выходят за фактические min/max
+    assert h.percentile(0.01) == 1.0 and h.percentile(100) == 1000.0
+    summary = h.summary()
+    assert (summary["count"], summary["min"], summary["mean"], summary["max"]) == (1000, 1.0, 500.5, 1000.0)
+
+
+def test_histogram_memory_is_fixed():
+    h = Histogram()
+    h.record(0.0004)
+    h.record(10**9)  # дальше MAX_US — в последнюю корзину
+    assert len(h.counts) == Histogram.SIZE and h.count == 2 and h.min_us == 0
+
+
+def test_parse_targets():
+    assert parse_targets("tls://1.1.1.1, http://example.com/generate_204 example.org:22") == [
+        Target("tls://1.1.1.1", "tls", "1.1.1.1", 443),
+        Target("http://example.com/generate_204", "http", "example.com", 80, "/generate_204"),
+        Target("example.org:22", "tcp", "example.org", 22),
+    ]
+    with pytest.raises(ValueError, match="схема"):
+        parse_targets("ftp://example.com")
+    with pytest.raises(ValueError, match="порта"):
+        parse_targets("tcp://example.com")
+
+
+def test_window_stats():
+    results = [
+        ProbeResult(0, True, 10.0),
+        ProbeResult(0, False, error="x"),
+        ProbeResult(0, True, 14.0),
+        ProbeResult(0, True, 12.0),
+    ]
+    assert window_stats(results) == {"probes": 4, "success_rate": 0.75, "jitter_ms": 3.0, "connect_p50_ms": 12.0}
+    assert window_stats([]) == {"probes": 0}
+
+
+@pytest.fixture
+def socks_and_http(loopback):
+    """SOCKS5-заглушка и HTTP-сервер: `(socks_port, http_port, closed_port)`."""
+
+    async def handle_http(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        writer.write(b"HTTP/1.1 204 No Content\r\n\r\n")
+        await writer.drain()
+        writer.close()
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        closed_port = s.getsockname()[1]
+    return loopback.socks(), loopback.tcp(handle_http), closed_port
+
+
+def test_monitor_through_socks(socks_and_http, wait_for):
+    socks_port, http_port, closed_port = socks_and_http
+    targets = parse_targets(f"http://127.0.0.1:{http_port}/generate_204 tcp://127.0.0.1:{closed_port}")
+    monitor = QualityMonitor(socks_port, targets, interval=0.2, timeout=1.0, windows=(60,))
+    monitor.start()
+    try:
+        wait_for(lambda: monitor.rounds >= 3)
+        snapshot = monitor.snapshot()
+    finally:
+        monitor.stop()
+    assert snapshot["socks"] == f"127.0.0.1:{socks_port}" and snapshot["windows"] == ["1m"]
+    http, closed = snapshot["targets"]
+    assert http["failures"] == 0 and http["last_ok"] is True and http["probes"] >= 3
+    assert http["first_byte_ms"]["count"] == http["probes"]
+    assert http["windows"]["1m"]["success_rate"] == 1.0
+    # Заглушка закрывает соединение, если цель не отвечает — проба неуспешна
+    assert closed["failures"] == closed["probes"] >= 3 and closed["last_ok"] is False
+    assert closed["connect_ms"] == {"count": 0}
@@ -0,0 +1,71 @@
+"""Проверки готовности против подставных SOCKS5-слушателей."""
+
+import socket
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from vpn_cli.readiness import ReadinessError, socks5_handshake, wait_port_free, wait_socks_ready
+
+
+@pytest.fixture
+def listener():
+    """Слушатель на 127.0.0.1, отвечающий на приветствие байтами `reply`."""
+    socks = []
+
+    def start(reply: bytes) -> int:
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        sock.listen()
+        socks.append(sock)
+
+        def serve():
+            while True:
+                try:
+                    conn, _ = sock.accept()
+                except OSError:
+                    return
+                with conn:
+                    conn.recv(3)
+                    conn.sendall(reply)
+
+        threading.Thread(target=serve, daemon=True).start()
+        return sock.getsockname()[1]
+
+    yield start
+    for sock in socks:
+        sock.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_socks5_handshake(listener):
+    assert socks5_handshake("127.0.0.1", listener(b"\x05\x00"))
+    # Слушает, но не SOCKS5 без аутентификации
+    assert not socks5_handshake("127.0.0.1", listener(b"\x05\xff"))
+    assert not socks5_handshake("127.0.0.1", listener(b""))
+    assert not socks5_handshake("127.0.0.1", _free_port())
+
+
+def test_wait_socks_ready(listener):
+    wait_socks_ready(listener(b"\x05\x00"), timeout=1.0)
+    with pytest.raises(ReadinessError, match="не ответил"):
+        wait_socks_ready(_free_port(), timeout=0.1)
+
+
+def test_wait_socks_ready_fails_fast_when_process_exits():
+    proc = subprocess.Popen([sys.executable, "-c", "raise SystemExit(3)"])
+    proc.wait()
+    with pytest.raises(ReadinessError, match="кодом 3"):
+        wait_socks_ready(_free_port(), timeout=30.0, proc=proc)
+
+
+def test_wait_port_free(listener):
+    assert wait_port_free(_free_port(), timeout=0.1)
+    assert not wait_port_free(listener(b"\x05\x00"), timeout=0.1)
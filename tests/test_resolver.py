@@ -0,0 +1,78 @@
+"""Резолв сервера с подменённым резолвером: кэш, устаревший кэш, happy eyeballs, состояние для `stop`."""
+
+import asyncio
+import socket
+
+import pytest
+
+from vpn_cli import resolver
+from vpn_cli.resolver import ResolveError, ServerState, happy_eyeballs, resolve_server
+
+
+class StubLookup:
+    """Скриптованные ответы по семейству; `None` — резолвер завис (таймаут)."""
+
+    def __init__(self, v6: list[str] | None, v4: list[str] | None) -> None:
+        self.answers = {socket.AF_INET6: v6, socket.AF_INET: v4}
+        self.calls = 0
+
+    async def __call__(self, host: str, family: int) -> list[str]:
+        self.calls += 1
+        answer = self.answers[family]
+        if answer is None:
+            await asyncio.sleep(10)
+        if not answer:
+            raise socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        return answer
+
+
+@pytest.fixture(autouse=True)
+def dirs(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    monkeypatch.setenv("XDG_STATE_HOME", str(tmp_path / "state"))
+
+
+async def _reachable(address: str, port: int, timeout: float) -> str:
+    if address.startswith("192.0.2."):
+        await asyncio.sleep(10)
+    return address
+
+
+def test_fresh_then_cached_then_stale():
+    lookup = StubLookup(["2001:db8::1"], ["198.51.100.1", "198.51.100.2"])
+    res = resolve_server("vpn.example", 8388, lookup=lookup, connect=_reachable)
+    assert res.source == "dns"
+    assert res.addresses == ["2001:db8::1", "198.51.100.1", "198.51.100.2"]
+    assert res.address == "2001:db8::1" and res.reachable
+
+    res = resolve_server("vpn.example", 8388, lookup=lookup, connect=_reachable)
+    assert res.source == "cache" and lookup.calls == 2
+
+    # TTL вышел, а DNS молчит — работаем по последнему известному ответу
+    silent = StubLookup(None, None)
+    res = asyncio.run(resolver.resolve_host("vpn.example", lookup=silent, ttl=0, timeout=0.05))
+    assert res.source == "stale-cache" and res.addresses[0] == "2001:db8::1"
+    assert resolver.cached_addresses("vpn.example") == res.addresses
+
+
+def test_unresolvable_without_cache():
+    with pytest.raises(ResolveError, match="nx.example"):
+        resolve_server("nx.example", 8388, lookup=StubLookup([], []), timeout=0.05)
+
+
+def test_literal_address_skips_lookup():
+    lookup = StubLookup([], [])
+    res = resolve_server("203.0.113.7", 8388, lookup=lookup)
+    assert (res.source, res.address, lookup.calls) == ("literal", "203.0.113.7", 0)
+
+
+def test_happy_eyeballs_moves_past_a_black_hole():
+    best = asyncio.run(happy_eyeballs(["192.0.2.1", "198.51.100.9"], 8388, delay=0.01, timeout=1.0, connect=_reachable))
+    assert best == "198.51.100.9"
+    assert asyncio.run(happy_eyeballs(["192.0.2.1"], 8388, timeout=0.05, connect=_reachable)) is None
+
+
+def test_server_state_round_trip():
+    states = [ServerState("vpn.example", "198.51.100.1", "192.168.0.1"), ServerState("b.example", "198.51.100.2")]
+    resolver.save_server_state(states)
+    assert resolver.load_server_state() == states
@@ -0,0 +1,103 @@
+"""Split tunneling: сжатие списков сетей и применение только разницы маршрутов."""
+
+import pytest
+
+from vpn_cli.network import NetBackend, Route, Rule
+from vpn_cli.routes import CompiledList, RouteTable, compile_list, desired_routes
+
+
+class RecordingBackend(NetBackend):
+    """Бэкенд без сети: запоминает пачки, которые ему отдали."""
+
+    def __init__(self) -> None:
+        self.calls: list[tuple[str, list]] = []
+
+    def replace_routes(self, routes):
+        self.calls.append(("replace", list(routes)))
+
+    def delete_routes(self, routes):
+        self.calls.append(("delete", list(routes)))
+
+    def add_rules(self, rules):
+        self.calls.append(("add_rules", list(rules)))
+
+    def delete_rules(self, rules):
+        self.calls.append(("delete_rules", list(rules)))
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+def test_compile_list_collapses_and_caches(tmp_path):
+    path = tmp_path / "ru.txt"
+    path.write_text("# comment\n10.0.0.0/25\n10.0.0.128/25\n10.0.0.7\n2001:db8::/32\nnot-a-net\n192.168.1.0/24 # inline\n")
+    compiled = compile_list([path])
+    assert compiled.cidrs == ["10.0.0.0/24", "192.168.1.0/24"]
+    assert (compiled.lines, compiled.skipped, compiled.cached) == (6, 2, False)
+    assert compile_list([path]).cached
+    path.write_text("172.16.0.0/12\n")
+    assert compile_list([path]).cidrs == ["172.16.0.0/12"]
+
+
+def test_desired_routes_full_and_split():
+    none = CompiledList(cidrs=[])
+    assert desired_routes("tun0", "192.0.2.1", none, none) == [Route("0.0.0.0/1", dev="tun0"), Route("128.0.0.0/1", dev="tun0")]
+
+    include = CompiledList(cidrs=["10.0.0.0/8", "172.16.0.0/12"])
+    exclude = CompiledList(cidrs=["172.16.0.0/12"])
+    assert desired_routes(["tun0", "tun1"], "192.0.2.1", include, exclude) == [
+        Route("10.0.0.0/8", nexthops=("tun0", "tun1")),
+        Route("172.16.0.0/12", via="192.0.2.1"),
+    ]
+    # Без шлюза обойти туннель некуда: исключения не ставятся
+    assert desired_routes("tun0", None, none, exclude) == [Route("0.0.0.0/1", dev="tun0"), Route("128.0.0.0/1", dev="tun0")]
+    # Point-to-point uplink без адреса шлюза: исключения — прямо в интерфейс
+    assert desired_routes("tun0", "dev ppp0", none, exclude)[-1] == Route("172.16.0.0/12", dev="ppp0")
+
+
+def test_invalidate_forgets_routes_through_the_old_gateway(tmp_path):
+    table = RouteTable(RecordingBackend(), tmp_path / "routes.json")
+    tunnel, via, dev = Route("0.0.0.0/1", dev="tun0"), Route("10.0.0.0/8", via="192.0.2.1"), Route("10.0.0.0/8", dev="ppp0")
+    table.installed = {tunnel, via, dev}
+    table.invalidate("192.0.2.1")
+    assert table.installed == {tunnel, dev}
+    table.invalidate("dev ppp0")
+    assert table.installed == {tunnel}
+
+
+def test_route_table_applies_only_the_difference(tmp_path):
+    state = tmp_path / "routes.json"
+    net = RecordingBackend()
+    table = RouteTable(net, state)
+    a, b, c = Route("10.0.0.0/8", dev="tun0"), Route("172.16.0.0/12", dev="tun0"), Route("192.168.0.0/16", dev="tun0")
+    rule = Rule(None, 1000, 10000, src="10.255.0.2")
+    table.apply([a, b], [rule])
+
+    net.calls.clear()
+    reloaded = RouteTable(net, state)
+    reloaded.load()
+    stats = reloaded.apply([b, c], [rule])
+    assert net.calls == [("replace", [c]), ("delete", [a]), ("add_rules", []), ("delete_rules", [])]
+    assert (stats["added"], stats["removed"], stats["installed"], stats["rules"]) == (1, 1, 2, 1)
+
+    # Маршруты через пересозданный интерфейс ядро уже удалило: их ставим заново
+    fresh = RouteTable(net, state)
+    fresh.load(fresh_devs=["tun0"])
+    assert fresh.installed == set() and fresh.rules == {rule}
+
+    net.calls.clear()
+    reloaded.clear()
+    assert sorted(net.calls[0][1], key=lambda r: r.dst) == [b, c]
+    assert net.calls[1] == ("delete_rules", [rule])
+    assert not state.exists()
+
+
+def test_route_table_reads_legacy_state(tmp_path):
+    state = tmp_path / "routes.json"
+    state.write_text('{"routes": [["10.0.0.0/8", "tun0", null]], "rules": [[1000, 1000, 10000]]}')
+    table = RouteTable(RecordingBackend(), state)
+    table.load()
+    assert table.installed == {Route("10.0.0.0/8", dev="tun0")}
+    assert table.rules == {Rule(1000, 1000, 10000)}
@@ -0,0 +1,34 @@
+"""Бюджет запуска CLI: `status`/`stop` дёргают из скриптов и статус-баров, импорт должен оставаться дешёвым."""
+
+import os
+
+import pytest
+
+from vpn_cli.bench import STARTUP_BUDGET_MS, STARTUP_MODULE, measure_imports
+from vpn_cli.cli import fast_command
+
+# Тянут за собой десятки модулей; нужны только `start`, `install` и сайдкарам
+HEAVY = ("asyncio", "ssl", "requests")
+
+
+@pytest.mark.skipif(not os.getenv("MY_VPN_STARTUP_BENCH"), reason="замер времени: MY_VPN_STARTUP_BENCH=1")
+def test_cli_import_within_budget():
+    # Время зависит от загрузки машины, поэтому только по запросу (как `my-vpn bench-startup`)
+    result = measure_imports(STARTUP_MODULE)
+    assert result["import_ms"] <= STARTUP_BUDGET_MS, result["heaviest"]
+
+
+def test_fast_path_flags_in_any_order():
+    assert fast_command(["status"]) == ("status", set())
+    assert fast_command(["status", "--quality", "--json", "--quality"]) == ("status", {"--json", "--quality"})
+    assert fast_command(["stop"]) == ("stop", set())
+    # Незнакомое — через полный CLI (там и ошибка про неизвестный флаг)
+    assert fast_command(["status", "--verbose"]) is None
+    assert fast_command(["stop", "--json"]) is None
+    assert fast_command(["start"]) is None and fast_command([]) is None
+
+
+@pytest.mark.parametrize("module", [STARTUP_MODULE, "vpn_cli.main"])
+def test_no_heavy_imports(module):
+    loaded = measure_imports(module, runs=1)["modules"]
+    assert not [name for name in loaded if name.split(".")[0] in HEAVY]
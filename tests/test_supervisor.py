@@ -0,0 +1,114 @@
+"""Супервизор: плановый перезапуск не блокирует цикл, готовность ждётся с дедлайном, код выхода `start`."""
+
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from vpn_cli.supervisor import Component, Supervisor, SupervisorError
+
+SLEEPER = [sys.executable, "-c", "import time; time.sleep(30)"]
+
+
+@pytest.fixture
+def make_supervisor(tmp_path):
+    made = []
+
+    def make(*components, **kwargs):
+        sup = Supervisor(list(components), state_path=tmp_path / "supervisor.json", **kwargs)
+        made.append(sup)
+        return sup
+
+    yield make
+    for sup in made:
+        sup.shutdown()
+
+
+def _run(sup: Supervisor) -> tuple[threading.Thread, list[BaseException]]:
+    errors: list[BaseException] = []
+
+    def target():
+        try:
+            sup.run()
+        except BaseException as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    return thread, errors
+
+
+def _wait(predicate, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "не дождались"
+        time.sleep(0.02)
+
+
+def test_planned_restart_returns_before_ready(make_supervisor, tmp_path):
+    flag = tmp_path / "ready"
+    comp = Component("svc", SLEEPER, str(tmp_path / "svc.log"), ready=lambda proc: flag.exists(), ready_timeout=10)
+    sup = make_supervisor(comp)
+    sup.spawn("svc")
+    old_pid = comp.proc.pid
+    thread, errors = _run(sup)
+
+    t0 = time.monotonic()
+    sup.call_later(0, lambda: sup.restart("svc"))
+    _wait(lambda: comp.proc.pid != old_pid)
+    assert time.monotonic() - t0 < 2
+    assert comp.snapshot()["state"] == "starting"
+
+    flag.touch()
+    _wait(lambda: comp.snapshot()["state"] == "running")
+    assert comp.restarts == 0
+    sup.stop()
+    thread.join(5)
+    assert not errors
+
+
+def test_readiness_deadline_counts_as_crash(make_supervisor, tmp_path):
+    comp = Component("svc", SLEEPER, str(tmp_path / "svc.log"), ready=lambda proc: False, ready_timeout=0.2)
+    sup = make_supervisor(comp, max_restarts=2, backoff_base=0.01)
+    sup.spawn("svc")
+    thread, errors = _run(sup)
+
+    sup.call_later(0, lambda: sup.restart("svc"))
+    thread.join(10)
+    assert not thread.is_alive()
+    assert len(errors) == 1 and isinstance(errors[0], SupervisorError)
+    assert comp.restarts == 2
+
+
+def test_start_exit_codes(scenario, ss_url):
+    out = scenario(
+        """
+        import os, signal
+
+        def foreground():
+            proc = subprocess.Popen([sys.executable, "-m", "vpn_cli.cli", "start", "--no-sudo"], stdout=subprocess.DEVNULL)
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                try:
+                    pids = {e["key"]: e["pid"] for e in journal()["entries"] if e["kind"] == "process"}
+                except (OSError, ValueError):
+                    pids = {}
+                if "tun2socks" in pids:
+                    return proc, pids
+                time.sleep(0.05)
+            raise RuntimeError("start не дошёл до готовности")
+
+        proc, pids = foreground()
+        vpn("stop")
+        stopped = proc.wait(10)
+        # Падение при RESTART_MAX=0 — бюджет перезапусков исчерпан сразу
+        proc, pids = foreground()
+        os.kill(pids["sslocal"], signal.SIGKILL)
+        crashed = proc.wait(10)
+        print(json.dumps({"stopped": stopped, "crashed": crashed, "links": ip("-br", "link").count("tun")}))
+        """,
+        f"SS_URL={ss_url('203.0.113.7', 'a')}\nRESTART_MAX=0\n",
+    )
+    assert json.loads(out.splitlines()[-1]) == {"stopped": 0, "crashed": 1, "links": 0}
@@ -0,0 +1,51 @@
+"""`switch`: новый набор поднимается рядом со старым, маршруты переключаются, старый снимается после grace."""
+
+import json
+
+
+def test_make_before_break_switch(scenario, ss_url):
+    out = scenario(
+        """
+        def dev(route):
+            words = route.split()
+            return words[words.index("dev") + 1] if "dev" in words else None
+
+        def state():
+            return {
+                "links": sorted(l.split()[0] for l in ip("-br", "link").splitlines() if l.startswith("tun")),
+                "half": dev(ip("route", "show", "0.0.0.0/1")),
+                "pins": sorted(l.split()[0] for l in ip("route").splitlines() if l.startswith("203.")),
+                "rules": [l for l in ip("rule").splitlines() if l.startswith("9")],
+            }
+
+        try:
+            assert vpn("start", "--detach", "--no-sudo").returncode == 0
+            before = state()
+            missing = vpn("switch", "nope")
+            done = vpn("switch", "b", "--grace", "1", "--json")
+            during = state()
+            time.sleep(1.5)
+            after = state()
+            status = json.loads(vpn("status", "--json").stdout)
+        finally:
+            vpn("stop")
+        print(json.dumps({
+            "before": before, "missing": missing.returncode, "switch": json.loads(done.stdout),
+            "during": during, "after": after, "server": status["server"], "final": state(),
+        }))
+        """,
+        f"SS_URLS={ss_url('203.0.113.7', 'a')} {ss_url('203.0.113.8', 'b')}\n",
+    )
+    result = json.loads(out.splitlines()[-1])
+    assert result["before"]["links"] == ["tun0"] and result["before"]["pins"] == ["203.0.113.7"]
+    assert result["missing"] != 0
+    assert result["switch"]["tun_dev"] == "tun1" and result["switch"]["draining"] == ["tun0"]
+    # Во время grace старый TUN жив и держит свои соединения правилом по адресу источника
+    during = result["during"]
+    assert during["links"] == ["tun0", "tun1"] and during["half"] == "tun1"
+    assert during["pins"] == ["203.0.113.7", "203.0.113.8"]
+    assert during["rules"] == ["9000:\tfrom 10.255.0.2 lookup 1000"]
+    after = result["after"]
+    assert after == {"links": ["tun1"], "half": "tun1", "pins": ["203.0.113.8"], "rules": []}
+    assert result["server"] == "b"
+    assert result["final"] == {"links": [], "half": None, "pins": [], "rules": []}
@@ -0,0 +1,84 @@
+"""Трассировка: пустой путь без трассы, спаны с кодом выхода и ошибкой, сводка, Chrome trace из CLI."""
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from vpn_cli import tracing
+
+
+@pytest.fixture
+def tracer():
+    yield tracing.enable()
+    tracing.disable()
+
+
+def test_disabled_spans_cost_nothing():
+    assert tracing.tracer() is None
+    with tracing.span("phase", key="value") as args:
+        args["exit_code"] = 1
+    assert tracing.span("a") is tracing.span("b") and args == {}
+    assert tracing.run([sys.executable, "-c", "pass"]).returncode == 0
+
+
+def test_spans_record_exit_codes_and_errors(tracer):
+    with tracing.span("resolve", host="example.com") as args:
+        args["address"] = "192.0.2.1"
+    with pytest.raises(ValueError):
+        with tracing.span("broken"):
+            raise ValueError("плохой .env")
+    tracing.run([sys.executable, "-c", "raise SystemExit(3)"])
+    with pytest.raises(subprocess.CalledProcessError):
+        tracing.check_output([sys.executable, "-c", "raise SystemExit(2)"])
+
+    events = {e["name"]: e for e in tracer.chrome_trace()["traceEvents"] if e["ph"] == "X"}
+    assert events["resolve"]["args"] == {"host": "example.com", "address": "192.0.2.1"}
+    assert events["broken"]["args"] == {"error": "ValueError: плохой .env"}
+    python = events[sys.executable.rsplit("/", 1)[-1]]
+    assert python["cat"] == "subprocess" and python["args"]["exit_code"] == 2
+
+    rows = {r["name"]: r for r in tracer.rows()}
+    assert rows[python["name"]]["calls"] == 2 and rows[python["name"]]["failed"] == 2
+    assert rows["resolve"]["failed"] == 0 and rows["broken"]["failed"] == 1
+
+
+def test_span_limit(tracer, monkeypatch):
+    monkeypatch.setattr(tracing, "MAX_SPANS", 2)
+    for _ in range(5):
+        with tracing.span("tick"):
+            pass
+    trace = tracer.chrome_trace()
+    assert len([e for e in trace["traceEvents"] if e["ph"] == "X"]) == 2
+    assert trace["otherData"]["dropped_spans"] == 3
+
+
+def test_redact():
+    assert tracing.redact(["sslocal", "-k", "secret", "--password", "p", "-b", "127.0.0.1:1080"]) == [
+        "sslocal", "-k", "***", "--password", "***", "-b", "127.0.0.1:1080",
+    ]
+
+
+def test_cli_writes_chrome_trace(tmp_path):
+    out = tmp_path / "trace.json"
+    env = {
+        "PYTHONPATH": str(Path(tracing.__file__).resolve().parents[1]),
+        "PATH": "/usr/bin:/bin",
+        "MY_VPN_ENV_FILE": "/dev/null",
+        "XDG_STATE_HOME": str(tmp_path),
+        "XDG_CONFIG_HOME": str(tmp_path),
+    }
+    result = subprocess.run(
+        [sys.executable, "-m", "vpn_cli.cli", "--trace", str(out), "status"], env=env, capture_output=True, text=True
+    )
+    assert result.returncode == 0, result.stderr
+    events = json.load(open(out))["traceEvents"]
+    assert events[0]["ph"] == "M"
+    spans = [e for e in events if e["ph"] == "X"]
+    root = next(e for e in spans if e["cat"] == "command")
+    assert root["name"] == "my-vpn status"
+    # Все спаны вложены в корневой спан команды
+    assert all(root["ts"] <= e["ts"] and e["ts"] + e["dur"] <= root["ts"] + root["dur"] for e in spans)
+    assert {".env", "find sslocal"} <= {e["name"] for e in spans}
@@ -0,0 +1,64 @@
+"""Параметры data path: разбор, профили, аргументы компонентов, path MTU и autotune."""
+
+import pytest
+
+from vpn_cli import tuning
+from vpn_cli.tuning import Tunables, autotune, from_dict, resolve_tunables, sslocal_args, sweep_stages, tun2socks_args
+
+
+def test_parse_and_validate():
+    assert tuning.parse_size("4M") == tuning.parse_size("4MiB") == 4 * 1024**2
+    assert from_dict({"tcp_sndbuf": "512K", "ss_no_delay": "on", "mtu": "1400"}) == Tunables(
+        mtu=1400, tcp_sndbuf=512 * 1024, ss_no_delay=True
+    )
+    with pytest.raises(ValueError, match="MTU"):
+        from_dict({"mtu": 100})
+    with pytest.raises(ValueError, match="Неизвестные"):
+        from_dict({"mtuu": 1400})
+
+
+def test_component_args():
+    t = Tunables(mtu=1400, tcp_rcvbuf=1024, tcp_auto_tuning=True, udp_timeout=30, ss_fast_open=True, ss_worker_threads=2)
+    assert tun2socks_args(t) == ["-mtu", "1400", "-tcp-rcvbuf", "1024", "-tcp-auto-tuning", "-udp-timeout", "30s"]
+    assert sslocal_args(t) == ["--tcp-fast-open", "--udp-timeout", "30", "--worker-threads", "2"]
+    assert tun2socks_args(Tunables()) == sslocal_args(Tunables()) == []
+
+
+def test_profile_overrides_env(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path))
+    monkeypatch.setenv("TUN_MTU", "1400")
+    monkeypatch.setenv("TUN_TXQUEUELEN", "50")
+    tuning.save_profile("mine", {"txqueuelen": 2000})
+    name, t = resolve_tunables("mine")
+    assert (name, t.mtu, t.txqueuelen) == ("mine", 1400, 2000)
+    assert resolve_tunables("latency")[1].ss_no_delay
+    with pytest.raises(ValueError, match="не найден"):
+        resolve_tunables("nope")
+
+
+def test_autotune_is_coordinate_descent():
+    # Оценка растёт с буферами tun2socks до 4M, MTU 1400 лучше 1500; прогоны с очередью 5000 падают
+    def measure(t: Tunables) -> float | None:
+        if t.txqueuelen == 5000:
+            return None
+        return (t.mtu == 1400) + min(t.tcp_sndbuf or 0, 4 * 1024**2) / 1024**2
+
+    stages = sweep_stages(Tunables(), safe_mtu=1400)
+    assert stages[0] == ("mtu", [1400])
+    stages[0] = ("mtu", [1500, 1400])
+    best, score = autotune(Tunables(), stages, measure)
+    assert (best.mtu, best.tcp_sndbuf, best.tcp_rcvbuf, best.txqueuelen) == (1400, 4 * 1024**2, 4 * 1024**2, None)
+    assert score == 5.0
+
+
+def test_path_mtu_in_namespace(netns):
+    out = netns(
+        """
+        import subprocess
+        subprocess.run(["ip", "link", "set", "lo", "mtu", "1400", "up"], check=True)
+        from vpn_cli.tuning import discover_path_mtu
+        result = discover_path_mtu("127.0.0.1", timeout=0.2)
+        print(result.path_mtu, result.method, result.tun_mtu)
+        """
+    )
+    assert out.split() == ["1400", "icmp", str(1400 - tuning.SS_UDP_OVERHEAD)]
@@ -0,0 +1,74 @@
+"""Несколько туннелей: раскладка по слотам, ECMP и таблицы туннелей по адресу источника."""
+
+from vpn_cli.network import Route, Rule
+from vpn_cli.tunnels import drain_rules, plan_tunnels, table_routes, table_rules, tun_addrs, tun_devs
+
+PARSED = {
+    "ss://a": ("203.0.113.7", "8388", "aes-256-gcm", "pw"),
+    "ss://b": ("203.0.113.8", "8388", "aes-256-gcm", "pw"),
+}
+
+
+def _plan(count: int, first: int = 0):
+    return plan_tunnels(
+        list(PARSED), PARSED, count, base_dev="tun0", base_addr="10.255.0.2/24", base_port=1080, first=first
+    )
+
+
+def test_slots():
+    assert tun_devs("tun0", 1) == ["tun0"]
+    assert tun_devs("vpn", 2, first=2) == ["vpn2", "vpn3"]
+    assert tun_addrs("10.255.0.2/24", 2, first=1) == ["10.255.1.2/24", "10.255.2.2/24"]
+
+
+def test_plan_spreads_servers_round_robin():
+    plan = _plan(3)
+    assert [(t.host, t.dev, t.socks_port, t.table) for t in plan] == [
+        ("203.0.113.7", "tun0", 1080, 1000),
+        ("203.0.113.8", "tun1", 1081, 1001),
+        ("203.0.113.7", "tun2", 1082, 1002),
+    ]
+    assert [t.ss_name for t in plan] == ["sslocal", "sslocal-1", "sslocal-2"]
+    # Одиночный туннель — без отдельной таблицы и правил
+    single = _plan(1)
+    assert single[0].table is None and table_rules(single) == [] and table_routes(single) == []
+
+
+def test_tables_are_selected_by_source_address():
+    plan = _plan(2)
+    assert table_routes(plan) == [Route("0.0.0.0/0", dev="tun0", table=1000), Route("0.0.0.0/0", dev="tun1", table=1001)]
+    assert table_rules(plan) == [Rule(None, 1000, 10000, src="10.255.0.2"), Rule(None, 1001, 10001, src="10.255.1.2")]
+    # Старый набор после `switch` держится правилами с более высоким приоритетом
+    assert drain_rules(_plan(2, first=2)) == [Rule(None, 1002, 9002, src="10.255.2.2"), Rule(None, 1003, 9003, src="10.255.3.2")]
+
+
+def test_routes_in_namespace(netns, tmp_path):
+    out = netns(
+        """
+        import subprocess, sys
+        from pathlib import Path
+        from vpn_cli.network import NetlinkBackend
+        from vpn_cli.routes import CompiledList, RouteTable, desired_routes
+        from vpn_cli.tunnels import plan_tunnels, table_routes, table_rules
+
+        parsed = {"ss://a": ("203.0.113.7", "8388", "m", "p"), "ss://b": ("203.0.113.8", "8388", "m", "p")}
+        plan = plan_tunnels(list(parsed), parsed, 2, base_dev="tun0", base_addr="10.255.0.2/24", base_port=1080)
+        net = NetlinkBackend()
+        for t in plan:
+            net.setup_tun(t.dev, t.addr)
+        empty = CompiledList(cidrs=[])
+        table = RouteTable(net, Path(sys.argv[1]))
+        table.apply(desired_routes([t.dev for t in plan], None, empty, empty) + table_routes(plan), table_rules(plan))
+        ip = lambda *args: subprocess.check_output(["ip", *args], text=True)
+        print(ip("route", "show", "0.0.0.0/1"))
+        print(ip("route", "get", "1.1.1.1", "from", "10.255.1.2"))
+        print(ip("rule", "show"))
+        table.clear()
+        print("after:", ip("rule", "show").count("lookup 100"))
+        """,
+        str(tmp_path / "routes.json"),
+    )
+    assert "nexthop dev tun0" in out and "nexthop dev tun1" in out
+    assert "1.1.1.1 from 10.255.1.2 dev tun1 table 1001" in out
+    assert "10001:\tfrom 10.255.1.2 lookup 1001" in out
+    assert "after: 0" in out